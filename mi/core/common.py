@@ -95,6 +95,47 @@ class Config(object):
     def as_dict(self):
         return self.config
     
+class BaseEnumMeta(type):
+    """
+    Metaclass for BaseEnum that caches the values of each enum class the
+    first time they are asked for. Collecting them walks dir() of the
+    class, which is far too slow for membership tests on every FSM event
+    or particle value. Setting or deleting a class attribute on any enum
+    drops every cached value set, since subclasses inherit values.
+    """
+    _generation = 0
+
+    def __setattr__(cls, name, value):
+        type.__setattr__(cls, name, value)
+        BaseEnumMeta._generation += 1
+
+    def __delattr__(cls, name):
+        type.__delattr__(cls, name)
+        BaseEnumMeta._generation += 1
+
+    def _enum_cache(cls):
+        """
+        @retval (generation, dict of attribute name to value, list of values
+        in attribute name order, frozenset of values or None if some values
+        are not hashable) for this class
+        """
+        cache = cls.__dict__.get('__enum_cache__')
+        if cache is None or cache[0] != BaseEnumMeta._generation:
+            values = {}
+            for attr in dir(cls):
+                if not attr.startswith('__'):
+                    value = getattr(cls, attr)
+                    if not callable(value):
+                        values[attr] = value
+            value_list = [values[attr] for attr in sorted(values)]
+            try:
+                value_set = frozenset(value_list)
+            except TypeError:
+                value_set = None
+            cache = (BaseEnumMeta._generation, values, value_list, value_set)
+            type.__setattr__(cls, '__enum_cache__', cache)
+        return cache
+
 class BaseEnum(object):
     """Base class for enums.
     
@@ -113,22 +154,20 @@ class BaseEnum(object):
     coupled with what the drivers can do. By putting the values here, they
     are quicker to execute and more compartmentalized so that code can be
     re-used more easily outside of a capability container as needed.
+
+    The values are collected once per class by BaseEnumMeta.
     """
+    __metaclass__ = BaseEnumMeta
     
     @classmethod
     def list(cls):
         """List the values of this enum."""
-        return [getattr(cls,attr) for attr in dir(cls) if\
-                not callable(getattr(cls,attr)) and not attr.startswith('__')]
+        return list(cls._enum_cache()[2])
 
     @classmethod
     def dict(cls):
         """Return a dict representation of this enum."""
-        result = {}
-        for attr in dir(cls):
-            if not callable(getattr(cls,attr)) and not attr.startswith('__'):
-                result[attr] = getattr(cls,attr)
-        return result
+        return dict(cls._enum_cache()[1])
 
     @classmethod
     def has(cls, item):
@@ -143,7 +182,13 @@ class BaseEnum(object):
         @retval True if one of the class attributes has value item, false
         otherwise.
         """
-        return item in cls.list()
+        (generation, values, value_list, value_set) = cls._enum_cache()
+        if value_set is not None:
+            try:
+                return item in value_set
+            except TypeError:
+                pass
+        return item in value_list
 
 class EventKey(BaseEnum):
     """Keys to the event dictionary fields as used by the InstrumentProtocol
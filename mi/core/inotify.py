@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.inotify
+@file mi/core/inotify.py
+@brief A small ctypes wrapper around the Linux inotify calls, enough to
+    watch directories for files being written, moved in or removed.
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import errno
+import struct
+import select
+import ctypes
+import ctypes.util
+
+# Event masks, from sys/inotify.h
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0x80000
+
+# struct inotify_event header: wd, mask, cookie, len
+EVENT_HEADER = struct.Struct('iIII')
+
+# Bytes read from the inotify file descriptor at a time
+READ_SIZE = 64 * 1024
+
+_libc = None
+
+
+def _load_libc():
+    """
+    @retval libc with the inotify calls, None if they aren't available.
+    """
+    global _libc
+    if _libc is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_init1
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+            _libc = libc
+        except (OSError, AttributeError):
+            _libc = False
+    return _libc or None
+
+
+def inotify_available():
+    """
+    @retval True if this platform has inotify.
+    """
+    return _load_libc() is not None
+
+
+def _check(result):
+    if result < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+    return result
+
+
+class InotifyEvent(object):
+    """
+    One event read from an inotify watch.
+    """
+    __slots__ = ('wd', 'mask', 'cookie', 'name')
+
+    def __init__(self, wd, mask, cookie, name):
+        self.wd = wd
+        self.mask = mask
+        self.cookie = cookie
+        self.name = name
+
+    def __repr__(self):
+        return 'InotifyEvent(wd=%d, mask=0x%x, name=%r)' % (self.wd, self.mask, self.name)
+
+
+class Inotify(object):
+    """
+    An inotify instance. Add watches on paths then read their events.
+    """
+    def __init__(self):
+        """
+        @throws OSError if inotify isn't available or the instance can't
+        be created.
+        """
+        libc = _load_libc()
+        if libc is None:
+            raise OSError(errno.ENOSYS, 'inotify is not available')
+        self._libc = libc
+        self.fd = _check(libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC))
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, path, mask):
+        """
+        @param path The file or directory to watch.
+        @param mask The events to watch for.
+        @retval The watch descriptor.
+        @throws OSError if the watch can't be added.
+        """
+        return _check(self._libc.inotify_add_watch(self.fd, path, mask))
+
+    def rm_watch(self, wd):
+        _check(self._libc.inotify_rm_watch(self.fd, wd))
+
+    def read_events(self, timeout=None):
+        """
+        Wait for events and read them.
+        @param timeout Seconds to wait, None to wait for events.
+        @retval A list of InotifyEvents, empty if the timeout passed.
+        """
+        (ready, _, _) = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            buf = os.read(self.fd, READ_SIZE)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+
+        events = []
+        offset = 0
+        while offset < len(buf):
+            (wd, mask, cookie, length) = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset:offset + length].rstrip('\0')
+            offset += length
+            events.append(InotifyEvent(wd, mask, cookie, name))
+        return events
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
@@ -11,9 +11,16 @@
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import re
+
+from bisect import bisect_right
+from collections import deque
+from struct import calcsize, unpack_from
+
 from mi.core.log import get_logger ; log = get_logger()
 
-from mi.core.exceptions import SampleException
+from mi.core.exceptions import SampleException, NotImplementedException
+from mi.core.instrument import pd0_decoder
 
 class Chunker(object):
     """
@@ -133,7 +140,7 @@ class Chunker(object):
         """
         log.debug("Generating data lists with start index %s", start_index)
         return_list = {'data_chunk_list':[], 'non_data_chunk_list':[]}
-        result = self.sieve(self.buffer[start_index:])
+        result = self._run_sieve(start_index)
         # assert no overlap!
         if (self.overlaps(result)):
             raise SampleException("Overlapping blocks in sieve list: %s" % result)
@@ -164,6 +171,20 @@ class Chunker(object):
         return_list['non_data_chunk_list'] = self.add_timestamps(return_list['non_data_chunk_list'])
         log.debug("Generated return list: %s", return_list)
         return return_list    
+
+    def _run_sieve(self, start_index):
+        """
+        Run the sieve over the buffer from start_index to the end. Incremental
+        sieves are only fed what lies past their resume index.
+
+        @param start_index The buffer index to start sieving from
+        @retval A list of (start, end) tuples relative to start_index
+        """
+        if isinstance(self.sieve, IncrementalSieve):
+            scan_index = max(start_index, self.sieve.resume_index)
+            return [(s - start_index, e - start_index) for (s, e) in
+                    self.sieve.feed(self.buffer[scan_index:], scan_index)]
+        return self.sieve(self.buffer[start_index:])
     
     def add_timestamps(self, start_end_list):
         """
@@ -335,6 +356,10 @@ class Chunker(object):
             self.buffer = self.buffer[end_index:]
         else:
             self.buffer[0:end_index] = []
+
+        # keep an incremental sieve in buffer coordinates
+        if isinstance(self.sieve, IncrementalSieve):
+            self.sieve.rebase(end_index)
         
     def get_next_non_data_with_index(self, clean=True):
         """
@@ -473,4 +498,812 @@ class BinaryChunker(Chunker):
     def __init__(self, data_sieve_fn):
         Chunker.__init__(self, data_sieve_fn)
         self.buffer = []
-    
\ No newline at end of file
+    
+
+
+class RingBufferChunker(Chunker):
+    """
+    A chunker engine that keeps the buffer in a growable bytearray with a
+    moving base offset instead of re-slicing a string on every add and get.
+    Chunk lists are kept in absolute stream coordinates, so consuming a block
+    only advances the base offset and trims the front of the lists. Raw chunk
+    timestamps are found by bisecting the raw chunk list and the sieve is
+    resumed from a cursor rather than the beginning of the buffer.
+
+    The buffer, the chunk lists and the get_next_* methods present the same
+    buffer relative view as the original Chunker, so this is a drop in
+    replacement for drivers and parsers that want to opt in.
+    """
+    # Compact the bytearray once at least this much has been consumed and
+    # the consumed prefix is larger than what remains.
+    COMPACT_SIZE = 4096
+
+    def __init__(self, data_sieve_fn):
+        """
+        Initialize the buffer and the absolute indexing structures. See
+        Chunker.__init__ for the sieve function contract.
+        """
+        self.sieve = data_sieve_fn
+
+        # self._buffer[0] sits at absolute stream offset self._offset,
+        # everything before self._base has been consumed
+        self._buffer = bytearray()
+        self._offset = 0
+        self._base = 0
+
+        # raw chunks are appended and consumed from the front, the head
+        # index avoids shifting the list on every consume
+        self._raw_chunks = []
+        self._raw_ends = []
+        self._raw_head = 0
+
+        self._data_chunks = deque()
+        self._nondata_chunks = deque()
+
+    ########################################################################
+    # Buffer relative views
+    ########################################################################
+    def _get_buffer(self):
+        return self._block(self._base, self._end())
+
+    def _set_buffer(self, value):
+        self._buffer = bytearray(value)
+        self._offset = self._base
+        if isinstance(self.sieve, IncrementalSieve):
+            self.sieve.reset(self._base)
+
+    buffer = property(_get_buffer, _set_buffer)
+
+    def _get_raw_chunk_list(self):
+        return self._relative(self._raw_chunks[self._raw_head:])
+
+    def _set_raw_chunk_list(self, chunk_list):
+        self._raw_chunks = self._absolute(chunk_list)
+        self._raw_ends = [e for (s, e, t) in self._raw_chunks]
+        self._raw_head = 0
+
+    raw_chunk_list = property(_get_raw_chunk_list, _set_raw_chunk_list)
+
+    def _get_data_chunk_list(self):
+        return self._relative(self._data_chunks)
+
+    def _set_data_chunk_list(self, chunk_list):
+        self._data_chunks = deque(self._absolute(chunk_list))
+
+    data_chunk_list = property(_get_data_chunk_list, _set_data_chunk_list)
+
+    def _get_nondata_chunk_list(self):
+        return self._relative(self._nondata_chunks)
+
+    def _set_nondata_chunk_list(self, chunk_list):
+        self._nondata_chunks = deque(self._absolute(chunk_list))
+
+    nondata_chunk_list = property(_get_nondata_chunk_list,
+                                  _set_nondata_chunk_list)
+
+    def _relative(self, chunk_list):
+        base = self._base
+        return [(s - base, e - base, t) for (s, e, t) in chunk_list]
+
+    def _absolute(self, chunk_list):
+        base = self._base
+        return [(s + base, e + base, t) for (s, e, t) in chunk_list]
+
+    ########################################################################
+    # Adding data
+    ########################################################################
+    def add_chunk(self, raw_data, timestamp):
+        """
+        Adds a chunk of data to the end of the buffer, records it in the raw
+        chunk list and sieves the unmatched tail of the buffer.
+
+        @param raw_data The bunch of raw data as a string or bytearray
+        @param timestamp The time (in NTP4 float format) that the data was
+            collected at the port agent
+        """
+        assert isinstance(timestamp, float)
+        start_index = self._end()
+        self._buffer.extend(raw_data)
+        self._index_chunk(start_index, self._end(), timestamp)
+
+    def _index_chunk(self, start_index, end_index, timestamp):
+        """
+        Record newly added data in the raw chunk list and sieve the unmatched
+        tail of the buffer.
+
+        @param start_index The absolute offset of the new data
+        @param end_index The absolute offset one past the new data
+        @param timestamp The time the data was collected at
+        """
+        self._raw_chunks.append((start_index, end_index, timestamp))
+        self._raw_ends.append(end_index)
+
+        sieve_start = self._sieve_start()
+        (data_list, nondata_list) = self._sieve_from(sieve_start, timestamp)
+
+        self._data_chunks.extend(data_list)
+        self._merge_nondata(sieve_start, data_list, nondata_list)
+
+        log.trace("Added chunk, data_chunk_list: %s, nondata_chunk_list: %s",
+                  self._data_chunks, self._nondata_chunks)
+
+    def _end(self):
+        """
+        @retval The absolute offset one past the last byte in the buffer
+        """
+        return self._offset + len(self._buffer)
+
+    def _sieve_start(self):
+        """
+        The resume cursor for the sieve. Nothing before the end of the last
+        recognized data block can start a new block, so that is where the
+        next sieve pass starts. With no pending data blocks the whole
+        unconsumed buffer is sieved, as the original Chunker does.
+
+        @retval The absolute offset to start sieving from
+        """
+        if self._data_chunks:
+            return self._data_chunks[-1][1]
+        return self._base
+
+    def _sieve_from(self, start_index, timestamp):
+        """
+        Run the sieve over the buffer from start_index to the end and turn
+        the result into data and non-data chunk lists.
+
+        @param start_index The absolute offset to start sieving from
+        @param timestamp The timestamp for the non-data block when the sieve
+            finds nothing
+        @retval A tuple of (data_list, nondata_list) of (start, end, time)
+            tuples in absolute coordinates
+        @throws SampleException if the sieve returns overlapping blocks
+        """
+        result = self._run_sieve(start_index)
+        if (self.overlaps(result)):
+            raise SampleException("Overlapping blocks in sieve list: %s" % result)
+        result.sort()
+
+        data_list = []
+        nondata_list = []
+
+        if result == []:
+            nondata_list.append((start_index, self._end(), timestamp))
+
+        previous_end = start_index
+        for (s, e) in result:
+            s += start_index
+            e += start_index
+            assert(s >= previous_end)
+            data_list.append((s, e, self._timestamp_at(s)))
+            if (s > previous_end):
+                nondata_list.append((previous_end, s,
+                                     self._timestamp_at(previous_end)))
+            previous_end = e
+
+        return (data_list, nondata_list)
+
+    def _run_sieve(self, start_index):
+        """
+        Run the sieve over the buffer from an absolute start index. The
+        chunker never rebases, so incremental sieves work in absolute stream
+        offsets.
+
+        @param start_index The absolute offset to start sieving from
+        @retval A list of (start, end) tuples relative to start_index
+        """
+        if isinstance(self.sieve, IncrementalSieve):
+            scan_index = max(start_index, self.sieve.resume_index)
+            return [(s - start_index, e - start_index) for (s, e) in
+                    self.sieve.feed(self._sieve_input(scan_index), scan_index)]
+        return self.sieve(self._sieve_input(start_index))
+
+    def _sieve_input(self, start_index):
+        """
+        @retval The buffer contents from start_index to the end as a string
+        """
+        return memoryview(self._buffer)[start_index - self._offset:].tobytes()
+
+    def _timestamp_at(self, index):
+        """
+        @param index An absolute buffer offset
+        @retval The timestamp of the raw chunk holding that offset
+        """
+        position = bisect_right(self._raw_ends, index, self._raw_head)
+        return self._raw_chunks[position][2]
+
+    def _merge_nondata(self, sieve_start, data_list, nondata_list):
+        """
+        Splice freshly sieved non-data blocks into the non-data list. Blocks
+        that became the start of a data block are dropped, and the first
+        block reaching into the newly sieved region is extended to cover the
+        first new non-data block, keeping its original timestamp.
+
+        @param sieve_start The absolute offset the sieve started from
+        @param data_list The new data blocks
+        @param nondata_list The new non-data blocks
+        """
+        data_starts = set(s for (s, e, t) in data_list)
+
+        tail = []
+        while self._nondata_chunks and self._nondata_chunks[-1][1] >= sieve_start:
+            chunk = self._nondata_chunks.pop()
+            if chunk[0] not in data_starts:
+                tail.append(chunk)
+        tail.reverse()
+
+        if nondata_list == []:
+            self._nondata_chunks.extend(tail)
+            return
+
+        (first_s, first_e, first_t) = nondata_list[0]
+        remaining = nondata_list
+        for (s, e, t) in tail:
+            if e >= first_s:
+                self._nondata_chunks.append((s, first_e, t))
+                remaining = nondata_list[1:]
+                break
+            self._nondata_chunks.append((s, e, t))
+        self._nondata_chunks.extend(remaining)
+
+    def _generate_data_lists(self, timestamp, start_index=0):
+        """
+        Sieve the buffer from a buffer relative start index without changing
+        any state. Provided for compatibility with Chunker.
+
+        @param timestamp The timestamp to use for an all non-data result
+        @param start_index The buffer relative index to start from
+        @retval A dict with keys "data_chunk_list" and "non_data_chunk_list"
+            in buffer relative coordinates
+        """
+        (data_list, nondata_list) = self._sieve_from(self._base + start_index,
+                                                     timestamp)
+        return {'data_chunk_list': self._relative(data_list),
+                'non_data_chunk_list': self._relative(nondata_list)}
+
+    ########################################################################
+    # Fetching data
+    ########################################################################
+    def get_next_data_with_index(self, clean=True):
+        """
+        Get the next chunk of data from the buffer. By default, it clears all
+        that comes before it.
+
+        @param clean If set to false, do not clear the buffer when fetching the
+            data, but simply return the data block and make no further changes.
+        @return A tuple of (timestamp, data_chunk, start_index, end_index)
+            with buffer relative indices, (None, None, None, None) if no data
+        """
+        if not self._data_chunks:
+            return (None, None, None, None)
+
+        if clean:
+            (next_start, next_end, timestamp) = self._data_chunks.popleft()
+        else:
+            (next_start, next_end, timestamp) = self._data_chunks[0]
+
+        next_block = self._block(next_start, next_end)
+        relative = (next_start - self._base, next_end - self._base)
+
+        if clean:
+            self._consume(next_end)
+
+        return (timestamp, next_block) + relative
+
+    def get_next_non_data_with_index(self, clean=True):
+        """
+        Get the next chunk of non-data from the buffer. By default, it clears
+        all that comes before it.
+
+        @param clean Remove the buffer contents before and including this data
+        @return A tuple of (timestamp, data_chunk, start_index, end_index)
+            with buffer relative indices, (None, None, None, None) if no data
+        """
+        if not self._nondata_chunks:
+            return (None, None, None, None)
+
+        if clean:
+            (next_start, next_end, timestamp) = self._nondata_chunks.popleft()
+        else:
+            (next_start, next_end, timestamp) = self._nondata_chunks[0]
+
+        next_block = self._block(next_start, next_end)
+        relative = (next_start - self._base, next_end - self._base)
+
+        if clean:
+            self._consume(next_end)
+
+        return (timestamp, next_block) + relative
+
+    def get_next_raw(self, clean=True):
+        """
+        Get the next chunk of raw data from the buffer. By default, it clears
+        all that comes before it. Data blocks that are torn apart by this are
+        removed and whatever is left of them becomes non-data.
+
+        @param clean Remove the buffer contents before and including this data
+        @return A tuple of (timestamp, data_chunk), (None, None) if empty
+        """
+        if self._raw_head >= len(self._raw_chunks):
+            return (None, None)
+
+        (next_start, next_end, timestamp) = self._raw_chunks[self._raw_head]
+        next_block = self._block(next_start, next_end)
+
+        if clean:
+            torn = []
+            while self._data_chunks and self._data_chunks[0][0] < next_end:
+                (s, e, t) = self._data_chunks.popleft()
+                if e > next_end:
+                    torn.append((next_end, e, t))
+            self._consume(next_end)
+            self._nondata_chunks.extendleft(reversed(torn))
+
+        return (timestamp, next_block)
+
+    def _block(self, start, end):
+        """
+        @param start absolute start offset
+        @param end absolute end offset
+        @retval The buffer contents between start and end
+        """
+        view = memoryview(self._buffer)
+        return view[start - self._offset:end - self._offset].tobytes()
+
+    ########################################################################
+    # Consuming data
+    ########################################################################
+    def _clean_buffer(self, end_index):
+        """
+        Consume the buffer up to a buffer relative index, keeping the chunk
+        lists in sync.
+        @param end_index the last index used...clean up to here
+        """
+        self._consume(self._base + end_index)
+
+    def _consume(self, index):
+        """
+        Drop everything before an absolute offset. Chunks ending at or before
+        the offset are removed, chunks straddling it are trimmed to start
+        there.
+
+        @param index The absolute offset to consume up to
+        """
+        if index <= self._base:
+            return
+        self._base = index
+
+        self._clip_deque(self._data_chunks, index)
+        self._clip_deque(self._nondata_chunks, index)
+
+        raw_chunks = self._raw_chunks
+        head = self._raw_head
+        while head < len(raw_chunks) and raw_chunks[head][0] < index:
+            (s, e, t) = raw_chunks[head]
+            if e > index:
+                raw_chunks[head] = (index, e, t)
+                break
+            head += 1
+        self._raw_head = head
+
+        if head > len(raw_chunks) / 2:
+            del raw_chunks[:head]
+            del self._raw_ends[:head]
+            self._raw_head = 0
+
+        self._compact()
+
+    def _compact(self):
+        """
+        Drop the consumed front of the bytearray once it is worth the copy
+        """
+        consumed = self._base - self._offset
+        if consumed >= self.COMPACT_SIZE and consumed > len(self._buffer) / 2:
+            del self._buffer[:consumed]
+            self._offset = self._base
+
+    @staticmethod
+    def _clip_deque(chunks, index):
+        """
+        Trim the front of a sorted chunk deque up to an absolute offset
+        """
+        while chunks and chunks[0][0] < index:
+            (s, e, t) = chunks.popleft()
+            if e > index:
+                chunks.appendleft((index, e, t))
+                break
+
+
+class RingBufferStringChunker(RingBufferChunker):
+    """
+    A ring buffer chunker that hands back blocks as strings, the equivalent
+    of StringChunker.
+    """
+
+
+class RingBufferBinaryChunker(RingBufferChunker):
+    """
+    A ring buffer chunker that hands back blocks as bytearrays for binary
+    instrument streams.
+    """
+    def _block(self, start, end):
+        return self._buffer[start - self._offset:end - self._offset]
+
+
+class MappedChunker(RingBufferChunker):
+    """
+    A ring buffer chunker over a read only memory mapped file. The map is the
+    buffer, indexed by file offset, so absolute chunker offsets are file
+    offsets. Adding data only moves the end of the window the sieve and the
+    get_next_* methods can see, nothing is copied into the chunker; the
+    blocks handed out and the sieve input are sliced out of the map as
+    strings.
+    """
+    def __init__(self, data_sieve_fn, mapped_file, start_index=0):
+        """
+        @param data_sieve_fn See Chunker.__init__
+        @param mapped_file An mmap, or anything that slices into strings
+        @param start_index The file offset the window starts at
+        """
+        RingBufferChunker.__init__(self, data_sieve_fn)
+        self._buffer = mapped_file
+        self._window_end = start_index
+        self._reset(start_index)
+
+    buffer = property(RingBufferChunker._get_buffer)
+
+    def add_chunk(self, raw_data, timestamp):
+        raise NotImplementedException("Data is added to a MappedChunker with add_range()")
+
+    def add_range(self, start_index, end_index, timestamp):
+        """
+        Extend the window to end_index and sieve what was added. If
+        start_index isn't the end of the window the file was read from
+        somewhere else, so the window is emptied and restarted there.
+
+        @param start_index The file offset of the new data
+        @param end_index The file offset one past the new data
+        @param timestamp The time (in NTP4 float format) the data was read at
+        """
+        assert isinstance(timestamp, float)
+        assert start_index <= end_index <= len(self._buffer)
+        if start_index != self._window_end:
+            self._reset(start_index)
+        self._window_end = end_index
+        self._index_chunk(start_index, end_index, timestamp)
+
+    def _reset(self, index):
+        """
+        Forget everything in the window and start it again at a file offset
+        """
+        self._base = index
+        self._window_end = index
+        self._raw_chunks = []
+        self._raw_ends = []
+        self._raw_head = 0
+        self._data_chunks.clear()
+        self._nondata_chunks.clear()
+        if isinstance(self.sieve, IncrementalSieve):
+            self.sieve.reset(index)
+
+    def _end(self):
+        return self._window_end
+
+    def _sieve_input(self, start_index):
+        return self._buffer[start_index:self._window_end]
+
+    def _block(self, start, end):
+        return self._buffer[start:end]
+
+    def _compact(self):
+        pass
+
+
+class IncrementalSieve(object):
+    """
+    Base class for stateful sieves. A plain sieve function is handed the
+    whole unconsumed tail of the chunker buffer every time data arrives, so
+    long non-data runs and partial records get rescanned on every packet.
+    An incremental sieve remembers its resume index, the offset before which
+    it has proven no new block can start, and the chunker only feeds it the
+    data from there on.
+
+    Offsets are in the coordinates of the chunker using the sieve. The
+    Chunker rebases the sieve when it cleans its buffer; if the buffer of a
+    Chunker is replaced directly, reset() the sieve as well.
+
+    Instances are also callable like a plain sieve function, without
+    touching the sieve state, so they can be used with driver chunker tests.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self, resume_index=0):
+        """
+        Forget everything scanned so far
+        @param resume_index Where the next scan should start
+        """
+        self.resume_index = resume_index
+
+    def rebase(self, index):
+        """
+        Shift the sieve state after the chunker dropped data before index
+        @param index The number of characters removed from the buffer front
+        """
+        self.resume_index = max(0, self.resume_index - index)
+
+    def feed(self, data, offset):
+        """
+        Scan newly available data and advance the resume index.
+
+        @param data The buffer contents from offset to the end of the buffer
+        @param offset The buffer offset of data[0]
+        @retval A list of (start, end) tuples in buffer coordinates for each
+            block completed in data, in order and without overlap
+        """
+        (spans, resume_index) = self._scan(data, offset)
+        self.resume_index = max(self.resume_index, resume_index)
+        return spans
+
+    def __call__(self, raw_data):
+        """
+        Plain sieve function interface, leaves the sieve state alone
+        """
+        (spans, resume_index) = self._scan(raw_data, 0)
+        return spans
+
+    def _scan(self, data, offset):
+        """
+        Find the complete blocks in data. Must be implemented by subclasses.
+
+        @param data The data to scan
+        @param offset The buffer offset of data[0]
+        @retval A tuple of (spans, resume_index) where spans is a list of
+            (start, end) tuples in buffer coordinates and resume_index is
+            the offset before which no further block can start
+        """
+        raise NotImplementedException("_scan() not overridden!")
+
+
+class RegexSieve(IncrementalSieve):
+    """
+    Incremental version of Chunker.regex_sieve_function. Scanning resumes
+    after the last match. When the longest possible match is known, the
+    sieve can also skip over non-data runs: a block starting more than
+    max_length characters before the end of the data would already have
+    matched.
+    """
+    def __init__(self, regex_list, max_length=None):
+        """
+        @param regex_list a list of pre-compiled regexes that will identify
+            some flavor of a pattern in the raw data
+        @param max_length The longest block any of the regexes can match,
+            None if unbounded
+        """
+        self.regex_list = regex_list
+        self.max_length = max_length
+        IncrementalSieve.__init__(self)
+
+    def _scan(self, data, offset):
+        spans = [(s + offset, e + offset) for (s, e) in self._find(data)]
+
+        resume_index = offset
+        if spans:
+            resume_index = max(e for (s, e) in spans)
+        if self.max_length is not None:
+            resume_index = max(resume_index,
+                               offset + len(data) - self.max_length + 1)
+        return (spans, resume_index)
+
+    def _find(self, data):
+        """
+        @retval A sorted list of (start, end) tuples for every match in data
+        """
+        spans = []
+        for matcher in self.regex_list:
+            for match in matcher.finditer(data):
+                spans.append((match.start(), match.end()))
+        spans.sort()
+        return spans
+
+
+class CombinedRegexSieve(RegexSieve):
+    """
+    A regex sieve that compiles a list of tagged patterns into a single
+    alternation of named groups, so the buffer is scanned once instead of
+    once per pattern. Where patterns compete for the same data the earliest
+    match wins, and at the same position the pattern listed first wins, so
+    the blocks come back in order and without overlap. Patterns compiled
+    with different flags are combined per set of flags.
+
+    The tag of the pattern a block matched can be recovered with classify(),
+    which lets _got_chunk dispatch on the tag instead of trying every
+    particle regex in turn. Patterns must not share group names or use
+    numbered back references.
+    """
+    def __init__(self, patterns, max_length=None):
+        """
+        @param patterns A list of (tag, regex) tuples in priority order. The
+            regex can be a pattern string or a compiled regex.
+        @param max_length The longest block any of the patterns can match,
+            None if unbounded
+        """
+        self.tags = []
+        groups = {}
+        for (index, (tag, regex)) in enumerate(patterns):
+            if isinstance(regex, basestring):
+                regex = re.compile(regex)
+            self.tags.append(tag)
+            groups.setdefault(regex.flags, []).append(
+                '(?P<_sieve%d>%s)' % (index, regex.pattern))
+
+        matchers = [re.compile('|'.join(alternatives), flags)
+                    for (flags, alternatives) in groups.items()]
+        RegexSieve.__init__(self, matchers, max_length)
+
+    def _tag_index(self, match):
+        # the wrapping group is the outermost, so it is always the last
+        # group closed in a match
+        return int(match.lastgroup[len('_sieve'):])
+
+    def tagged(self, raw_data):
+        """
+        Scan the data once and tag each block with its pattern.
+
+        @param raw_data The data to scan
+        @retval A list of (tag, start, end) tuples in order and without
+            overlap
+        """
+        found = []
+        for matcher in self.regex_list:
+            for match in matcher.finditer(raw_data):
+                found.append((match.start(), self._tag_index(match),
+                              match.end()))
+
+        if len(self.regex_list) > 1:
+            found.sort()
+
+        result = []
+        last_end = 0
+        for (start, index, end) in found:
+            if start >= last_end:
+                result.append((self.tags[index], start, end))
+                last_end = end
+        return result
+
+    def _find(self, data):
+        return [(s, e) for (tag, s, e) in self.tagged(data)]
+
+    def classify(self, chunk):
+        """
+        Find the pattern a block from this sieve matched.
+
+        @param chunk A block of data handed out by the chunker
+        @retval The tag of the first pattern matching at the start of the
+            chunk, None if no pattern matches
+        """
+        best = None
+        for matcher in self.regex_list:
+            match = matcher.match(chunk)
+            if match:
+                index = self._tag_index(match)
+                if best is None or index < best:
+                    best = index
+        if best is None:
+            return None
+        return self.tags[best]
+
+
+class LengthPrefixedSieve(IncrementalSieve):
+    """
+    Incremental sieve for binary records that start with a sync pattern and
+    carry their own length in a fixed header field. Records are walked by
+    their length field instead of being matched with a regex, and scanning
+    resumes at the first incomplete record.
+    """
+    def __init__(self, sync, length_offset, length_format, length_adjust=0,
+                 max_length=None, validator=None):
+        """
+        @param sync The string every record starts with
+        @param length_offset Offset of the length field from the record start
+        @param length_format struct format of the length field, e.g. '<H'
+        @param length_adjust Added to the length field value to get the full
+            record length (e.g. the size of a trailing checksum)
+        @param max_length Records claiming to be longer are treated as a
+            false sync, None for no limit
+        @param validator Optional function taking (data, start, end) that
+            returns False for a complete but invalid record
+        """
+        self.sync = sync
+        self.length_offset = length_offset
+        self.length_format = length_format
+        self.length_adjust = length_adjust
+        self.max_length = max_length
+        self.validator = validator
+        self.header_size = length_offset + calcsize(length_format)
+        IncrementalSieve.__init__(self)
+
+    def _scan(self, data, offset):
+        spans = []
+        pending = None
+        data_length = len(data)
+        position = data.find(self.sync)
+
+        while position >= 0:
+            end = None
+            if position + self.header_size <= data_length:
+                length = unpack_from(self.length_format, data,
+                                     position + self.length_offset)[0]
+                length += self.length_adjust
+                if length < self.header_size or \
+                   (self.max_length is not None and length > self.max_length):
+                    length = None
+                elif position + length <= data_length:
+                    end = position + length
+                    if self.validator is not None and \
+                       not self.validator(data, position, end):
+                        end = None
+                elif pending is None:
+                    pending = position
+            elif pending is None:
+                pending = position
+
+            if end is not None:
+                spans.append((position + offset, end + offset))
+                # anything pending before a complete record is abandoned
+                pending = None
+                position = data.find(self.sync, end)
+            else:
+                position = data.find(self.sync, position + 1)
+
+        if pending is not None:
+            resume_index = pending
+        else:
+            # a partial sync pattern may sit at the very end
+            resume_index = max(data_length - len(self.sync) + 1, 0)
+            if spans:
+                resume_index = max(resume_index, spans[-1][1] - offset)
+        return (spans, resume_index + offset)
+
+
+class PD0Framer(LengthPrefixedSieve):
+    """
+    Frames Teledyne RDI PD0 ensembles. An ensemble starts with 0x7f7f
+    followed by the little endian number of bytes in the ensemble, which
+    covers everything but the trailing 16 bit checksum. Ensembles are walked
+    by that length and only those whose checksum (the sum of all preceding
+    bytes modulo 65536) matches are handed out, so there is no need to match
+    variable length binary records with regexes.
+    """
+    SYNC = '\x7f\x7f'
+    CHECKSUM_SIZE = 2
+
+    def __init__(self, max_length=None, verify_checksum=True):
+        """
+        @param max_length Ensembles claiming to be longer are treated as a
+            false sync, None for no limit
+        @param verify_checksum Skip ensembles with a bad checksum
+        """
+        validator = None
+        if verify_checksum:
+            validator = self.checksum_valid
+        LengthPrefixedSieve.__init__(self, self.SYNC, 2, '<H',
+                                     length_adjust=self.CHECKSUM_SIZE,
+                                     max_length=max_length,
+                                     validator=validator)
+
+    @staticmethod
+    def checksum(data, start, end):
+        """
+        @retval The PD0 checksum of data[start:end]
+        """
+        return pd0_decoder.checksum(data, start, end)
+
+    @staticmethod
+    def checksum_valid(data, start, end):
+        """
+        @retval True if the ensemble in data[start:end] carries a matching
+            checksum in its last two bytes
+        """
+        checksum_index = end - PD0Framer.CHECKSUM_SIZE
+        return PD0Framer.checksum(data, start, checksum_index) == \
+            unpack_from('<H', data, checksum_index)[0]
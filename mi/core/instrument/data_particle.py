@@ -22,6 +22,11 @@ try:
 except ImportError:
     warn("Failed to import simplejson; particle generation will be slower.")
     import json
+from json.encoder import JSONEncoder, encode_basestring_ascii, c_make_encoder
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 from mi.core.common import BaseEnum
 from mi.core.exceptions import SampleException, ReadOnlyException, NotImplementedException, InstrumentParameterException
@@ -57,7 +62,134 @@ class DataParticleValue(BaseEnum):
     OUT_OF_RANGE = "out_of_range"
     INVALID = "invalid"
     QUESTIONABLE = "questionable"
-    
+
+# Upper bound on the number of compiled particle layouts kept by ParticleEncoder
+MAX_ENCODER_TEMPLATES = 1000
+
+INFINITY = float('inf')
+
+def _encode_float(value, _repr=float.__repr__):
+    """
+    Encode a float the way the json C encoder does
+    """
+    if value != value:
+        return 'NaN'
+    if value == INFINITY:
+        return 'Infinity'
+    if value == -INFINITY:
+        return '-Infinity'
+    return _repr(value)
+
+_VALUE_ENCODERS = {
+    float: _encode_float,
+    int: str,
+    long: str,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+    str: encode_basestring_ascii,
+    unicode: encode_basestring_ascii,
+}
+
+class ParticleEncoder(object):
+    """
+    Encodes particles of one layout, the header keys and the value ids, to
+    the same JSON json.dumps produces for generate_dict(). Everything but the
+    values is compiled into a format string once, so a particle costs one
+    encoder pass over a flat list rather than building and walking the
+    nested value dicts.
+    """
+    _templates = {}
+
+    def __init__(self, keys, value_ids, sort_keys=False):
+        """
+        @param keys The header keys, including VALUES, in the order json
+            will emit them
+        @param value_ids The value ids in the order of the parsed values
+        @param sort_keys True to match json.dumps(..., sort_keys=True)
+        """
+        self.sort_keys = sort_keys
+        position = list(keys).index(DataParticleKey.VALUES)
+        self._before = list(keys[:position])
+        self._after = list(keys[position + 1:])
+
+        value_keys = {DataParticleKey.VALUE_ID: None, DataParticleKey.VALUE: None}.keys()
+        if sort_keys:
+            value_keys.sort()
+
+        values = []
+        for value_id in value_ids:
+            fields = []
+            for key in value_keys:
+                if key == DataParticleKey.VALUE_ID:
+                    field = '%s: %s' % (encode_basestring_ascii(key), encode_basestring_ascii(value_id))
+                    fields.append(field.replace('%', '%%'))
+                else:
+                    fields.append(encode_basestring_ascii(key).replace('%', '%%') + ': %s')
+            values.append('{' + ', '.join(fields) + '}')
+
+        fields = []
+        for key in keys:
+            name = encode_basestring_ascii(key).replace('%', '%%')
+            if key == DataParticleKey.VALUES:
+                fields.append('%s: [%s]' % (name, ', '.join(values)))
+            else:
+                fields.append(name + ': %s')
+        self._template = '{' + ', '.join(fields) + '}'
+
+    @classmethod
+    def get(cls, keys, value_ids, sort_keys=False):
+        """
+        Return the encoder for a particle layout, compiling it on first use
+        @param keys Tuple of header keys in json order
+        @param value_ids Sequence of value ids
+        @param sort_keys True for sorted json
+        """
+        layout = (keys, tuple(value_ids), sort_keys)
+        encoder = cls._templates.get(layout)
+        if encoder is None:
+            if len(cls._templates) >= MAX_ENCODER_TEMPLATES:
+                cls._templates.clear()
+            encoder = cls._templates[layout] = cls(keys, layout[1], sort_keys)
+        return encoder
+
+    def _encode(self, value):
+        """
+        Encode a single value to json
+        """
+        encode = _VALUE_ENCODERS.get(type(value))
+        if encode is not None:
+            return encode(value)
+        if isinstance(value, float):
+            return _encode_float(value)
+        return json.dumps(value, sort_keys=self.sort_keys)
+
+    def encode(self, header, values):
+        """
+        @param header The base structure with the stream name
+        @param values The parsed values in value id order
+        @retval A JSON string
+        """
+        args = [header[key] for key in self._before]
+        args.extend(values)
+        args.extend([header[key] for key in self._after])
+
+        # The C encoder hands back a list as '[', value, ', ', value ... ']'
+        # chunks. Values that are containers span several chunks, so those
+        # particles are encoded a value at a time instead.
+        if _list_encoders is not None:
+            chunks = _list_encoders[self.sort_keys](args, 0)
+            if len(chunks) == 2 * len(args) + 1:
+                return self._template % tuple(chunks[1::2])
+
+        return self._template % tuple([self._encode(value) for value in args])
+
+if c_make_encoder is not None:
+    _list_encoders = dict((sort_keys, c_make_encoder(None, JSONEncoder().default, encode_basestring_ascii, None,
+                                                     ': ', ', ', sort_keys, False, True))
+                          for sort_keys in (False, True))
+else:
+    _list_encoders = None
+
 class DataParticle(object):
     """
     This class is responsible for storing and ultimately generating data
@@ -208,10 +340,74 @@ class DataParticle(object):
            and driver timestamp
         @throws InstrumentDriverException If there is a problem with the inputs
         """
-        result = self.generate_dict()
-        json_result = json.dumps(result, sort_keys=sorted)
-        return json_result
-        
+        if not self._use_parsed_tuple():
+            result = self.generate_dict()
+            json_result = json.dumps(result, sort_keys=sorted)
+            return json_result
+
+        result = self._build_header()
+        (value_ids, values) = self._build_parsed_tuple()
+        keys = result.keys()
+        if sorted:
+            keys.sort()
+        return ParticleEncoder.get(tuple(keys), value_ids, sorted).encode(result, values)
+
+    def generate_packed(self):
+        """
+        Generate a compact msgpack encoding of the particle, a list of the
+        header, the value ids and the values. unpack_particle turns it back
+        into the generate_dict() structure.
+        @retval A msgpack string
+        @throws NotImplementedException if msgpack is not installed
+        """
+        if msgpack is None:
+            raise NotImplementedException("msgpack not installed")
+
+        if self._use_parsed_tuple():
+            result = self._build_header()
+            (value_ids, values) = self._build_parsed_tuple()
+        else:
+            result = self.generate_dict()
+            values = result[DataParticleKey.VALUES]
+            # values carrying more than an id, ie the binary flag, are
+            # packed as they are
+            if all(len(value) == 2 for value in values):
+                value_ids = [value[DataParticleKey.VALUE_ID] for value in values]
+                values = [value[DataParticleKey.VALUE] for value in values]
+            else:
+                value_ids = None
+
+        del result[DataParticleKey.VALUES]
+        return msgpack.packb([result, value_ids, values], use_bin_type=True)
+
+    def _build_header(self):
+        """
+        Build the particle structure without its values, as generate_dict
+        does, with a VALUES placeholder so key order matches it.
+        """
+        if not self._check_preferred_timestamps():
+            raise SampleException("Preferred timestamp not in particle!")
+
+        result = self._build_base_structure()
+        result[DataParticleKey.STREAM_NAME] = self.data_particle_type()
+        result[DataParticleKey.VALUES] = None
+        return result
+
+    @classmethod
+    def _use_parsed_tuple(cls):
+        """
+        True when the particle values come from _build_parsed_tuple, so
+        generate can skip building the value dicts. A subclass overriding
+        _build_parsed_values or generate_dict keeps the original path.
+        """
+        use = cls.__dict__.get('_parsed_tuple_path')
+        if use is None:
+            use = (cls._build_parsed_tuple.im_func is not DataParticle._build_parsed_tuple.im_func and
+                   cls._build_parsed_values.im_func is DataParticle._build_parsed_values.im_func and
+                   cls.generate_dict.im_func is DataParticle.generate_dict.im_func)
+            cls._parsed_tuple_path = use
+        return use
+
     def _build_parsed_values(self):
         """
         Build values of a parsed structure. Just the values are built so
@@ -221,7 +417,24 @@ class DataParticle(object):
         @return the values tag for this data structure ready to JSONify
         @raises SampleException when parsed values can not be properly returned
         """
-        raise SampleException("Parsed values block not overridden")
+        parsed = self._build_parsed_tuple()
+        if parsed is None:
+            raise SampleException("Parsed values block not overridden")
+
+        return [{DataParticleKey.VALUE_ID: value_id, DataParticleKey.VALUE: value}
+                for (value_id, value) in zip(*parsed)]
+
+    def _build_parsed_tuple(self):
+        """
+        Optional fast path for _build_parsed_values. A particle may
+        implement this instead, returning its value ids and values as two
+        tuples in the same order. The ids are best kept in a class constant;
+        generate compiles one encoder per distinct id tuple.
+
+        @return (value ids, values), or None if not implemented
+        @raises SampleException when parsed values can not be properly returned
+        """
+        return None
 
 
     def _build_base_structure(self):
@@ -278,6 +491,24 @@ class DataParticle(object):
         
         return True
 
+def unpack_particle(data):
+    """
+    Rebuild the generate_dict() structure of a particle from
+    DataParticle.generate_packed output.
+    @param data A msgpack string
+    @retval A python dictionary with the timestamps and data values
+    @throws NotImplementedException if msgpack is not installed
+    """
+    if msgpack is None:
+        raise NotImplementedException("msgpack not installed")
+
+    (result, value_ids, values) = msgpack.unpackb(data, raw=False)
+    if value_ids is not None:
+        values = [{DataParticleKey.VALUE_ID: value_id, DataParticleKey.VALUE: value}
+                  for (value_id, value) in zip(value_ids, values)]
+    result[DataParticleKey.VALUES] = values
+    return result
+
 class RawDataParticleKey(BaseEnum):
     PAYLOAD = "raw"
     LENGTH = "length"
@@ -304,9 +535,11 @@ class RawDataParticle(DataParticle):
         if(not isinstance(port_agent_packet, dict)):
             raise SampleException("raw data not a dictionary")
 
-        for param in ["raw", "length", "type", "checksum"]:
+        for param in ["length", "type", "checksum"]:
              if(not param in port_agent_packet.keys()):
                   raise SampleException("raw data not a complete port agent packet. missing %s" % param)
+        if(not "raw" in port_agent_packet and not "raw_base64" in port_agent_packet):
+             raise SampleException("raw data not a complete port agent packet. missing raw")
 
 
         payload = None
@@ -314,11 +547,14 @@ class RawDataParticle(DataParticle):
         type = None
         checksum = None
 
-        # Attempt to convert values
-        try: 
-            payload = base64.b64encode(port_agent_packet.get("raw"))
-        except TypeError:
-            pass
+        # Attempt to convert values. Port agent clients encode the payload
+        # straight from their receive buffer.
+        payload = port_agent_packet.get("raw_base64")
+        if payload is None:
+            try:
+                payload = base64.b64encode(port_agent_packet.get("raw"))
+            except TypeError:
+                pass
 
         try: 
             length = int(port_agent_packet.get("length"))
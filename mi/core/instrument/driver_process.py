@@ -11,52 +11,189 @@ __author__ = 'Edward Hunter'
 __license__ = 'Apache 2.0'
 
 import logging
+from collections import deque
+from heapq import merge
+from itertools import count
 from threading import Thread
+from threading import Condition
 from subprocess import Popen
 from subprocess import PIPE
+from subprocess import MAXFD
 import signal
 import os
 import sys
 import time
 import traceback
+from mi.core.common import BaseEnum
 from mi.core.exceptions import InstrumentException, InstrumentCommandException
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.data_particle import DataParticleKey, CommonDataParticleType
+from mi.core.instrument import startup_stats
+from mi.core.instrument.startup_stats import StartupStatsKey
 
 from ooi.logging import log
 
+# Events held for the event thread before the queue policy applies
+DEFAULT_EVENT_QUEUE_SIZE = 10000
+
+# Log a warning every this many events dropped from a full queue
+DROPPED_EVENT_LOG_INTERVAL = 1000
+
+# How raw particles appear in a JSON encoded sample event value
+RAW_PARTICLE_TAG = '"%s": "%s"' % (DataParticleKey.STREAM_NAME, CommonDataParticleType.RAW)
+
+# Events carrying the whole current state or config, so only the latest
+# queued of each type is worth sending
+COALESCE_EVENTS = (DriverAsyncEvent.STATE_CHANGE, DriverAsyncEvent.CONFIG_CHANGE)
+
+# Events holding particles
+SAMPLE_EVENTS = (DriverAsyncEvent.SAMPLE, DriverAsyncEvent.SAMPLE_BATCH)
+
+
+class EventQueuePolicy(BaseEnum):
+    """
+    What send_event does when the event queue is full.
+    BLOCK - wait for the event thread to make room.
+    DROP_RAW - drop the oldest raw particle, else the oldest sample, else
+        the oldest event.
+    COALESCE - drop state and config changes superseded by a later one of
+        the same type, then as DROP_RAW.
+    """
+    BLOCK = 'block'
+    DROP_RAW = 'drop_raw'
+    COALESCE = 'coalesce'
+
+
+class ProcessStatsKey(BaseEnum):
+    """
+    Keys of the get_process_stats reply
+    """
+    QUEUE_POLICY = 'queue_policy'
+    QUEUE_SIZE = 'queue_size'
+    QUEUE_DEPTH = 'queue_depth'
+    HIGH_WATER_MARK = 'high_water_mark'
+    QUEUED = 'queued'
+    SENT = 'sent'
+    BLOCKED = 'blocked'
+    DROPPED_RAW = 'dropped_raw'
+    DROPPED_SAMPLE = 'dropped_sample'
+    DROPPED_OTHER = 'dropped_other'
+    COALESCED = 'coalesced'
+    STARTUP = 'startup'
+
+
+# Queues full event queues are dropped from, first to last, keyed by the
+# stats key counting their drops
+DROP_ORDER = (ProcessStatsKey.DROPPED_RAW, ProcessStatsKey.DROPPED_SAMPLE,
+              ProcessStatsKey.DROPPED_OTHER)
+
+
+def _event_type(evt):
+    if isinstance(evt, dict):
+        return evt.get('type')
+    return None
+
+
+def _is_raw_sample(evt):
+    """
+    @retval True if evt is a sample event holding a raw particle
+    """
+    if _event_type(evt) != DriverAsyncEvent.SAMPLE:
+        return False
+    value = evt.get('value')
+    if isinstance(value, basestring):
+        return RAW_PARTICLE_TAG in value
+    if isinstance(value, dict):
+        return value.get(DataParticleKey.STREAM_NAME) == CommonDataParticleType.RAW
+    return False
+
+
+def _drop_class(evt):
+    """
+    @retval The DROP_ORDER key of the queue evt is held in.
+    """
+    if _is_raw_sample(evt):
+        return ProcessStatsKey.DROPPED_RAW
+    if _event_type(evt) in SAMPLE_EVENTS:
+        return ProcessStatsKey.DROPPED_SAMPLE
+    return ProcessStatsKey.DROPPED_OTHER
+
+
 class DriverProcess(object):
     """
     Base class for messaging enabled OS-level driver processes. Provides
     run loop, dynamic driver import and construction and interface
     for messaging implementation subclasses.
     """
+
+    # A started DriverZygote to fork driver processes from, rather than
+    # starting an interpreter for each.
+    zygote = None
     
     @staticmethod
-    def launch_process(cmd_str):
+    def launch_process(cmd_str, keep_fd=None):
         """
         Base class static constructor. Launch the calling class as a
         separate OS level process. This method combines the derived class
         command string with the common python interpreter command.
         @param cmd_string The python command sequence to import, create and
         run a derived class object.
-        @retval a Popen object representing the dirver process.
+        @param keep_fd A file descriptor the process inherits, all others
+        but stdin, stdout and stderr are closed.
+        @retval a Popen object representing the dirver process, or a
+        ZygoteProcess if launched by the zygote.
         """
 
+        # The zygote's children can not inherit this process' descriptors.
+        if DriverProcess.zygote and keep_fd is None:
+            return DriverProcess.zygote.launch(cmd_str)
+
         # Launch a separate python interpreter, executing the calling
         # class command string.
         spawnargs = ['bin/python', '-c', cmd_str]
-        return Popen(spawnargs, close_fds=True)
+        if keep_fd is None:
+            return Popen(spawnargs, close_fds=True)
+
+        def close_fds():
+            os.closerange(3, keep_fd)
+            os.closerange(keep_fd + 1, MAXFD)
+        return Popen(spawnargs, close_fds=False, preexec_fn=close_fds)
         
-    def __init__(self, driver_module, driver_class, ppid):
+    def __init__(self, driver_module, driver_class, ppid,
+                 event_queue_size=DEFAULT_EVENT_QUEUE_SIZE,
+                 event_queue_policy=EventQueuePolicy.DROP_RAW):
         """
         @param driver_module The python module containing the driver code.
         @param driver_class The python driver class.
+        @param event_queue_size Most events held for the event thread.
+        @param event_queue_policy An EventQueuePolicy, what send_event does
+        when the queue is full.
         """
+        if not EventQueuePolicy.has(event_queue_policy):
+            raise ValueError('unknown event queue policy %s' % event_queue_policy)
+        if event_queue_size < 1:
+            raise ValueError('event queue size must be positive')
+
         self.driver_module = driver_module
         self.driver_class = driver_class
         self.ppid = ppid
         self.driver = None
-        self.events = []
+        # Events waiting to be sent as (sequence, event) in a queue per
+        # DROP_ORDER key, so a full queue drops in constant time, and the
+        # condition the event sender waits on for more and blocked senders
+        # wait on for room.
+        self.event_queues = dict((key, deque()) for key in DROP_ORDER)
+        self.queued_events = 0
+        self.event_sequence = count()
+        self.events_condition = Condition()
+        self.event_queue_size = event_queue_size
+        self.event_queue_policy = event_queue_policy
+        self.event_stats = dict((key, 0) for key in ProcessStatsKey.list())
+        # Count of each state and config change type in the queue, worth
+        # coalescing when there are more than one of a type.
+        self.queued_changes = dict.fromkeys(COALESCE_EVENTS, 0)
+        # StartupStatsKey times of importing and constructing the driver
+        self.driver_startup = {}
         self.messaging_started = False
         
     def construct_driver(self):
@@ -67,10 +204,15 @@ class DriverProcess(object):
         """
         import_str = 'import %s as dvr_mod' % self.driver_module
         ctor_str = 'driver = dvr_mod.%s(self.send_event)' % self.driver_class
+        tallies = startup_stats.get_stats()
         try:
+            start_time = time.time()
             exec import_str
+            import_time = time.time() - start_time
             log.info('Imported driver module %s' % self.driver_module)
+            start_time = time.time()
             exec ctor_str
+            construct_time = time.time() - start_time
             log.info('Constructed driver %s' % self.driver_class)
             
         except (ImportError, NameError, AttributeError) as e:
@@ -81,7 +223,38 @@ class DriverProcess(object):
 
         else:
             self.driver = driver
+            self.driver_startup = self._driver_startup(self.driver_module, import_time,
+                                                       construct_time, tallies)
             return True
+
+    def _driver_startup(self, name, import_time, construct_time, tallies):
+        """
+        Log the startup stats of a constructed driver.
+        @param name The driver name to log.
+        @param import_time Seconds taken importing the driver module.
+        @param construct_time Seconds taken constructing the driver.
+        @param tallies The startup_stats tallies before the import.
+        @retval A dict of StartupStatsKey values for the driver.
+        """
+        stats = startup_stats.difference(startup_stats.get_stats(), tallies)
+        stats[StartupStatsKey.IMPORT_TIME] = import_time
+        stats[StartupStatsKey.CONSTRUCT_TIME] = construct_time
+        log.info('Driver %s startup: import %.3fs, construct %.3fs, %d regex compiles %.3fs, '
+                 '%d yaml loads %.3fs, %d metadata cache hits', name, import_time, construct_time,
+                 stats[StartupStatsKey.REGEX_COMPILES], stats[StartupStatsKey.REGEX_COMPILE_TIME],
+                 stats[StartupStatsKey.YAML_LOADS], stats[StartupStatsKey.YAML_LOAD_TIME],
+                 stats[StartupStatsKey.METADATA_CACHE_HITS])
+        return stats
+
+    def get_startup_stats(self):
+        """
+        @retval A dict of StartupStatsKey values: the driver import and
+        construction times and the process' tallies so far, which include
+        the parameter dicts built once the driver connects.
+        """
+        stats = dict(self.driver_startup)
+        stats.update(startup_stats.get_stats())
+        return stats
             
     def start_messaging(self):
         """
@@ -129,6 +302,7 @@ class DriverProcess(object):
         not forwarded to the driver are:
         'stop_driver_process' - signal to close messaging and terminate.
         'test_events' - populate event queue with test data.
+        'get_process_stats' - event queue depth, throughput and drops.
         'process_echo' - echos the message back.
         If the command is not found in the driver, an echo message is
         replied to the client.
@@ -138,15 +312,15 @@ class DriverProcess(object):
         cmd = msg.get('cmd', None)
         args = msg.get('args', None)
         kwargs = msg.get('kwargs', None)
-        cmd_func = getattr(self.driver, cmd, None)
-        log.debug("DriverProcess.cmd_driver(): cmd=%s, cmd_func=%s" %(cmd, cmd_func))
         if cmd == 'stop_driver_process':
             self.stop_messaging()
             return'stop_driver_process'
         elif cmd == 'test_events':
-            events = kwargs['events']
-            self.events += events
+            for evt in kwargs['events']:
+                self.send_event(evt)
             reply = 'test_events'
+        elif cmd == 'get_process_stats':
+            reply = self.get_process_stats()
         elif cmd == 'process_echo':
             reply = 'ping from resource ppid:%s, resource:%s' % (str(self.ppid), str(self.driver))
             #try:
@@ -154,7 +328,23 @@ class DriverProcess(object):
             #except IndexError:
             #    msg = 'no message to echo'
             # reply = 'process_echo: %s' % msg
-        elif cmd_func:
+        else:
+            reply = self._call_driver(self.driver, cmd, args, kwargs)
+        
+        return reply        
+            
+    def _call_driver(self, driver, cmd, args, kwargs):
+        """
+        Call a driver command.
+        @param driver The driver object.
+        @param cmd The driver command identifier.
+        @param args Positional arguments of the command.
+        @param kwargs Keyword arguments of the command.
+        @retval The driver command result, or the exception it raised.
+        """
+        cmd_func = getattr(driver, cmd, None)
+        log.debug("DriverProcess.cmd_driver(): cmd=%s, cmd_func=%s" %(cmd, cmd_func))
+        if cmd_func:
             try:
                 reply = cmd_func(*args, **kwargs)
             except Exception as e:
@@ -182,15 +372,132 @@ class DriverProcess(object):
             #    'time' : time.time()
             #}
             #self.send_event(event)
-        
-        return reply        
-            
+
+        return reply
+
     def send_event(self, evt):
         """
-        Append an event to the list to be sent by the event threaed.
+        Append an event to the queue to be sent by the event thread,
+        applying the queue policy first if the queue is full.
         """
-        self.events.append(evt)
-            
+        drop_class = _drop_class(evt)
+        evt_type = _event_type(evt)
+        with self.events_condition:
+            if self.queued_events >= self.event_queue_size:
+                self._make_room()
+            self.event_queues[drop_class].append((next(self.event_sequence), evt))
+            self.queued_events += 1
+            if evt_type in self.queued_changes:
+                self.queued_changes[evt_type] += 1
+            stats = self.event_stats
+            stats[ProcessStatsKey.QUEUED] += 1
+            if self.queued_events > stats[ProcessStatsKey.HIGH_WATER_MARK]:
+                stats[ProcessStatsKey.HIGH_WATER_MARK] = self.queued_events
+            # Blocked senders wait on the same condition.
+            self.events_condition.notify_all()
+
+    @property
+    def events(self):
+        """
+        @retval A list of the queued events in the order they were sent.
+        Call holding events_condition.
+        """
+        return [evt for (_, evt) in merge(*self.event_queues.values())]
+
+    def get_events(self):
+        """
+        Wait for events to send, returning all that are queued.
+        @retval A list of events, empty if messaging was stopped.
+        """
+        with self.events_condition:
+            while not self.queued_events and self.messaging_started:
+                self.events_condition.wait()
+            events = self.events
+            for queue in self.event_queues.values():
+                queue.clear()
+            self.queued_events = 0
+            self.queued_changes = dict.fromkeys(COALESCE_EVENTS, 0)
+            self.event_stats[ProcessStatsKey.SENT] += len(events)
+            self.events_condition.notify_all()
+        return events
+
+    def get_process_stats(self):
+        """
+        @retval A dict of ProcessStatsKey values for the event queue.
+        """
+        with self.events_condition:
+            stats = dict(self.event_stats)
+            stats[ProcessStatsKey.QUEUE_POLICY] = self.event_queue_policy
+            stats[ProcessStatsKey.QUEUE_SIZE] = self.event_queue_size
+            stats[ProcessStatsKey.QUEUE_DEPTH] = self.queued_events
+        stats[ProcessStatsKey.STARTUP] = self.get_startup_stats()
+        return stats
+
+    def _make_room(self):
+        """
+        Apply the queue policy until there is room for one more event.
+        Blocking only waits while the event thread is running to drain
+        the queue, events are dropped otherwise. Called holding
+        events_condition.
+        """
+        if self.event_queue_policy == EventQueuePolicy.BLOCK and self.messaging_started:
+            self.event_stats[ProcessStatsKey.BLOCKED] += 1
+            while self.queued_events >= self.event_queue_size and self.messaging_started:
+                self.events_condition.wait()
+
+        if (self.event_queue_policy == EventQueuePolicy.COALESCE and
+                max(self.queued_changes.values()) > 1):
+            self._coalesce_events()
+
+        while self.queued_events >= self.event_queue_size:
+            self._drop_event()
+
+    def _coalesce_events(self):
+        """
+        Remove queued state and config changes superseded by a later one
+        of the same type. Only the DROPPED_OTHER queue holds them.
+        """
+        latest = set()
+        kept = deque()
+        coalesced = 0
+        for (seq, evt) in reversed(self.event_queues[ProcessStatsKey.DROPPED_OTHER]):
+            evt_type = _event_type(evt)
+            if evt_type in COALESCE_EVENTS:
+                if evt_type in latest:
+                    coalesced += 1
+                    continue
+                latest.add(evt_type)
+            kept.appendleft((seq, evt))
+
+        if coalesced:
+            self.event_queues[ProcessStatsKey.DROPPED_OTHER] = kept
+            self.queued_events -= coalesced
+            for evt_type in latest:
+                self.queued_changes[evt_type] = 1
+            self.event_stats[ProcessStatsKey.COALESCED] += coalesced
+
+    def _drop_event(self):
+        """
+        Drop the oldest raw particle, else the oldest sample, else the
+        oldest event.
+        """
+        for key in DROP_ORDER:
+            queue = self.event_queues[key]
+            if queue:
+                break
+        (_, evt) = queue.popleft()
+        self.queued_events -= 1
+        evt_type = _event_type(evt)
+        if evt_type in self.queued_changes:
+            self.queued_changes[evt_type] -= 1
+
+        stats = self.event_stats
+        stats[key] += 1
+        dropped = (stats[ProcessStatsKey.DROPPED_RAW] + stats[ProcessStatsKey.DROPPED_SAMPLE] +
+                   stats[ProcessStatsKey.DROPPED_OTHER])
+        if dropped % DROPPED_EVENT_LOG_INTERVAL == 1:
+            log.warn('Driver process event queue full, %d events dropped' % dropped)
+
     def run(self):
         """
         Process entry point. Construct driver and start messaging loops.
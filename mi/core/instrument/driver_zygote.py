@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.driver_zygote
+@file mi/core/instrument/driver_zygote.py
+@brief A prefork launcher for driver processes. The zygote is an
+    interpreter that imports mi.core once and forks a child for each driver
+    process launched, so the children start with it already imported
+    rather than each starting an interpreter and importing it again.
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import sys
+import errno
+import random
+import select
+import signal
+import time
+import traceback
+import cPickle as pickle
+from Queue import Queue, Empty
+from subprocess import Popen, PIPE
+from threading import Thread, Lock, Condition
+
+from mi.core.exceptions import InstrumentException
+from mi.core.log import get_logger ; log = get_logger()
+
+# Modules the zygote imports before forking
+PRELOAD_MODULES = [
+    'zmq',
+    'yaml',
+    'mi.core.instrument.zmq_driver_process',
+    'mi.core.instrument.zmq_driver_host',
+    'mi.core.instrument.instrument_driver',
+    'mi.core.instrument.instrument_protocol',
+    'mi.core.instrument.instrument_fsm',
+    'mi.core.instrument.protocol_param_dict',
+    'mi.core.instrument.protocol_cmd_dict',
+    'mi.core.instrument.driver_dict',
+    'mi.core.instrument.data_particle',
+    'mi.core.instrument.chunker',
+    'mi.core.instrument.port_agent_client',
+]
+
+# Seconds the zygote waits for a request before reaping exited children
+REAP_INTERVAL = .5
+
+# Seconds to wait for the zygote to report a launched process
+LAUNCH_TIMEOUT = 30
+
+# Zygote messages
+STARTED = 'started'
+EXITED = 'exited'
+
+
+def _returncode(status):
+    """
+    @retval The Popen returncode of a waitpid status.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+class ZygoteProcess(object):
+    """
+    Stands in for the Popen object of a process forked by the zygote. The
+    process is the zygote's child, so its exit status comes from the
+    zygote.
+    """
+    def __init__(self, zygote, pid):
+        self.zygote = zygote
+        self.pid = pid
+        self.returncode = None
+
+    def poll(self):
+        """
+        @retval The returncode if the process has exited, None otherwise.
+        """
+        self.returncode = self.zygote.returncode(self.pid)
+        return self.returncode
+
+    def wait(self, timeout=None):
+        """
+        Wait for the process to exit.
+        @param timeout Seconds to wait, None to wait until it exits.
+        @retval The returncode, None if the process is still running.
+        """
+        self.returncode = self.zygote.wait(self.pid, timeout)
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.poll() is None:
+            os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class DriverZygote(object):
+    """
+    Launches driver processes by having a zygote process fork them. Set
+    DriverProcess.zygote to a started DriverZygote to have driver processes
+    launched by it.
+    """
+    def __init__(self, python='bin/python', preload=None):
+        """
+        @param python The interpreter to run the zygote with.
+        @param preload Modules for the zygote to import, PRELOAD_MODULES
+        if None.
+        """
+        self.python = python
+        self.preload = PRELOAD_MODULES if preload is None else preload
+        self.process = None
+        self.launch_lock = Lock()
+        self.started = Queue()
+        # Exit codes of children by pid, and the condition waiters for
+        # them wait on.
+        self.returncodes = {}
+        self.exit_condition = Condition()
+        self.reader_thread = None
+
+    def start(self):
+        """
+        Start the zygote process, returning once it has imported the
+        preload modules.
+        @throws InstrumentException if the zygote fails to start.
+        """
+        cmd_str = 'from %s import DriverZygote; DriverZygote.serve(%r)' % (__name__, self.preload)
+        self.process = Popen([self.python, '-c', cmd_str], stdin=PIPE, stdout=PIPE, close_fds=True)
+
+        self.reader_thread = Thread(target=self._read_replies)
+        self.reader_thread.daemon = True
+        self.reader_thread.start()
+
+        try:
+            self.started.get(timeout=LAUNCH_TIMEOUT)
+        except Empty:
+            self.stop()
+            raise InstrumentException('Driver zygote did not start.')
+        if not self.is_running():
+            raise InstrumentException('Driver zygote exited while starting.')
+        log.info('Driver zygote started, pid %d', self.process.pid)
+
+    def stop(self):
+        """
+        Stop the zygote. Processes it launched keep running.
+        """
+        if self.process and self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+        if self.reader_thread:
+            self.reader_thread.join()
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def launch(self, cmd_str):
+        """
+        Launch a process running a python command sequence.
+        @param cmd_str The python command sequence to run.
+        @retval A ZygoteProcess for the process.
+        @throws InstrumentException if the zygote is not running or does
+        not report the process.
+        """
+        with self.launch_lock:
+            if not self.is_running():
+                raise InstrumentException('Driver zygote is not running.')
+            try:
+                pickle.dump(cmd_str, self.process.stdin, pickle.HIGHEST_PROTOCOL)
+                self.process.stdin.flush()
+                pid = self.started.get(timeout=LAUNCH_TIMEOUT)
+            except (IOError, Empty):
+                raise InstrumentException('Driver zygote did not launch the process.')
+        if pid is None:
+            raise InstrumentException('Driver zygote exited.')
+        return ZygoteProcess(self, pid)
+
+    def returncode(self, pid):
+        """
+        @retval The returncode of a launched process, None if it is running.
+        """
+        with self.exit_condition:
+            return self.returncodes.get(pid, None)
+
+    def wait(self, pid, timeout=None):
+        """
+        Wait for a launched process to exit. Other processes exiting wake
+        waiters too, so wait again until this one has or time is up.
+        @param timeout Seconds to wait, None to wait until it exits.
+        @retval The returncode, None if it is still running.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.exit_condition:
+            while pid not in self.returncodes and self.reader_thread.is_alive():
+                if deadline is None:
+                    self.exit_condition.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self.exit_condition.wait(remaining)
+            return self.returncodes.get(pid, None)
+
+    def _read_replies(self):
+        """
+        Read zygote messages until it exits, passing launched pids to the
+        launching thread and recording exits.
+        """
+        while True:
+            try:
+                msg = pickle.load(self.process.stdout)
+            except (EOFError, IOError, pickle.UnpicklingError):
+                break
+            if msg[0] == STARTED:
+                self.started.put(msg[1])
+            elif msg[0] == EXITED:
+                with self.exit_condition:
+                    self.returncodes[msg[1]] = msg[2]
+                    self.exit_condition.notify_all()
+
+        self.started.put(None)
+        with self.exit_condition:
+            self.exit_condition.notify_all()
+
+    @staticmethod
+    def serve(preload):
+        """
+        Zygote process entry point. Import the preload modules, then fork a
+        child for each command sequence read from stdin, writing the child
+        pids and exit codes to stdout, until stdin closes.
+        @param preload Names of the modules to import.
+        """
+        for module in preload:
+            __import__(module)
+
+        # Requests and replies keep the pipes; stray output from the zygote
+        # and its children goes to stderr.
+        requests = os.fdopen(os.dup(0), 'rb', 0)
+        replies = os.fdopen(os.dup(1), 'wb')
+        null_fd = os.open(os.devnull, os.O_RDWR)
+        os.dup2(null_fd, 0)
+        os.dup2(2, 1)
+        os.close(null_fd)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        def reply(*msg):
+            pickle.dump(msg, replies, pickle.HIGHEST_PROTOCOL)
+            replies.flush()
+
+        reply(STARTED, os.getpid())
+        while True:
+            (ready, _, _) = select.select([requests], [], [], REAP_INTERVAL)
+
+            while True:
+                try:
+                    (pid, status) = os.waitpid(-1, os.WNOHANG)
+                except OSError as e:
+                    if e.errno != errno.ECHILD:
+                        raise
+                    break
+                if not pid:
+                    break
+                reply(EXITED, pid, _returncode(status))
+
+            if ready:
+                try:
+                    cmd_str = pickle.load(requests)
+                except EOFError:
+                    break
+                pid = os.fork()
+                if pid == 0:
+                    requests.close()
+                    replies.close()
+                    DriverZygote._run_child(cmd_str)
+                reply(STARTED, pid)
+
+        os._exit(0)
+
+    @staticmethod
+    def _run_child(cmd_str):
+        """
+        Run a command sequence in a forked child, then exit.
+        """
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        random.seed()
+        try:
+            exec cmd_str in {'__name__': '__main__'}
+        except SystemExit as e:
+            sys.stdout.flush()
+            if e.code is None:
+                os._exit(0)
+            os._exit(e.code if isinstance(e.code, int) else 1)
+        except Exception:
+            traceback.print_exc()
+            os._exit(1)
+        sys.stdout.flush()
+        os._exit(0)
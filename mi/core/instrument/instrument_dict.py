@@ -12,11 +12,19 @@ protocol classes.
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import os
+import stat
 import yaml
 import sys
+import hashlib
+import tempfile
+import cPickle as pickle
 import pkg_resources
+from threading import Lock
 from mi.core.common import BaseEnum
 from mi.core.exceptions import InstrumentParameterException
+from mi.core.instrument import startup_stats
+from mi.core.instrument.startup_stats import StartupStatsKey
 
 from mi.core.log import get_logger ; log = get_logger()
 
@@ -24,6 +32,23 @@ MODULE = "res"
 EGG_PATH = "config"
 DEFAULT_FILENAME = "strings.yml"
 
+# Where metadata loaded from YAML is pickled, keyed by the digest of the
+# YAML, so the next process loading the same strings skips parsing them.
+# Anyone can make the directory first under /tmp, so it is only used if
+# it belongs to this user with mode 0700, and only cache files owned by
+# this user are read.
+METADATA_CACHE_DIR = os.environ.get('MI_METADATA_CACHE',
+                                    os.path.join(tempfile.gettempdir(), 'mi_metadata_cache_%d' % os.getuid()))
+
+# Bumped when the pickled metadata changes form
+METADATA_CACHE_VERSION = 1
+
+# Metadata already loaded in this process by digest. The parameter and
+# command dicts of every driver using the same strings share it, so it
+# must not be changed.
+_loaded_metadata = {}
+_loaded_metadata_lock = Lock()
+
 class InstrumentDict(object):
     """
     A package for classes that provides some base behavior for manages
@@ -36,7 +61,10 @@ class InstrumentDict(object):
         log.debug("Attempting to load instrument dictionary metadata from file %s",
                       filename)
         file = open("%s" % filename, "r")
-        return yaml.safe_load(file)
+        try:
+            return InstrumentDict.load_metadata(file.read(), yaml.safe_load)
+        finally:
+            file.close()
         
     @staticmethod
     def load_metadata_from_egg():
@@ -53,9 +81,105 @@ class InstrumentDict(object):
             yml = pkg_resources.resource_string(resource_base, resource_name)
             log.debug("Found resource in the %s, %s base",
                       resource_base, resource_name)
-            return yaml.load(yml)
+            return InstrumentDict.load_metadata(yml, yaml.load)
         else:
             return False
+
+    @staticmethod
+    def load_metadata(yml, loader):
+        """
+        Load YAML metadata, from this process' earlier loads or the pickled
+        metadata cache if the same YAML was loaded before, parsing and
+        caching it otherwise.
+        @param yml The YAML string.
+        @param loader The yaml function to parse it with.
+        @retval The metadata structure, shared with other loads of the same
+        YAML so not to be changed.
+        """
+        digest = hashlib.md5(yml).hexdigest()
+        with _loaded_metadata_lock:
+            if digest in _loaded_metadata:
+                startup_stats.add(StartupStatsKey.METADATA_CACHE_HITS)
+                return _loaded_metadata[digest]
+
+        cache_filename = os.path.join(METADATA_CACHE_DIR, '%s.pickle' % digest)
+        metadata = InstrumentDict._read_metadata_cache(cache_filename)
+        if metadata is None:
+            with startup_stats.timed(StartupStatsKey.YAML_LOAD_TIME, StartupStatsKey.YAML_LOADS):
+                metadata = loader(yml)
+            InstrumentDict._write_metadata_cache(cache_filename, metadata)
+        else:
+            startup_stats.add(StartupStatsKey.METADATA_CACHE_HITS)
+
+        with _loaded_metadata_lock:
+            _loaded_metadata[digest] = metadata
+        return metadata
+
+    @staticmethod
+    def _read_metadata_cache(cache_filename):
+        """
+        @retval The metadata pickled in a cache file, None if there is no
+        usable cache file.
+        """
+        if not InstrumentDict._metadata_cache_dir_private():
+            return None
+        try:
+            with open(cache_filename, 'rb') as cache_file:
+                if os.fstat(cache_file.fileno()).st_uid != os.getuid():
+                    log.warning("Ignoring metadata cache %s owned by another user", cache_filename)
+                    return None
+                (version, metadata) = pickle.load(cache_file)
+        except IOError:
+            return None
+        except Exception as e:
+            # a damaged pickle can fail in many ways
+            log.debug("Ignoring unreadable metadata cache %s: %s", cache_filename, e)
+            return None
+
+        if version != METADATA_CACHE_VERSION:
+            return None
+        log.debug("Loaded instrument dictionary metadata from cache %s", cache_filename)
+        return metadata
+
+    @staticmethod
+    def _metadata_cache_dir_private():
+        """
+        @retval True if the cache directory is a directory of this user's
+        that no one else can get into, not a link or a directory another
+        user made to plant or read cache files.
+        """
+        try:
+            dir_stat = os.lstat(METADATA_CACHE_DIR)
+        except OSError:
+            return False
+        if (not stat.S_ISDIR(dir_stat.st_mode) or dir_stat.st_uid != os.getuid() or
+                stat.S_IMODE(dir_stat.st_mode) != 0700):
+            log.warning("Not using metadata cache %s, it must be a directory owned by this user "
+                        "with mode 0700", METADATA_CACHE_DIR)
+            return False
+        return True
+
+    @staticmethod
+    def _write_metadata_cache(cache_filename, metadata):
+        """
+        Pickle metadata to a cache file, written under a temporary name and
+        renamed so processes starting together never read a partial file.
+        Failing to write the cache only costs the next process a parse.
+        """
+        temp_filename = None
+        try:
+            if not os.path.lexists(METADATA_CACHE_DIR):
+                os.makedirs(METADATA_CACHE_DIR, 0700)
+            if not InstrumentDict._metadata_cache_dir_private():
+                return
+            (fd, temp_filename) = tempfile.mkstemp(dir=METADATA_CACHE_DIR)
+            with os.fdopen(fd, 'wb') as cache_file:
+                pickle.dump((METADATA_CACHE_VERSION, metadata), cache_file, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_filename, cache_filename)
+        except (IOError, OSError, pickle.PicklingError) as e:
+            log.debug("Could not write metadata cache %s: %s", cache_filename, e)
+            if temp_filename and os.path.exists(temp_filename):
+                os.remove(temp_filename)
     
     @staticmethod
     def get_metadata_from_source(devel_path=None, filename=None):
@@ -174,11 +174,25 @@ class DriverAsyncEvent(BaseEnum):
     STATE_CHANGE = 'DRIVER_ASYNC_EVENT_STATE_CHANGE'
     CONFIG_CHANGE = 'DRIVER_ASYNC_EVENT_CONFIG_CHANGE'
     SAMPLE = 'DRIVER_ASYNC_EVENT_SAMPLE'
+    SAMPLE_BATCH = 'DRIVER_ASYNC_EVENT_SAMPLE_BATCH'
     ERROR = 'DRIVER_ASYNC_EVENT_ERROR'
     RESULT = 'DRIVER_ASYNC_RESULT'
     DIRECT_ACCESS = 'DRIVER_ASYNC_EVENT_DIRECT_ACCESS'
     AGENT_EVENT = 'DRIVER_ASYNC_EVENT_AGENT_EVENT'
 
+def unpack_sample_batch(event):
+    """
+    Split a SAMPLE_BATCH event back into the SAMPLE events it carries, so
+    event consumers see one event per particle.
+    @param event An asynchronous driver event
+    @retval A list of events, just [event] if it is not a batch
+    """
+    if not isinstance(event, dict) or event.get('type') != DriverAsyncEvent.SAMPLE_BATCH:
+        return [event]
+
+    return [{'type': DriverAsyncEvent.SAMPLE, 'value': value, 'time': event['time']}
+            for value in event['value']]
+
 class DriverParameter(BaseEnum):
     """
     Base driver parameters. Subclassed by specific drivers with device
@@ -370,6 +384,10 @@ class InstrumentDriver(object):
         elif type == DriverAsyncEvent.SAMPLE:
             event['value'] = val
             self._send_event(event)
+
+        elif type == DriverAsyncEvent.SAMPLE_BATCH:
+            event['value'] = val
+            self._send_event(event)
             
         elif type == DriverAsyncEvent.ERROR:
             event['value'] = val
@@ -415,6 +433,11 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
     Provides connenction state logic for single connection drivers. This is
     the base class for the majority of driver implementation classes.
     """
+
+    # A PortAgentSelector to serve the listener of the port agent client
+    # the driver connects with, as a driver host sets on its drivers. None
+    # for a listener thread of its own.
+    port_agent_selector = None
     
     def __init__(self, event_callback):
         """
@@ -902,7 +925,7 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
         result = None
         self._build_protocol()
         try:
-            self._connection.init_comms(self._protocol.got_data, 
+            self._connection.init_comms(self._got_data,
                                         self._protocol.got_raw,
                                         self._got_exception,
                                         self._lost_connection_callback)
@@ -1053,13 +1076,21 @@ class SingleConnectionInstrumentDriver(InstrumentDriver):
             cmd_port = config.get('cmd_port')
 
             if isinstance(addr, str) and isinstance(port, int) and len(addr)>0:
-                return PortAgentClient(addr, port, cmd_port)
+                return PortAgentClient(addr, port, cmd_port, selector=self.port_agent_selector)
             else:
                 raise InstrumentParameterException('Invalid comms config dict.')
 
         except (TypeError, KeyError):
             raise InstrumentParameterException('Invalid comms config dict.')
 
+    def _got_data(self, port_agent_packet):
+        """
+        Callback for the client with data from the instrument. Samples the
+        protocol raises while handling the packet are published together.
+        """
+        with self._protocol.sample_batch():
+            self._protocol.got_data(port_agent_packet)
+
     def _got_exception(self, exception):
         """
         Callback for the client for exception handling with async data.  Exceptions
@@ -10,6 +10,7 @@
 __author__ = 'Edward Hunter'
 __license__ = 'Apache 2.0'
 
+import time
 from threading import RLock
 
 from mi.core.exceptions import InstrumentStateException
@@ -17,6 +18,47 @@ from mi.core.exceptions import InstrumentStateException
 from mi.core.log import get_logger,LoggerManager
 log = get_logger()
 
+# Upper bounds in seconds of the handler latency histogram buckets; the
+# last bucket holds everything slower.
+LATENCY_BUCKETS = (.001, .01, .1, 1, 10)
+
+class HandlerLatency(object):
+    """
+    Latency histogram of one state/event handler.
+    """
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def add(self, elapsed):
+        """
+        Record one handler call.
+        @param elapsed Time the handler took in seconds
+        """
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        index = 0
+        for bound in LATENCY_BUCKETS:
+            if elapsed <= bound:
+                break
+            index += 1
+        self.buckets[index] += 1
+
+    def as_dict(self):
+        """
+        @retval dict with the call count, total and max time in seconds, and
+        a list of (bucket upper bound, count) with None for the open bucket
+        """
+        bounds = list(LATENCY_BUCKETS) + [None]
+        return {'count': self.count,
+                'total': self.total,
+                'max': self.max,
+                'buckets': zip(bounds, self.buckets)}
+
 class InstrumentFSM(object):
     """
     Simple state mahcine for driver and agent classes.
@@ -40,6 +82,16 @@ class InstrumentFSM(object):
         self.enter_event = enter_event
         self.exit_event = exit_event
 
+        # Dispatch tables built by compile()
+        self._compiled = False
+        self._state_set = None
+        self._event_set = None
+        self._state_events = None
+        self._all_events = None
+
+        # Per handler latency, only kept once enabled
+        self._handler_latency = None
+
     def get_current_state(self):
         """
         Return current state.
@@ -63,7 +115,92 @@ class InstrumentFSM(object):
             return False
 
         self.state_handlers[(state,event)] = handler
+        self._compiled = False
         return True
+
+    def compile(self):
+        """
+        Build the dispatch tables: the state and event sets used to validate
+        events and transitions, and the events handled in each state. Run
+        once the handlers have been added; dispatch compiles on first use
+        and again after any later add_handler.
+        """
+        try:
+            self._state_set = frozenset(self.states.list())
+            self._event_set = frozenset(self.events.list())
+        except TypeError:
+            self._state_set = None
+            self._event_set = None
+
+        state_events = {}
+        all_events = []
+        for (state, event) in self.state_handlers.iterkeys():
+            if event == self.enter_event or event == self.exit_event:
+                continue
+            events = state_events.setdefault(state, [])
+            if event not in events:
+                events.append(event)
+            if event not in all_events:
+                all_events.append(event)
+
+        self._state_events = dict((state, tuple(events)) for (state, events)
+                                  in state_events.iteritems())
+        self._all_events = tuple(all_events)
+        self._compiled = True
+
+    def _is_state(self, state):
+        if self._state_set is None:
+            return self.states.has(state)
+        try:
+            return state in self._state_set
+        except TypeError:
+            return False
+
+    def _is_event(self, event):
+        if self._event_set is None:
+            return self.events.has(event)
+        try:
+            return event in self._event_set
+        except TypeError:
+            return False
+
+    def enable_handler_latency(self, enable=True):
+        """
+        Start or stop recording how long each handler takes. Starting
+        clears anything recorded so far.
+        @param enable True to record handler latency, False to stop
+        """
+        self._handler_latency = {} if enable else None
+
+    def get_handler_latency(self):
+        """
+        @retval dict of (state, event) to the latency histogram of its
+        handler as returned by HandlerLatency.as_dict, empty when recording
+        is not enabled.
+        """
+        if not self._handler_latency:
+            return {}
+        return dict((key, latency.as_dict()) for (key, latency)
+                    in self._handler_latency.iteritems())
+
+    def _call_handler(self, state, event, handler, *args, **kwargs):
+        """
+        Call a handler, recording its latency if enabled.
+        """
+        if self._handler_latency is None:
+            return handler(*args, **kwargs)
+
+        start_time = time.time()
+        try:
+            return handler(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start_time
+            latency = self._handler_latency.get((state, event))
+            if latency is None:
+                latency = self._handler_latency[(state, event)] = HandlerLatency()
+            latency.add(elapsed)
+            if elapsed > LATENCY_BUCKETS[-2]:
+                log.debug("slow FSM handler for %s in %s: %.3fs", event, state, elapsed)
         
     def start(self, state, *args, **kwargs):
         """
@@ -76,13 +213,16 @@ class InstrumentFSM(object):
         @raises Any exception raised by the enter handler.
         """
 
-        if not self.states.has(state):
+        if not self._compiled:
+            self.compile()
+
+        if not self._is_state(state):
             return False
                 
         self.current_state = state
         handler = self.state_handlers.get((state, self.enter_event), None)
         if handler:
-            handler(*args, **kwargs)
+            self._call_handler(state, self.enter_event, handler, *args, **kwargs)
         return True
 
     def on_event(self, event, *args, **kwargs):
@@ -100,16 +240,20 @@ class InstrumentFSM(object):
         next_state = None
         result = None
 
-        if self.events.has(event):
+        if not self._compiled:
+            self.compile()
+
+        if self._is_event(event):
             handler = self.state_handlers.get((self.current_state, event), None)
             if handler:
-                (next_state, result) = handler(*args, **kwargs)
+                (next_state, result) = self._call_handler(self.current_state, event, handler,
+                                                          *args, **kwargs)
             else:
                 raise InstrumentStateException('Command (%s) not handled in current state (%s).' % (event, self.current_state))
         else:
             raise InstrumentStateException(str(event) + " was not handled by InstrumentFSM.on_event()")
 
-        if self.states.has(next_state):
+        if self._is_state(next_state):
             self._on_transition(next_state, *args, **kwargs)
         else:
             log.debug("No next state'" + repr(next_state) + "', remaining in current_state.")
@@ -128,12 +272,12 @@ class InstrumentFSM(object):
 
         handler = self.state_handlers.get((self.current_state, self.exit_event), None)
         if handler:
-            handler(*args, **kwargs)
+            self._call_handler(self.current_state, self.exit_event, handler, *args, **kwargs)
         self.previous_state = self.current_state
         self.current_state = next_state
         handler = self.state_handlers.get((self.current_state, self.enter_event), None)
         if handler:
-            handler(*args, **kwargs)
+            self._call_handler(self.current_state, self.enter_event, handler, *args, **kwargs)
 
     def get_events(self, current_state=True):
         """
@@ -141,19 +285,12 @@ class InstrumentFSM(object):
         @param current_state if true, return events handled in the current state only.
         @retval list of events handled.
         """
-        events = []
-        for (key, handler) in self.state_handlers.iteritems():
-            state = key[0]
-            event = key[1]
-            if not ((event == self.enter_event) or (event == self.exit_event)):
-                if current_state:
-                    if (self.current_state==state):
-                        if event not in events:
-                            events.append(event)
-                else:
-                    if event not in events:
-                        events.append(event)
-        return events
+        if not self._compiled:
+            self.compile()
+
+        if current_state:
+            return list(self._state_events.get(self.current_state, ()))
+        return list(self._all_events)
 
 
 class ThreadSafeFSM(InstrumentFSM):
@@ -172,21 +309,6 @@ class ThreadSafeFSM(InstrumentFSM):
     def on_event(self, event, *args, **kwargs):
         """
         """
-        
-        self._lock.acquire(True)
-        ex = None
-        
-        try:
-            result = super(ThreadSafeFSM, self).on_event(event, *args, **kwargs)
-        
-        except Exception as ex:
-            pass
-        
-        finally:
-            self._lock.release()
-        
-        if ex:
-            raise ex
-        
-        return result
+        with self._lock:
+            return super(ThreadSafeFSM, self).on_event(event, *args, **kwargs)
     
@@ -17,10 +17,13 @@ import re
 import time
 import json
 from functools import partial
+from contextlib import contextmanager
 
 from mi.core.log import get_logger ; log = get_logger()
 
 from threading import Thread
+from threading import Condition
+from threading import local
 
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.common import BaseEnum, InstErrorCode
@@ -46,6 +49,10 @@ from mi.core.exceptions import InstrumentParameterExpirationException
 
 DEFAULT_CMD_TIMEOUT=20
 DEFAULT_WRITE_DELAY=0
+DEFAULT_BUFFER_SIZE=1048576
+WAKEUP_SETTLE_TIME=.1
+DEFAULT_SAMPLE_BATCH_SIZE=500
+DEFAULT_SAMPLE_BATCH_WINDOW=1.0
 RE_PATTERN = type(re.compile(""))
 
 class InterfaceType(BaseEnum):
@@ -58,18 +65,88 @@ class InitializationType(BaseEnum):
     STARTUP = 1,
     DIRECTACCESS = 2
 
+class ReceiveBuffer(object):
+    """
+    Rolling buffer of data received from a device. Only the last max_size
+    bytes are kept. Positions handed out by end() count every byte ever
+    received, so a search can resume where the previous one left off even
+    after the start of the buffer has been dropped.
+    """
+    def __init__(self, max_size=DEFAULT_BUFFER_SIZE):
+        """
+        @param max_size The most bytes to hold
+        """
+        self.max_size = max_size
+        self.data = ''
+        self._offset = 0
+
+    def append(self, data):
+        """
+        Add data to the end of the buffer, dropping the oldest bytes if it
+        grows past max_size.
+        @param data bytes to add
+        """
+        self.data += data
+        overflow = len(self.data) - self.max_size
+        if overflow > 0:
+            self.data = self.data[overflow:]
+            self._offset += overflow
+
+    def replace(self, data):
+        """
+        Replace the contents of the buffer. Searches resuming from a
+        position taken before the replacement start over at the beginning.
+        @param data The new contents
+        """
+        self._offset = self.end()
+        self.data = ''
+        self.append(data)
+
+    def end(self):
+        """
+        @retval Position just past the last byte received
+        """
+        return self._offset + len(self.data)
+
+    def find(self, sub, scanned=None):
+        """
+        Find a string in the buffer, skipping what has already been scanned.
+        @param sub The string to look for
+        @param scanned Position returned by end() when the buffer was last
+        searched for sub, None to search all of it
+        @retval Index of sub in data, -1 if not found
+        """
+        start = 0
+        if scanned is not None:
+            start = max(scanned - len(sub) + 1 - self._offset, 0)
+        return self.data.find(sub, start)
+
 class InstrumentProtocol(object):
     """
         
     Base instrument protocol class.
     """    
-    def __init__(self, driver_event):
+    def __init__(self, driver_event,
+                 sample_batch_size=DEFAULT_SAMPLE_BATCH_SIZE,
+                 sample_batch_window=DEFAULT_SAMPLE_BATCH_WINDOW):
         """
         Base constructor.
         @param driver_event The callback for asynchronous driver events.
-        """
-        # Event callback to send asynchronous events to the agent.
-        self._driver_event = driver_event
+        @param sample_batch_size The most samples published in one batch
+        @param sample_batch_window The most seconds a sample is held in a
+        batch before it is published
+        """
+        # Event callback to send asynchronous events to the agent. Events
+        # go through _batch_driver_event so samples raised in sample_batch()
+        # can be published together.
+        self._driver_event_callback = driver_event
+        self._driver_event = self._batch_driver_event if driver_event else driver_event
+
+        # Samples held by sample_batch(), per thread so only samples from
+        # the data being handled are batched.
+        self._sample_batch = local()
+        self._sample_batch_size = sample_batch_size
+        self._sample_batch_window = sample_batch_window
 
         # The connection used to talk to the device.
         self._connection = None
@@ -181,6 +258,66 @@ class InstrumentProtocol(object):
         log.error("base got_data.  Who called me?")
         pass
 
+    @contextmanager
+    def sample_batch(self):
+        """
+        Hold the samples raised through _driver_event in this thread and
+        publish them as one SAMPLE_BATCH event on exit, or sooner once
+        sample_batch_size samples are held or the oldest has waited
+        sample_batch_window seconds. A lone sample is published as a plain
+        SAMPLE event. Any other event publishes the held samples first so
+        events keep their order.
+        """
+        if getattr(self._sample_batch, 'samples', None) is not None:
+            # already batching, the outer batch publishes
+            yield
+            return
+
+        self._sample_batch.samples = []
+        try:
+            yield
+        finally:
+            try:
+                self._flush_sample_batch()
+            finally:
+                self._sample_batch.samples = None
+
+    def _flush_sample_batch(self):
+        """
+        Publish the samples held by sample_batch()
+        """
+        samples = self._sample_batch.samples
+        if not samples:
+            return
+
+        self._sample_batch.samples = []
+        if len(samples) == 1:
+            self._driver_event_callback(DriverAsyncEvent.SAMPLE, samples[0])
+        else:
+            self._driver_event_callback(DriverAsyncEvent.SAMPLE_BATCH, samples)
+
+    def _batch_driver_event(self, type, *args, **kwargs):
+        """
+        Send an asynchronous driver event, holding samples while a
+        sample_batch() is open in this thread.
+        @param type a DriverAsyncEvent type specifier.
+        """
+        samples = getattr(self._sample_batch, 'samples', None)
+        if samples is None:
+            return self._driver_event_callback(type, *args, **kwargs)
+
+        if type == DriverAsyncEvent.SAMPLE and len(args) == 1 and not kwargs:
+            if not samples:
+                self._sample_batch.start = time.time()
+            samples.append(args[0])
+            if len(samples) >= self._sample_batch_size or \
+               time.time() - self._sample_batch.start >= self._sample_batch_window:
+                self._flush_sample_batch()
+            return
+
+        self._flush_sample_batch()
+        return self._driver_event_callback(type, *args, **kwargs)
+
     def _get_param_result(self,param_list, expire_time):
         """
         return a dictionary of the parameters and values
@@ -784,18 +921,25 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
     Base class for text-based command-response instruments.
     """
     
-    def __init__(self, prompts, newline, driver_event):
+    def __init__(self, prompts, newline, driver_event, buffer_size=DEFAULT_BUFFER_SIZE):
         """
         Constructor.
         @param prompts Enum class containing possible device prompts used for
         command response logic.
         @param newline The device newline.
         @driver_event The callback for asynchronous driver events.
+        @param buffer_size The most bytes kept in the line and prompt buffers.
         """
         
         # Construct superclass.
         InstrumentProtocol.__init__(self, driver_event)
 
+        # Bounded storage behind _linebuf and _promptbuf, and the condition
+        # waiters for a response are woken through when either changes.
+        self._line_buffer = ReceiveBuffer(buffer_size)
+        self._prompt_buffer = ReceiveBuffer(buffer_size)
+        self._buffer_condition = Condition()
+
         # The end of line delimiter.                
         self._newline = newline
     
@@ -820,6 +964,28 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
 
         self._last_data_receive_timestamp = None
 
+    def _get_linebuf(self):
+        return self._line_buffer.data
+
+    def _set_linebuf(self, value):
+        with self._buffer_condition:
+            self._line_buffer.replace(value)
+            self._buffer_condition.notify_all()
+
+    # Line buffer for input from device, capped at buffer_size bytes.
+    _linebuf = property(_get_linebuf, _set_linebuf)
+
+    def _get_promptbuf(self):
+        return self._prompt_buffer.data
+
+    def _set_promptbuf(self, value):
+        with self._buffer_condition:
+            self._prompt_buffer.replace(value)
+            self._buffer_condition.notify_all()
+
+    # Buffer to look for prompts in, capped at buffer_size bytes.
+    _promptbuf = property(_get_promptbuf, _set_promptbuf)
+
     def _get_prompts(self):
         """
         Return a list of prompts order from longest to shortest.  The
@@ -880,24 +1046,24 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
 
         log.debug('_get_response: timeout=%s, prompt_list=%s, expected_prompt=%s, response_regex=%s, promptbuf=%s',
                   timeout, prompt_list, expected_prompt, response_regex, self._promptbuf)
-        while True:
-            if response_regex:
+
+        if response_regex:
+            def match():
                 match = response_regex.search(self._linebuf)
                 if match:
                     return match.groups()
-                else:
-                    time.sleep(.1)
-            else:
-                for item in prompt_list:
-                    index = self._promptbuf.find(item)
-                    if index >= 0:
-                        result = self._promptbuf[0:index+len(item)]
-                        return (item, result)
-                    else:
-                        time.sleep(.1)
-
-            if time.time() > starttime + timeout:
-                raise InstrumentTimeoutException("in InstrumentProtocol._get_response()")
+        else:
+            find_prompt = self._prompt_matcher(prompt_list)
+            def match():
+                found = find_prompt()
+                if found:
+                    (item, index) = found
+                    return (item, self._promptbuf[0:index+len(item)])
+
+        result = self._wait_for_buffer(match, starttime + timeout - time.time())
+        if result is None:
+            raise InstrumentTimeoutException("in InstrumentProtocol._get_response()")
+        return result
 
     def _get_raw_response(self, timeout=10, expected_prompt=None):
         """
@@ -921,15 +1087,79 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
             else:
                 prompt_list = expected_prompt
 
-        while True:
+        def match():
+            promptbuf = self._promptbuf.rstrip(strip_chars)
             for item in prompt_list:
-                if self._promptbuf.rstrip(strip_chars).endswith(item.rstrip(strip_chars)):
+                if promptbuf.endswith(item.rstrip(strip_chars)):
                     return (item, self._linebuf)
-                else:
-                    time.sleep(.1)
 
-            if time.time() > starttime + timeout:
-                raise InstrumentTimeoutException("in InstrumentProtocol._get_raw_response()")
+        result = self._wait_for_buffer(match, starttime + timeout - time.time())
+        if result is None:
+            raise InstrumentTimeoutException("in InstrumentProtocol._get_raw_response()")
+        return result
+
+    def _prompt_matcher(self, prompt_list, scanned=None):
+        """
+        Build a match function for _wait_for_buffer that looks for prompts
+        in the prompt buffer. Each call only searches data that arrived
+        since the previous one.
+        @param prompt_list Prompts to look for, in order of preference
+        @param scanned Buffer position to start searching from, None for
+        the whole buffer
+        @retval Function returning (prompt, index in _promptbuf) for the first
+        prompt in prompt_list found, None if there is none yet
+        """
+        state = [scanned]
+
+        def match():
+            for item in prompt_list:
+                index = self._prompt_buffer.find(item, state[0])
+                if index >= 0:
+                    return (item, index)
+            state[0] = self._prompt_buffer.end()
+
+        return match
+
+    def _wait_for_buffer(self, match, timeout):
+        """
+        Wait for data from the device to satisfy match. The caller sleeps on
+        the buffer condition and match is checked again each time data is
+        added to the line and prompt buffers, so a response is seen as soon
+        as it arrives.
+        @param match Function checking the buffers, called with the buffer
+        condition held. Returns None to keep waiting.
+        @param timeout The most time to wait in seconds
+        @retval The first result of match other than None, None on timeout
+        """
+        endtime = time.time() + timeout
+        with self._buffer_condition:
+            while True:
+                result = match()
+                if result is not None:
+                    return result
+
+                remaining = endtime - time.time()
+                if remaining <= 0:
+                    return None
+                self._buffer_condition.wait(remaining)
+
+    def _wait_for_quiet(self, quiet, timeout):
+        """
+        Wait until no data has arrived from the device for quiet seconds.
+        @param quiet The idle time to wait for in seconds
+        @param timeout The most time to wait in seconds
+        """
+        endtime = time.time() + timeout
+        with self._buffer_condition:
+            while True:
+                remaining = endtime - time.time()
+                if remaining <= 0:
+                    return
+
+                position = self._prompt_buffer.end()
+                self._buffer_condition.wait(min(quiet, remaining))
+                if self._prompt_buffer.end() == position:
+                    return
 
     def _do_cmd_resp(self, cmd, *args, **kwargs):
         """
@@ -1119,9 +1349,11 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         Add a chunk of data to the internal data buffers
         @param data: bytes to add to the buffer
         '''
-        # Update the line and prompt buffers.
-        self._linebuf += data
-        self._promptbuf += data
+        # Update the line and prompt buffers and wake anyone waiting on them.
+        with self._buffer_condition:
+            self._line_buffer.append(data)
+            self._prompt_buffer.append(data)
+            self._buffer_condition.notify_all()
         self._last_data_timestamp = time.time()
 
         log.debug("LINE BUF: %s", self._linebuf)
@@ -1151,23 +1383,28 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
         
         # Grab time for timeout.
         starttime = time.time()
+        prompts = self._get_prompts()
+        log.debug("Prompts: %s", prompts)
         
         while True:
-            # Send a line return and wait a sec.
+            # Send a line return and wait up to delay for a prompt.
             log.trace('Sending wakeup. timeout=%s', timeout)
+            sendtime = time.time()
             self._send_wakeup()
-            time.sleep(delay)
 
-            log.debug("Prompts: %s", self._get_prompts())
-
-            for item in self._get_prompts():
-                log.debug("buffer: %s", self._promptbuf)
-                log.debug("find prompt: %s", item)
-                index = self._promptbuf.find(item)
-                log.debug("Got prompt (index: %s): %s ", index, repr(self._promptbuf))
-                if index >= 0:
-                    log.trace('wakeup got prompt: %s', repr(item))
-                    return item
+            found = self._wait_for_buffer(self._prompt_matcher(prompts), delay)
+            if found:
+                # Let the rest of the wakeup response arrive so it does not
+                # end up in the response to the next command, then prefer
+                # prompts in the same order as before.
+                self._wait_for_quiet(WAKEUP_SETTLE_TIME, sendtime + delay - time.time())
+                log.debug("Got prompt (index: %s): %s ", found[1], repr(self._promptbuf))
+                for item in prompts:
+                    if self._promptbuf.find(item) >= 0:
+                        found = (item, None)
+                        break
+                log.trace('wakeup got prompt: %s', repr(found[0]))
+                return found[0]
             log.debug("Searched for all prompts")
 
             if time.time() > starttime + timeout:
@@ -1193,7 +1430,11 @@ class CommandResponseInstrumentProtocol(InstrumentProtocol):
             if prompt == desired_prompt:
                 break
             else:
-                time.sleep(delay)
+                # Give the device up to delay to come round to the desired
+                # prompt by itself before waking it again.
+                find_prompt = self._prompt_matcher([desired_prompt], self._prompt_buffer.end())
+                if self._wait_for_buffer(find_prompt, delay):
+                    break
                 count += 1
                 if count >= no_tries:
                     raise InstrumentProtocolException('Incorrect prompt.')
@@ -1314,11 +1555,14 @@ class MenuInstrumentProtocol(CommandResponseInstrumentProtocol):
         @param driver_event The callback for asynchronous driver events.
         @param read_delay optional kwarg specifying amount of time to delay before
                attempting to read response from instrument (in _get_response).
+        @param buffer_size optional kwarg with the most bytes kept in the line
+               and prompt buffers.
 
         """
         
         # Construct superclass.
-        CommandResponseInstrumentProtocol.__init__(self, prompts, newline, driver_event)
+        CommandResponseInstrumentProtocol.__init__(self, prompts, newline, driver_event,
+                                                   kwargs.get('buffer_size', DEFAULT_BUFFER_SIZE))
         self._menu = menu
 
         # The end of line delimiter.                
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.pd0_decoder
+@file mi/core/instrument/pd0_decoder.py
+@brief Vectorized helpers for decoding Teledyne RDI PD0 ensembles. The per
+    cell data types (velocity, correlation, echo intensity, percent good)
+    hold one value per beam for every depth cell; decoding them a cell at a
+    time with struct dominates particle generation for long profiles.
+    The chunker checksums ensembles with this module, so numpy is optional
+    for the checksum; decoding cell data needs it.
+"""
+
+__license__ = 'Apache 2.0'
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Number of beams in the per cell data types
+BEAMS = 4
+
+
+def checksum(data, start=0, end=None):
+    """
+    Compute a PD0 checksum, the sum of all bytes modulo 65536.
+    @param data The ensemble as a string or buffer
+    @param start Index of the first byte to sum
+    @param end Index past the last byte to sum, None for the end of data
+    @retval The checksum as an int
+    """
+    if end is None:
+        end = len(data)
+    if end <= start:
+        return 0
+    if numpy is None:
+        return sum(bytearray(buffer(data, start, end - start))) & 0xFFFF
+    values = numpy.frombuffer(data, dtype=numpy.uint8, count=end - start, offset=start)
+    return int(values.sum(dtype=numpy.uint64)) & 0xFFFF
+
+
+def beam_values(chunk, dtype, rows, offset=2):
+    """
+    Decode the per beam values of a cell data type.
+    @param chunk The data type block, starting with its two byte id
+    @param dtype A numpy dtype string for a single value, ie '<i2' for
+        velocities or 'u1' for correlation magnitudes
+    @param rows The number of depth cells to decode
+    @param offset Index of the first value in chunk
+    @retval A list of BEAMS lists of python ints, one per beam
+    """
+    if rows <= 0:
+        return [[] for beam in range(BEAMS)]
+    values = numpy.frombuffer(chunk, dtype=dtype, count=rows * BEAMS, offset=offset)
+    return values.reshape(rows, BEAMS).T.tolist()
@@ -12,15 +12,25 @@ __author__ = 'David Everett'
 __license__ = 'Apache 2.0'
 
 import socket
+import select
 import errno
 import threading
 import time
 import datetime
+import math
+import operator
 import struct
 import array
+import base64
 import binascii
 import ctypes
 import subprocess
+import os
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import InstrumentConnectionException
@@ -58,10 +68,32 @@ MIN_RETRY_WINDOW = 2 # 2 seconds
 
 MAX_SEND_ATTEMPTS = 15              # Max number of times we can get EAGAIN
 
+RECEIVE_BUFFER_SIZE = 65536         # Buffered receive block, holds any packet
+VIEW_PACKET_SIZE = 4096             # Smaller packets let go of the receive buffer once handled
+SELECT_TIMEOUT = .1                 # Seconds to block before checking for done
+
 
 class SocketClosed(Exception): pass
 
 
+def xor_bytes(data, offset = 0, count = None):
+    """
+    XOR bytes of data together without copying them
+    @param data A string or buffer, ie a bytearray
+    @param offset Index of the first byte
+    @param count Number of bytes, None for the rest of data
+    @retval The XOR of the bytes, 0 for no data
+    """
+    if count is None:
+        count = len(data) - offset
+    if count <= 0:
+        return 0
+    if numpy is None:
+        return reduce(operator.xor, bytearray(buffer(data, offset, count)), 0)
+    values = numpy.frombuffer(data, dtype=numpy.uint8, count=count, offset=offset)
+    return int(numpy.bitwise_xor.reduce(values))
+
+
 class PortAgentPacket():
     """
     An object that encapsulates the details packets that are sent to and
@@ -84,22 +116,30 @@ class PortAgentPacket():
 
     def __init__(self, packetType = None):
         self.__header = None
+        self.__header_offset = 0
         self.__data = None
+        self.__data_offset = 0
+        self.__data_string = None
         self.__type = packetType
         self.__length = None
         self.__port_agent_timestamp = None
         self.__recv_checksum  = None
         self.__checksum = None
         self.__isValid = False
+        self.__header_checksum = None
+        self.__verified = False
 
-    def unpack_header(self, header):
+    def unpack_header(self, header, offset = 0):
         self.__header = header
+        self.__header_offset = offset
+        self.__header_checksum = None
+        self.__verified = False
         #@TODO may want to switch from big endian to network order '!' instead of '>' note network order is big endian.
         # B = unsigned char size 1 bytes
         # H = unsigned short size 2 bytes
         # L = unsigned long size 4 bytes
         # d = float size8 bytes
-        variable_tuple = struct.unpack_from('>BBBBHHII', header)
+        variable_tuple = struct.unpack_from('>BBBBHHII', header, offset)
         # change offset to index.
         self.__type = variable_tuple[TYPE_INDEX]
         self.__length = int(variable_tuple[LENGTH_INDEX]) - HEADER_SIZE
@@ -141,6 +181,8 @@ class PortAgentPacket():
             temp_header = ctypes.create_string_buffer(size)
             struct.pack_into(format, temp_header, 0, *variable_tuple)
             self.__header = temp_header.raw
+            self.__header_offset = 0
+            self.__header_checksum = None
             #print "here it is: ", binascii.hexlify(self.__header)
             
             """
@@ -161,39 +203,71 @@ class PortAgentPacket():
             #self.__header[OFFSET_P_CHECKSUM_LOW] = (self.__checksum & 0xff00) >> 8
 
 
+    def unpack_buffer(self, block, offset = 0):
+        """
+        Unpack a whole packet held in a receive buffer without copying it.
+        The header and payload remain views into block, so block must not
+        be reused for anything else once it has been handed to a packet.
+        @param block A bytearray or string holding the packet
+        @param offset Index of the packet header in block
+        """
+        self.unpack_header(block, offset)
+        self.__data = block
+        self.__data_offset = offset + HEADER_SIZE
+        self.__data_string = None
+
     def attach_data(self, data):
+        """
+        @param data The payload, either a string or a buffer such as a
+        bytearray; a buffer is only copied once get_data is called.
+        """
         self.__data = data
+        self.__data_offset = 0
+        self.__data_string = data if isinstance(data, str) else None
+        self.__verified = False
+
+    def _payload_size(self):
+        if self.__length is None:
+            return len(self.__data) - self.__data_offset
+        return self.__length
+
+    def _calculate_header_checksum(self):
+        """
+        XOR of the header bytes, skipping the checksum field. The header
+        does not change once received so this is only computed once.
+        """
+        if self.__header_checksum is None:
+            header = self.__header
+            offset = self.__header_offset
+            self.__header_checksum = \
+                xor_bytes(header, offset, OFFSET_P_CHECKSUM_LOW) ^ \
+                xor_bytes(header, offset + OFFSET_P_CHECKSUM_HIGH + 1,
+                          HEADER_SIZE - OFFSET_P_CHECKSUM_HIGH - 1)
+        return self.__header_checksum
 
     def calculate_checksum(self):
-        checksum = 0
-        for i in range(HEADER_SIZE):
-            if i < OFFSET_P_CHECKSUM_LOW or i > OFFSET_P_CHECKSUM_HIGH:
-                checksum ^= struct.unpack_from('B', str(self.__header[i]))[0]
-                
-        for i in range(self.__length):
-            checksum ^= struct.unpack_from('B', str(self.__data[i]))[0]
-            
-        return checksum
+        return self._calculate_header_checksum() ^ \
+            xor_bytes(self.__data, self.__data_offset, self.__length)
             
                                 
-    def verify_checksum(self):
-        checksum = 0
-        for i in range(HEADER_SIZE):
-            if i < OFFSET_P_CHECKSUM_LOW or i > OFFSET_P_CHECKSUM_HIGH:
-                checksum ^= struct.unpack_from('B', self.__header[i])[0]
-                
-        for i in range(self.__length):
-            checksum ^= struct.unpack_from('B', self.__data[i])[0]
-            
-        if checksum == self.__recv_checksum:
-            self.__isValid = True
-        else:
-            self.__isValid = False
-            
-        #log.debug('checksum: %i.' %(checksum))
+    def verify_checksum(self, force = False):
+        """
+        Check the received checksum against the packet contents. The result
+        is kept so the raw and data callbacks only verify a packet once.
+        @param force Verify again even if the packet was already verified
+        """
+        if self.__verified and not force:
+            return
+
+        self.__isValid = self.calculate_checksum() == self.__recv_checksum
+        self.__verified = True
 
     def get_header(self):
-        return self.__header
+        """
+        @retval The header as a string of its own, never the receive buffer
+        the packet was unpacked from.
+        """
+        return str(buffer(self.__header, self.__header_offset, HEADER_SIZE))
 
     
     def set_header(self, header):
@@ -202,9 +276,52 @@ class PortAgentPacket():
         this is one of the hoops we jump through to do that.
         """
         self.__header = header
+        self.__header_offset = 0
+        self.__header_checksum = None
+        self.__verified = False
 
     def get_data(self):
-        return self.__data
+        """
+        @retval The payload as a string, copied out of the receive buffer
+        the first time it is asked for.
+        """
+        if self.__data_string is None and self.__data is not None:
+            self.__data_string = str(buffer(self.__data, self.__data_offset,
+                                            self._payload_size()))
+        return self.__data_string
+
+    def get_data_view(self):
+        """
+        @retval The payload as a memoryview into the receive buffer, for
+        consumers that do not need a string of their own.
+        """
+        if self.__data is None:
+            return None
+        return memoryview(self.__data)[self.__data_offset:
+                                       self.__data_offset + self._payload_size()]
+
+    def get_data_base64(self):
+        """
+        @retval The payload base64 encoded, straight from the receive
+        buffer unless the payload string has already been made.
+        """
+        if self.__data is None:
+            return None
+        if self.__data_string is not None:
+            return base64.b64encode(self.__data_string)
+        return base64.b64encode(self.get_data_view())
+
+    def detach(self):
+        """
+        Stop referring to the receive buffer the packet was unpacked from,
+        so it can be reused. The payload is only copied if get_data has
+        not already made a string of it.
+        """
+        self.__header = self.get_header()
+        self.__header_offset = 0
+        if self.__data is not None:
+            self.__data = self.get_data()
+            self.__data_offset = 0
 
     def get_timestamp(self):
         return self.__port_agent_timestamp
@@ -220,6 +337,7 @@ class PortAgentPacket():
 
     def set_data_length(self, length):
         self.__length = length
+        self.__verified = False
 
     def get_header_type(self):
         return self.__type
@@ -232,13 +350,16 @@ class PortAgentPacket():
 
     def get_as_dict(self):
         """
-        Return a dictionary representation of a port agent packet
+        Return a dictionary representation of a port agent packet for
+        RawDataParticle. The payload is base64 encoded from the receive
+        buffer under 'raw_base64' rather than copied to a string under
+        'raw', and the dictionary can be pickled and copied.
         """
         return {
             'type': self.__type,
             'length': self.__length,
             'checksum': self.__checksum,
-            'raw': self.__data
+            'raw_base64': self.get_data_base64()
         }
 
     def is_valid(self):
@@ -257,10 +378,14 @@ class PortAgentClient(object):
     HEARTBEAT_INTERVAL_COMMAND = "heartbeat_interval "
     BREAK_COMMAND = "break "
     
-    def __init__(self, host, port, cmd_port, delim=None):
+    def __init__(self, host, port, cmd_port, delim=None, selector=None):
         """
         PortAgentClient constructor.
+        @param selector A PortAgentSelector to serve this client's listener
+        rather than a thread of its own. Listeners served by a selector
+        always use buffered receives. None for a listener thread of its own.
         """
+        self.selector = selector
         self.host = host
         self.port = port
         self.cmd_port = cmd_port
@@ -278,6 +403,7 @@ class PortAgentClient(object):
         self.listener_callback_error = None
         self.last_retry_time = None
         self.recovery_mutex = threading.Lock()
+        self.buffered_receive = False
         
     def _init_comms(self):
         """
@@ -286,6 +412,8 @@ class PortAgentClient(object):
         """
         
         try:
+            if self.selector and self.listener_thread:
+                self.selector.unregister(self.listener_thread)
             self._destroy_connection()
             self._create_connection()
 
@@ -310,8 +438,13 @@ class PortAgentClient(object):
                                                 self.callback_raw,
                                                 self.listener_callback_error,
                                                 self.callback_error,
-                                                self.user_callback_error)
-                self.listener_thread.start()
+                                                self.user_callback_error,
+                                                buffered = self.buffered_receive,
+                                                selector = self.selector)
+                if self.selector:
+                    self.selector.register(self.listener_thread)
+                else:
+                    self.listener_thread.start()
 
             ###
             # Reset recovery_attempts because we were successful, but only 
@@ -363,8 +496,14 @@ class PortAgentClient(object):
     def init_comms(self, user_callback_data = None, user_callback_raw = None,
                    listener_callback_error = None,
                    user_callback_error = None, heartbeat = 0,
-                   max_missed_heartbeats = None, start_listener = True):
-        
+                   max_missed_heartbeats = None, start_listener = True,
+                   buffered_receive = False):
+        """
+        Connect to the port agent and start the listener thread.
+        @param buffered_receive If True the listener reads whole blocks from
+        the socket and frames every complete packet in them, rather than
+        issuing separate reads for each packet header and payload.
+        """
         self.user_callback_data = user_callback_data        
         self.user_callback_raw = user_callback_raw
         self.listener_callback_error = listener_callback_error
@@ -372,6 +511,7 @@ class PortAgentClient(object):
         self.heartbeat = heartbeat
         self.max_missed_heartbeats = max_missed_heartbeats
         self.start_listener = start_listener 
+        self.buffered_receive = buffered_receive
 
         if  False == self._init_comms():
             error_string = ' port_agent_client private _init_comms failed.'
@@ -386,7 +526,10 @@ class PortAgentClient(object):
         log.info('PortAgentClient shutting down comms.')
         if (self.listener_thread):
             self.listener_thread.done()
-            self.listener_thread.join()
+            if self.selector:
+                self.selector.unregister(self.listener_thread)
+            else:
+                self.listener_thread.join()
 
         #-self.sock.shutdown(socket.SHUT_RDWR)
         self.sock.close()
@@ -442,7 +585,7 @@ class PortAgentClient(object):
             """        
             self.recovery_mutex.release()
             log.error("Maximum connection_level recovery attempts (%d) reached." % (self.recovery_attempts))
-            if self.listener_thread and self.listener_thread.is_alive():
+            if self.listener_thread and (self.selector or self.listener_thread.is_alive()):
                 log.info("Stopping listener thread.") 
                 self.listener_thread.done()
             returnValue = False
@@ -594,7 +737,9 @@ class Listener(threading.Thread):
                  callback_data = None, callback_raw = None,
                  default_callback_error = None,
                  local_callback_error = None,
-                 user_callback_error = None):
+                 user_callback_error = None,
+                 buffered = False,
+                 selector = None):
         """
         Listener thread constructor.
         @param sock The socket to listen on.
@@ -609,9 +754,17 @@ class Listener(threading.Thread):
         @param default_callback_data A callback to handle non-network exceptions
         @param local_callback_data The local callback when error encountered.
         @param user_callback_data The user callback on error_encountered.
+        @param buffered Receive into a reusable block and frame as many
+        packets as are available per read.
+        @param selector The PortAgentSelector that calls receive when the
+        socket is readable, rather than the listener running as a thread.
         """
         threading.Thread.__init__(self)
         self.sock = sock
+        self.buffered = buffered
+        self.selector = selector
+        # When a heartbeat is next due, for listeners served by a selector
+        self.heartbeat_deadline = None
         self.recovery_attempt = recovery_attempt
         self._done = False
         self.linebuf = ''
@@ -693,7 +846,7 @@ class Listener(threading.Thread):
         if self.heartbeat_missed_count <= 0:
             errorString = 'Maximum allowable Port Agent heartbeats (' + str(self.max_missed_heartbeats) + ') missed!'
             log.error(errorString)
-            self._invoke_error_callback(self.recovery_attempt, errorString)
+            self._connection_error(errorString)
         else:
             self.start_heartbeat_timer()
 
@@ -723,7 +876,12 @@ class Listener(threading.Thread):
         it and start it again, you have to instantiate a new one.
         I don't like this; we need to implement a tread timer that 
         stays up and can be reset and started many times.
+        Listeners served by a selector have it check a deadline instead.
         """
+        if self.selector:
+            self.heartbeat_deadline = time.time() + self.heartbeat
+            return
+
         if self.heartbeat_timer:
             self.heartbeat_timer.cancel()
 
@@ -784,6 +942,9 @@ class Listener(threading.Thread):
         if self.heartbeat:
             self.start_heartbeat_timer()
 
+        if self.buffered:
+            self._run_buffered()
+
         while not self._done:
             try:
                 log.debug('RX NEW PACKET')
@@ -793,8 +954,8 @@ class Listener(threading.Thread):
                 while bytes_left and not self._done:
                     try:
                         bytesrx = self.sock.recv_into(headerview[HEADER_SIZE - bytes_left:], bytes_left)
-                        log.debug('RX HEADER BYTES %d LEFT %d SOCK %r' % (
-                                                    bytesrx, bytes_left, self.sock,))
+                        log.debug('RX HEADER BYTES %d LEFT %d SOCK %r',
+                                  bytesrx, bytes_left, self.sock)
                         if bytesrx <= 0:
                             raise SocketClosed()
                         bytes_left -= bytesrx
@@ -810,18 +971,18 @@ class Listener(threading.Thread):
                 """
                 if (bytes_left == 0):
                     paPacket = PortAgentPacket()
-                    paPacket.unpack_header(str(header))
+                    paPacket.unpack_header(header)
                     data_size = paPacket.get_data_length()
                     bytes_left = data_size
                     data = bytearray(data_size)
                     dataview = memoryview(data)
-                    log.debug('Expecting DATA BYTES %d' % data_size)
+                    log.debug('Expecting DATA BYTES %d', data_size)
                     
                 while bytes_left and not self._done:
                     try:
                         bytesrx = self.sock.recv_into(dataview[data_size - bytes_left:], bytes_left)
-                        log.debug('RX DATA BYTES %d LEFT %d SOCK %r' % (
-                                                    bytesrx, bytes_left, self.sock,))
+                        log.debug('RX DATA BYTES %d LEFT %d SOCK %r',
+                                  bytesrx, bytes_left, self.sock)
                         if bytesrx <= 0:
                             raise SocketClosed()
                         bytes_left -= bytesrx
@@ -835,7 +996,7 @@ class Listener(threading.Thread):
                     """
                     Should have complete port agent packet.
                     """
-                    paPacket.attach_data(str(data))
+                    paPacket.attach_data(data)
                     log.debug("HANDLE PACKET")
                     self.handle_packet(paPacket)
 
@@ -870,6 +1031,132 @@ class Listener(threading.Thread):
 
         log.info('Port_agent_client thread done listening; going away.')
 
+    def _run_buffered(self):
+        """
+        Buffered processing loop. Block in select until the socket is
+        readable and receive what is available.
+        """
+        while not self._done:
+            (readable, writable, errored) = select.select([self.sock], [], [], SELECT_TIMEOUT)
+            if readable:
+                self.receive()
+
+    def _reset_buffer(self):
+        self._buf = bytearray(RECEIVE_BUFFER_SIZE)
+        self._view = memoryview(self._buf)
+        self._end = 0
+        self._buf_shared = False
+
+    def receive(self):
+        """
+        Read as much as is available into a reusable buffer and hand off
+        every complete packet in it. Packets are views into the buffer
+        while they are handled. Those with payloads of at least
+        VIEW_PACKET_SIZE keep the view, so once one of those has been
+        handed off the buffer belongs to it and receiving continues in a
+        new one. Smaller ones detach from the buffer once handled, so it is
+        kept and a trailing partial packet is moved to its front. The buffer is
+        larger than the biggest packet the 16 bit length field allows, so
+        there is always room to receive into. Connection errors are
+        reported to the error callbacks and end the listener.
+        """
+        if getattr(self, '_buf', None) is None:
+            self._reset_buffer()
+
+        try:
+            try:
+                bytesrx = self.sock.recv_into(self._view[self._end:])
+            except socket.error as e:
+                if e.errno == errno.EWOULDBLOCK:
+                    return
+                raise
+
+            if bytesrx <= 0:
+                raise SocketClosed()
+            self._end += bytesrx
+
+            start = self._handle_buffer(self._buf, 0, self._end)
+            if start:
+                remainder = self._view[start:self._end]
+                end = self._end - start
+                if self._buf_shared:
+                    self._reset_buffer()
+                    self._view[:end] = remainder
+                else:
+                    self._buf[:end] = remainder.tobytes()
+                self._end = end
+
+        except SocketClosed:
+            errorString = 'Listener thread: %s SocketClosed exception from port_agent socket' \
+                % (self.thread_name)
+            log.error(errorString)
+            self._done = True
+            self._connection_error(errorString)
+
+        except socket.error as e:
+            errorString = 'Listener thread: %s Socket error while receiving from port agent: %r' \
+             % (self.thread_name, e)
+            log.error(errorString)
+            self._done = True
+            self._connection_error(errorString)
+
+        except Exception as e:
+            # packets already handed off may still be viewing the buffer
+            self._reset_buffer()
+            self.default_callback_error(e)
+
+    def _connection_error(self, error_string):
+        """
+        Report a lost connection. Recovery reconnects and sleeps, so for
+        a listener served by a selector it runs in a thread of its own
+        rather than holding up the other listeners.
+        """
+        if self.selector:
+            thread = threading.Thread(target=self._invoke_error_callback,
+                                      args=(self.recovery_attempt, error_string))
+            thread.daemon = True
+            thread.start()
+        else:
+            self._invoke_error_callback(self.recovery_attempt, error_string)
+
+    def _handle_buffer(self, buf, start, end):
+        """
+        Frame and handle every complete packet in buf[start:end].
+        @param buf The receive buffer
+        @param start Index of the first unhandled byte
+        @param end Index past the last received byte
+        @retval Index of the first byte not yet handled
+        """
+        while end - start >= HEADER_SIZE and not self._done:
+            paPacket = PortAgentPacket()
+            paPacket.unpack_buffer(buf, start)
+            data_size = paPacket.get_data_length()
+            if data_size < 0:
+                raise ValueError('Invalid port agent packet length %d' % (data_size + HEADER_SIZE))
+
+            packet_end = start + HEADER_SIZE + data_size
+            if packet_end > end:
+                break
+
+            # small packets are cheaper to detach than to give up the buffer for
+            detach = data_size < VIEW_PACKET_SIZE
+            if not detach:
+                self._buf_shared = True
+            start = packet_end
+
+            # a failing callback must not cost the packets behind it
+            try:
+                self.handle_packet(paPacket)
+            except (SocketClosed, socket.error):
+                raise
+            except Exception as e:
+                self.default_callback_error(e)
+            finally:
+                if detach:
+                    paPacket.detach()
+
+        return start
+
     def _invoke_error_callback(self, recovery_attempt, error_string = "No error string passed."):
         """
         Invoke either the user_error_callback or the local_error_callback, depending upon the
@@ -889,3 +1176,142 @@ class Listener(threading.Thread):
         else:
             log.debug('port_agent_client listen thread calling user_callback_error.')
             self.user_callback_error(error_string)
+
+
+class PortAgentSelector(threading.Thread):
+    """
+    Serve the listeners of many port agent clients from one thread, as a
+    process hosting many drivers does rather than running a listener
+    thread and heartbeat timer for each. The thread blocks in poll on
+    every registered socket, receiving from those that are readable and
+    checking for missed heartbeats. Unlike select, poll is not limited to
+    descriptors below FD_SETSIZE.
+    """
+
+    def __init__(self):
+        threading.Thread.__init__(self, name='PortAgentSelector')
+        self.daemon = True
+        self._listeners = {}
+        self._lock = threading.Condition()
+        # Completed passes of the select loop, for unregister to wait on
+        self._cycles = 0
+        self._done = False
+        # Written to wake the select loop when the listeners change
+        (self._wake_read, self._wake_write) = os.pipe()
+
+    def register(self, listener):
+        """
+        Start serving a listener, starting the thread if need be.
+        @param listener A Listener constructed with this selector.
+        """
+        listener.thread_name = self.name
+        if listener.heartbeat:
+            listener.start_heartbeat_timer()
+        with self._lock:
+            self._listeners[listener.sock.fileno()] = listener
+            if not self.is_alive() and not self._done:
+                self.start()
+        self._wake()
+
+    def unregister(self, listener):
+        """
+        Stop serving a listener. Unless called from the selector thread,
+        wait until the loop is no longer using it, so its socket can be
+        closed.
+        @param listener A registered Listener.
+        """
+        with self._lock:
+            for (fileno, registered) in self._listeners.items():
+                if registered is listener:
+                    del self._listeners[fileno]
+            if threading.current_thread() is self or not self.is_alive():
+                return
+            # the pass after the one in progress leaves the listener out
+            self._wake()
+            cycle = self._cycles
+            while self._cycles <= cycle and self.is_alive():
+                self._lock.wait(SELECT_TIMEOUT)
+
+    def stop(self):
+        """
+        End the select loop.
+        """
+        self._done = True
+        self._wake()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+    def _wake(self):
+        try:
+            os.write(self._wake_write, 'x')
+        except OSError:
+            pass
+
+    def run(self):
+        log.info('PortAgentSelector thread started.')
+        poller = select.poll()
+        poller.register(self._wake_read, select.POLLIN)
+        polled = set()
+        while not self._done:
+            with self._lock:
+                listeners = dict(self._listeners)
+                self._cycles += 1
+                self._lock.notify_all()
+
+            for fileno in polled.difference(listeners):
+                poller.unregister(fileno)
+            for fileno in set(listeners).difference(polled):
+                poller.register(fileno, select.POLLIN)
+            polled = set(listeners)
+
+            now = time.time()
+            timeout = None
+            for listener in listeners.values():
+                if listener.heartbeat_deadline is not None:
+                    if listener.heartbeat_deadline <= now:
+                        listener.heartbeat_deadline = None
+                        listener.heartbeat_timeout()
+                    if listener.heartbeat_deadline is not None:
+                        wait = max(listener.heartbeat_deadline - now, 0)
+                        timeout = wait if timeout is None else min(timeout, wait)
+
+            try:
+                events = poller.poll(None if timeout is None else int(math.ceil(timeout * 1000)))
+            except select.error as e:
+                if e.args[0] != errno.EINTR:
+                    # don't spin on an error that persists
+                    log.error('PortAgentSelector poll failed: %r', e)
+                    time.sleep(SELECT_TIMEOUT)
+                continue
+
+            for (fileno, event) in events:
+                if fileno == self._wake_read:
+                    os.read(self._wake_read, 4096)
+                    continue
+                listener = listeners[fileno]
+                if event & select.POLLNVAL:
+                    self._drop_closed(fileno, listener)
+                    continue
+                # hang ups and errors show up as failed receives
+                if not listener._done:
+                    listener.receive()
+                # a finished listener's socket stays ready, stop polling it
+                if listener._done:
+                    with self._lock:
+                        if self._listeners.get(fileno) is listener:
+                            del self._listeners[fileno]
+
+        with self._lock:
+            self._cycles += 1
+            self._lock.notify_all()
+        log.info('PortAgentSelector thread done.')
+
+    def _drop_closed(self, fileno, listener):
+        """
+        Stop serving a listener whose socket was closed without it being
+        unregistered, rather than polling the closed descriptor forever.
+        """
+        log.warn('PortAgentSelector dropping listener %s, its socket is closed', fileno)
+        with self._lock:
+            if self._listeners.get(fileno) is listener:
+                del self._listeners[fileno]
@@ -12,6 +12,8 @@ __author__ = 'Edward Hunter'
 __license__ = 'Apache 2.0'
 
 import re
+import sre_parse
+import sre_constants
 import ntplib
 import time
 import yaml
@@ -21,12 +23,17 @@ from mi.core.common import BaseEnum
 from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import InstrumentParameterExpirationException
 from mi.core.instrument.instrument_dict import InstrumentDict
+from mi.core.instrument import startup_stats
+from mi.core.instrument.startup_stats import StartupStatsKey
 
 from mi.core.log import get_logger ; log = get_logger()
 
 EGG_PATH = "resource"
 DEFAULT_FILENAME = "strings.yml"
 
+# Required literals of the regexes seen so far, by (pattern, flags)
+_required_literals = {}
+
 class ParameterDictType(BaseEnum):
     BOOL = "bool"
     INT = "int"
@@ -219,7 +226,61 @@ class Parameter(object):
         """
         return self.value.get_value(timestamp)
     
+def _literal_runs(items, runs, run):
+    """
+    Collect the runs of literal characters a parsed regex must match.
+    @param items A parsed regex sequence.
+    @param runs The list to add finished runs to.
+    @param run The characters of the run in progress.
+    """
+    for (op, av) in items:
+        if op == sre_constants.LITERAL:
+            run.append(chr(av))
+        elif op == sre_constants.SUBPATTERN:
+            # a group is matched in sequence, so its literals continue the run
+            _literal_runs(av[1], runs, run)
+        else:
+            runs.append(''.join(run))
+            del run[:]
+            if op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+                repeated = []
+                _literal_runs(av[2], runs, repeated)
+                runs.append(''.join(repeated))
+
+
+def required_literal(regex):
+    """
+    Find the longest string every match of a regex contains, so input
+    without it can be passed over without searching.
+    @param regex A compiled regex.
+    @retval The string, None if there is none or it can not be found.
+    """
+    key = (regex.pattern, regex.flags)
+    if key in _required_literals:
+        return _required_literals[key]
+
+    literal = None
+    if isinstance(regex.pattern, str):
+        try:
+            parsed = sre_parse.parse(regex.pattern, regex.flags)
+        except (sre_constants.error, ValueError):
+            parsed = None
+        if parsed is not None and not parsed.pattern.flags & sre_constants.SRE_FLAG_IGNORECASE:
+            runs = []
+            run = []
+            _literal_runs(parsed, runs, run)
+            runs.append(''.join(run))
+            literal = max(runs, key=len) or None
+
+    _required_literals[key] = literal
+    return literal
+
+
 class RegexParameter(Parameter):
+    # The regex required_literal was last found for, and the literal
+    _literal_regex = None
+    _literal = None
+
     def __init__(self, name, pattern, f_getval, f_format, value=None,
                  visibility=ParameterDictVisibility.READ_WRITE,
                  menu_path_read=None,
@@ -280,10 +341,11 @@ class RegexParameter(Parameter):
                            value_description=value_description)
 
         self.pattern = pattern
-        if regex_flags == None:
-            self.regex = re.compile(pattern)
-        else:
-            self.regex = re.compile(pattern, regex_flags)
+        with startup_stats.timed(StartupStatsKey.REGEX_COMPILE_TIME, StartupStatsKey.REGEX_COMPILES):
+            if regex_flags == None:
+                self.regex = re.compile(pattern)
+            else:
+                self.regex = re.compile(pattern, regex_flags)
             
         self.f_getval = f_getval
 
@@ -295,15 +357,28 @@ class RegexParameter(Parameter):
         @retval True if an update was successful, False otherwise.
         """
         if not (isinstance(input, str)):
-            match = self.regex.search(str(input))
-        else:
-            match = self.regex.search(input)
+            input = str(input)
+        if not self.could_match(input):
+            return False
 
+        match = self.regex.search(input)
         if match:
             self.value.set_value(self.f_getval(match))
             return True
         else:
             return False    
+
+    def could_match(self, input):
+        """
+        Check input for the literal text every match of the value regex
+        contains, which is much quicker than searching it with the regex.
+        @param input A string possibly containing the parameter value.
+        @retval False if the regex can not match the input, True if it may.
+        """
+        if self._literal_regex is not self.regex:
+            self._literal = required_literal(self.regex)
+            self._literal_regex = self.regex
+        return self._literal is None or self._literal in input
     
 class FunctionParameter(Parameter):
     def __init__(self, name, f_getval, f_format, value=None,
@@ -389,6 +464,11 @@ class ProtocolParameterDict(InstrumentDict):
     Protocol parameter dictionary. Manages, matches and formats device
     parameters.
     """
+    # The parameters the update index was built from, and the index of
+    # (name, parameter, regex, required literal) in dictionary order.
+    _indexed_items = None
+    _update_index = ()
+
     def __init__(self):
         """
         Constructor.        
@@ -673,7 +753,7 @@ class ProtocolParameterDict(InstrumentDict):
         """
         hit_count = 0
         multi_mode = False
-        for (name, val) in self._param_dict.iteritems():
+        for (name, val) in self._update_candidates(input):
             if multi_mode == True and val.description.multi_match == False:
                 continue
             if val.update(input):
@@ -694,7 +774,7 @@ class ProtocolParameterDict(InstrumentDict):
         @retval A dict with the names and values that were updated
         """
         result = {}
-        for (name, val) in self._param_dict.iteritems():
+        for (name, val) in self._update_candidates(input):
             update_result = val.update(input)
             if update_result:
                 result[name] = update_result 
@@ -722,7 +802,7 @@ class ProtocolParameterDict(InstrumentDict):
         elif(target_params and isinstance(target_params, list)):
             params = target_params
         elif(target_params == None):
-            params = self._param_dict.keys()
+            params = [name for (name, val) in self._update_candidates(input)]
         else:
             raise InstrumentParameterException("invalid target_params, must be name or list")
 
@@ -733,6 +813,35 @@ class ProtocolParameterDict(InstrumentDict):
                 found = True
         return found
 
+    def _update_candidates(self, input):
+        """
+        Find the parameters that may update from an input, in dictionary
+        order. Regex parameters are indexed by the literal text every match
+        of their regex contains, and passed over when the input lacks it,
+        rather than each searching the input in turn.
+        @param input A string to match to dictionary objects.
+        @retval A list of (name, parameter) pairs.
+        """
+        items = self._param_dict.items()
+        if items != self._indexed_items:
+            self._indexed_items = items
+            self._update_index = [self._index_entry(name, val) for (name, val) in items]
+
+        text = input if isinstance(input, str) else str(input)
+        return [(name, val) for (name, val, regex, literal) in self._update_index
+                if literal is None or literal in text or val.regex is not regex]
+
+    @staticmethod
+    def _index_entry(name, val):
+        """
+        @retval The update index entry of a parameter. Only parameters
+        updating by a plain regex search have a literal; any other update
+        may match input the regex does not.
+        """
+        if isinstance(val, RegexParameter) and type(val).update.im_func is RegexParameter.update.im_func:
+            return (name, val, val.regex, required_literal(val.regex))
+        return (name, val, None, None)
+
     def get_all(self, timestamp=None):
         """
         Retrive the configuration (all settable key values).
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.startup_stats
+@file mi/core/instrument/startup_stats.py
+@brief Process wide tallies of the time drivers spend starting up:
+    compiling parameter regexes and loading YAML metadata. Driver processes
+    add the time taken importing and constructing their drivers and report
+    these with their process stats.
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+from threading import Lock
+from contextlib import contextmanager
+
+from mi.core.common import BaseEnum
+
+
+class StartupStatsKey(BaseEnum):
+    """
+    Keys of the startup stats. Times are in seconds.
+    """
+    IMPORT_TIME = 'import_time'
+    CONSTRUCT_TIME = 'construct_time'
+    REGEX_COMPILE_TIME = 'regex_compile_time'
+    REGEX_COMPILES = 'regex_compiles'
+    YAML_LOAD_TIME = 'yaml_load_time'
+    YAML_LOADS = 'yaml_loads'
+    METADATA_CACHE_HITS = 'metadata_cache_hits'
+
+# Tallies kept for the whole process
+TALLY_KEYS = (StartupStatsKey.REGEX_COMPILE_TIME, StartupStatsKey.REGEX_COMPILES,
+              StartupStatsKey.YAML_LOAD_TIME, StartupStatsKey.YAML_LOADS,
+              StartupStatsKey.METADATA_CACHE_HITS)
+
+_stats = dict.fromkeys(TALLY_KEYS, 0)
+_lock = Lock()
+
+
+def add(key, value=1):
+    """
+    Add to a tally.
+    @param key A StartupStatsKey in TALLY_KEYS.
+    @param value The time or count to add.
+    """
+    with _lock:
+        _stats[key] += value
+
+
+@contextmanager
+def timed(time_key, count_key):
+    """
+    Time a block, adding the time taken and one to the count.
+    @param time_key The StartupStatsKey of the time tally.
+    @param count_key The StartupStatsKey of the count tally.
+    """
+    start_time = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - start_time
+        with _lock:
+            _stats[time_key] += elapsed
+            _stats[count_key] += 1
+
+
+def get_stats():
+    """
+    @retval A dict of the tallies so far.
+    """
+    with _lock:
+        return dict(_stats)
+
+
+def difference(stats, since):
+    """
+    @param stats Tallies from get_stats.
+    @param since Earlier tallies from get_stats.
+    @retval The tallies added between the two.
+    """
+    return dict((key, stats[key] - since[key]) for key in TALLY_KEYS)
+
+
+def reset():
+    """
+    Zero the tallies.
+    """
+    with _lock:
+        for key in TALLY_KEYS:
+            _stats[key] = 0
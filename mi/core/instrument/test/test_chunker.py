@@ -10,16 +10,29 @@
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import os
+import mmap
+import tempfile
 import unittest
+import random
 import re
+import time
 from functools import partial
 from mi.core.unit_test import MiUnitTest, MiUnitTestCase
 from nose.plugins.attrib import attr
 from pyon.util.unit_test import IonUnitTestCase
 from ooi.logging import log
 
-from mi.core.exceptions import SampleException
+from mi.core.exceptions import SampleException, NotImplementedException
+from mi.core.instrument.chunker import Chunker
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import RingBufferStringChunker
+from mi.core.instrument.chunker import RingBufferBinaryChunker
+from mi.core.instrument.chunker import MappedChunker
+from mi.core.instrument.chunker import RegexSieve
+from mi.core.instrument.chunker import LengthPrefixedSieve
+from mi.core.instrument.chunker import CombinedRegexSieve
+from mi.core.instrument.chunker import PD0Framer
 
 @attr('UNIT', group='mi')
 class UnitTestStringChunker(MiUnitTestCase):
@@ -59,9 +72,11 @@ class UnitTestStringChunker(MiUnitTestCase):
                 
         return return_list
     
+    chunker_class = StringChunker
+
     def setUp(self):
         """ Setup a chunker for use in tests """
-        self._chunker = StringChunker(UnitTestStringChunker.sieve_function)
+        self._chunker = self.chunker_class(UnitTestStringChunker.sieve_function)
         
     def _display_chunk_list(self, data, chunk_list):
         """ Display the data as viewed through the chunk list """
@@ -90,7 +105,7 @@ class UnitTestStringChunker(MiUnitTestCase):
         pattern = r'SATPAR(?P<sernum>\d{4}),(?P<timer>\d{1,7}.\d\d),(?P<counts>\d{10}),(?P<checksum>\d{1,3})'
         regex = re.compile(pattern)
 
-        self._chunker = StringChunker(partial(self._chunker.regex_sieve_function, regex_list=[regex]))
+        self._chunker = self.chunker_class(partial(self._chunker.regex_sieve_function, regex_list=[regex]))
         
         self.assertEquals([(0,31)],
                           self._chunker.regex_sieve_function(self.SAMPLE_1, [regex]))
@@ -308,7 +323,7 @@ class UnitTestStringChunker(MiUnitTestCase):
         def funky_sieve(data):
             return [(3,6),(0,3)]
 
-        self._chunker = StringChunker(funky_sieve)
+        self._chunker = self.chunker_class(funky_sieve)
         self._chunker.add_chunk("BarFoo", self.TIMESTAMP_1)
         (time, result) = self._chunker.get_next_data()
         self.assertEquals(result, "Bar")
@@ -327,10 +342,569 @@ class UnitTestStringChunker(MiUnitTestCase):
         def overlap_sieve(data):
             return [(0,3),(2,6)]
 
-        self._chunker = StringChunker(overlap_sieve)
+        self._chunker = self.chunker_class(overlap_sieve)
         self.assertRaises(SampleException,
                           self._chunker.add_chunk, "foobar", self.TIMESTAMP_1)
 
+@attr('UNIT', group='mi')
+class UnitTestRingBufferStringChunker(UnitTestStringChunker):
+    """
+    Run the string chunker tests against the ring buffer engine and check
+    that it behaves like the original chunker.
+    """
+    chunker_class = RingBufferStringChunker
+
+    def _random_feed(self, seed, count):
+        """
+        Build a repeatable list of (data, timestamp) packets made up of
+        samples and garbage split at random boundaries.
+        """
+        rand = random.Random(seed)
+        stream = ""
+        for i in range(count):
+            choice = rand.randint(0, 3)
+            if choice == 0:
+                stream += "Garbage%d\r\n" % i
+            else:
+                stream += "SATPAR0229,10.%02d,22067%05d,%d\r\n" % (
+                    i % 100, i, i % 1000)
+
+        packets = []
+        index = 0
+        while index < len(stream):
+            length = rand.randint(1, 80)
+            packets.append((stream[index:index+length],
+                            self.TIMESTAMP_1 + len(packets)))
+            index += length
+        return packets
+
+    def test_matches_string_chunker(self):
+        """
+        Feed the same packets to both engines, pulling data and non-data
+        along the way, and verify identical results.
+        """
+        rand = random.Random(1)
+        old = StringChunker(UnitTestStringChunker.sieve_function)
+        new = RingBufferStringChunker(UnitTestStringChunker.sieve_function)
+
+        for (data, timestamp) in self._random_feed(0, 500):
+            old.add_chunk(data, timestamp)
+            new.add_chunk(data, timestamp)
+            self.assertEquals(old.data_chunk_list, new.data_chunk_list)
+            self.assertEquals(old.nondata_chunk_list, new.nondata_chunk_list)
+            self.assertEquals(old.buffer, new.buffer)
+
+            action = rand.randint(0, 3)
+            if action == 1:
+                self.assertEquals(old.get_next_data_with_index(),
+                                  new.get_next_data_with_index())
+            elif action == 2:
+                self.assertEquals(old.get_next_non_data_with_index(),
+                                  new.get_next_non_data_with_index())
+
+        (time, result) = old.get_next_data()
+        while result is not None:
+            self.assertEquals((time, result), new.get_next_data())
+            (time, result) = old.get_next_data()
+        self.assertEquals(new.get_next_data(), (None, None))
+
+    def test_compaction(self):
+        """
+        Consumed data is eventually dropped from the underlying buffer
+        """
+        for i in range(1000):
+            self._chunker.add_chunk(self.SAMPLE_1, self.TIMESTAMP_1)
+            (time, result) = self._chunker.get_next_data()
+            self.assertEquals(result, self.SAMPLE_1)
+
+        self.assertEquals(self._chunker.buffer, "")
+        self.assertTrue(len(self._chunker._buffer) < 2 * RingBufferStringChunker.COMPACT_SIZE)
+        self.assertTrue(len(self._chunker._raw_chunks) < 2)
+
+    def test_reset(self):
+        """
+        Parsers reset the chunker by assigning the buffer and lists
+        """
+        self._chunker.add_chunk("Foo" + self.FRAGMENT_1, self.TIMESTAMP_1)
+        self._chunker.buffer = ""
+        self._chunker.raw_chunk_list = []
+        self._chunker.data_chunk_list = []
+        self._chunker.nondata_chunk_list = []
+
+        self._chunker.add_chunk(self.SAMPLE_2, self.TIMESTAMP_2)
+        (time, result, start, end) = self._chunker.get_next_data_with_index()
+        self.assertEquals(result, self.SAMPLE_2)
+        self.assertEquals(time, self.TIMESTAMP_2)
+        self.assertEquals((start, end), (0, 31))
+
+@attr('UNIT', group='mi')
+class UnitTestRingBufferBinaryChunker(MiUnitTestCase):
+    """
+    Test the binary flavor of the ring buffer chunker
+    """
+    SAMPLE_1 = "\x7f\x7f\x04\x00\x01\x02"
+    SAMPLE_2 = "\x7f\x7f\x04\x00\x03\x04"
+    TIMESTAMP_1 = 3569168821.102485
+
+    @staticmethod
+    def sieve_function(raw_data):
+        return [(m.start(), m.end())
+                for m in re.finditer(r'\x7f\x7f\x04\x00..', raw_data, re.DOTALL)]
+
+    def test_add_get_fragment(self):
+        """
+        Binary blocks are stitched together and come back as bytearrays
+        """
+        chunker = RingBufferBinaryChunker(self.sieve_function)
+        chunker.add_chunk(bytearray(self.SAMPLE_1 + self.SAMPLE_2[:3]), self.TIMESTAMP_1)
+        chunker.add_chunk(bytearray(self.SAMPLE_2[3:]), self.TIMESTAMP_1 + 1)
+
+        (time, result) = chunker.get_next_data()
+        self.assertTrue(isinstance(result, bytearray))
+        self.assertEquals(result, bytearray(self.SAMPLE_1))
+        (time, result) = chunker.get_next_data()
+        self.assertEquals(result, bytearray(self.SAMPLE_2))
+        self.assertEquals(time, self.TIMESTAMP_1)
+        self.assertEquals(chunker.get_next_data(), (None, None))
+
+@attr('UNIT', group='mi')
+class UnitTestMappedChunker(MiUnitTestCase):
+    """
+    Test the chunker sieving windows of a memory mapped file
+    """
+    SAMPLE = UnitTestStringChunker.SAMPLE_1
+    TIMESTAMP_1 = 3569168821.102485
+
+    def setUp(self):
+        (fd, path) = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        self.data = "Foo" + self.SAMPLE + "Bar" + self.SAMPLE + self.SAMPLE + "Baz"
+        os.write(fd, self.data)
+        self.mapped_file = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+        os.close(fd)
+        self.addCleanup(self.mapped_file.close)
+        self.chunker = MappedChunker(RegexSieve([re.compile(r'SATPAR.{25}')]), self.mapped_file)
+
+    def test_matches_string_chunker(self):
+        """
+        Windows of the map give the same blocks as the same data read in
+        """
+        chunker = StringChunker(UnitTestStringChunker.sieve_function)
+        for index in range(0, len(self.data), 7):
+            end = min(index + 7, len(self.data))
+            chunker.add_chunk(self.data[index:end], self.TIMESTAMP_1)
+            self.chunker.add_range(index, end, self.TIMESTAMP_1)
+            self.assertEquals(self.chunker.buffer, chunker.buffer)
+            self.assertEquals(self.chunker.get_next_data_with_index(),
+                              chunker.get_next_data_with_index())
+            self.assertEquals(self.chunker.get_next_non_data(), chunker.get_next_non_data())
+        self.assertEquals(self.chunker.get_next_data(), (None, None))
+
+    def test_file_offsets(self):
+        """
+        The window is indexed by file offset, a discontinuous range restarts it
+        """
+        self.chunker.add_range(0, len(self.data), self.TIMESTAMP_1)
+        (time, result, start, end) = self.chunker.get_next_data_with_index()
+        self.assertEquals((result, start, end), (self.SAMPLE, 3, 34))
+        self.assertEquals(self.chunker._base, 34)
+
+        self.chunker.add_range(37, 68, self.TIMESTAMP_1 + 1)
+        self.assertEquals(self.chunker.buffer, self.SAMPLE)
+        (time, result, start, end) = self.chunker.get_next_data_with_index()
+        self.assertEquals((time, result, start, end), (self.TIMESTAMP_1 + 1, self.SAMPLE, 0, 31))
+        self.assertEquals(self.chunker._base, 68)
+
+        self.assertRaises(NotImplementedException, self.chunker.add_chunk, self.SAMPLE, self.TIMESTAMP_1)
+
+@attr('UNIT', group='mi')
+class UnitTestIncrementalSieve(MiUnitTestCase):
+    """
+    Test the stateful sieve adapters with both chunker engines
+    """
+    SAMPLE_REGEX = re.compile(r'SATPAR(?P<sernum>\d{4}),(?P<timer>\d{1,7}.\d\d),(?P<counts>\d{10}),(?P<checksum>\d{1,3})')
+    SAMPLE_1 = "SATPAR0229,10.01,2206748111,111"
+    SAMPLE_2 = "SATPAR0229,10.02,2206748222,222"
+    TIMESTAMP_1 = 3569168821.102485
+
+    RECORD_1 = "\x7f\x7f\x08\x00ABCD"
+    RECORD_2 = "\x7f\x7f\x0a\x00EFGHIJ"
+
+    def _record_sieve(self):
+        return LengthPrefixedSieve('\x7f\x7f', 2, '<H', max_length=64)
+
+    def test_regex_sieve_callable(self):
+        """
+        Called like a function the sieve is stateless
+        """
+        sieve = RegexSieve([self.SAMPLE_REGEX])
+        self.assertEquals(sieve(self.SAMPLE_1), [(0, 31)])
+        self.assertEquals(sieve("Foo" + self.SAMPLE_1), [(3, 34)])
+        self.assertEquals(sieve.resume_index, 0)
+
+    def test_regex_sieve_resume(self):
+        """
+        The resume index moves past matches and, with a maximum length,
+        past non-data that can no longer start a match
+        """
+        sieve = RegexSieve([self.SAMPLE_REGEX], max_length=40)
+        self.assertEquals(sieve.feed("x" * 100, 0), [])
+        self.assertEquals(sieve.resume_index, 61)
+
+        data = "x" * 39 + self.SAMPLE_1
+        self.assertEquals(sieve.feed(data, 61), [(100, 131)])
+        self.assertEquals(sieve.resume_index, 131)
+
+        sieve.rebase(131)
+        self.assertEquals(sieve.resume_index, 0)
+
+    def test_regex_sieve_chunkers(self):
+        """
+        Fragments and noise come out the same with both chunker engines
+        """
+        for chunker_class in (StringChunker, RingBufferStringChunker):
+            chunker = chunker_class(RegexSieve([self.SAMPLE_REGEX], max_length=40))
+            stream = "Foo" * 50 + self.SAMPLE_1 + "\r\n" + "Bar" * 50 + self.SAMPLE_2
+            for index in range(0, len(stream), 7):
+                chunker.add_chunk(stream[index:index+7], self.TIMESTAMP_1)
+                # only data past the resume index is ever rescanned
+                self.assertTrue(len(chunker.buffer) - chunker.sieve.resume_index <= 46)
+
+            (time, result) = chunker.get_next_data()
+            self.assertEquals(result, self.SAMPLE_1)
+            (time, result) = chunker.get_next_non_data()
+            self.assertEquals(result, "\r\n" + "Bar" * 50)
+            (time, result) = chunker.get_next_data()
+            self.assertEquals(result, self.SAMPLE_2)
+            self.assertEquals(chunker.get_next_data(), (None, None))
+
+    def test_length_prefixed_sieve(self):
+        """
+        Records are framed by their length field, garbage and false syncs
+        are skipped
+        """
+        sieve = self._record_sieve()
+        data = "junk" + self.RECORD_1 + "\x7f\x7f\xff\xff" + self.RECORD_2
+        self.assertEquals(sieve(data), [(4, 12), (16, 26)])
+
+    def test_length_prefixed_sieve_truncated(self):
+        """
+        Scanning resumes at an incomplete record until the rest arrives
+        """
+        sieve = self._record_sieve()
+        data = "junk" + self.RECORD_1 + self.RECORD_2[:5]
+        self.assertEquals(sieve.feed(data, 0), [(4, 12)])
+        self.assertEquals(sieve.resume_index, 12)
+
+        self.assertEquals(sieve.feed(self.RECORD_2[:5] + self.RECORD_2[5:], 12),
+                          [(12, 22)])
+        self.assertEquals(sieve.resume_index, 22)
+
+    def test_length_prefixed_sieve_validator(self):
+        """
+        Complete records failing validation are skipped
+        """
+        sieve = LengthPrefixedSieve('\x7f\x7f', 2, '<H',
+                                    validator=lambda data, s, e: data[s+4] != 'A')
+        self.assertEquals(sieve(self.RECORD_1 + self.RECORD_2), [(8, 18)])
+
+    def test_length_prefixed_sieve_chunker(self):
+        """
+        Feed records one byte at a time through the ring buffer chunker
+        """
+        chunker = RingBufferBinaryChunker(self._record_sieve())
+        stream = "junk" + self.RECORD_1 + "noise" + self.RECORD_2
+        for char in stream:
+            chunker.add_chunk(char, self.TIMESTAMP_1)
+
+        (time, result) = chunker.get_next_data()
+        self.assertEquals(result, bytearray(self.RECORD_1))
+        (time, result) = chunker.get_next_data()
+        self.assertEquals(result, bytearray(self.RECORD_2))
+        self.assertEquals(chunker.get_next_data(), (None, None))
+
+@attr('UNIT', group='mi')
+class UnitTestCombinedRegexSieve(MiUnitTestCase):
+    """
+    Test the single pass multi-pattern sieve
+    """
+    SAMPLE = "SATPAR0229,10.01,2206748111,111"
+    STATUS = "Status: OK\r\n"
+
+    PATTERNS = [
+        ('sample', re.compile(r'SATPAR(?P<sernum>\d{4}),(\d{1,7}.\d\d),(\d{10}),(\d{1,3})')),
+        ('status', re.compile(r'Status: (.*?)\r\n', re.DOTALL))]
+
+    def setUp(self):
+        self.sieve = CombinedRegexSieve(self.PATTERNS + [('number', r'\d{4}')])
+
+    def test_tagged(self):
+        """
+        Blocks are ordered, tagged and the first listed pattern wins
+        """
+        data = "Foo%s%sBar1234" % (self.SAMPLE, self.STATUS)
+        self.assertEquals(self.sieve.tagged(data),
+                          [('sample', 3, 34), ('status', 34, 46), ('number', 49, 53)])
+        self.assertEquals(self.sieve(data), [(3, 34), (34, 46), (49, 53)])
+
+    def test_classify(self):
+        """
+        Chunks handed out by the chunker map back to their pattern
+        """
+        self.assertEquals(self.sieve.classify(self.SAMPLE), 'sample')
+        self.assertEquals(self.sieve.classify(self.STATUS), 'status')
+        self.assertEquals(self.sieve.classify("1234"), 'number')
+        self.assertEquals(self.sieve.classify("Foo"), None)
+
+    def test_chunker(self):
+        """
+        Use the sieve incrementally in a chunker
+        """
+        sieve = CombinedRegexSieve(self.PATTERNS)
+        chunker = RingBufferStringChunker(sieve)
+        data = "Foo%s%sBar" % (self.SAMPLE, self.STATUS)
+        for index in range(0, len(data), 5):
+            chunker.add_chunk(data[index:index+5], 3569168821.102485)
+
+        (time, result) = chunker.get_next_data()
+        self.assertEquals(result, self.SAMPLE)
+        (time, result) = chunker.get_next_data()
+        self.assertEquals(sieve.classify(result), 'status')
+
+    def test_driver_fixtures(self):
+        """
+        The combined driver sieves find the same blocks as the per-matcher
+        loops on the driver test fixtures
+        """
+        for (sieve, matchers, blocks) in BenchmarkChunker._sieve_fixtures():
+            for block in blocks:
+                self.assertEquals(sieve(block),
+                                  sorted(Chunker.regex_sieve_function(block, matchers)))
+
+            # where the per-matcher loop produces overlapping blocks the
+            # combined sieve settles on one
+            self.assertFalse(Chunker.overlaps(sieve("".join(blocks))))
+
+@attr('UNIT', group='mi')
+class UnitTestPD0Framer(MiUnitTestCase):
+    """
+    Test the PD0 ensemble framer against the teledyne driver fixtures
+    """
+    def setUp(self):
+        from mi.instrument.teledyne.workhorse_monitor_75_khz.test import test_data
+        self.ensembles = [test_data.RSN_SAMPLE_RAW_DATA,
+                          test_data.CG_SAMPLE_RAW_DATA,
+                          test_data.CG_SAMPLE_RAW_DATA2]
+        self.framer = PD0Framer()
+
+    def _corrupt(self, ensemble):
+        """
+        @retval The ensemble with a flipped byte in its payload
+        """
+        return ensemble[:100] + chr(ord(ensemble[100]) ^ 0xff) + ensemble[101:]
+
+    def test_fixtures(self):
+        """
+        Every fixture ensemble is framed whole, including its checksum
+        """
+        for ensemble in self.ensembles:
+            self.assertTrue(PD0Framer.checksum_valid(ensemble, 0, len(ensemble)))
+            self.assertEquals(self.framer(ensemble), [(0, len(ensemble))])
+
+    def test_corpus(self):
+        """
+        Frame a stream of ensembles mixed with corrupt and truncated ones
+        """
+        (first, second, third) = self.ensembles
+        corpus = ["\r\n>", first,
+                  self._corrupt(second),
+                  third[:200],
+                  second,
+                  "\x7f\x7fjunk",
+                  third,
+                  first[:-1]]
+        expected = []
+        position = 0
+        for part in corpus:
+            if part in self.ensembles:
+                expected.append((position, position + len(part)))
+            position += len(part)
+
+        data = "".join(corpus)
+        self.assertEquals(self.framer(data), expected)
+        self.assertEquals(PD0Framer(verify_checksum=False)(data)[0], expected[0])
+
+        # the truncated tail holds the resume index until it is complete
+        framer = PD0Framer()
+        self.assertEquals(framer.feed(data, 0), expected)
+        self.assertEquals(framer.resume_index, len(data) - len(first) + 1)
+
+    def test_chunker(self):
+        """
+        Stream the corpus through the ring buffer chunker in small packets
+        """
+        (first, second, third) = self.ensembles
+        data = first + self._corrupt(second) + third[:200] + second + third
+        chunker = RingBufferBinaryChunker(PD0Framer())
+        for index in range(0, len(data), 61):
+            chunker.add_chunk(data[index:index+61], 3569168821.0)
+
+        for ensemble in (first, second, third):
+            (time, result) = chunker.get_next_data()
+            self.assertEquals(result, bytearray(ensemble))
+        self.assertEquals(chunker.get_next_data(), (None, None))
+
+    def test_max_length(self):
+        """
+        Ensembles longer than the limit are treated as false syncs
+        """
+        ensemble = self.ensembles[0]
+        self.assertEquals(PD0Framer(max_length=len(ensemble) - 1)(ensemble), [])
+        self.assertEquals(PD0Framer(max_length=len(ensemble))(ensemble),
+                          [(0, len(ensemble))])
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkChunker(MiUnitTest):
+    """
+    Feed 1 MB of SBE37 and PD0 traffic through the original and the ring
+    buffer chunkers using the driver sieves.
+    """
+    FEED_SIZE = 1024 * 1024
+    PACKET_SIZE = 64
+    # The original engine is quadratic when the buffer is drained late so
+    # the bulk comparison uses a smaller feed.
+    BULK_SIZE = 64 * 1024
+
+    def _sbe37(self, size):
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37Protocol
+        sample = "#55.9044,41.40609, 572.170,   34.2583, 1505.948, 05 Feb 2013, 19:16:59\r\n"
+        return (SBE37Protocol.sieve_function, sample * (size / len(sample)))
+
+    def _pd0(self, size):
+        from mi.instrument.teledyne.workhorse_monitor_75_khz.driver import WorkhorseProtocol
+        from mi.instrument.teledyne.workhorse_monitor_75_khz.test.test_data import RSN_SAMPLE_RAW_DATA
+        return (WorkhorseProtocol.sieve_function,
+                RSN_SAMPLE_RAW_DATA * (size / len(RSN_SAMPLE_RAW_DATA)))
+
+    def _feed(self, chunker_class, sieve, data, drain_each_packet):
+        chunker = chunker_class(sieve)
+        count = 0
+        start_time = time.time()
+        for index in range(0, len(data), self.PACKET_SIZE):
+            chunker.add_chunk(data[index:index+self.PACKET_SIZE], 3569168821.0)
+            if drain_each_packet:
+                (timestamp, result) = chunker.get_next_data()
+                while result is not None:
+                    count += 1
+                    (timestamp, result) = chunker.get_next_data()
+        (timestamp, result) = chunker.get_next_data()
+        while result is not None:
+            count += 1
+            (timestamp, result) = chunker.get_next_data()
+        return (time.time() - start_time, count)
+
+    def _compare(self, name, source, size, drain_each_packet):
+        (sieve, data) = source(size)
+        (old_time, old_count) = self._feed(StringChunker, sieve, data, drain_each_packet)
+        (new_time, new_count) = self._feed(RingBufferStringChunker, sieve, data, drain_each_packet)
+        self.assertEquals(old_count, new_count)
+        log.info("%s %d bytes, %d chunks: StringChunker %.3fs, RingBufferStringChunker %.3fs",
+                 name, len(data), new_count, old_time, new_time)
+
+    @staticmethod
+    def _sieve_fixtures():
+        """
+        @retval A list of (combined sieve, matcher list, blocks) for the
+            seabird and wetlabs driver test fixtures
+        """
+        from mi.instrument.seabird.sbe37smb.ooicore import driver as sbe37
+        from mi.instrument.seabird.sbe37smb.ooicore.test import sample_data as sbe37_data
+        from mi.instrument.wetlabs.fluorometer.flort_d import driver as flort
+        from mi.instrument.wetlabs.fluorometer.flort_d.test import sample_data as flort_data
+
+        sbe37_blocks = [sbe37_data.SAMPLE, sbe37_data.SAMPLE_DS,
+                        sbe37_data.SAMPLE, sbe37_data.SAMPLE_DC]
+        flort_blocks = [flort_data.SAMPLE_MNU_RESPONSE, flort_data.SAMPLE_SAMPLE_RESPONSE,
+                        flort_data.SAMPLE_RUN_RESPONSE, flort_data.SAMPLE_MET_RESPONSE,
+                        flort_data.SAMPLE_DUMP_MEMORY_RESPONSE, flort_data.SAMPLE_SAMPLE_RESPONSE]
+
+        return [(sbe37.SIEVE_MATCHER,
+                 [sbe37.SAMPLE_PATTERN_MATCHER, sbe37.STATUS_DATA_REGEX_MATCHER,
+                  sbe37.CALIBRATION_DATA_REGEX_MATCHER],
+                 sbe37_blocks),
+                (flort.SIEVE_MATCHER,
+                 [flort.MNU_REGEX_MATCHER, flort.RUN_REGEX_MATCHER, flort.MET_REGEX_MATCHER,
+                  flort.DUMP_MEMORY_REGEX_MATCHER, flort.SAMPLE_REGEX_MATCHER],
+                 flort_blocks)]
+
+    def test_combined_regex_sieve(self):
+        """
+        Time the combined sieve against the per-matcher loop
+        """
+        for (sieve, matchers, blocks) in self._sieve_fixtures():
+            data = "".join(blocks)
+            start_time = time.time()
+            for i in range(1000):
+                Chunker.regex_sieve_function(data, matchers)
+            loop_time = time.time() - start_time
+
+            start_time = time.time()
+            for i in range(1000):
+                sieve(data)
+            combined_time = time.time() - start_time
+
+            log.info("%s x1000 (%d bytes): per-matcher loop %.3fs, combined %.3fs",
+                     sieve.tags, len(data), loop_time, combined_time)
+
+    def test_pd0_framer(self):
+        """
+        Report PD0 framing throughput against the regex sieves it replaces
+        """
+        import os
+        from struct import unpack
+        from mi.dataset.parser.adcpa import ADCPA_PD0_PARSED_MATCHER
+
+        def regex_sieve(raw_data):
+            # the per-candidate regex the workhorse drivers used before
+            return_list = []
+            for match in re.finditer(r'\x7f\x7f(..)', raw_data, re.DOTALL):
+                length = unpack("H", match.group(1))[0]
+                matcher = re.compile(r'\x7f\x7f(.{' + str(length) + '})', re.DOTALL)
+                for inner in matcher.finditer(raw_data, match.start()):
+                    if inner.start() == match.start():
+                        return_list.append((inner.start(), inner.end()))
+            return return_list
+
+        path = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'dataset', 'driver',
+                            'moas', 'gl', 'adcpa', 'resource', 'LB180210.PD0')
+        # the old workhorse sieve rescans the rest of the buffer for every
+        # candidate so keep the sample small enough for it to finish
+        data = open(path, 'rb').read()[:256 * 1024]
+        size = len(data) / (1024.0 * 1024.0)
+
+        framer = PD0Framer()
+        for (name, sieve) in [("PD0Framer", framer),
+                              ("workhorse regex", regex_sieve),
+                              ("adcpa regex", partial(Chunker.regex_sieve_function,
+                                                      regex_list=[ADCPA_PD0_PARSED_MATCHER]))]:
+            start_time = time.time()
+            spans = sieve(data)
+            elapsed = time.time() - start_time
+            log.info("%s: %d ensembles in %.2f MB, %.3fs, %.1f MB/s",
+                     name, len(spans), size, elapsed, size / elapsed)
+
+    def test_sbe37_streaming(self):
+        self._compare("SBE37 streaming", self._sbe37, self.FEED_SIZE, True)
+
+    def test_pd0_streaming(self):
+        self._compare("PD0 streaming", self._pd0, self.FEED_SIZE, True)
+
+    def test_sbe37_bulk(self):
+        self._compare("SBE37 bulk", self._sbe37, self.BULK_SIZE, False)
+
+    def test_pd0_bulk(self):
+        self._compare("PD0 bulk", self._pd0, self.BULK_SIZE, False)
+
 @unittest.skip("Write this when a binary chunker is needed")
 @attr('UNIT', group='mi')
 class UnitTestBinaryChunker(MiUnitTestCase):
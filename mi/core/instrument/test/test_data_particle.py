@@ -15,14 +15,17 @@ import json
 import base64
 import time
 import ntplib
+import numpy
+from mock import patch
 
 from nose.plugins.attrib import attr
-from mi.core.unit_test import MiUnitTestCase
+from mi.core.unit_test import MiUnitTest, MiUnitTestCase
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import SampleException, ReadOnlyException, NotImplementedException, InstrumentParameterException
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, DataParticleValue
 from mi.core.instrument.data_particle import RawDataParticle, CommonDataParticleType
+from mi.core.instrument.data_particle import ParticleEncoder, unpack_particle, msgpack
 from mi.core.instrument.port_agent_client import PortAgentPacket
 
 TEST_PARTICLE_VERSION = 1
@@ -283,3 +286,145 @@ class TestUnitDataParticle(MiUnitTestCase):
 
         with self.assertRaises(NotImplementedException):
             particle.data_particle_type()
+
+
+class TupleParticle(DataParticle):
+    """
+    A particle providing its values through _build_parsed_tuple
+    """
+    _data_particle_type = TEST_PARTICLE_TYPE
+    _value_ids = ("temp", "cond", "depth", "serial", "flag", "none", "count",
+                  "array", "nested", "unicode", "percent %s")
+
+    def _build_parsed_tuple(self):
+        return (self._value_ids, self.raw_data)
+
+class ExtendedTupleParticle(TupleParticle):
+    """
+    Adds a value to a tuple particle the old way
+    """
+    def _build_parsed_values(self):
+        result = super(ExtendedTupleParticle, self)._build_parsed_values()
+        result.append({DataParticleKey.VALUE_ID: "extra", DataParticleKey.VALUE: 1})
+        return result
+
+TUPLE_VALUES = (23.45, 15.9, numpy.float64(0.1), "SN\"%s\n", True, None, 2 ** 40,
+                [1, 2.5, "a"], {"b": 1, "a": [None]}, u"caf\xe9", float('nan'))
+
+@attr('UNIT', group='mi')
+class TestUnitParticleEncoder(MiUnitTestCase):
+    """
+    Compare the compiled particle encoder against json.dumps of generate_dict
+    """
+    def assert_json(self, particle):
+        for sort_keys in [False, True]:
+            self.assertEqual(particle.generate(sorted=sort_keys),
+                             json.dumps(particle.generate_dict(), sort_keys=sort_keys))
+
+    def test_tuple_particle(self):
+        particle = TupleParticle(TUPLE_VALUES, port_timestamp=3555423720.711772)
+        self.assertTrue(particle._use_parsed_tuple())
+        self.assert_json(particle)
+
+        values = particle.generate_dict()[DataParticleKey.VALUES]
+        self.assertEqual(values[0], {DataParticleKey.VALUE_ID: "temp", DataParticleKey.VALUE: 23.45})
+        self.assertEqual(len(values), len(TUPLE_VALUES))
+
+    def test_headers(self):
+        for kwargs in [{},
+                       {'internal_timestamp': 3555423719.711772, 'new_sequence': False},
+                       {'port_timestamp': 3555423720.711772, 'new_sequence': True,
+                        'preferred_timestamp': DataParticleKey.INTERNAL_TIMESTAMP,
+                        'quality_flag': DataParticleValue.INVALID}]:
+            self.assert_json(TupleParticle(TUPLE_VALUES, **kwargs))
+
+    def test_encoder_cache(self):
+        particle = TupleParticle(TUPLE_VALUES)
+        particle.generate()
+        templates = len(ParticleEncoder._templates)
+        TupleParticle(TUPLE_VALUES[::-1]).generate()
+        self.assertEqual(len(ParticleEncoder._templates), templates)
+
+        with patch('mi.core.instrument.data_particle.MAX_ENCODER_TEMPLATES', 1):
+            ParticleEncoder.get((DataParticleKey.VALUES,), ("a",))
+            self.assertEqual(len(ParticleEncoder._templates), 1)
+
+    def test_fallback(self):
+        """
+        Particles overriding _build_parsed_values keep the json.dumps path
+        """
+        particle = ExtendedTupleParticle(TUPLE_VALUES)
+        self.assertFalse(particle._use_parsed_tuple())
+        self.assertEqual(particle.generate_dict()[DataParticleKey.VALUES][-1][DataParticleKey.VALUE_ID], "extra")
+        self.assert_json(particle)
+
+        self.assertFalse(RawDataParticle._use_parsed_tuple())
+        with self.assertRaises(SampleException):
+            TestUnitDataParticle.BadDataParticle("raw").generate()
+
+    def test_driver_particles(self):
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37DataParticle
+        from mi.instrument.seabird.sbe37smb.ooicore.test.sample_data import SAMPLE
+        from mi.dataset.parser.glider import GgldrEngDelayedDataParticle, EngineeringParticleKey
+
+        self.assert_json(SBE37DataParticle(SAMPLE, port_timestamp=3555423720.711772))
+        self.assertRaises(SampleException, SBE37DataParticle("bad sample").generate)
+
+        data = dict((key, {'Data': numpy.float64(i) / 3}) for (i, key) in
+                    enumerate(EngineeringParticleKey.list()[::3]))
+        data[EngineeringParticleKey.M_BATTPOS] = {'Data': numpy.float64('nan')}
+        self.assert_json(GgldrEngDelayedDataParticle(data))
+
+    def test_packed(self):
+        particles = [TupleParticle(TUPLE_VALUES[:-1], port_timestamp=3555423720.711772, new_sequence=True),
+                     ExtendedTupleParticle(TUPLE_VALUES[:-1]),
+                     RawDataParticle({"raw": "abc", "length": 3, "type": 1, "checksum": 5})]
+        if msgpack is None:
+            self.assertRaises(NotImplementedException, particles[0].generate_packed)
+            return
+
+        for particle in particles:
+            self.assertEqual(unpack_particle(particle.generate_packed()), particle.generate_dict())
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkParticleEncoder(MiUnitTest):
+    """
+    Time generate() with the compiled encoder against json.dumps of
+    generate_dict() for driver and parser particles
+    """
+    def _time(self, name, particles):
+        for (method, generate) in [("json.dumps", lambda particle: json.dumps(particle.generate_dict())),
+                                   ("encoder", lambda particle: particle.generate()),
+                                   ("msgpack", lambda particle: particle.generate_packed())]:
+            if method == "msgpack" and msgpack is None:
+                continue
+            # the first pass warms up the value parsing and encoder caches
+            for i in range(2):
+                start_time = time.time()
+                for particle in particles:
+                    generate(particle)
+                elapsed = time.time() - start_time
+            log.info("%s, %d particles: %s %.1f us per particle",
+                     name, len(particles), method, elapsed / len(particles) * 1e6)
+
+    def test_sbe37(self):
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37DataParticle
+        from mi.instrument.seabird.sbe37smb.ooicore.test.sample_data import SAMPLE
+
+        self._time("SBE37", [SBE37DataParticle(SAMPLE, port_timestamp=3555423720.711772)
+                             for i in range(20000)])
+
+    def test_glider_eng(self):
+        from mi.dataset.parser.glider import GgldrEngDelayedDataParticle, EngineeringParticleKey
+
+        data = dict((key, {'Data': numpy.float64(i) / 3}) for (i, key) in
+                    enumerate(EngineeringParticleKey.list()))
+        self._time("glider engineering", [GgldrEngDelayedDataParticle(data) for i in range(2000)])
+
+    def test_pd0(self):
+        from mi.instrument.teledyne.particles import ADCP_PD0_PARSED_DataParticle
+        from mi.instrument.teledyne.workhorse_monitor_75_khz.test import test_data
+
+        self._time("PD0 (json.dumps path)", [ADCP_PD0_PARSED_DataParticle(test_data.RSN_SAMPLE_RAW_DATA)
+                                             for i in range(200)])
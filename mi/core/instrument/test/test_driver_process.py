@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_driver_process
+@file mi/core/instrument/test/test_driver_process.py
+@brief Test cases for the driver process event queue and startup stats
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.driver_process import DriverProcess, EventQueuePolicy, ProcessStatsKey
+from mi.core.instrument import zmq_driver_process
+from mi.core.instrument.zmq_driver_process import ZmqDriverProcess
+from mi.core.instrument.protocol_param_dict import ProtocolParameterDict
+from mi.core.instrument.startup_stats import StartupStatsKey
+
+
+def sample(stream, i):
+    value = '{"stream_name": "%s", "values": [%d]}' % (stream, i)
+    return {'type': DriverAsyncEvent.SAMPLE, 'value': value, 'time': 1.0}
+
+
+def change(evt_type, value):
+    return {'type': evt_type, 'value': value, 'time': 1.0}
+
+
+class ParamDriver(object):
+    """
+    Stands in for a driver building its parameter dict when constructed
+    """
+    def __init__(self, evt_callback):
+        self._param_dict = ProtocolParameterDict()
+        for i in range(10):
+            self._param_dict.add('param%d' % i, r'param%d = (\d+)' % i, lambda match: int(match.group(1)), str)
+
+
+@attr('UNIT', group='mi')
+class TestDriverProcessEvents(MiUnitTest):
+    """
+    Test the bounded event queue policies and stats
+    """
+    def _process(self, size, policy):
+        process = DriverProcess(None, None, None, event_queue_size=size, event_queue_policy=policy)
+        process.messaging_started = True
+        return process
+
+    def test_unbounded_until_full(self):
+        process = self._process(3, EventQueuePolicy.DROP_RAW)
+        for i in range(3):
+            process.send_event(i)
+        self.assertEqual(process.get_events(), [0, 1, 2])
+
+        stats = process.get_process_stats()
+        self.assertEqual(stats[ProcessStatsKey.QUEUED], 3)
+        self.assertEqual(stats[ProcessStatsKey.SENT], 3)
+        self.assertEqual(stats[ProcessStatsKey.QUEUE_DEPTH], 0)
+        self.assertEqual(stats[ProcessStatsKey.HIGH_WATER_MARK], 3)
+        self.assertEqual(stats[ProcessStatsKey.QUEUE_SIZE], 3)
+        self.assertEqual(stats[ProcessStatsKey.QUEUE_POLICY], EventQueuePolicy.DROP_RAW)
+        self.assertEqual(stats[ProcessStatsKey.DROPPED_OTHER], 0)
+
+    def test_drop_raw(self):
+        process = self._process(4, EventQueuePolicy.DROP_RAW)
+        events = [sample('parsed', 0), sample('raw', 1), 'other', sample('raw', 2)]
+        for evt in events:
+            process.send_event(evt)
+
+        # raw particles go first, oldest first
+        process.send_event('a')
+        process.send_event('b')
+        self.assertEqual(list(process.events), [sample('parsed', 0), 'other', 'a', 'b'])
+
+        # then samples, then anything
+        process.send_event('c')
+        process.send_event('d')
+        self.assertEqual(process.get_events(), ['a', 'b', 'c', 'd'])
+
+        stats = process.get_process_stats()
+        self.assertEqual(stats[ProcessStatsKey.DROPPED_RAW], 2)
+        self.assertEqual(stats[ProcessStatsKey.DROPPED_SAMPLE], 1)
+        self.assertEqual(stats[ProcessStatsKey.DROPPED_OTHER], 1)
+        self.assertEqual(stats[ProcessStatsKey.HIGH_WATER_MARK], 4)
+
+    def test_coalesce(self):
+        process = self._process(4, EventQueuePolicy.COALESCE)
+        for evt in [change(DriverAsyncEvent.STATE_CHANGE, 'A'),
+                    change(DriverAsyncEvent.CONFIG_CHANGE, 1),
+                    change(DriverAsyncEvent.STATE_CHANGE, 'B'),
+                    change(DriverAsyncEvent.CONFIG_CHANGE, 2),
+                    sample('raw', 0)]:
+            process.send_event(evt)
+
+        self.assertEqual(process.get_events(), [change(DriverAsyncEvent.STATE_CHANGE, 'B'),
+                                                change(DriverAsyncEvent.CONFIG_CHANGE, 2),
+                                                sample('raw', 0)])
+        self.assertEqual(process.get_process_stats()[ProcessStatsKey.COALESCED], 2)
+
+        # with nothing to coalesce it drops as DROP_RAW does
+        for i in range(5):
+            process.send_event(sample('raw', i))
+        self.assertEqual(process.get_events(), [sample('raw', i) for i in range(1, 5)])
+        self.assertEqual(process.get_process_stats()[ProcessStatsKey.DROPPED_RAW], 1)
+
+    def test_drop_keeps_order(self):
+        """
+        Events held in the raw, sample and other queues go out in the
+        order they were sent
+        """
+        process = self._process(5, EventQueuePolicy.COALESCE)
+        for evt in [change(DriverAsyncEvent.STATE_CHANGE, 'A'),
+                    sample('raw', 0),
+                    sample('parsed', 0),
+                    change(DriverAsyncEvent.STATE_CHANGE, 'B'),
+                    sample('raw', 1),
+                    'other',
+                    sample('parsed', 1)]:
+            process.send_event(evt)
+
+        self.assertEqual(process.get_events(), [sample('parsed', 0),
+                                                change(DriverAsyncEvent.STATE_CHANGE, 'B'),
+                                                sample('raw', 1),
+                                                'other',
+                                                sample('parsed', 1)])
+        stats = process.get_process_stats()
+        self.assertEqual(stats[ProcessStatsKey.COALESCED], 1)
+        self.assertEqual(stats[ProcessStatsKey.DROPPED_RAW], 1)
+        self.assertEqual(stats[ProcessStatsKey.QUEUE_DEPTH], 0)
+
+    def test_block(self):
+        process = self._process(2, EventQueuePolicy.BLOCK)
+        process.send_event(0)
+        process.send_event(1)
+
+        sender = threading.Thread(target=process.send_event, args=(2,))
+        sender.start()
+        time.sleep(.1)
+        self.assertTrue(sender.is_alive())
+        self.assertEqual(process.get_events(), [0, 1])
+        sender.join(5)
+        self.assertFalse(sender.is_alive())
+        self.assertEqual(process.get_events(), [2])
+        self.assertEqual(process.get_process_stats()[ProcessStatsKey.BLOCKED], 1)
+
+    def test_block_stopped(self):
+        """
+        Senders do not wait on a queue nothing is draining
+        """
+        process = self._process(1, EventQueuePolicy.BLOCK)
+        process.send_event(0)
+
+        sender = threading.Thread(target=process.send_event, args=(1,))
+        sender.start()
+        time.sleep(.1)
+        with process.events_condition:
+            process.messaging_started = False
+            process.events_condition.notify_all()
+        sender.join(5)
+        self.assertFalse(sender.is_alive())
+        self.assertEqual(list(process.events), [1])
+        self.assertEqual(process.get_process_stats()[ProcessStatsKey.DROPPED_OTHER], 1)
+
+    def test_bad_config(self):
+        self.assertRaises(ValueError, DriverProcess, None, None, None, event_queue_policy='bogus')
+        self.assertRaises(ValueError, DriverProcess, None, None, None, event_queue_size=0)
+
+    def test_commands(self):
+        process = self._process(2, EventQueuePolicy.DROP_RAW)
+        self.assertEqual(process.cmd_driver({'cmd': 'test_events', 'kwargs': {'events': [1, 2, 3]}}),
+                         'test_events')
+        stats = process.cmd_driver({'cmd': 'get_process_stats'})
+        self.assertEqual(stats[ProcessStatsKey.QUEUE_DEPTH], 2)
+        self.assertEqual(stats[ProcessStatsKey.DROPPED_OTHER], 1)
+
+
+@attr('UNIT', group='mi')
+class TestDriverProcessStartup(MiUnitTest):
+    """
+    Test the driver startup stats
+    """
+    def test_construct_driver(self):
+        process = DriverProcess(__name__, 'ParamDriver', None)
+        self.assertTrue(process.construct_driver())
+
+        stats = process.get_process_stats()[ProcessStatsKey.STARTUP]
+        self.assertEqual(stats, process.get_startup_stats())
+        self.assertEqual(process.driver_startup[StartupStatsKey.REGEX_COMPILES], 10)
+        self.assertGreater(process.driver_startup[StartupStatsKey.REGEX_COMPILE_TIME], 0)
+        self.assertGreaterEqual(process.driver_startup[StartupStatsKey.IMPORT_TIME], 0)
+        self.assertGreater(process.driver_startup[StartupStatsKey.CONSTRUCT_TIME], 0)
+        self.assertEqual(process.driver_startup[StartupStatsKey.YAML_LOADS], 0)
+        # the process tallies include every driver constructed so far
+        self.assertGreaterEqual(stats[StartupStatsKey.REGEX_COMPILES], 10)
+
+    def test_bad_driver(self):
+        process = DriverProcess(__name__, 'NoSuchDriver', None)
+        self.assertFalse(process.construct_driver())
+        self.assertEqual(process.driver_startup, {})
+
+
+class GatedZmqDriverProcess(ZmqDriverProcess):
+    """
+    Holds the messaging threads up before they bind their sockets until
+    the gate is set
+    """
+    def __init__(self, *args):
+        self.gate = threading.Event()
+        ZmqDriverProcess.__init__(self, *args)
+
+    def _get_host_string(self):
+        self.gate.wait()
+        return self._host_string
+
+    def _set_host_string(self, value):
+        self._host_string = value
+
+    cmd_host_string = property(_get_host_string, _set_host_string)
+    event_host_string = property(_get_host_string, _set_host_string)
+
+
+@attr('UNIT', group='mi')
+class TestZmqDriverProcessMessaging(MiUnitTest):
+    """
+    Test starting and stopping the ZMQ messaging threads
+    """
+    def test_stop_while_binding(self):
+        """
+        Stopping messaging before the threads have bound their sockets
+        still ends them
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        process = GatedZmqDriverProcess(None, None, os.path.join(directory, 'cmd_port'),
+                                        os.path.join(directory, 'evt_port'), None)
+        process.start_messaging()
+        process.stop_messaging()
+        process.gate.set()
+
+        shutdown = threading.Thread(target=process.shutdown)
+        shutdown.daemon = True
+        shutdown.start()
+        shutdown.join(5)
+        self.assertFalse(shutdown.is_alive())
+        self.assertFalse(process.cmd_thread.is_alive())
+        self.assertFalse(process.evt_thread.is_alive())
+
+    def test_shutdown_threads_stuck(self):
+        """
+        Shutdown returns when the threads do not stop in time, rather than
+        waiting on their sockets to close
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        process = GatedZmqDriverProcess(None, None, os.path.join(directory, 'cmd_port'),
+                                        os.path.join(directory, 'evt_port'), None)
+        process.start_messaging()
+        self.addCleanup(process.gate.set)
+        process.stop_messaging()
+
+        with patch.object(zmq_driver_process, 'SHUTDOWN_TIMEOUT', .1):
+            shutdown = threading.Thread(target=process.shutdown)
+            shutdown.daemon = True
+            shutdown.start()
+            shutdown.join(5)
+        self.assertFalse(shutdown.is_alive())
+        self.assertTrue(process.cmd_thread.is_alive())
+        self.assertIsNone(process.zmq_context)
+
+        # the threads still close their sockets once they get going
+        process.gate.set()
+        process.cmd_thread.join(5)
+        process.evt_thread.join(5)
+        self.assertFalse(process.cmd_thread.is_alive())
+        self.assertFalse(process.evt_thread.is_alive())
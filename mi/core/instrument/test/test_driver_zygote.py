@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_driver_zygote
+@file mi/core/instrument/test/test_driver_zygote.py
+@brief Test cases for launching driver processes from the zygote, and a
+    benchmark comparing it to starting an interpreter for each.
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import sys
+import time
+import signal
+import tempfile
+from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentException
+from mi.core.instrument.driver_process import DriverProcess
+from mi.core.instrument.driver_zygote import DriverZygote, ZygoteProcess
+from mi.core.instrument.zmq_driver_client import ZmqDriverClient, MAX_POLL_DELAY
+from mi.core.instrument.zmq_driver_process import ZmqDriverProcess
+
+TEST_DRIVER = ('mi.instrument.ooici.mi.test_driver.driver', 'InstrumentDriver')
+
+
+@attr('UNIT', group='mi')
+class TestDriverZygote(MiUnitTest):
+    """
+    Test processes forked by the zygote
+    """
+    def setUp(self):
+        self.zygote = DriverZygote(python=sys.executable, preload=['mi.core.instrument.driver_process'])
+        self.zygote.start()
+        self.addCleanup(self.zygote.stop)
+
+    def test_exit_codes(self):
+        process = self.zygote.launch('import os; os._exit(3)')
+        self.assertTrue(isinstance(process, ZygoteProcess))
+        self.assertEqual(process.wait(5), 3)
+        self.assertEqual(process.returncode, 3)
+
+        self.assertEqual(self.zygote.launch('pass').wait(5), 0)
+        self.assertEqual(self.zygote.launch('import sys; sys.exit(2)').wait(5), 2)
+        self.assertEqual(self.zygote.launch('raise ValueError()').wait(5), 1)
+
+    def test_preloaded(self):
+        """
+        Children start with the preload modules imported
+        """
+        process = self.zygote.launch('import sys, os; '
+                                     'os._exit("mi.core.instrument.driver_process" in sys.modules)')
+        self.assertEqual(process.wait(5), 1)
+
+    def test_terminate(self):
+        process = self.zygote.launch('import time; time.sleep(30)')
+        self.assertEqual(process.poll(), None)
+        self.assertEqual(process.wait(.1), None)
+        process.terminate()
+        self.assertEqual(process.wait(5), -signal.SIGTERM)
+
+    def test_wait_other_exits(self):
+        """
+        Other processes exiting do not end a wait early
+        """
+        process = self.zygote.launch('import time; time.sleep(1)')
+        self.zygote.launch('pass')
+        self.zygote.launch('import time; time.sleep(.3)')
+        self.assertEqual(process.wait(10), 0)
+
+    def test_stopped(self):
+        process = self.zygote.launch('import time; time.sleep(1)')
+        self.zygote.stop()
+        self.assertRaises(InstrumentException, self.zygote.launch, 'pass')
+        # the process outlives the zygote
+        os.kill(process.pid, 0)
+        process.kill()
+
+    def test_driver_process(self):
+        DriverProcess.zygote = self.zygote
+        self.addCleanup(setattr, DriverProcess, 'zygote', None)
+
+        workdir = tempfile.gettempdir() + '/'
+        (process, cmd_port, evt_port) = ZmqDriverProcess.launch_process(*TEST_DRIVER, workdir=workdir,
+                                                                        ppid=os.getpid())
+        self.assertTrue(isinstance(process, ZygoteProcess))
+        client = ZmqDriverClient('localhost', cmd_port, evt_port)
+        client.start_messaging()
+        self.addCleanup(time.sleep, MAX_POLL_DELAY)
+        self.addCleanup(client.stop_messaging)
+        self.assertTrue('ppid:%d' % os.getpid() in client.cmd_dvr('process_echo'))
+
+        client.cmd_dvr('stop_driver_process')
+        self.assertEqual(process.wait(10), 0)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkDriverZygote(MiUnitTest):
+    """
+    Launch 20 test driver processes from the zygote and as interpreters
+    of their own, timing until every driver answers
+    """
+    count = 20
+
+    def setUp(self):
+        if not os.path.exists('bin/python'):
+            raise SkipTest('driver processes are launched with bin/python')
+        self.processes = []
+        self.clients = []
+        self.addCleanup(self._cleanup)
+
+    def _cleanup(self):
+        for client in self.clients:
+            client.stop_messaging()
+        time.sleep(MAX_POLL_DELAY)
+        for process in self.processes:
+            process.kill()
+            process.wait()
+
+    def _launch(self, name):
+        workdir = tempfile.mkdtemp() + '/'
+        start_time = time.time()
+        for i in range(self.count):
+            (process, cmd_port, evt_port) = ZmqDriverProcess.launch_process(*TEST_DRIVER, workdir=workdir,
+                                                                            ppid=os.getpid())
+            self.processes.append(process)
+            client = ZmqDriverClient('localhost', cmd_port, evt_port)
+            self.clients.append(client)
+            client.start_messaging()
+            client.cmd_dvr('get_resource_state')
+        log.info("%s: %d drivers started in %.2fs", name, self.count, time.time() - start_time)
+
+    def test_interpreters(self):
+        self._launch("interpreter per driver")
+
+    def test_zygote(self):
+        zygote = DriverZygote()
+        zygote.start()
+        self.addCleanup(zygote.stop)
+        DriverProcess.zygote = zygote
+        self.addCleanup(setattr, DriverProcess, 'zygote', None)
+        self._launch("zygote")
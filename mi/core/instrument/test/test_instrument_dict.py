@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_instrument_dict
+@file mi/core/instrument/test/test_instrument_dict.py
+@brief Test cases for loading instrument dictionary metadata through the
+    metadata cache
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import shutil
+import tempfile
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.instrument import instrument_dict
+from mi.core.instrument import startup_stats
+from mi.core.instrument.instrument_dict import InstrumentDict
+from mi.core.instrument.startup_stats import StartupStatsKey
+from mi.core.instrument.protocol_param_dict import ProtocolParameterDict
+from mi.core.instrument.protocol_cmd_dict import ProtocolCommandDict
+
+STRINGS = """
+parameters: {
+  foo: {
+    description: "FooDesc",
+    display_name: "FooDisp",
+    value: {type: "int", units: "C"}
+  }
+}
+commands: {
+  cmd1: {
+    description: "C1Desc",
+    display_name: "C1Disp"
+  }
+}
+"""
+
+
+@attr('UNIT', group='mi')
+class TestMetadataCache(MiUnitTest):
+    """
+    Test strings files are parsed once and their metadata pickled
+    """
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.workdir)
+        self.cache_dir = os.path.join(self.workdir, 'cache')
+        patcher = patch.object(instrument_dict, 'METADATA_CACHE_DIR', self.cache_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.dict(instrument_dict._loaded_metadata, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.filename = self._write(STRINGS)
+
+    def _write(self, yml):
+        filename = os.path.join(self.workdir, 'strings.yml')
+        with open(filename, 'w') as strings:
+            strings.write(yml)
+        return filename
+
+    def _load(self):
+        """
+        @retval The metadata and the startup tallies added loading it
+        """
+        tallies = startup_stats.get_stats()
+        metadata = InstrumentDict.load_metadata_from_file(self.filename)
+        return (metadata, startup_stats.difference(startup_stats.get_stats(), tallies))
+
+    def test_parsed_once(self):
+        (metadata, added) = self._load()
+        self.assertEqual(metadata['commands']['cmd1']['display_name'], 'C1Disp')
+        self.assertEqual(added[StartupStatsKey.YAML_LOADS], 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        # loaded again in this process
+        (again, added) = self._load()
+        self.assertTrue(again is metadata)
+        self.assertEqual(added[StartupStatsKey.YAML_LOADS], 0)
+        self.assertEqual(added[StartupStatsKey.METADATA_CACHE_HITS], 1)
+
+        # loaded by another process, from the cache file
+        instrument_dict._loaded_metadata.clear()
+        (cached, added) = self._load()
+        self.assertEqual(cached, metadata)
+        self.assertEqual(added[StartupStatsKey.YAML_LOADS], 0)
+        self.assertEqual(added[StartupStatsKey.METADATA_CACHE_HITS], 1)
+
+    def test_changed_strings(self):
+        self._load()
+        self._write(STRINGS.replace('C1Disp', 'C1New'))
+        (metadata, added) = self._load()
+        self.assertEqual(metadata['commands']['cmd1']['display_name'], 'C1New')
+        self.assertEqual(added[StartupStatsKey.YAML_LOADS], 1)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+    def test_bad_cache(self):
+        self._load()
+        instrument_dict._loaded_metadata.clear()
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'w') as cache_file:
+                cache_file.write('garbage')
+
+        (metadata, added) = self._load()
+        self.assertEqual(metadata['parameters']['foo']['description'], 'FooDesc')
+        self.assertEqual(added[StartupStatsKey.YAML_LOADS], 1)
+
+    def test_unwritable_cache(self):
+        with open(self.cache_dir, 'w') as cache_file:
+            cache_file.write('not a directory')
+        (metadata, added) = self._load()
+        self.assertEqual(metadata['parameters']['foo']['description'], 'FooDesc')
+        self.assertEqual(added[StartupStatsKey.YAML_LOADS], 1)
+
+    def test_cache_dir_private(self):
+        """
+        The cache is made private to this user and not used from a
+        directory others can get into or a link
+        """
+        self._load()
+        self.assertEqual(os.stat(self.cache_dir).st_mode & 0777, 0700)
+
+        os.chmod(self.cache_dir, 0755)
+        for i in range(2):
+            instrument_dict._loaded_metadata.clear()
+            (metadata, added) = self._load()
+            self.assertEqual(metadata['parameters']['foo']['description'], 'FooDesc')
+            self.assertEqual(added[StartupStatsKey.YAML_LOADS], 1)
+
+        os.chmod(self.cache_dir, 0700)
+        os.rename(self.cache_dir, self.cache_dir + '.real')
+        os.symlink(self.cache_dir + '.real', self.cache_dir)
+        instrument_dict._loaded_metadata.clear()
+        (metadata, added) = self._load()
+        self.assertEqual(added[StartupStatsKey.YAML_LOADS], 1)
+
+    def test_dicts_share_load(self):
+        param_dict = ProtocolParameterDict()
+        param_dict.add('foo', r'foo = (\d+)', lambda match: int(match.group(1)), str)
+        cmd_dict = ProtocolCommandDict()
+        cmd_dict.add('cmd1')
+
+        tallies = startup_stats.get_stats()
+        self.assertTrue(param_dict.load_strings(filename=self.filename))
+        self.assertTrue(cmd_dict.load_strings(filename=self.filename))
+        added = startup_stats.difference(startup_stats.get_stats(), tallies)
+        self.assertEqual(added[StartupStatsKey.YAML_LOADS], 1)
+
+        self.assertEqual(param_dict._param_dict['foo'].description.display_name, 'FooDisp')
+        self.assertEqual(cmd_dict._cmd_dict['cmd1'].display_name, 'C1Disp')
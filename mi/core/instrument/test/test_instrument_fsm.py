@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_instrument_fsm
+@file mi/core/instrument/test/test_instrument_fsm.py
+@brief Test cases for the instrument state machine
+"""
+
+__license__ = 'Apache 2.0'
+
+import time
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.common import BaseEnum
+from mi.core.exceptions import InstrumentStateException
+from mi.core.instrument.instrument_fsm import ThreadSafeFSM, LATENCY_BUCKETS
+
+
+class State(BaseEnum):
+    COMMAND = 'COMMAND'
+    AUTOSAMPLE = 'AUTOSAMPLE'
+
+class Event(BaseEnum):
+    ENTER = 'ENTER'
+    EXIT = 'EXIT'
+    START = 'START'
+    STOP = 'STOP'
+    GET = 'GET'
+    UNHANDLED = 'UNHANDLED'
+
+
+def loop_get_events(fsm, current_state=True):
+    """
+    The handler table walk get_events used to do on every call
+    """
+    events = []
+    for (state, event) in fsm.state_handlers.iterkeys():
+        if event in (fsm.enter_event, fsm.exit_event):
+            continue
+        if current_state and state != fsm.current_state:
+            continue
+        if event not in events:
+            events.append(event)
+    return events
+
+
+@attr('UNIT', group='mi')
+class TestInstrumentFSM(MiUnitTest):
+    """
+    Test dispatch through the compiled state machine tables
+    """
+    def setUp(self):
+        self.calls = []
+        self.fsm = ThreadSafeFSM(State, Event, Event.ENTER, Event.EXIT)
+        for state in State.list():
+            self.fsm.add_handler(state, Event.ENTER, self._handler('enter ' + state))
+            self.fsm.add_handler(state, Event.EXIT, self._handler('exit ' + state))
+            self.fsm.add_handler(state, Event.GET, self._handler('get', result=state))
+        self.fsm.add_handler(State.COMMAND, Event.START, self._handler('start', State.AUTOSAMPLE))
+        self.fsm.add_handler(State.AUTOSAMPLE, Event.STOP, self._handler('stop', State.COMMAND))
+
+    def _handler(self, name, next_state=None, result=None):
+        def handler(*args, **kwargs):
+            self.calls.append(name)
+            return (next_state, result)
+        return handler
+
+    def test_dispatch(self):
+        self.assertTrue(self.fsm.start(State.COMMAND))
+        self.assertEqual(self.fsm.on_event(Event.GET), State.COMMAND)
+        self.fsm.on_event(Event.START)
+        self.assertEqual(self.fsm.get_current_state(), State.AUTOSAMPLE)
+        self.assertEqual(self.fsm.previous_state, State.COMMAND)
+        self.assertEqual(self.calls, ['enter COMMAND', 'get', 'start',
+                                      'exit COMMAND', 'enter AUTOSAMPLE'])
+
+        self.assertRaises(InstrumentStateException, self.fsm.on_event, Event.START)
+        self.assertRaises(InstrumentStateException, self.fsm.on_event, 'BOGUS')
+        self.assertRaises(InstrumentStateException, self.fsm.on_event, ['unhashable'])
+        self.assertFalse(self.fsm.start('BOGUS'))
+        self.assertFalse(self.fsm.add_handler('BOGUS', Event.GET, None))
+        self.assertFalse(self.fsm.add_handler(State.COMMAND, 'BOGUS', None))
+
+    def test_get_events(self):
+        self.fsm.start(State.COMMAND)
+        for current_state in [True, False]:
+            self.assertEqual(sorted(self.fsm.get_events(current_state)),
+                             sorted(loop_get_events(self.fsm, current_state)))
+        self.assertEqual(sorted(self.fsm.get_events()), [Event.GET, Event.START])
+        self.assertEqual(sorted(self.fsm.get_events(False)), [Event.GET, Event.START, Event.STOP])
+
+        # handlers added after dispatch has started are picked up
+        self.fsm.add_handler(State.COMMAND, Event.STOP, self._handler('stop'))
+        self.assertEqual(sorted(self.fsm.get_events()), [Event.GET, Event.START, Event.STOP])
+
+        # callers may change what they get back
+        self.fsm.get_events().append(Event.UNHANDLED)
+        self.assertEqual(len(self.fsm.get_events()), 3)
+
+    def test_handler_exception(self):
+        """
+        A failing handler leaves the lock free and the state unchanged
+        """
+        def fail(*args, **kwargs):
+            raise ValueError("failed")
+        self.fsm.add_handler(State.COMMAND, Event.UNHANDLED, fail)
+        self.fsm.start(State.COMMAND)
+
+        self.assertRaises(ValueError, self.fsm.on_event, Event.UNHANDLED)
+        self.assertEqual(self.fsm.get_current_state(), State.COMMAND)
+        self.assertEqual(self.fsm.on_event(Event.GET), State.COMMAND)
+
+    def test_handler_latency(self):
+        self.fsm.start(State.COMMAND)
+        self.fsm.on_event(Event.GET)
+        self.assertEqual(self.fsm.get_handler_latency(), {})
+
+        def slow(*args, **kwargs):
+            time.sleep(.02)
+            return (None, None)
+        self.fsm.add_handler(State.COMMAND, Event.UNHANDLED, slow)
+
+        self.fsm.enable_handler_latency()
+        for i in range(3):
+            self.fsm.on_event(Event.GET)
+        self.fsm.on_event(Event.UNHANDLED)
+        self.fsm.on_event(Event.START)
+
+        latency = self.fsm.get_handler_latency()
+        self.assertEqual(sorted(latency.keys()),
+                         sorted([(State.COMMAND, Event.GET), (State.COMMAND, Event.UNHANDLED),
+                                 (State.COMMAND, Event.START), (State.COMMAND, Event.EXIT),
+                                 (State.AUTOSAMPLE, Event.ENTER)]))
+        self.assertEqual(latency[(State.COMMAND, Event.GET)]['count'], 3)
+
+        slow_latency = latency[(State.COMMAND, Event.UNHANDLED)]
+        self.assertEqual(slow_latency['count'], 1)
+        self.assertGreaterEqual(slow_latency['max'], .02)
+        self.assertEqual(slow_latency['buckets'],
+                         zip(list(LATENCY_BUCKETS) + [None], [0, 0, 1, 0, 0, 0]))
+
+        self.fsm.enable_handler_latency(False)
+        self.fsm.on_event(Event.STOP)
+        self.assertEqual(self.fsm.get_handler_latency(), {})
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkInstrumentFSM(MiUnitTest):
+    """
+    Time capability queries and event dispatch on a driver state machine
+    """
+    def test_sbe37(self):
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37Protocol, SBE37Prompt, NEWLINE
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37ProtocolState
+
+        fsm = SBE37Protocol(SBE37Prompt, NEWLINE, lambda *args, **kwargs: None)._protocol_fsm
+        fsm.current_state = SBE37ProtocolState.COMMAND
+        count = 10000
+
+        start_time = time.time()
+        for i in range(count):
+            loop_get_events(fsm)
+        loop_time = time.time() - start_time
+
+        start_time = time.time()
+        for i in range(count):
+            fsm.get_events()
+        compiled_time = time.time() - start_time
+
+        log.info("get_events over %d handlers: loop %.1f us, compiled %.1f us per call",
+                 len(fsm.state_handlers), loop_time / count * 1e6, compiled_time / count * 1e6)
+
+        fsm = ThreadSafeFSM(State, Event, Event.ENTER, Event.EXIT)
+        fsm.add_handler(State.COMMAND, Event.GET, lambda: (None, None))
+        fsm.start(State.COMMAND)
+        for enable in [False, True]:
+            fsm.enable_handler_latency(enable)
+            start_time = time.time()
+            for i in range(count):
+                fsm.on_event(Event.GET)
+            elapsed = time.time() - start_time
+            log.info("on_event with handler latency %s: %.1f us per event",
+                     "recorded" if enable else "off", elapsed / count * 1e6)
@@ -14,14 +14,19 @@ import re
 import time
 import ntplib
 import datetime
+import threading
 from mock import Mock
 from nose.plugins.attrib import attr
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.instrument.instrument_fsm import ThreadSafeFSM
 from mi.core.instrument.instrument_driver import DriverParameter
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.instrument_driver import unpack_sample_batch
 from mi.core.instrument.instrument_protocol import InstrumentProtocol
 from mi.core.instrument.instrument_protocol import MenuInstrumentProtocol
 from mi.core.instrument.instrument_protocol import CommandResponseInstrumentProtocol
+from mi.core.instrument.instrument_protocol import ReceiveBuffer
+from mi.core.instrument.port_agent_client import PortAgentPacket
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.instrument.instrument_driver import ConfigMetadataKey
 from mi.instrument.satlantic.par_ser_600m.driver import SAMPLE_REGEX
@@ -468,6 +473,118 @@ class TestUnitInstrumentProtocol(MiUnitTestCase):
             self.protocol._verify_not_readonly({'rw': 1, 'ro': 2}, startup=True)
 
 
+@attr('UNIT', group='mi')
+class TestUnitSampleBatch(MiUnitTestCase):
+    """
+    Test publishing the samples raised while handling data as one event
+    """
+    def setUp(self):
+        self.events = []
+        self.protocol = InstrumentProtocol(self.event_callback)
+
+    def event_callback(self, event, *args):
+        self.events.append((event,) + args)
+
+    def publish(self, count):
+        for i in range(count):
+            self.protocol._extract_sample(SatlanticPARDataParticle, SAMPLE_REGEX,
+                                          "SATPAR0229,10.01,2206748544,234\r\n",
+                                          ntplib.system_to_ntp_time(time.time()))
+
+    def test_batch(self):
+        with self.protocol.sample_batch():
+            self.publish(3)
+            self.assertEqual(self.events, [])
+
+        self.assertEqual(len(self.events), 1)
+        (event, samples) = self.events[0]
+        self.assertEqual(event, DriverAsyncEvent.SAMPLE_BATCH)
+        self.assertEqual(len(samples), 3)
+        self.assertTrue(samples[2].find('"value": 2206748544}') > 0)
+
+        unpacked = unpack_sample_batch({'type': event, 'value': samples, 'time': 1.0})
+        self.assertEqual(unpacked, [{'type': DriverAsyncEvent.SAMPLE, 'value': sample, 'time': 1.0}
+                                    for sample in samples])
+        event = {'type': DriverAsyncEvent.SAMPLE, 'value': samples[0], 'time': 1.0}
+        self.assertEqual(unpack_sample_batch(event), [event])
+
+    def test_single_sample(self):
+        with self.protocol.sample_batch():
+            pass
+        self.assertEqual(self.events, [])
+
+        with self.protocol.sample_batch():
+            self.publish(1)
+        self.assertEqual([event[0] for event in self.events], [DriverAsyncEvent.SAMPLE])
+
+        # outside a batch samples go straight through
+        self.publish(1)
+        self.assertEqual([event[0] for event in self.events], [DriverAsyncEvent.SAMPLE] * 2)
+
+    def test_event_order(self):
+        """
+        Other events publish the held samples first, with their arguments
+        passed through as they were
+        """
+        with self.protocol.sample_batch():
+            self.publish(2)
+            self.protocol._driver_event(DriverAsyncEvent.STATE_CHANGE)
+            self.publish(1)
+            with self.protocol.sample_batch():
+                self.publish(1)
+        self.assertEqual([event[0] for event in self.events],
+                         [DriverAsyncEvent.SAMPLE_BATCH, DriverAsyncEvent.STATE_CHANGE,
+                          DriverAsyncEvent.SAMPLE_BATCH])
+        self.assertEqual(self.events[1], (DriverAsyncEvent.STATE_CHANGE,))
+        self.assertEqual(len(self.events[2][1]), 2)
+
+    def test_batch_limits(self):
+        self.protocol = InstrumentProtocol(self.event_callback, sample_batch_size=2)
+        with self.protocol.sample_batch():
+            self.publish(5)
+        self.assertEqual([len(event[1]) for event in self.events[:2]], [2, 2])
+        self.assertEqual(self.events[2][0], DriverAsyncEvent.SAMPLE)
+
+        self.events = []
+        self.protocol = InstrumentProtocol(self.event_callback, sample_batch_window=0)
+        with self.protocol.sample_batch():
+            self.publish(3)
+        self.assertEqual([event[0] for event in self.events], [DriverAsyncEvent.SAMPLE] * 3)
+
+    def test_exception(self):
+        """
+        Samples held when handling the data fails are still published
+        """
+        def fail():
+            with self.protocol.sample_batch():
+                self.publish(2)
+                raise ValueError("bad data")
+        self.assertRaises(ValueError, fail)
+        self.assertEqual([event[0] for event in self.events], [DriverAsyncEvent.SAMPLE_BATCH])
+
+        self.publish(1)
+        self.assertEqual(self.events[-1][0], DriverAsyncEvent.SAMPLE)
+
+    def test_other_threads(self):
+        """
+        Samples from other threads, ie polled samples, are not held
+        """
+        with self.protocol.sample_batch():
+            self.publish(1)
+            thread = threading.Thread(target=self.publish, args=(1,))
+            thread.start()
+            thread.join()
+            self.assertEqual([event[0] for event in self.events], [DriverAsyncEvent.SAMPLE])
+        self.assertEqual(len(self.events), 2)
+
+    def test_no_callback(self):
+        protocol = InstrumentProtocol(None)
+        self.assertIsNone(protocol._driver_event)
+        with protocol.sample_batch():
+            protocol._extract_sample(SatlanticPARDataParticle, SAMPLE_REGEX,
+                                     "SATPAR0229,10.01,2206748544,234\r\n", 1.0)
+
+
 @attr('UNIT', group='mi')
 class TestUnitCommandInstrumentProtocol(MiUnitTestCase):
     """
@@ -571,6 +688,243 @@ class TestUnitCommandInstrumentProtocol(MiUnitTestCase):
                           self.protocol._do_cmd_resp,
                           self.TestEvent.TEST, expected_prompt=">", response_regex=regex1)
 
+    def test_bounded_buffers(self):
+        """
+        The line and prompt buffers keep only the most recent data but
+        still behave like strings for drivers that assign to them.
+        """
+        self.protocol = CommandResponseInstrumentProtocol(self.prompts, self.newline,
+                                                          self.event_callback,
+                                                          buffer_size=10)
+        for i in range(100):
+            self.protocol.add_to_buffer("%02d," % i)
+        self.assertEqual(self.protocol._linebuf, ",97,98,99,")
+        self.assertEqual(self.protocol._promptbuf, ",97,98,99,")
+
+        self.protocol._promptbuf += "abc"
+        self.assertEqual(self.protocol._promptbuf, ",98,99,abc")
+        self.protocol._promptbuf = ''
+        self.assertEqual(self.protocol._promptbuf, '')
+        self.assertEqual(self.protocol._linebuf, ",97,98,99,")
+
+    def test_response_wakeup(self):
+        """
+        A waiting caller is woken as soon as its prompt arrives, however
+        many prompts it is waiting for.
+        """
+        prompts = ["prompt %d>" % i for i in range(20)]
+        timer = threading.Timer(.2, self.protocol.add_to_buffer, ["some response\nprompt 19>"])
+
+        starttime = time.time()
+        timer.start()
+        (prompt, result) = self.protocol._get_response(timeout=5, expected_prompt=prompts)
+        elapsed = time.time() - starttime
+        timer.join()
+
+        self.assertEqual(prompt, "prompt 19>")
+        self.assertEqual(result, "some response\nprompt 19>")
+        self.assertLess(elapsed, 1)
+
+    def test_prompt_split_across_data(self):
+        """
+        A prompt that arrives in pieces is found
+        """
+        def send_pieces():
+            for piece in ["resp", "onse pro", "mpt", ">"]:
+                time.sleep(.05)
+                self.protocol.add_to_buffer(piece)
+        thread = threading.Thread(target=send_pieces)
+        thread.start()
+        result = self.protocol._get_response(timeout=5, expected_prompt="prompt>")
+        thread.join()
+        self.assertEqual(result, ("prompt>", "response prompt>"))
+
+    def test_wakeup(self):
+        """
+        A wakeup returns once the device answers instead of after the full
+        delay, and prefers the longest prompt found.
+        """
+        self.protocol._prompts = [">", ">->"]
+        starttime = time.time()
+        prompt = self.protocol._wakeup(timeout=10, delay=5)
+        self.assertEqual(prompt, ">->")
+        self.assertLess(time.time() - starttime, 1)
+
+        self.protocol._send_wakeup = lambda: None
+        self.assertRaises(InstrumentTimeoutException, self.protocol._wakeup, timeout=.5, delay=.2)
+
+    def test_wakeup_until(self):
+        """
+        Waking until a prompt stops as soon as the device shows it
+        """
+        self.protocol._prompts = ["A>", "B>"]
+        self.protocol._send_wakeup = lambda: self.protocol.add_to_buffer("A>")
+        timer = threading.Timer(.3, self.protocol.add_to_buffer, ["B>"])
+
+        starttime = time.time()
+        timer.start()
+        self.protocol._wakeup_until(10, "B>", delay=5)
+        timer.join()
+        self.assertLess(time.time() - starttime, 2)
+
+        self.assertRaises(InstrumentProtocolException, self.protocol._wakeup_until,
+                          10, "B>", delay=.2, no_tries=2)
+
+    def test_raw_response(self):
+        """
+        A raw response is returned when the buffer ends with the prompt
+        """
+        self.protocol.add_to_buffer("first >\nsecond")
+        timer = threading.Timer(.2, self.protocol.add_to_buffer, [" >\t "])
+        timer.start()
+        result = self.protocol._get_raw_response(timeout=5)
+        timer.join()
+        self.assertEqual(result, (">", "first >\nsecond >\t "))
+
+        self.assertRaises(InstrumentTimeoutException, self.protocol._get_raw_response,
+                          timeout=.5, expected_prompt="-->")
+
+
+class SimulatedSBE37(object):
+    """
+    Stands in for an SBE37 connection, answering commands sent by the
+    protocol after a fixed instrument latency.
+    """
+    def __init__(self, protocol, latency):
+        from mi.instrument.seabird.sbe37smb.ooicore.test import sample_data
+        self._responses = {'ds': sample_data.SAMPLE_DS, 'dc': sample_data.SAMPLE_DC}
+        self._protocol = protocol
+        self._latency = latency
+        self._pending = ''
+
+    def send(self, data):
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import NEWLINE, SBE37Prompt
+
+        self._pending += data
+        while NEWLINE in self._pending:
+            (line, self._pending) = self._pending.split(NEWLINE, 1)
+            response = line + NEWLINE + self._responses.get(line, '') + SBE37Prompt.COMMAND
+            threading.Timer(self._latency, self._reply, [response]).start()
+
+    def _reply(self, data):
+        packet = PortAgentPacket(PortAgentPacket.DATA_FROM_INSTRUMENT)
+        packet.attach_data(data)
+        packet.attach_timestamp(0)
+        packet.pack_header()
+        self._protocol.got_data(packet)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkCommandResponse(MiUnitTestCase):
+    """
+    Time configuring an SBE37 through its protocol against a simulated
+    instrument
+    """
+    def test_apply_startup_params(self):
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37Protocol, SBE37Prompt, NEWLINE
+
+        latency = .01
+        protocol = SBE37Protocol(SBE37Prompt, NEWLINE, lambda *args, **kwargs: None)
+        protocol._connection = SimulatedSBE37(protocol, latency)
+
+        # read the parameters and set every writable one at startup
+        starttime = time.time()
+        protocol._update_params()
+        update_time = time.time() - starttime
+
+        readonly = protocol._param_dict.get_visibility_list(ParameterDictVisibility.READ_ONLY)
+        params = dict((key, protocol._param_dict.get(key)) for key in protocol._param_dict.get_keys()
+                      if key not in readonly and protocol._param_dict.get(key) is not None)
+        protocol.set_init_params({DriverConfigKey.PARAMETERS: params})
+
+        starttime = time.time()
+        protocol.apply_startup_params()
+        apply_time = time.time() - starttime
+
+        log.info("sbe37 with %d ms instrument latency: _update_params %.2fs, "
+                 "apply_startup_params with %d parameters %.2fs",
+                 latency * 1000, update_time, len(params), apply_time)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkSampleBatch(MiUnitTestCase):
+    """
+    Time publishing a backlog of samples one event at a time and batched,
+    pickling each event as the driver process does before sending it
+    """
+    def test_backlog(self):
+        import cPickle
+
+        def driver_event(type, val=None):
+            event = {'type': type, 'value': val, 'time': time.time()}
+            sent.append(cPickle.dumps(event, -1))
+
+        protocol = InstrumentProtocol(driver_event)
+        count = 5000
+        samples = [SatlanticPARDataParticle("SATPAR0229,10.01,2206748544,234\r\n").generate()
+                   for i in range(count)]
+
+        for batch in [False, True]:
+            sent = []
+            start_time = time.time()
+            if batch:
+                with protocol.sample_batch():
+                    for sample in samples:
+                        protocol._driver_event(DriverAsyncEvent.SAMPLE, sample)
+            else:
+                for sample in samples:
+                    protocol._driver_event(DriverAsyncEvent.SAMPLE, sample)
+            elapsed = time.time() - start_time
+            log.info("%d samples %s: %d events, %d bytes, %.3fs",
+                     count, "batched" if batch else "one at a time", len(sent),
+                     sum(len(event) for event in sent), elapsed)
+
+
+@attr('UNIT', group='mi')
+class TestUnitReceiveBuffer(MiUnitTestCase):
+    """
+    Test the rolling receive buffer behind the line and prompt buffers
+    """
+    def test_append(self):
+        buf = ReceiveBuffer(8)
+        buf.append("0123")
+        buf.append("456789")
+        self.assertEqual(buf.data, "23456789")
+        self.assertEqual(buf.end(), 10)
+
+    def test_find_resumes(self):
+        """
+        A search resuming from end() still finds a string that straddles
+        the old and new data, and doesn't find it in the scanned part.
+        """
+        buf = ReceiveBuffer(8)
+        buf.append("xx>")
+        self.assertEqual(buf.find(">"), 2)
+        scanned = buf.end()
+        self.assertEqual(buf.find(">", scanned), -1)
+
+        buf.append("S>")
+        self.assertEqual(buf.find("S>", scanned), 3)
+        scanned = buf.end()
+
+        buf.append("abcdefg")
+        self.assertEqual(buf.data, ">abcdefg")
+        self.assertEqual(buf.find(">", scanned), -1)
+        self.assertEqual(buf.find("fg", scanned), 6)
+
+    def test_replace(self):
+        """
+        A replaced buffer is searched from its start again
+        """
+        buf = ReceiveBuffer(8)
+        buf.append("abc>")
+        scanned = buf.end()
+        buf.replace("abc>")
+        self.assertEqual(buf.data, "abc>")
+        self.assertEqual(buf.find(">", scanned), 3)
+        buf.replace("")
+        self.assertEqual(buf.data, "")
+
 
 @attr('UNIT', group='mi')
 class TestUnitMenuInstrumentProtocol(MiUnitTestCase):
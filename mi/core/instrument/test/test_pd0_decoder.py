@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_pd0_decoder
+@file mi/core/instrument/test/test_pd0_decoder.py
+@brief Test cases for the vectorized PD0 decoding helpers
+"""
+
+__license__ = 'Apache 2.0'
+
+import glob
+import os
+import random
+import time
+from struct import pack, unpack
+from mi.core.unit_test import MiUnitTest, MiUnitTestCase
+from nose.plugins.attrib import attr
+from mock import patch
+from ooi.logging import log
+
+from mi.core.instrument import pd0_decoder
+from mi.core.instrument.chunker import PD0Framer
+
+
+def struct_checksum(data, start, end):
+    """
+    The byte at a time checksum the particles used to compute
+    """
+    total = 0
+    for i in range(start, end):
+        total += ord(data[i])
+    return total & 65535
+
+
+def struct_beam_values(chunk, fmt, rows):
+    """
+    The cell at a time decoding the particles used to do
+    """
+    size = len(pack(fmt, 0, 0, 0, 0))
+    beams = ([], [], [], [])
+    offset = 0
+    for row in range(rows):
+        for (beam, value) in zip(beams, unpack(fmt, chunk[offset + 2: offset + 2 + size])):
+            beam.append(value)
+        offset += size
+    return list(beams)
+
+
+def fixture_ensembles():
+    """
+    @retval The PD0 ensembles from the ADCP driver and parser test fixtures
+    """
+    from mi.instrument.teledyne.workhorse_monitor_75_khz.test import test_data
+
+    ensembles = [test_data.RSN_SAMPLE_RAW_DATA,
+                 test_data.CG_SAMPLE_RAW_DATA,
+                 test_data.CG_SAMPLE_RAW_DATA2]
+
+    resource = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'dataset', 'driver',
+                            'moas', 'gl', 'adcpa', 'resource')
+    for path in sorted(glob.glob(os.path.join(resource, '*.PD0'))):
+        data = open(path, 'rb').read()
+        ensembles.extend(data[start:end] for (start, end) in PD0Framer()(data))
+    return ensembles
+
+
+@attr('UNIT', group='mi')
+class UnitTestPD0Decoder(MiUnitTestCase):
+    """
+    Compare the vectorized helpers against struct decoding
+    """
+    def setUp(self):
+        self.random = random.Random(1)
+        self.chunk = '\x00\x01' + ''.join(chr(self.random.randint(0, 255)) for i in range(8 * 30))
+
+    def test_checksum(self):
+        data = self.chunk * 40
+        self.assertEquals(pd0_decoder.checksum(data), struct_checksum(data, 0, len(data)))
+        self.assertEquals(pd0_decoder.checksum(data, 5, 100), struct_checksum(data, 5, 100))
+        self.assertEquals(pd0_decoder.checksum(data, 5, 5), 0)
+
+        ensemble = fixture_ensembles()[0]
+        self.assertEquals(pd0_decoder.checksum(ensemble, 0, len(ensemble) - 2),
+                          unpack('<H', ensemble[-2:])[0])
+
+    def test_checksum_without_numpy(self):
+        """
+        The chunker frames ensembles where numpy is not installed
+        """
+        data = self.chunk * 40
+        with patch.object(pd0_decoder, 'numpy', None):
+            self.assertEquals(pd0_decoder.checksum(data), struct_checksum(data, 0, len(data)))
+            self.assertEquals(pd0_decoder.checksum(data, 5, 100), struct_checksum(data, 5, 100))
+            self.assertEquals(pd0_decoder.checksum(data, 5, 5), 0)
+            self.assertEquals(PD0Framer.checksum(data, 5, 100), struct_checksum(data, 5, 100))
+
+    def test_beam_values(self):
+        for (fmt, dtype, rows) in [('<hhhh', '<i2', 30),
+                                   ('!HHHH', '>u2', 29),
+                                   ('<BBBB', 'u1', 60)]:
+            self.assertEquals(pd0_decoder.beam_values(self.chunk, dtype, rows),
+                              struct_beam_values(self.chunk, fmt, rows))
+
+    def test_beam_values_types(self):
+        """
+        Values are handed back as python ints so particles encode as before
+        """
+        values = pd0_decoder.beam_values(self.chunk, '<i2', 2)
+        self.assertEquals(len(values), pd0_decoder.BEAMS)
+        for beam in values:
+            self.assertTrue(all(type(value) is int for value in beam))
+
+    def test_no_rows(self):
+        self.assertEquals(pd0_decoder.beam_values(self.chunk, 'u1', 0), [[], [], [], []])
+        self.assertEquals(pd0_decoder.beam_values(self.chunk, 'u1', -1), [[], [], [], []])
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkPD0Decoder(MiUnitTest):
+    """
+    Time checksums and particle generation over the PD0 test fixtures
+    """
+    def test_checksum(self):
+        ensembles = fixture_ensembles()
+
+        start_time = time.time()
+        for ensemble in ensembles:
+            struct_checksum(ensemble, 0, len(ensemble) - 2)
+        loop_time = time.time() - start_time
+
+        start_time = time.time()
+        for ensemble in ensembles:
+            pd0_decoder.checksum(ensemble, 0, len(ensemble) - 2)
+        numpy_time = time.time() - start_time
+
+        log.info("checksum of %d ensembles: loop %.3fs, numpy %.3fs",
+                 len(ensembles), loop_time, numpy_time)
+
+    def test_particles(self):
+        from mi.dataset.parser.adcpa import ADCPA_PD0_PARSED_DataParticle
+        from mi.instrument.teledyne.particles import ADCP_PD0_PARSED_DataParticle
+
+        ensembles = fixture_ensembles()
+        for (name, particle_class, samples) in [
+                ("workhorse", ADCP_PD0_PARSED_DataParticle, ensembles[:3] * 100),
+                ("adcpa", ADCPA_PD0_PARSED_DataParticle, ensembles[3:])]:
+            start_time = time.time()
+            for sample in samples:
+                particle_class(sample)._build_parsed_values()
+            elapsed = time.time() - start_time
+            log.info("%s: %d particles in %.3fs, %.0f/s",
+                     name, len(samples), elapsed, len(samples) / elapsed)
@@ -14,16 +14,23 @@ __license__ = 'Apache 2.0'
 from gevent import monkey; monkey.patch_all()
 import gevent
 
+import os
 import logging
+import resource
 import unittest
 import re
+import copy
 import time
+import pickle
 import datetime
 import array
+import base64
 import struct
 import ctypes
+import socket
 from nose.plugins.attrib import attr
-from mock import Mock
+from nose.plugins.skip import SkipTest
+from mock import Mock, patch
 
 from ion.agents.port.port_agent_process import PortAgentProcess
 from ion.agents.port.port_agent_process import PortAgentProcessType
@@ -38,9 +45,11 @@ from mi.idk.unit_test import InstrumentDriverTestCase
 from mi.idk.unit_test import InstrumentDriverUnitTestCase
 from mi.idk.unit_test import InstrumentDriverIntegrationTestCase
 
-from mi.core.instrument.port_agent_client import PortAgentClient, PortAgentPacket, Listener
-from mi.core.instrument.port_agent_client import HEADER_SIZE
+from mi.core.instrument.port_agent_client import PortAgentClient, PortAgentPacket, Listener, PortAgentSelector
+from mi.core.instrument.port_agent_client import HEADER_SIZE, RECEIVE_BUFFER_SIZE, VIEW_PACKET_SIZE
+from mi.core.instrument import port_agent_client
 from mi.core.instrument.instrument_driver import DriverConnectionState
+from mi.core.instrument.data_particle import RawDataParticle, RawDataParticleKey
 from mi.core.instrument.instrument_driver import DriverProtocolState
 
 from mi.core.exceptions import InstrumentConnectionException
@@ -55,6 +64,21 @@ SYSTEM_EPOCH = datetime.date(*time.gmtime(0)[0:3])
 NTP_EPOCH = datetime.date(1900, 1, 1)
 NTP_DELTA = (SYSTEM_EPOCH - NTP_EPOCH).days * 24 * 3600
 
+def make_packet(msgtype, data, timestamp=0.0):
+    """
+    Build a port agent packet with a valid checksum
+    """
+    header_struct = struct.Struct("!BBBBHHd")
+    pktsize = HEADER_SIZE + len(data)
+    pkt = bytearray(pktsize)
+    header_struct.pack_into(pkt, 0, 0xA3, 0x9D, 0x7A, msgtype, pktsize, 0, timestamp)
+    pkt[HEADER_SIZE:] = data
+    checksum = 0
+    for datum in pkt:
+        checksum ^= datum
+    header_struct.pack_into(pkt, 0, 0xA3, 0x9D, 0x7A, msgtype, pktsize, checksum, timestamp)
+    return str(pkt)
+
 ## Initialize the test parameters
 ## Use the SBE37 here because this is a generic port_agent_client test not 
 ## necessarily associated with any driver.
@@ -420,6 +444,433 @@ class PAClientTestPortAgentPacket(MiUnitTest):
         #self.assertEqual(got_timestamp, 1105890970.110589)
         self.assertEqual(self.pap.get_header_recv_checksum(), 3729) 
 
+    def _received_packet(self, data):
+        packet = make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, data)
+        self.pap.unpack_header(packet[:HEADER_SIZE])
+        self.pap.attach_data(packet[HEADER_SIZE:])
+        return packet
+
+    def test_verify_checksum(self):
+        for size in [0, 1, 4096, 65000]:
+            self._received_packet("".join(chr(i % 251) for i in range(size)))
+            self.pap.verify_checksum()
+            self.assertTrue(self.pap.is_valid())
+
+        self.pap.attach_data("x" * 65000)
+        self.pap.verify_checksum()
+        self.assertFalse(self.pap.is_valid())
+
+    def test_verify_checksum_once(self):
+        """
+        A verified packet is not verified again unless forced or changed
+        """
+        packet = self._received_packet("verify me")
+        self.pap.verify_checksum()
+        self.assertTrue(self.pap.is_valid())
+
+        self.pap.calculate_checksum = Mock(return_value=-1)
+        self.pap.verify_checksum()
+        self.assertTrue(self.pap.is_valid())
+        self.assertFalse(self.pap.calculate_checksum.called)
+
+        self.pap.verify_checksum(force=True)
+        self.assertFalse(self.pap.is_valid())
+
+        del self.pap.calculate_checksum
+        self.pap.attach_data("verify mE")
+        self.pap.verify_checksum()
+        self.assertFalse(self.pap.is_valid())
+
+    def test_unpack_buffer(self):
+        """
+        A packet unpacked from the middle of a receive buffer
+        """
+        packet = make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "in the middle")
+        block = bytearray("leading junk" + packet + "trailing junk")
+
+        self.pap.unpack_buffer(block, len("leading junk"))
+        self.assertEqual(self.pap.get_header_type(), PortAgentPacket.DATA_FROM_INSTRUMENT)
+        self.assertEqual(self.pap.get_data_length(), len("in the middle"))
+        self.assertEqual(self.pap.get_header(), packet[:HEADER_SIZE])
+        self.assertEqual(self.pap.get_data(), "in the middle")
+
+        self.pap.verify_checksum()
+        self.assertTrue(self.pap.is_valid())
+
+    def test_checksum_without_numpy(self):
+        """
+        Checksums come out the same where numpy is not installed
+        """
+        data = ''.join(chr(i % 256) for i in range(1000))
+        expected = [port_agent_client.xor_bytes(data, offset, count)
+                    for (offset, count) in [(0, 1000), (3, 500), (10, 0)]]
+        with patch.object(port_agent_client, 'numpy', None):
+            self.assertEqual([port_agent_client.xor_bytes(data, offset, count)
+                              for (offset, count) in [(0, 1000), (3, 500), (10, 0)]], expected)
+            packet = make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, data)
+            self.pap.unpack_header(packet[:HEADER_SIZE])
+            self.pap.attach_data(packet[HEADER_SIZE:])
+            self.pap.verify_checksum()
+            self.assertTrue(self.pap.is_valid())
+
+    def test_unpack_buffer_start(self):
+        """
+        The header of a packet at the start of a buffer is only the header,
+        and a copy rather than part of the buffer
+        """
+        packet = make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "short")
+        block = bytearray(packet)
+
+        self.pap.unpack_buffer(block)
+        header = self.pap.get_header()
+        self.assertEqual(len(header), HEADER_SIZE)
+        self.assertEqual(header, packet[:HEADER_SIZE])
+        self.assertTrue(isinstance(header, str))
+        self.assertEqual(self.pap.get_data(), "short")
+
+    def test_get_data_view(self):
+        """
+        The data view shares memory with the receive buffer and the data
+        string is only made once
+        """
+        packet = make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "abcdef")
+        block = bytearray(packet + packet)
+        self.pap.unpack_buffer(block, len(packet))
+
+        view = self.pap.get_data_view()
+        self.assertEqual(view.tobytes(), "abcdef")
+        block[len(packet) + HEADER_SIZE] = "z"
+        self.assertEqual(view.tobytes(), "zbcdef")
+
+        data = self.pap.get_data()
+        self.assertEqual(data, "zbcdef")
+        self.assertTrue(self.pap.get_data() is data)
+
+    def test_raw_particle(self):
+        """
+        A raw particle from a buffer backed packet matches one from strings
+        """
+        payload = "".join(chr(i) for i in range(256))
+        packet = make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, payload, 3.0)
+
+        viewed = PortAgentPacket()
+        viewed.unpack_buffer(bytearray(packet))
+        self.assertTrue(isinstance(viewed.get_as_dict()['raw_base64'], str))
+        copy.deepcopy(viewed.get_as_dict())
+        pickle.dumps(viewed.get_as_dict())
+
+        copied = PortAgentPacket()
+        copied.unpack_header(packet[:HEADER_SIZE])
+        copied.attach_data(packet[HEADER_SIZE:])
+
+        values = []
+        for paPacket in [viewed, copied]:
+            particle = RawDataParticle(paPacket.get_as_dict(), port_timestamp=3.0)
+            values.append(particle._build_parsed_values())
+        self.assertEqual(values[0], values[1])
+        payloads = [v['value'] for v in values[0] if v['value_id'] == RawDataParticleKey.PAYLOAD]
+        self.assertEqual(payloads, [base64.b64encode(payload)])
+
+@attr('UNIT', group='mi')
+class PAClientBufferedListenerTestCase(MiUnitTest):
+    """
+    Feed packets through a socket pair into a buffered listener
+    """
+    def setUp(self):
+        (self.sock, self.peer) = socket.socketpair()
+        self.sock.setblocking(0)
+        self.addCleanup(self.sock.close)
+        self.addCleanup(self.peer.close)
+        self.received = []
+        self.errors = []
+
+    def _got_data(self, paPacket):
+        self.received.append(paPacket.get_data())
+
+    def _start_listener(self, callback_data=None):
+        listener = Listener(self.sock, 0,
+                            callback_data = callback_data or self._got_data,
+                            callback_raw = lambda paPacket: None,
+                            default_callback_error = self.errors.append,
+                            buffered = True)
+        listener.start()
+        self.addCleanup(listener.join)
+        self.addCleanup(listener.done)
+        return listener
+
+    def _wait_for(self, count, timeout=10):
+        end_time = time.time() + timeout
+        while len(self.received) < count and time.time() < end_time:
+            time.sleep(.01)
+
+    def test_framing(self):
+        """
+        Packets split at arbitrary points are framed whole and in order
+        """
+        payloads = ["packet %d " % i * (i % 7 + 1) for i in range(200)]
+        stream = "".join(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, payload)
+                         for payload in payloads)
+        self._start_listener()
+
+        index = 0
+        for size in [1, 15, 16, 17, 1000, 3] * 1000:
+            self.peer.sendall(stream[index:index + size])
+            index += size
+            if index >= len(stream):
+                break
+
+        self._wait_for(len(payloads))
+        self.assertEqual(self.received, payloads)
+        self.assertEqual(self.errors, [])
+
+    def test_large_packet(self):
+        """
+        The largest possible packet is received behind a partial one
+        """
+        payload = "A" * (RECEIVE_BUFFER_SIZE - HEADER_SIZE - 1)
+        self._start_listener()
+        self.peer.sendall(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "before") +
+                          make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, payload) +
+                          make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "after"))
+
+        self._wait_for(3)
+        self.assertEqual(len(self.received), 3)
+        self.assertEqual(self.received[0], "before")
+        # don't use assertEquals b/c it will print 64kb
+        self.assert_(self.received[1] == payload)
+        self.assertEqual(self.received[2], "after")
+
+    def test_packets_keep_data(self):
+        """
+        Packets held on to by a callback are not overwritten by later reads
+        """
+        packets = []
+        payloads = ["held %d " % i * 100 for i in range(100)]
+        self._start_listener(packets.append)
+
+        for payload in payloads:
+            self.peer.sendall(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, payload))
+        end_time = time.time() + 10
+        while len(packets) < len(payloads) and time.time() < end_time:
+            time.sleep(.01)
+
+        self.assertEqual([paPacket.get_data() for paPacket in packets], payloads)
+
+    def test_buffer_reuse(self):
+        """
+        Small packets detach from the receive buffer and it is kept, a large
+        packet keeps the buffer it views and receiving moves to a new one
+        """
+        packets = []
+        listener = Listener(self.sock, 0,
+                            callback_data = packets.append,
+                            callback_raw = lambda paPacket: None,
+                            default_callback_error = self.errors.append,
+                            buffered = True)
+        large = "L" * VIEW_PACKET_SIZE
+        small = make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "small")
+
+        self.peer.sendall(small + small[:5])
+        listener.receive()
+        buf = listener._buf
+        self.peer.sendall(small[5:] + small)
+        listener.receive()
+        self.assertTrue(listener._buf is buf)
+
+        self.peer.sendall(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, large) + small[:5])
+        listener.receive()
+        self.assertFalse(listener._buf is buf)
+        self.peer.sendall(small[5:])
+        listener.receive()
+
+        self.assertEqual([paPacket.get_data() for paPacket in packets],
+                         ["small", "small", "small", large, "small"])
+        self.assertEqual(self.errors, [])
+
+    def test_raw_without_copy(self):
+        """
+        Raw particles are encoded straight from the receive buffer, the
+        payload is only copied for the data callback
+        """
+        raw = []
+        data = []
+        def got_raw(paPacket):
+            raw.append(RawDataParticle(paPacket.get_as_dict())._build_parsed_values())
+            data.append(paPacket._PortAgentPacket__data_string)
+
+        listener = Listener(self.sock, 0,
+                            callback_data = self._got_data,
+                            callback_raw = got_raw,
+                            default_callback_error = self.errors.append,
+                            buffered = True)
+        payloads = ["small", "L" * VIEW_PACKET_SIZE]
+        self.peer.sendall("".join(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, payload)
+                                  for payload in payloads))
+        while len(self.received) < len(payloads):
+            listener.receive()
+
+        self.assertEqual(data, [None, None])
+        self.assertEqual([[v['value'] for v in values if v['value_id'] == RawDataParticleKey.PAYLOAD]
+                          for values in raw],
+                         [[base64.b64encode(payload)] for payload in payloads])
+        self.assertEqual(self.received, payloads)
+        self.assertEqual(self.errors, [])
+
+    def test_callback_error(self):
+        """
+        A failing callback is reported without losing the following packets
+        """
+        def got_data(paPacket):
+            if paPacket.get_data() == "bad":
+                raise ValueError("bad packet")
+            self._got_data(paPacket)
+
+        self._start_listener(got_data)
+        self.peer.sendall("".join(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, data)
+                                  for data in ["one", "bad", "two"]))
+
+        self._wait_for(2)
+        self.assertEqual(self.received, ["one", "two"])
+        self.assertEqual(len(self.errors), 1)
+
+@attr('UNIT', group='mi')
+class PAClientSelectorTestCase(MiUnitTest):
+    """
+    Serve many listeners from one selector thread
+    """
+    def setUp(self):
+        self.selector = PortAgentSelector()
+        self.addCleanup(self.selector.stop)
+        self.received = {}
+        self.errors = []
+
+    def _listener(self, name, heartbeat=0):
+        (sock, peer) = socket.socketpair()
+        sock.setblocking(0)
+        self.addCleanup(sock.close)
+        self.addCleanup(peer.close)
+        self.received[name] = []
+        listener = Listener(sock, 0, None, heartbeat, 1,
+                            callback_data = lambda paPacket: self.received[name].append(paPacket.get_data()),
+                            callback_raw = lambda paPacket: None,
+                            default_callback_error = self.errors.append,
+                            local_callback_error = lambda error: False,
+                            user_callback_error = self.errors.append,
+                            selector = self.selector)
+        self.selector.register(listener)
+        return (listener, peer)
+
+    def _wait_for(self, condition, timeout=10):
+        end_time = time.time() + timeout
+        while not condition() and time.time() < end_time:
+            time.sleep(.01)
+
+    def test_listeners(self):
+        listeners = [self._listener(i) for i in range(20)]
+        peers = [peer for (listener, peer) in listeners]
+        for count in range(10):
+            for (i, peer) in enumerate(peers):
+                peer.sendall(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "%d-%d" % (i, count)))
+
+        self._wait_for(lambda: all(len(received) == 10 for received in self.received.values()))
+        for i in range(len(peers)):
+            self.assertEqual(self.received[i], ["%d-%d" % (i, count) for count in range(10)])
+        # no listener runs a thread of its own
+        self.assertFalse(any(listener.is_alive() for (listener, peer) in listeners))
+
+    def test_unregister(self):
+        (listener, peer) = self._listener('a')
+        peer.sendall(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "one"))
+        self._wait_for(lambda: self.received['a'])
+
+        self.selector.unregister(listener)
+        peer.sendall(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "two"))
+        time.sleep(.2)
+        self.assertEqual(self.received['a'], ["one"])
+
+    def test_closed(self):
+        """
+        A closed connection is reported and the listener dropped
+        """
+        (listener, peer) = self._listener('a')
+        peer.close()
+        self._wait_for(lambda: self.errors)
+        self.assertEqual(len(self.errors), 1)
+        self.assertTrue(listener._done)
+
+    def test_high_descriptor(self):
+        """
+        Sockets numbered past FD_SETSIZE are served
+        """
+        (soft, hard) = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard != resource.RLIM_INFINITY and hard < 1200:
+            raise SkipTest('needs more than 1200 open files')
+        if soft != resource.RLIM_INFINITY and soft < 1200:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (1200, hard))
+            self.addCleanup(resource.setrlimit, resource.RLIMIT_NOFILE, (soft, hard))
+
+        filler = []
+        try:
+            while len(filler) < 1100:
+                filler.append(os.dup(0))
+            (listener, peer) = self._listener('a')
+        finally:
+            for fd in filler:
+                os.close(fd)
+        self.assertTrue(listener.sock.fileno() > 1024)
+
+        peer.sendall(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "high"))
+        self._wait_for(lambda: self.received['a'])
+        self.assertEqual(self.received['a'], ["high"])
+
+    def test_closed_unregistered(self):
+        """
+        A socket closed without unregistering its listener is dropped
+        rather than polled forever
+        """
+        (listener, peer) = self._listener('a')
+        (other, other_peer) = self._listener('b')
+        listener.sock.close()
+        self.selector._wake()
+        self._wait_for(lambda: len(self.selector._listeners) == 1)
+        self.assertEqual(self.selector._listeners.values(), [other])
+
+        other_peer.sendall(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "still served"))
+        self._wait_for(lambda: self.received['b'])
+        self.assertEqual(self.received['b'], ["still served"])
+
+    def test_heartbeat(self):
+        """
+        Missed heartbeats are timed by the selector
+        """
+        (listener, peer) = self._listener('a', heartbeat=1)
+        self.assertEqual(listener.heartbeat_timer, None)
+        self._wait_for(lambda: self.errors, timeout=5)
+        self.assertEqual(len(self.errors), 1)
+        self.assertTrue('heartbeats' in self.errors[0])
+
+    def test_client(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('localhost', 0))
+        server.listen(1)
+        self.addCleanup(server.close)
+
+        received = []
+        client = PortAgentClient('localhost', server.getsockname()[1], None, selector=self.selector)
+        client.init_comms(lambda paPacket: received.append(paPacket.get_data()),
+                          lambda paPacket: None, self.errors.append, self.errors.append)
+        (peer, address) = server.accept()
+        self.addCleanup(peer.close)
+        self.assertEqual(client.listener_thread.selector, self.selector)
+
+        peer.sendall(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "data"))
+        self._wait_for(lambda: received)
+        self.assertEqual(received, ["data"])
+
+        client.stop_comms()
+        self.assertEqual(self.selector._listeners, {})
+        self.assertEqual(self.errors, [])
+
 @attr('INT', group='mi')
 class PAClientIntTestCase(InstrumentDriverTestCase):
     def initialize(cls, *args, **kwargs):
@@ -913,3 +1364,121 @@ class PAClientIntTestCase(InstrumentDriverTestCase):
         """
         self.assertTrue(self.errorCallbackCalled)        
         self.assertTrue(exceptionCaught)
+
+
+@attr('BENCHMARK', group='mi')
+class PAClientChecksumBenchmark(MiUnitTest):
+    """
+    Time checksum verification against the byte at a time loop it replaced
+    """
+    @staticmethod
+    def loop_checksum(header, data):
+        checksum = 0
+        for i in range(HEADER_SIZE):
+            if i < 6 or i > 7:
+                checksum ^= struct.unpack_from('B', header[i])[0]
+        for i in range(len(data)):
+            checksum ^= struct.unpack_from('B', data[i])[0]
+        return checksum
+
+    def test_checksum(self):
+        for size in [4096, 65000]:
+            packet = make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "\x5a" * size)
+            (header, data) = (packet[:HEADER_SIZE], packet[HEADER_SIZE:])
+            count = 100
+
+            start_time = time.time()
+            for i in range(count):
+                self.loop_checksum(header, data)
+            loop_time = (time.time() - start_time) / count
+
+            start_time = time.time()
+            for i in range(count):
+                paPacket = PortAgentPacket()
+                paPacket.unpack_header(header)
+                paPacket.attach_data(data)
+                paPacket.verify_checksum()
+                paPacket.verify_checksum()
+            packet_time = (time.time() - start_time) / count
+            self.assertTrue(paPacket.is_valid())
+
+            log.info("%d byte payload: loop %.3f ms per verification, "
+                     "packet %.3f ms for the raw and data callbacks together",
+                     size, loop_time * 1000, packet_time * 1000)
+
+@attr('BENCHMARK', group='mi')
+class PAClientPacketBenchmark(MiUnitTest):
+    """
+    Time framing a packet and building its raw particle from copies of the
+    receive buffer against views into it
+    """
+    def test_raw_particle(self):
+        for size in [256, 4096, 65000]:
+            packet = make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, "\x5a" * size)
+            block = bytearray(packet)
+            count = 1000
+
+            start_time = time.time()
+            for i in range(count):
+                paPacket = PortAgentPacket()
+                paPacket.unpack_header(str(block[:HEADER_SIZE]))
+                paPacket.attach_data(str(block[HEADER_SIZE:]))
+                RawDataParticle(paPacket.get_as_dict())._build_parsed_values()
+            copy_time = (time.time() - start_time) / count
+
+            start_time = time.time()
+            for i in range(count):
+                paPacket = PortAgentPacket()
+                paPacket.unpack_buffer(block)
+                RawDataParticle(paPacket.get_as_dict())._build_parsed_values()
+            view_time = (time.time() - start_time) / count
+
+            log.info("%d byte payload: copied %.1f us, viewed %.1f us per raw particle",
+                     size, copy_time * 1e6, view_time * 1e6)
+
+@attr('BENCHMARK', group='mi')
+class PAClientBenchmark(MiUnitTest):
+    """
+    Compare packet throughput and latency of the per-packet and buffered
+    listeners with a bursty instrument simulated by a TCPSimulatorServer.
+    """
+    PACKETS = 20000
+    BURST = 200
+    PAYLOAD_SIZE = 64
+
+    def _run(self, buffered_receive):
+        simulator = TCPSimulatorServer()
+        self.addCleanup(simulator.close)
+
+        latencies = []
+        def got_data(paPacket):
+            latencies.append(time.time() - float(paPacket.get_data()[:20]))
+
+        paClient = PortAgentClient('localhost', simulator.port, None)
+        paClient.init_comms(got_data, lambda paPacket: None,
+                            lambda exception: None, lambda error: None,
+                            buffered_receive = buffered_receive)
+        try:
+            start_time = time.time()
+            for burst in range(self.PACKETS / self.BURST):
+                stamp = "%20.6f" % time.time()
+                payload = stamp + "x" * (self.PAYLOAD_SIZE - len(stamp))
+                simulator.send(make_packet(PortAgentPacket.DATA_FROM_INSTRUMENT, payload) * self.BURST)
+                time.sleep(.001)
+
+            timeout = time.time() + 60
+            while len(latencies) < self.PACKETS and time.time() < timeout:
+                time.sleep(.01)
+            elapsed = time.time() - start_time
+        finally:
+            paClient.stop_comms()
+
+        self.assertEqual(len(latencies), self.PACKETS)
+        latencies.sort()
+        return (self.PACKETS / elapsed, latencies[int(len(latencies) * .99)])
+
+    def test_receive(self):
+        for buffered_receive in (False, True):
+            (rate, p99) = self._run(buffered_receive)
+            log.info("buffered_receive=%s: %.0f packets/s, p99 latency %.1f ms",
+                     buffered_receive, rate, p99 * 1000)
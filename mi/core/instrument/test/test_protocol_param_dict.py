@@ -12,9 +12,13 @@ __license__ = 'Apache 2.0'
 
 import json
 import re
+import time
+from mock import patch
 
 from ooi.logging import log
 from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
+from mi.core.unit_test import MiUnitTestCase
 from mi.core.instrument.test.test_strings import TestUnitStringsDict
 from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import InstrumentParameterExpirationException
@@ -23,6 +27,7 @@ from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.instrument.protocol_param_dict import ParameterDictType
 from mi.core.instrument.protocol_param_dict import ParameterDictKey
 from mi.core.instrument.protocol_param_dict import Parameter, FunctionParameter, RegexParameter
+from mi.core.instrument.protocol_param_dict import required_literal
 
 @attr('UNIT', group='mi')
 class TestUnitProtocolParameterDict(TestUnitStringsDict):
@@ -653,3 +658,143 @@ bar=200, baz=300
         self.assertEqual(new_dict["baz"][ParameterDictKey.DISPLAY_NAME], "Baz")
         
         self.assertTrue('extra_param' not in new_dict)
+
+
+@attr('UNIT', group='mi')
+class TestUnitRequiredLiteral(MiUnitTestCase):
+    """
+    Test the literal text parameters check for before searching
+    """
+    PATTERNS = [
+        (r'\s*pressure sensor = ([\w ]+),', 0, 'pressure sensor = '),
+        (r'.*foo=(\d+).*', 0, 'foo='),
+        (r'SBE 16plus V ([\w.]+) +SERIAL NO. (\d+)', 0, 'SBE 16plus V '),
+        (r'x(?:ab|cd)yz', 0, 'yz'),
+        (r'abc(def)?g', 0, 'abc'),
+        (r'(ab)+c', 0, 'ab'),
+        (r'(?!foo)bar', 0, 'bar'),
+        (r'ab?c', 0, 'a'),
+        (r'tx(\d)?', re.MULTILINE, 'tx'),
+        (r'(?i)abc', 0, None),
+        (r'abc', re.IGNORECASE, None),
+        (r'^.{4}(.{2}).*', re.DOTALL, None),
+        (r'a|bcd', 0, None),
+        (u'abc', 0, None),
+    ]
+
+    INPUTS = ['pressure sensor = strain gauge, range = 160.0', 'foo=12', 'foo=', 'xabyz', 'xcdyz', 'abcg', 'abcdefg',
+              'ababc', 'bar', 'foobar', 'ac', 'abc', 'ABC', 'tx', 'tx1', '123456789', 'SBE 16plus V 2.5  SERIAL NO. 6841',
+              '', 'bcd']
+
+    def test_required_literal(self):
+        for (pattern, flags, literal) in self.PATTERNS:
+            self.assertEqual(required_literal(re.compile(pattern, flags)), literal)
+
+    def test_same_matches(self):
+        """
+        Input the literal rules out never matches the regex
+        """
+        for (pattern, flags, literal) in self.PATTERNS:
+            param = RegexParameter('foo', pattern, lambda match: match.group(0), str, regex_flags=flags)
+            for input in self.INPUTS:
+                matched = param.regex.search(input) is not None
+                self.assertEqual(param.update(input), matched)
+                if matched:
+                    self.assertTrue(param.could_match(input))
+                    self.assertEqual(param.get_value(), param.regex.search(input).group(0))
+
+    def test_replaced_regex(self):
+        param = RegexParameter('foo', r'foo=(\d+)', lambda match: int(match.group(1)), str)
+        self.assertFalse(param.update('bar=1'))
+        param.regex = re.compile(r'bar=(\d+)')
+        self.assertTrue(param.update('bar=1'))
+        self.assertEqual(param.get_value(), 1)
+
+    def test_index_rebuilt(self):
+        """
+        Parameters added or replaced after an update are indexed
+        """
+        param_dict = ProtocolParameterDict()
+        param_dict.add('foo', r'foo=(\d+)', lambda match: int(match.group(1)), str)
+        self.assertTrue(param_dict.update('foo=1'))
+        self.assertFalse(param_dict.update('bar=2'))
+
+        param_dict.add('bar', r'bar=(\d+)', lambda match: int(match.group(1)), str)
+        self.assertTrue(param_dict.update('bar=2'))
+        self.assertEqual(param_dict.get('bar'), 2)
+
+        param_dict.add('foo', r'baz=(\d+)', lambda match: int(match.group(1)), str)
+        self.assertEqual(param_dict.update_many('foo=3 baz=4'), {'foo': True})
+        self.assertEqual(param_dict.get('foo'), 4)
+
+        # parameters without a plain regex search try every input
+        param_dict.add_parameter(FunctionParameter('fn', lambda input: len(input), str))
+        self.assertTrue(param_dict.update('qux'))
+        self.assertEqual(param_dict.get('fn'), 3)
+
+    def test_multi_match_update(self):
+        param_dict = ProtocolParameterDict()
+        param_dict.add('ta0', r'TA0 = (\S+)', lambda match: float(match.group(1)), str, multi_match=True)
+        param_dict.add('ta1', r'TA1 = (\S+)', lambda match: float(match.group(1)), str, multi_match=True)
+        param_dict.add('serial', r'SERIAL NO. (\d+)', lambda match: int(match.group(1)), str)
+
+        self.assertEqual(param_dict.multi_match_update('TA0 = 1.5 TA1 = 2.5'), 2)
+        self.assertEqual(param_dict.get('ta0'), 1.5)
+        self.assertEqual(param_dict.get('ta1'), 2.5)
+        self.assertEqual(param_dict.multi_match_update('SERIAL NO. 6841'), 1)
+        self.assertEqual(param_dict.get('serial'), 6841)
+        self.assertEqual(param_dict.multi_match_update('nothing here'), 0)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkParameterDictUpdate(MiUnitTestCase):
+    """
+    Time driver parameter dicts updating from instrument status responses,
+    with and without the update index
+    """
+    count = 200
+
+    def _protocol(self, module, driver_class):
+        try:
+            module = __import__(module, fromlist=[driver_class])
+        except ImportError as e:
+            raise SkipTest('driver can not be imported: %s' % e)
+        driver = getattr(module, driver_class)(lambda evt: None)
+        driver._build_protocol()
+        return driver._protocol
+
+    def _time(self, name, update):
+        """
+        Time an update using the index, and with every parameter trying
+        every input
+        """
+        start_time = time.time()
+        for i in range(self.count):
+            update()
+        indexed = (time.time() - start_time) / self.count
+
+        with patch.object(ProtocolParameterDict, '_update_candidates', lambda pd, input: pd._param_dict.items()):
+            with patch.object(RegexParameter, 'could_match', lambda param, input: True):
+                start_time = time.time()
+                for i in range(self.count):
+                    update()
+                unindexed = (time.time() - start_time) / self.count
+
+        log.info("%s update: %.0fus indexed, %.0fus searching every regex", name, indexed * 1e6, unindexed * 1e6)
+
+    def test_sbe16plus(self):
+        protocol = self._protocol('mi.instrument.seabird.sbe16plus_v2.driver', 'SBE16InstrumentDriver')
+        from mi.instrument.seabird.sbe16plus_v2.test.test_driver import SeaBird16plusMixin
+        self._time('sbe16plus ds', lambda: protocol._parse_dsdc_response(SeaBird16plusMixin.VALID_DS_RESPONSE,
+                                                                         '<Executed/>'))
+
+    def test_sbe26plus(self):
+        protocol = self._protocol('mi.instrument.seabird.sbe26plus.driver', 'SBE26PlusInstrumentDriver')
+        from mi.instrument.seabird.sbe26plus.test.sample_data import SAMPLE_DS
+        self._time('sbe26plus ds', lambda: protocol._parse_ds_response(SAMPLE_DS, 'S>'))
+
+    def test_nortek(self):
+        protocol = self._protocol('mi.instrument.nortek.vector.ooicore.driver', 'InstrumentDriver')
+        from mi.instrument.nortek.test.test_driver import user_config1
+        user_config = user_config1()
+        self._time('nortek user config', lambda: protocol._param_dict.update(user_config))
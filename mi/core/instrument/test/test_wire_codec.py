@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_wire_codec
+@file mi/core/instrument/test/test_wire_codec.py
+@brief Test cases for the driver process message encodings
+"""
+
+__license__ = 'Apache 2.0'
+
+import cPickle as pickle
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument import wire_codec
+from mi.core.instrument.wire_codec import WireCodecType, WIRE_TAG
+
+PARTICLE = '{"stream_name": "parsed", "values": [{"value_id": "temp", "value": 10.5}]}'
+
+SAMPLE = {'type': DriverAsyncEvent.SAMPLE, 'value': PARTICLE, 'time': 3600.25}
+BATCH = {'type': DriverAsyncEvent.SAMPLE_BATCH, 'value': [PARTICLE, PARTICLE], 'time': 3600.25}
+CONFIG = {'type': DriverAsyncEvent.CONFIG_CHANGE, 'value': {'TA0': 1.5, 'NAME': u'unit'}, 'time': 1.0}
+COMMAND = {'cmd': 'execute_resource', 'args': ['DRIVER_EVENT_ACQUIRE_SAMPLE'], 'kwargs': {'timeout': 10}}
+
+
+@attr('UNIT', group='mi')
+class TestWireCodec(MiUnitTest):
+    """
+    Test messages round trip through every codec
+    """
+    def test_round_trip(self):
+        for codec in [None] + wire_codec.available_codecs():
+            for msg in [SAMPLE, BATCH, CONFIG, COMMAND, 'ping', None, ['BAD_PARAMETER', 'message', None]]:
+                frames = wire_codec.encode(msg, codec)
+                self.assertEqual(wire_codec.message_codec(frames), codec)
+                self.assertEqual(wire_codec.decode(frames), msg)
+
+    def test_pickle_compatible(self):
+        """
+        Without a codec messages are what send_pyobj and recv_pyobj use
+        """
+        frames = wire_codec.encode(SAMPLE)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(pickle.loads(frames[0]), SAMPLE)
+        self.assertEqual(wire_codec.decode([pickle.dumps(COMMAND)]), COMMAND)
+
+    def test_multipart_frames(self):
+        """
+        Particles travel as their own frames
+        """
+        frames = wire_codec.encode(SAMPLE, WireCodecType.MULTIPART)
+        self.assertEqual(len(frames), 2)
+        self.assertEqual(frames[1], PARTICLE)
+
+        frames = wire_codec.encode(BATCH, WireCodecType.MULTIPART)
+        self.assertEqual(frames[1:], [PARTICLE, PARTICLE])
+
+        # the sent event is left as it was
+        self.assertEqual(SAMPLE['value'], PARTICLE)
+
+        # values that are not strings are pickled with the event
+        self.assertEqual(len(wire_codec.encode(CONFIG, WireCodecType.MULTIPART)), 1)
+        unicode_sample = dict(SAMPLE, value=unicode(PARTICLE))
+        frames = wire_codec.encode(unicode_sample, WireCodecType.MULTIPART)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(type(wire_codec.decode(frames)['value']), unicode)
+
+    def test_msgpack_fallback(self):
+        if not wire_codec.msgpack:
+            return
+        frames = wire_codec.encode(SAMPLE, WireCodecType.MSGPACK)
+        self.assertEqual(wire_codec.message_codec(frames), WireCodecType.MSGPACK)
+        self.assertEqual(type(wire_codec.decode(frames)['value']), str)
+
+        # msgpack has no sets, so it goes as pickle
+        msg = {'value': set([1, 2])}
+        frames = wire_codec.encode(msg, WireCodecType.MSGPACK)
+        self.assertEqual(wire_codec.message_codec(frames), WireCodecType.PICKLE)
+        self.assertEqual(wire_codec.decode(frames), msg)
+
+    def test_unknown_codec(self):
+        self.assertRaises(ValueError, wire_codec.decode, [WIRE_TAG + 'X' + 'data'])
+        self.assertRaises(ValueError, wire_codec.decode, [WIRE_TAG])
+
+    def test_negotiate(self):
+        self.assertEqual(wire_codec.negotiate(['bogus', WireCodecType.PICKLE, WireCodecType.MULTIPART]),
+                         WireCodecType.PICKLE)
+        self.assertEqual(wire_codec.negotiate(['bogus']), None)
+        self.assertEqual(wire_codec.negotiate(None), None)
+
+        with patch.object(wire_codec, 'msgpack', None):
+            self.assertFalse(WireCodecType.MSGPACK in wire_codec.available_codecs())
+            self.assertEqual(wire_codec.negotiate([WireCodecType.MSGPACK]), None)
+            self.assertRaises(ValueError, wire_codec.decode, [wire_codec.MsgpackCodec.tag])
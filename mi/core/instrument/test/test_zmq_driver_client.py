@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_zmq_driver_client
+@file mi/core/instrument/test/test_zmq_driver_client.py
+@brief Test cases for the ZMQ driver client against a driver process run in
+    this process. Unlike test_zmq_driver_process these do not monkey patch
+    with gevent, the messaging threads need real threads.
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import tempfile
+import threading
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentParameterException
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.zmq_driver_client import ZmqDriverClient, MAX_POLL_DELAY
+from mi.core.instrument.driver_process import DriverProcess, ProcessStatsKey, DEFAULT_EVENT_QUEUE_SIZE
+from mi.core.instrument.wire_codec import WireCodecType, available_codecs
+from mi.core.instrument.zmq_driver_process import ZmqDriverProcess
+
+
+class EchoDriver(object):
+    """
+    Stands in for a driver, replying with its arguments
+    """
+    def echo(self, *args, **kwargs):
+        return (args, kwargs)
+
+    def fail(self):
+        raise InstrumentParameterException("bad parameter")
+
+
+def read_port(fname, timeout=10):
+    """
+    Wait for a driver process port file as launch_process does
+    """
+    end_time = time.time() + timeout
+    while time.time() < end_time:
+        try:
+            port = int(open(fname).read().strip())
+            os.remove(fname)
+            return port
+        except (IOError, ValueError):
+            time.sleep(.01)
+    raise IOError("no port written to %s" % fname)
+
+
+class ZmqDriverMixin(object):
+    """
+    Run a ZmqDriverProcess in this process and connect a client to it
+    """
+    def start_process(self, driver_module=None, driver_class=None, wire_codecs=None):
+        workdir = tempfile.mkdtemp()
+        self.process = ZmqDriverProcess(driver_module, driver_class,
+                                        os.path.join(workdir, 'cmd_port'),
+                                        os.path.join(workdir, 'evt_port'), None)
+        if driver_module:
+            self.assertTrue(self.process.construct_driver())
+        else:
+            self.process.driver = EchoDriver()
+        self.process.start_messaging()
+        self.addCleanup(self.stop_process)
+
+        self.events = []
+        self.event_received = threading.Event()
+        self.client = ZmqDriverClient('localhost', read_port(self.process.cmd_port_fname),
+                                      read_port(self.process.evt_port_fname), wire_codecs)
+        self.client.start_messaging(self.got_event)
+
+        # Events published before the subscription is in place are
+        # dropped, so wait for one to come through.
+        while not self.events:
+            self.process.send_event('ready')
+            self.event_received.wait(.1)
+        self.events = []
+
+    def stop_process(self):
+        if self.process.messaging_started:
+            self.process.stop_messaging()
+        self.process.shutdown()
+        if self.client.zmq_context:
+            self.client.stop_messaging()
+            # let the client event thread see it is stopped
+            time.sleep(MAX_POLL_DELAY)
+
+    def got_event(self, evt):
+        self.events.append(evt)
+        self.event_received.set()
+
+    def wait_for_events(self, count, timeout=5):
+        end_time = time.time() + timeout
+        while len(self.events) < count and time.time() < end_time:
+            time.sleep(.001)
+        return self.events
+
+
+@attr('UNIT', group='mi')
+class TestZmqDriverClient(MiUnitTest, ZmqDriverMixin):
+    """
+    Test commands and events between the driver process and client
+    """
+    def setUp(self):
+        self.start_process()
+
+    def test_commands(self):
+        self.assertEqual(self.client.cmd_dvr('echo', 1, a=2), ((1,), {'a': 2}))
+        self.assertTrue(self.client.cmd_dvr('process_echo').startswith('ping from resource'))
+
+        # exceptions come back as their error triple
+        reply = self.client.cmd_dvr('fail')
+        self.assertEqual(reply[0], InstrumentParameterException("").error_code)
+        self.assertTrue('bad parameter' in reply[1])
+
+    def test_events(self):
+        sent = ['event %d' % i for i in range(100)]
+        for evt in sent:
+            self.process.send_event(evt)
+        self.assertEqual(self.client.cmd_dvr('test_events', events=['test event']), 'test_events')
+        self.assertEqual(self.wait_for_events(101), sent + ['test event'])
+
+    def test_process_stats(self):
+        self.process.send_event('event')
+        self.wait_for_events(1)
+        stats = self.client.cmd_dvr('get_process_stats')
+        self.assertEqual(stats[ProcessStatsKey.QUEUE_DEPTH], 0)
+        self.assertEqual(stats[ProcessStatsKey.QUEUE_SIZE], DEFAULT_EVENT_QUEUE_SIZE)
+        self.assertGreaterEqual(stats[ProcessStatsKey.SENT], 1)
+
+    def test_sample_batch(self):
+        self.process.send_event({'type': DriverAsyncEvent.SAMPLE_BATCH, 'value': ['a', 'b'], 'time': 1.0})
+        self.assertEqual(self.wait_for_events(2),
+                         [{'type': DriverAsyncEvent.SAMPLE, 'value': 'a', 'time': 1.0},
+                          {'type': DriverAsyncEvent.SAMPLE, 'value': 'b', 'time': 1.0}])
+
+    def test_wire_codec(self):
+        self.assertEqual(self.client.wire_codec, WireCodecType.PICKLE)
+        self.assertEqual(self.process.event_codec, WireCodecType.PICKLE)
+
+    def test_stop(self):
+        self.assertEqual(self.client.cmd_dvr('stop_driver_process'), 'stop_driver_process')
+        self.process.cmd_thread.join(5)
+        self.process.evt_thread.join(5)
+        self.assertFalse(self.process.cmd_thread.is_alive())
+        self.assertFalse(self.process.evt_thread.is_alive())
+        self.assertFalse(self.process.messaging_started)
+
+    def test_stop_idle(self):
+        """
+        Stopping from outside the command thread wakes both threads
+        """
+        self.process.stop_messaging()
+        self.process.cmd_thread.join(5)
+        self.process.evt_thread.join(5)
+        self.assertFalse(self.process.cmd_thread.is_alive())
+        self.assertFalse(self.process.evt_thread.is_alive())
+
+
+@attr('UNIT', group='mi')
+class TestZmqDriverClientCodecs(MiUnitTest, ZmqDriverMixin):
+    """
+    Test commands and events with each wire codec, and with clients and
+    driver processes that have none
+    """
+    def _exchange(self):
+        reply = self.client.cmd_dvr('echo', 1, a=[2])
+        if self.client.wire_codec == WireCodecType.MSGPACK:
+            # msgpack has no tuples
+            self.assertEqual(reply, [[1], {'a': [2]}])
+        else:
+            self.assertEqual(reply, ((1,), {'a': [2]}))
+        reply = self.client.cmd_dvr('fail')
+        self.assertEqual(reply[0], InstrumentParameterException("").error_code)
+
+        sent = [{'type': DriverAsyncEvent.SAMPLE, 'value': '{"n": %d}' % i, 'time': 1.0} for i in range(3)]
+        sent.append({'type': DriverAsyncEvent.CONFIG_CHANGE, 'value': {'a': 1.5}, 'time': 1.0})
+        for evt in sent:
+            self.process.send_event(evt)
+        self.assertEqual(self.wait_for_events(4), sent)
+
+    def test_pickle_client(self):
+        self.start_process(wire_codecs=[])
+        self.assertEqual(self.client.wire_codec, None)
+        self.assertEqual(self.process.event_codec, None)
+        self._exchange()
+
+    def test_codecs(self):
+        for codec in available_codecs():
+            self.start_process(wire_codecs=[codec])
+            self.assertEqual(self.client.wire_codec, codec)
+            self.assertEqual(self.process.event_codec, codec)
+            self._exchange()
+            self.stop_process()
+
+    def test_second_client(self):
+        """
+        Later clients get the codec the process already publishes events
+        in, or none if they do not offer it
+        """
+        self.start_process(wire_codecs=[WireCodecType.PICKLE])
+        for (offered, expected) in [([WireCodecType.MULTIPART, WireCodecType.PICKLE], WireCodecType.PICKLE),
+                                    ([WireCodecType.MULTIPART], None)]:
+            client = ZmqDriverClient('localhost', self.client.cmd_port, self.client.event_port, offered)
+            client.start_messaging()
+            self.addCleanup(client.stop_messaging)
+            self.assertEqual(client.wire_codec, expected)
+            self.assertEqual(client.cmd_dvr('echo', 1), ((1,), {}))
+        self.assertEqual(self.process.event_codec, WireCodecType.PICKLE)
+        self._exchange()
+
+    def test_pickle_process(self):
+        """
+        Driver processes without codecs refuse to negotiate one
+        """
+        with patch.object(ZmqDriverProcess, 'cmd_driver', DriverProcess.cmd_driver.im_func):
+            self.start_process()
+        self.assertEqual(self.client.wire_codec, None)
+        self._exchange()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkZmqDriverClient(MiUnitTest, ZmqDriverMixin):
+    """
+    Time command round trips and event delivery through the ZMQ driver
+    process and client with the test driver
+    """
+    def setUp(self):
+        self.start_process('mi.instrument.ooici.mi.test_driver.driver', 'InstrumentDriver')
+
+    def test_latency(self):
+        count = 200
+
+        rtt = []
+        for i in range(count):
+            start_time = time.time()
+            self.client.cmd_dvr('get_resource_state')
+            rtt.append(time.time() - start_time)
+
+        for i in range(count):
+            self.process.send_event({'type': DriverAsyncEvent.SAMPLE, 'value': i, 'time': time.time()})
+            time.sleep(.002)
+        events = self.wait_for_events(count)
+        delivery = [evt['received'] - evt['time'] for evt in events if isinstance(evt, dict)]
+
+        log.info("command round trip: p50 %.2f ms, p99 %.2f ms; "
+                 "event delivery: p50 %.2f ms, p99 %.2f ms",
+                 percentile(rtt, .5) * 1000, percentile(rtt, .99) * 1000,
+                 percentile(delivery, .5) * 1000, percentile(delivery, .99) * 1000)
+
+    def got_event(self, evt):
+        if isinstance(evt, dict):
+            evt['received'] = time.time()
+        ZmqDriverMixin.got_event(self, evt)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkWireCodec(MiUnitTest, ZmqDriverMixin):
+    """
+    Time SBE37 sample events through the driver process and client with
+    each wire codec
+    """
+    def test_throughput(self):
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37DataParticle
+        from mi.instrument.seabird.sbe37smb.ooicore.test.sample_data import SAMPLE
+
+        count = 20000
+        particle = SBE37DataParticle(SAMPLE).generate()
+        for codec in [None] + available_codecs():
+            self.start_process(wire_codecs=[codec] if codec else [])
+
+            start_cpu = sum(os.times()[:2])
+            start_time = time.time()
+            # in chunks, the PUB socket drops what is over its high water mark
+            for chunk in range(0, count, 500):
+                for i in range(500):
+                    self.process.send_event({'type': DriverAsyncEvent.SAMPLE, 'value': particle, 'time': time.time()})
+                self.assertEqual(len(self.wait_for_events(chunk + 500)), chunk + 500)
+            elapsed = time.time() - start_time
+            cpu = sum(os.times()[:2]) - start_cpu
+
+            log.info("%s: %d events in %.3fs, %.0f events/s, %.1f us CPU per event",
+                     codec or "untagged pickle", count, elapsed, count / elapsed, cpu / count * 1e6)
+            self.stop_process()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.test.test_zmq_driver_host
+@file mi/core/instrument/test/test_zmq_driver_host.py
+@brief Test cases for the multi-driver ZMQ host, run in this process, and
+    a benchmark comparing it to a process per driver.
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import tempfile
+import threading
+from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import InstrumentCommandException
+from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.port_agent_client import PortAgentClient
+from mi.core.instrument.driver_process import ProcessStatsKey
+from mi.core.instrument.zmq_driver_client import ZmqDriverClient, ZmqDriverHostClient, MAX_POLL_DELAY
+from mi.core.instrument.zmq_driver_process import ZmqDriverProcess
+from mi.core.instrument.zmq_driver_host import ZmqDriverHost, HOST_ID
+
+TEST_DRIVER = ('mi.instrument.ooici.mi.test_driver.driver', 'InstrumentDriver')
+
+
+class HostedDriver(object):
+    """
+    Stands in for a driver, replying with its id
+    """
+    def __init__(self, evt_callback):
+        self.evt_callback = evt_callback
+
+    def echo(self, *args):
+        return args
+
+    def sleep(self, seconds):
+        time.sleep(seconds)
+        return 'slept'
+
+    def event(self, value):
+        self.evt_callback({'type': DriverAsyncEvent.SAMPLE, 'value': value, 'time': 1.0})
+
+
+@attr('UNIT', group='mi')
+class TestZmqDriverHost(MiUnitTest):
+    """
+    Test commands and events routed by driver id
+    """
+    def setUp(self):
+        driver = (__name__, 'HostedDriver')
+        self.host = ZmqDriverHost({'a': driver, 'a1': driver, 'b': driver}, None)
+        self.assertTrue(self.host.construct_driver())
+        self.host.start_messaging()
+        self.addCleanup(self.host.shutdown)
+        self.addCleanup(self.host.stop_messaging)
+
+        self.events = {}
+        self.clients = {}
+        for driver_id in [HOST_ID, 'a', 'a1', 'b']:
+            self._client(driver_id)
+
+    def _client(self, driver_id):
+        client = ZmqDriverHostClient('localhost', self.host.cmd_port, self.host.evt_port, driver_id)
+        self.events[driver_id] = []
+        client.start_messaging(self.events[driver_id].append)
+        self.clients[driver_id] = client
+        self.addCleanup(time.sleep, MAX_POLL_DELAY)
+        self.addCleanup(client.stop_messaging)
+
+        # Events published before the subscription is in place are
+        # dropped, so wait for one to come through.
+        while not self.events[driver_id]:
+            if driver_id == HOST_ID:
+                self.host.send_event('ready')
+            else:
+                self.host.drivers[driver_id].event('ready')
+            self._wait_for(lambda: self.events[driver_id], .1)
+        del self.events[driver_id][:]
+
+    def _wait_for(self, condition, timeout=5):
+        end_time = time.time() + timeout
+        while not condition() and time.time() < end_time:
+            time.sleep(.001)
+
+    def test_commands(self):
+        for driver_id in ['a', 'a1', 'b']:
+            self.assertEqual(self.clients[driver_id].cmd_dvr('echo', driver_id), (driver_id,))
+
+        reply = self.clients['a'].cmd_dvr('bogus')
+        self.assertEqual(reply[0], InstrumentCommandException("").error_code)
+
+        # a driver's client stopping its process leaves the host running
+        self.assertEqual(self.clients['a'].cmd_dvr('stop_driver_process'), 'stop_driver_process')
+        self.assertTrue(self.host.messaging_started)
+
+        client = ZmqDriverHostClient('localhost', self.host.cmd_port, self.host.evt_port, 'c')
+        client.start_messaging()
+        self.addCleanup(client.stop_messaging)
+        reply = client.cmd_dvr('echo')
+        self.assertEqual(reply[0], InstrumentCommandException("").error_code)
+        self.assertTrue('Unknown driver c' in reply[1])
+
+    def test_host_commands(self):
+        stats = self.clients[HOST_ID].cmd_dvr('get_process_stats')
+        self.assertEqual(stats[ProcessStatsKey.QUEUE_DEPTH], 0)
+        reply = self.clients[HOST_ID].cmd_dvr('echo')
+        self.assertEqual(reply[0], InstrumentCommandException("").error_code)
+
+        self.assertEqual(self.clients[HOST_ID].cmd_dvr('stop_driver_process'), 'stop_driver_process')
+        self.host.cmd_thread.join(5)
+        self.assertFalse(self.host.cmd_thread.is_alive())
+
+    def test_events(self):
+        for driver_id in ['a', 'a1', 'b']:
+            for i in range(3):
+                self.host.drivers[driver_id].event('%s %d' % (driver_id, i))
+
+        self._wait_for(lambda: all(len(self.events[driver_id]) >= 3 for driver_id in ['a', 'a1', 'b']))
+        for driver_id in ['a', 'a1', 'b']:
+            self.assertEqual([evt['value'] for evt in self.events[driver_id]],
+                             ['%s %d' % (driver_id, i) for i in range(3)])
+            self.assertFalse('_driver_id' in self.events[driver_id][0])
+        self.assertEqual(self.events[HOST_ID], [])
+
+    def test_slow_command(self):
+        """
+        A slow command holds up only its own driver
+        """
+        replies = []
+        thread = threading.Thread(target=lambda: replies.append(self.clients['a'].cmd_dvr('sleep', 1)))
+        thread.start()
+        time.sleep(.1)
+
+        start_time = time.time()
+        self.assertEqual(self.clients['b'].cmd_dvr('echo', 1), (1,))
+        self.assertLess(time.time() - start_time, .5)
+        thread.join(5)
+        self.assertEqual(replies, ['slept'])
+
+    def test_driver_commands_in_order(self):
+        """
+        A driver runs one command at a time, in the order they came in
+        """
+        client = ZmqDriverHostClient('localhost', self.host.cmd_port, self.host.evt_port, 'a')
+        client.start_messaging()
+        self.addCleanup(client.stop_messaging)
+
+        replies = []
+        thread = threading.Thread(target=lambda: replies.append(self.clients['a'].cmd_dvr('sleep', .5)))
+        thread.start()
+        time.sleep(.1)
+
+        self.assertEqual(client.cmd_dvr('echo', 1), (1,))
+        self.assertEqual(replies, ['slept'])
+        thread.join(5)
+
+    def test_port_agent_selector(self):
+        """
+        Drivers hand the host's selector to the port agent clients they
+        build, other clients get none
+        """
+        for driver in self.host.drivers.values():
+            self.assertIs(driver.port_agent_selector, self.host.port_agent_selector)
+
+        host = ZmqDriverHost({'t': TEST_DRIVER}, None)
+        self.assertTrue(host.construct_driver())
+        self.addCleanup(host.shutdown)
+        client = host.drivers['t']._build_connection({'addr': 'localhost', 'port': 4001, 'cmd_port': 4002})
+        self.assertIs(client.selector, host.port_agent_selector)
+        self.assertIsNot(client.selector, self.host.port_agent_selector)
+        self.assertIsNone(PortAgentClient('localhost', 4001, 4002).selector)
+
+        self.host.stop_messaging()
+        self.host.shutdown()
+        self.assertIsNone(self.host.port_agent_selector)
+
+
+def rss_kb(pid):
+    """
+    @retval The resident memory of a process in kB
+    """
+    for line in open('/proc/%d/status' % pid):
+        if line.startswith('VmRSS:'):
+            return int(line.split()[1])
+    return 0
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkZmqDriverHost(MiUnitTest):
+    """
+    Launch 50 test drivers as a process each and in one host, timing
+    startup until every driver answers and totalling resident memory
+    """
+    count = 50
+
+    def setUp(self):
+        if not os.path.exists('bin/python'):
+            raise SkipTest('driver processes are launched with bin/python')
+        self.processes = []
+        self.clients = []
+        self.addCleanup(self._cleanup)
+
+    def _cleanup(self):
+        for client in self.clients:
+            client.stop_messaging()
+        # let the client event threads see they are stopped
+        time.sleep(MAX_POLL_DELAY)
+        for process in self.processes:
+            process.terminate()
+            process.wait()
+
+    def _started(self, name, start_time):
+        for client in self.clients:
+            client.start_messaging()
+            client.cmd_dvr('get_resource_state')
+        elapsed = time.time() - start_time
+        rss = sum(rss_kb(process.pid) for process in self.processes)
+        log.info("%s: %d drivers started in %.2fs, %d MB resident in %d processes",
+                 name, self.count, elapsed, rss / 1024, len(self.processes))
+
+    def test_process_per_driver(self):
+        workdir = tempfile.mkdtemp() + '/'
+        start_time = time.time()
+        for i in range(self.count):
+            (process, cmd_port, evt_port) = ZmqDriverProcess.launch_process(*TEST_DRIVER, workdir=workdir,
+                                                                            ppid=os.getpid())
+            self.processes.append(process)
+            self.clients.append(ZmqDriverClient('localhost', cmd_port, evt_port))
+        self._started("process per driver", start_time)
+
+    def test_host(self):
+        drivers = dict(('driver%d' % i, TEST_DRIVER) for i in range(self.count))
+        start_time = time.time()
+        (process, cmd_port, evt_port) = ZmqDriverHost.launch_process(drivers, ppid=os.getpid())
+        self.processes.append(process)
+        for driver_id in sorted(drivers):
+            self.clients.append(ZmqDriverHostClient('localhost', cmd_port, evt_port, driver_id))
+        self._started("driver host", start_time)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.wire_codec
+@file mi/core/instrument/wire_codec.py
+@brief Message encodings for the ZMQ driver process command and event
+    sockets. Messages are lists of ZMQ frames. A message of one untagged
+    frame is a pickle, as send_pyobj writes and recv_pyobj reads, so
+    clients and processes that predate the codecs keep working. Otherwise
+    the first frame starts with a tag naming the codec, so either end can decode
+    whatever it is sent; the client and process negotiate which codec
+    events are published with. The tag is a prefix rather than a frame of
+    its own as every frame costs more to send and receive than encoding
+    the message does.
+"""
+
+__license__ = 'Apache 2.0'
+
+import cPickle as pickle
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from mi.core.common import BaseEnum
+
+# First byte of a message encoded by a codec, which no pickle starts with,
+# followed by a byte for the codec
+WIRE_TAG = '\x00'
+
+
+class WireCodecType(BaseEnum):
+    """
+    PICKLE - highest protocol pickle.
+    MSGPACK - msgpack, falling back to pickle for values msgpack can not
+        encode. Needs the msgpack package.
+    MULTIPART - event values that are already encoded particles travel
+        as frames of their own, everything else as pickle.
+    """
+    PICKLE = 'pickle'
+    MSGPACK = 'msgpack'
+    MULTIPART = 'multipart'
+
+
+class PickleCodec(object):
+    """
+    Encode a message as one pickle frame
+    """
+    name = WireCodecType.PICKLE
+    tag = WIRE_TAG + 'P'
+
+    def encode(self, obj):
+        return [self.tag + pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)]
+
+    def decode(self, data, frames):
+        return pickle.loads(data)
+
+
+class MsgpackCodec(object):
+    """
+    Encode a message as one msgpack frame. Strings keep their python 2
+    type; tuples come back as lists.
+    """
+    name = WireCodecType.MSGPACK
+    tag = WIRE_TAG + 'M'
+
+    def encode(self, obj):
+        try:
+            data = msgpack.packb(obj, use_bin_type=True)
+        except (TypeError, ValueError, OverflowError):
+            return CODECS[WireCodecType.PICKLE].encode(obj)
+        return [self.tag + data]
+
+    def decode(self, data, frames):
+        return msgpack.unpackb(data, raw=False)
+
+
+# How the multipart header says the event value was sent
+VALUE_NONE = 0
+VALUE_FRAME = 1
+VALUE_FRAMES = 2
+
+
+class MultipartCodec(object):
+    """
+    Encode events whose value is a string, such as a sample and its JSON
+    particle, or a list of strings, such as a sample batch, as a pickled
+    header with the rest of the event followed by the value frames. The
+    particles are sent as they are rather than copied into a pickle and
+    out again. Anything else is pickled whole into the header.
+    """
+    name = WireCodecType.MULTIPART
+    tag = WIRE_TAG + 'F'
+
+    def encode(self, obj):
+        mode = VALUE_NONE
+        if isinstance(obj, dict) and 'value' in obj:
+            value = obj['value']
+            if type(value) is str:
+                mode = VALUE_FRAME
+                values = [value]
+            elif type(value) is list and all(type(item) is str for item in value):
+                mode = VALUE_FRAMES
+                values = value
+
+        if mode == VALUE_NONE:
+            return [self.tag + pickle.dumps((mode, obj), pickle.HIGHEST_PROTOCOL)]
+
+        header = dict(obj)
+        del header['value']
+        return [self.tag + pickle.dumps((mode, header), pickle.HIGHEST_PROTOCOL)] + values
+
+    def decode(self, data, frames):
+        (mode, obj) = pickle.loads(data)
+        if mode == VALUE_FRAME:
+            obj['value'] = frames[0]
+        elif mode == VALUE_FRAMES:
+            obj['value'] = frames
+        return obj
+
+
+CODECS = {
+    WireCodecType.PICKLE: PickleCodec(),
+    WireCodecType.MSGPACK: MsgpackCodec(),
+    WireCodecType.MULTIPART: MultipartCodec(),
+}
+
+# Codecs by the tag their messages start with
+TAGGED_CODECS = dict((codec.tag, codec) for codec in CODECS.values())
+
+
+def available_codecs():
+    """
+    @retval The codec names usable here, most preferred first. Pickle is
+    cheapest for particles a few hundred bytes long, the extra frames of
+    multipart cost more than copying them into the pickle does.
+    """
+    codecs = [WireCodecType.PICKLE, WireCodecType.MULTIPART]
+    if msgpack:
+        codecs.append(WireCodecType.MSGPACK)
+    return codecs
+
+
+def negotiate(offered):
+    """
+    Pick the codec to use from those a peer offers.
+    @param offered A list of codec names, most preferred first.
+    @retval The first offered codec usable here, None if there is none.
+    """
+    available = available_codecs()
+    for name in offered or []:
+        if name in available:
+            return name
+    return None
+
+
+def encode(obj, codec=None):
+    """
+    @param obj The message.
+    @param codec A WireCodecType, None for an untagged pickle.
+    @retval A list of frames to send.
+    """
+    if codec is None:
+        return [pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)]
+    return CODECS[codec].encode(obj)
+
+
+def message_codec(frames):
+    """
+    @param frames A received message.
+    @retval The WireCodecType it was encoded with, None for an untagged
+    pickle.
+    @throws ValueError if the codec is not known here.
+    """
+    codec = _message_codec(frames[0])
+    return codec.name if codec else None
+
+
+def _message_codec(data):
+    """
+    @retval The codec of a message starting with data, None for a pickle.
+    """
+    if not data.startswith(WIRE_TAG):
+        return None
+    codec = TAGGED_CODECS.get(data[:2])
+    if codec is None:
+        raise ValueError('unknown wire codec %r' % data[:2])
+    if codec.name == WireCodecType.MSGPACK and not msgpack:
+        raise ValueError('msgpack is not installed')
+    return codec
+
+
+def decode(frames):
+    """
+    @param frames A received message.
+    @retval The message.
+    @throws ValueError if its codec is not known here.
+    """
+    data = frames[0]
+    codec = _message_codec(data)
+    if codec is None:
+        return pickle.loads(data)
+    return codec.decode(data[2:], frames[1:])
@@ -26,22 +26,36 @@ import time
 # with unpatched threads as well.
 import zmq
 
+from mi.core.instrument import wire_codec
 from mi.core.instrument.driver_client import DriverClient
+from mi.core.instrument.instrument_driver import unpack_sample_batch
 from mi.core.log import get_logger ; log = get_logger()
 
+# The sockets are polled, sleeping between attempts so the client also works
+# in monkey patched gevent processes. The sleep starts short for prompt
+# replies and backs off to the longest while nothing arrives.
+MIN_POLL_DELAY = .001
+MAX_POLL_DELAY = .5
+
  
 class ZmqDriverClient(DriverClient):
     """
     A class for communicating with a ZMQ-based driver process using python
     thread for catching asynchronous driver events.
     """
+
+    # Prefix of the event messages to subscribe to
+    event_topic = ''
     
-    def __init__(self, host, cmd_port, event_port):
+    def __init__(self, host, cmd_port, event_port, wire_codecs=None):
         """
         Initialize members.
         @param host Host string address of the driver process.
         @param cmd_port Port number for the driver process command port.
         @param event_port Port number for the driver process event port.
+        @param wire_codecs WireCodecType names to offer the driver process,
+        most preferred first. None offers all available here, an empty
+        list keeps to the single frame pickle.
         """
         DriverClient.__init__(self)
         self.host = host
@@ -53,6 +67,11 @@ class ZmqDriverClient(DriverClient):
         self.zmq_cmd_socket = None
         self.event_thread = None
         self.stop_event_thread = True
+        if wire_codecs is None:
+            wire_codecs = wire_codec.available_codecs()
+        self.wire_codecs = wire_codecs
+        # Codec negotiated with the driver process, None for pickle.
+        self.wire_codec = None
         
     def start_messaging(self, evt_callback=None):
         """
@@ -67,6 +86,15 @@ class ZmqDriverClient(DriverClient):
         log.info('Driver client cmd socket connected to %s.' %
                        self.cmd_host_string)        
         self.evt_callback = evt_callback
+
+        self.wire_codec = None
+        if self.wire_codecs:
+            # Driver processes without codecs reply with an unknown
+            # command error, and carry on pickling.
+            reply = self.cmd_dvr('set_wire_codec', self.wire_codecs)
+            if wire_codec.WireCodecType.has(reply):
+                self.wire_codec = reply
+            log.info('Driver client wire codec %s.' % self.wire_codec)
         
         def recv_evt_messages(driver_client):
             """
@@ -77,20 +105,26 @@ class ZmqDriverClient(DriverClient):
             context = zmq.Context()
             sock = context.socket(zmq.SUB)
             sock.connect(driver_client.event_host_string)
-            sock.setsockopt(zmq.SUBSCRIBE, '')
+            sock.setsockopt(zmq.SUBSCRIBE, driver_client.event_topic)
             log.info('Driver client event thread connected to %s.' %
                   driver_client.event_host_string)
 
             driver_client.stop_event_thread = False
             #last_time = time.time()
+            delay = MIN_POLL_DELAY
             while not driver_client.stop_event_thread:
                 try:
-                    evt = sock.recv_pyobj(flags=zmq.NOBLOCK)
+                    evt = driver_client._decode_event(sock.recv_multipart(flags=zmq.NOBLOCK))
+                    delay = MIN_POLL_DELAY
                     log.debug('got event: %s' % str(evt))
-                    if driver_client.evt_callback:
-                        driver_client.evt_callback(evt)
+                    if driver_client.evt_callback and evt is not None:
+                        for sample_evt in unpack_sample_batch(evt):
+                            driver_client.evt_callback(sample_evt)
                 except zmq.ZMQError:
-                    time.sleep(.5)
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_POLL_DELAY)
+                except ValueError as e:
+                    log.error('Driver client dropped event: %s' % e)
                 #cur_time = time.time()
                 #if cur_time - last_time > 5:
                 #    log.info('event thread listening')
@@ -136,7 +170,7 @@ class ZmqDriverClient(DriverClient):
         while True:
             try:
                 # Attempt command send. Retry if necessary.
-                self.zmq_cmd_socket.send_pyobj(msg)
+                self.zmq_cmd_socket.send_multipart(self._encode_command(msg))
                 if msg == 'stop_driver_process':
                     return 'driver stopping'
 
@@ -148,16 +182,18 @@ class ZmqDriverClient(DriverClient):
                 time.sleep(.5)
             
         log.debug('Awaiting reply.')
+        delay = MIN_POLL_DELAY
         while True:
             try:
                 # Attempt reply recv. Retry if necessary.
-                reply = self.zmq_cmd_socket.recv_pyobj(flags=zmq.NOBLOCK)
+                reply = wire_codec.decode(self.zmq_cmd_socket.recv_multipart(flags=zmq.NOBLOCK))
                 # Reply recieved, break and return.
                 break
 
             except zmq.ZMQError:
                 # Socket not ready with the reply. Sleep and retry later.
-                time.sleep(.5)
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_POLL_DELAY)
                 
         log.debug('Reply: %s.' % str(reply))
         
@@ -166,3 +202,45 @@ class ZmqDriverClient(DriverClient):
         else:
             return reply
     
+
+    def _encode_command(self, msg):
+        """
+        @retval The frames of a command message.
+        """
+        return wire_codec.encode(msg, self.wire_codec)
+
+    def _decode_event(self, frames):
+        """
+        @retval The event in a message, None if it is not for this client.
+        """
+        return wire_codec.decode(frames)
+
+
+class ZmqDriverHostClient(ZmqDriverClient):
+    """
+    A client for one of the drivers in a ZmqDriverHost, or for the host
+    itself with the driver id HOST_ID.
+    """
+
+    def __init__(self, host, cmd_port, event_port, driver_id, wire_codecs=None):
+        """
+        Initialize members.
+        @param host Host string address of the driver host.
+        @param cmd_port Port number for the driver host command port.
+        @param event_port Port number for the driver host event port.
+        @param driver_id The id of the hosted driver to command.
+        @param wire_codecs WireCodecType names to offer, most preferred
+        first.
+        """
+        ZmqDriverClient.__init__(self, host, cmd_port, event_port, wire_codecs)
+        self.driver_id = driver_id
+        self.event_topic = driver_id
+
+    def _encode_command(self, msg):
+        return [self.driver_id] + ZmqDriverClient._encode_command(self, msg)
+
+    def _decode_event(self, frames):
+        # subscriptions match prefixes, so one id may see another's events
+        if frames[0] != self.driver_id:
+            return None
+        return wire_codec.decode(frames[1:])
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.instrument.zmq_driver_host
+@file mi/core/instrument/zmq_driver_host.py
+@brief A driver process hosting many drivers. Commands and events for all
+    of them share one ROUTER and one PUB socket, keyed by driver id, and
+    their port agent connections share one PortAgentSelector thread, so a
+    host of N drivers costs one interpreter rather than N.
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import uuid
+from collections import deque
+from threading import Thread, Lock
+from Queue import Queue
+
+import zmq
+
+from mi.core.exceptions import InstrumentException, InstrumentCommandException
+from mi.core.instrument import wire_codec
+from mi.core.instrument import startup_stats
+from mi.core.instrument.port_agent_client import PortAgentSelector
+from mi.core.instrument.driver_process import DriverProcess, DEFAULT_EVENT_QUEUE_SIZE, EventQueuePolicy
+from mi.core.instrument.zmq_driver_process import ZmqDriverProcess, _encode_exception
+from mi.core.log import get_logger ; log = get_logger()
+
+# Driver id that addresses the host itself rather than a driver
+HOST_ID = ''
+
+# Key the host adds to queued driver events, removed before they are sent
+DRIVER_ID_KEY = '_driver_id'
+
+
+class ZmqDriverHost(ZmqDriverProcess):
+    """
+    A driver process hosting many drivers. Command messages are the driver
+    id frame followed by a wire codec message, and are handled in order by
+    a worker thread for each driver so a slow command holds up only its
+    driver. Events are
+    published as the driver id frame followed by the event, so clients
+    subscribe to their driver's events.
+    """
+
+    @classmethod
+    def launch_process(cls, drivers, ppid=None,
+                       event_queue_size=DEFAULT_EVENT_QUEUE_SIZE,
+                       event_queue_policy=EventQueuePolicy.DROP_RAW):
+        """
+        Launch a driver host as a separate OS process. The host writes its
+        ports to a pipe once they are bound.
+        @param drivers A dict of driver id: (driver module, driver class).
+        @param ppid ID of the parent process, used to self destruct when
+        parent dies in test cases.
+        @param event_queue_size Most events held for the event thread.
+        @param event_queue_policy What to do when the event queue is full.
+        @retval Tuple containing (Popen object for the process, cmd port,
+            evt_port)
+        @throws InstrumentException if the host exits before binding.
+        """
+        (port_read, port_write) = os.pipe()
+        cmd_str = 'from %s import %s; dp = %s(%r, %s, %d, %d, "%s");dp.run()' \
+            % (__name__, cls.__name__, cls.__name__, drivers, str(ppid), port_write,
+               event_queue_size, event_queue_policy)
+        try:
+            dvr_proc = DriverProcess.launch_process(cmd_str, keep_fd=port_write)
+        finally:
+            os.close(port_write)
+
+        ports = ''
+        try:
+            while not ports.endswith('\n'):
+                data = os.read(port_read, 64)
+                if not data:
+                    raise InstrumentException('Driver host exited before binding its ports.')
+                ports += data
+        finally:
+            os.close(port_read)
+
+        (cmd_port, evt_port) = [int(port) for port in ports.split()]
+        return (dvr_proc, cmd_port, evt_port)
+
+    def __init__(self, drivers, ppid, port_fd=None,
+                 event_queue_size=DEFAULT_EVENT_QUEUE_SIZE,
+                 event_queue_policy=EventQueuePolicy.DROP_RAW):
+        """
+        @param drivers A dict of driver id: (driver module, driver class).
+        @param ppid ID of the parent process, used to self destruct when
+        parent dies in test cases.
+        @param port_fd A file descriptor to write the command and event
+        ports to once they are bound, then close.
+        @param event_queue_size Most events held for the event thread.
+        @param event_queue_policy What to do when the event queue is full.
+        """
+        ZmqDriverProcess.__init__(self, None, None, None, None, ppid,
+                                  event_queue_size, event_queue_policy)
+        if HOST_ID in drivers:
+            raise ValueError('driver id %r addresses the host' % HOST_ID)
+        self.driver_classes = drivers
+        self.drivers = {}
+        self.port_fd = port_fd
+        self.port_agent_selector = None
+        # Every hosted client decodes any codec, so events use the
+        # cheapest rather than a negotiated one.
+        self.event_codec = wire_codec.available_codecs()[0]
+        # Driver command replies waiting for the command thread to send,
+        # and the pipe written to wake it.
+        self.replies = deque()
+        self.reply_lock = Lock()
+        self.reply_pipe = None
+        # Command queues of the driver worker threads by driver id,
+        # started with the driver's first command.
+        self.driver_commands = {}
+
+    def construct_driver(self):
+        """
+        Import and construct every driver, giving each the selector to
+        serve their port agent clients.
+        @retval True if successful, False otherwise.
+        """
+        self.port_agent_selector = PortAgentSelector()
+
+        for (driver_id, (driver_module, driver_class)) in sorted(self.driver_classes.items()):
+            tallies = startup_stats.get_stats()
+            try:
+                start_time = time.time()
+                module = __import__(driver_module, fromlist=[driver_class])
+                import_time = time.time() - start_time
+                start_time = time.time()
+                driver = getattr(module, driver_class)(self._event_callback(driver_id))
+                construct_time = time.time() - start_time
+                driver.port_agent_selector = self.port_agent_selector
+                self.drivers[driver_id] = driver
+            except (ImportError, NameError, AttributeError) as e:
+                log.error('Could not import/construct driver %s module %s, class %s.' %
+                          (driver_id, driver_module, driver_class))
+                log.error('%s' % str(e))
+                return False
+            self.driver_startup[driver_id] = self._driver_startup(driver_id, import_time,
+                                                                  construct_time, tallies)
+
+        log.info('Constructed %d drivers' % len(self.drivers))
+        return True
+
+    def get_startup_stats(self):
+        """
+        @retval A dict of driver id: the StartupStatsKey values of importing
+        and constructing the driver, with HOST_ID: the process' tallies so
+        far. Only the first driver of a module pays for importing it.
+        """
+        stats = dict(self.driver_startup)
+        stats[HOST_ID] = startup_stats.get_stats()
+        return stats
+
+    def _event_callback(self, driver_id):
+        """
+        @retval The event callback for a driver, queuing its events tagged
+        with its id.
+        """
+        def send_event(evt):
+            if isinstance(evt, dict):
+                evt = dict(evt)
+                evt[DRIVER_ID_KEY] = driver_id
+            self.send_event(evt)
+        return send_event
+
+    def cmd_driver(self, msg):
+        """
+        Process a command message addressed to the host. A wire codec
+        offer is replied to with the codec to use for commands; the host
+        does not change its event codec.
+        @param msg A driver command message.
+        @retval The command result.
+        """
+        if msg.get('cmd', None) == 'set_wire_codec':
+            return wire_codec.negotiate(msg.get('args', [None])[0])
+        return ZmqDriverProcess.cmd_driver(self, msg)
+
+    def _cmd_hosted_driver(self, identity, driver, msg, codec):
+        """
+        Run a command against a hosted driver and queue the reply for the
+        command thread. Clients stopping a driver's process get the reply
+        they expect, but only stopping the host itself ends the process.
+        """
+        cmd = msg.get('cmd', None)
+        if cmd == 'stop_driver_process':
+            reply = 'stop_driver_process'
+        elif cmd == 'set_wire_codec':
+            reply = wire_codec.negotiate(msg.get('args', [None])[0])
+        else:
+            reply = self._call_driver(driver, cmd, msg.get('args', None), msg.get('kwargs', None))
+        self._queue_reply(identity, reply, codec)
+
+    def _reply_frames(self, identity, reply, codec):
+        """
+        @retval The ROUTER socket frames of a reply.
+        """
+        if isinstance(reply, Exception):
+            reply = _encode_exception(reply)
+        return [identity, ''] + wire_codec.encode(reply, codec)
+
+    def _queue_reply(self, identity, reply, codec):
+        """
+        Queue a reply for the command thread to send and wake it.
+        """
+        frames = self._reply_frames(identity, reply, codec)
+        with self.reply_lock:
+            self.replies.append(frames)
+        try:
+            os.write(self.reply_pipe[1], 'x')
+        except (OSError, TypeError):
+            pass
+
+    def start_messaging(self):
+        """
+        Bind the command and event sockets and start their threads. The
+        command thread polls the ROUTER socket, the stop signal and the
+        pipe command threads write to when they have a reply.
+        """
+        self.zmq_context = zmq.Context()
+        self.stop_host_string = 'inproc://driver-host-stop-%s' % uuid.uuid4()
+        self.reply_pipe = os.pipe()
+
+        cmd_sock = self.zmq_context.socket(zmq.ROUTER)
+        self.cmd_port = cmd_sock.bind_to_random_port(self.cmd_host_string)
+        evt_sock = self.zmq_context.socket(zmq.PUB)
+        self.evt_port = evt_sock.bind_to_random_port(self.event_host_string)
+        stop_sock = self.zmq_context.socket(zmq.PAIR)
+        stop_sock.bind(self.stop_host_string)
+        log.info('Driver host cmd socket bound to %i, event socket to %i',
+                 self.cmd_port, self.evt_port)
+
+        if self.port_fd is not None:
+            os.write(self.port_fd, '%d %d\n' % (self.cmd_port, self.evt_port))
+            os.close(self.port_fd)
+            self.port_fd = None
+
+        def recv_cmd_msg(host):
+            poller = zmq.Poller()
+            poller.register(cmd_sock, zmq.POLLIN)
+            poller.register(stop_sock, zmq.POLLIN)
+            poller.register(host.reply_pipe[0], zmq.POLLIN)
+
+            host.stop_cmd_thread = False
+            while not host.stop_cmd_thread:
+                ready = dict(poller.poll())
+
+                if host.reply_pipe[0] in ready:
+                    os.read(host.reply_pipe[0], 4096)
+                    with host.reply_lock:
+                        replies = list(host.replies)
+                        host.replies.clear()
+                    for reply in replies:
+                        cmd_sock.send_multipart(reply)
+
+                if cmd_sock in ready:
+                    reply = host._dispatch(cmd_sock.recv_multipart())
+                    if reply:
+                        cmd_sock.send_multipart(reply)
+
+            cmd_sock.close()
+            stop_sock.close()
+            log.info('Driver host cmd socket closed.')
+
+        def send_evt_msg(host):
+            host.stop_evt_thread = False
+            while not host.stop_evt_thread:
+                for evt in host.get_events():
+                    driver_id = HOST_ID
+                    if isinstance(evt, dict):
+                        driver_id = evt.pop(DRIVER_ID_KEY, HOST_ID)
+                    elif isinstance(evt, Exception):
+                        evt = _encode_exception(evt)
+                    evt_sock.send_multipart([driver_id] + wire_codec.encode(evt, host.event_codec))
+
+            evt_sock.close()
+            log.info('Driver host event socket closed')
+
+        self.messaging_started = True
+        self.cmd_thread = Thread(target=recv_cmd_msg, args=(self, ))
+        self.evt_thread = Thread(target=send_evt_msg, args=(self, ))
+        self.cmd_thread.start()
+        self.evt_thread.start()
+
+    def _dispatch(self, frames):
+        """
+        Route a command from the ROUTER socket, handling commands to the
+        host in the command thread and queuing driver commands for the
+        driver's worker thread.
+        @param frames The client identity, the REQ delimiter, the driver
+        id and the command message.
+        @retval The reply frames to send now, None if a worker will queue
+        them.
+        """
+        identity = frames[0]
+        codec = None
+        try:
+            if len(frames) < 4:
+                raise InstrumentCommandException('Command has no driver id.')
+            driver_id = frames[2]
+            codec = wire_codec.message_codec(frames[3:])
+            msg = wire_codec.decode(frames[3:])
+        except (ValueError, InstrumentCommandException) as e:
+            return self._reply_frames(identity, InstrumentCommandException(str(e)), codec)
+
+        if driver_id == HOST_ID:
+            return self._reply_frames(identity, self.cmd_driver(msg), codec)
+        if driver_id not in self.drivers:
+            return self._reply_frames(identity, InstrumentCommandException('Unknown driver %s.' % driver_id),
+                                      codec)
+
+        self._driver_queue(driver_id).put((identity, self.drivers[driver_id], msg, codec))
+        return None
+
+    def _driver_queue(self, driver_id):
+        """
+        @retval The command queue of a driver, starting its worker thread
+        if this is the driver's first command. Called from the command
+        thread.
+        """
+        commands = self.driver_commands.get(driver_id)
+        if commands is None:
+            commands = self.driver_commands[driver_id] = Queue()
+            worker = Thread(target=self._run_driver_commands, args=(commands, ))
+            worker.daemon = True
+            worker.start()
+        return commands
+
+    def _run_driver_commands(self, commands):
+        """
+        Driver worker thread, running a driver's commands one at a time
+        until it is handed None.
+        """
+        while True:
+            command = commands.get()
+            if command is None:
+                break
+            self._cmd_hosted_driver(*command)
+
+    def shutdown(self):
+        """
+        Shutdown function prior to process exit.
+        """
+        ZmqDriverProcess.shutdown(self)
+        for commands in self.driver_commands.values():
+            commands.put(None)
+        self.driver_commands = {}
+        if self.port_agent_selector:
+            self.port_agent_selector.stop()
+            self.port_agent_selector = None
+        if self.reply_pipe:
+            for fd in self.reply_pipe:
+                os.close(fd)
+            self.reply_pipe = None
+        self.drivers = {}
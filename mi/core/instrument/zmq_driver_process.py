@@ -28,12 +28,16 @@ import uuid
 import zmq
 
 from ooi.exception import ApplicationException
-from mi.core.exceptions import InstrumentException, UnexpectedError
+from mi.core.exceptions import InstrumentException, InstrumentCommandException, UnexpectedError
 
 import mi.core.instrument.driver_process as driver_process
+from mi.core.instrument import wire_codec
 from mi.core.log import get_logger
 log = get_logger()
 
+# Seconds to wait for the messaging threads to finish at shutdown
+SHUTDOWN_TIMEOUT = 5
+
 def _encode_exception(reply):
     if isinstance(reply, InstrumentException):
         # InstrumentExceptions have corresponding IonException error code built-in
@@ -52,7 +56,9 @@ class ZmqDriverProcess(driver_process.DriverProcess):
     """
     
     @classmethod
-    def launch_process(cls, driver_module, driver_class, workdir='/tmp/', ppid=None):
+    def launch_process(cls, driver_module, driver_class, workdir='/tmp/', ppid=None,
+                       event_queue_size=driver_process.DEFAULT_EVENT_QUEUE_SIZE,
+                       event_queue_policy=driver_process.EventQueuePolicy.DROP_RAW):
         """
         Class method constructor to launch ZmqDriverProcess as a
         separate OS process. Creates command string for this
@@ -62,6 +68,8 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         @param workdir The work directory when temporary port files are written.
         @param ppid ID of the parent process, used to self destruct when
         parent dies in test cases.
+        @param event_queue_size Most events held for the event thread.
+        @param event_queue_policy What to do when the event queue is full.
         @retval Tuple containing (Popen object for the process, cmd port,
             evt_port)
         """
@@ -72,9 +80,10 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         cmd_port_fname = workdir + cmd_port_fname
         evt_port_fname = 'dvr_evt_port_%s.txt' % tag
         evt_port_fname = workdir + evt_port_fname
-        cmd_str = 'from %s import %s; dp = %s("%s", "%s", "%s", "%s", %s);dp.run()' \
+        cmd_str = 'from %s import %s; dp = %s("%s", "%s", "%s", "%s", %s, %d, "%s");dp.run()' \
             % (__name__, cls.__name__, cls.__name__, driver_module,
-               driver_class, cmd_port_fname, evt_port_fname, str(ppid))
+               driver_class, cmd_port_fname, evt_port_fname, str(ppid),
+               event_queue_size, event_queue_policy)
                 
         # Call base class launch method.
         dvr_proc = driver_process.DriverProcess.launch_process(cmd_str)
@@ -101,7 +110,9 @@ class ZmqDriverProcess(driver_process.DriverProcess):
 
         return (dvr_proc, dvr_cmd_port, dvr_evt_port)
         
-    def __init__(self, driver_module, driver_class, cmd_port_fname, evt_port_fname, ppid):
+    def __init__(self, driver_module, driver_class, cmd_port_fname, evt_port_fname, ppid,
+                 event_queue_size=driver_process.DEFAULT_EVENT_QUEUE_SIZE,
+                 event_queue_policy=driver_process.EventQueuePolicy.DROP_RAW):
         """
         Zmq driver process constructor.
         @param driver_module The python module containing the driver code.
@@ -110,8 +121,11 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         @param evt_port_fname Filename for temp evt port file.
         @param ppid ID of the parent process, used to self destruct when
         parent dies in test cases.        
+        @param event_queue_size Most events held for the event thread.
+        @param event_queue_policy What to do when the event queue is full.
         """
-        driver_process.DriverProcess.__init__(self, driver_module, driver_class, ppid)
+        driver_process.DriverProcess.__init__(self, driver_module, driver_class, ppid,
+                                              event_queue_size, event_queue_policy)
         self.cmd_port = None
         self.cmd_port_fname = cmd_port_fname
         self.evt_port = None
@@ -122,50 +136,97 @@ class ZmqDriverProcess(driver_process.DriverProcess):
         self.stop_evt_thread = True
         self.cmd_thread = None
         self.stop_cmd_thread = True
+        self.zmq_context = None
+        self.stop_host_string = None
+        # Wire codec the first client negotiated for events, None until one
+        # does for the single frame pickle clients without codecs expect.
+        self.event_codec = None
+
+    def cmd_driver(self, msg):
+        """
+        Process a command message, handling the 'set_wire_codec' message
+        a client sends to negotiate the event encoding, passing the
+        offered codec names most preferred first. The reply is the codec
+        chosen, None to keep pickling events.
+
+        Every subscriber to the event socket gets the same messages, so
+        the process publishes in one codec: the first one negotiated.
+        Later clients get that codec if they offer it and an error
+        otherwise, leaving them with commands in pickle and events they
+        can only decode if they have the codec. Clients that never
+        negotiate expect pickles and can not share a process with ones
+        that do.
+        @param msg A driver command message.
+        @retval The driver command result.
+        """
+        if msg.get('cmd', None) == 'set_wire_codec':
+            offered = msg.get('args', [None])[0]
+            if self.event_codec is None:
+                self.event_codec = wire_codec.negotiate(offered)
+                log.info('Driver process event wire codec %s', self.event_codec)
+            elif self.event_codec not in (offered or []):
+                log.warn('Driver process refused event wire codecs %s, already publishing %s',
+                         offered, self.event_codec)
+                return InstrumentCommandException('Driver process events already use wire codec %s.'
+                                                  % self.event_codec)
+            return self.event_codec
+        return driver_process.DriverProcess.cmd_driver(self, msg)
         
     def start_messaging(self):
         """
         Initialize and start messaging resources for the driver, blocking
         until messaging terminates. This ZMQ implementation starts and
-        joins command and event threads, managing nonblocking send/recv calls
-        on REP and PUB sockets, respectively. Terminate loops and close
-        sockets when stop flag is set in driver process.
+        joins command and event threads. The command thread blocks in a
+        poller on the REP socket and an inproc PAIR socket stop_messaging
+        signals; the event thread blocks until events are queued and
+        publishes all that are waiting on the PUB socket.
         """
+        self.zmq_context = zmq.Context()
+        self.stop_host_string = 'inproc://driver-process-stop-%s' % uuid.uuid4()
+
         def recv_cmd_msg(zmq_driver_process):
             """
             Await commands on a ZMQ REP socket, forwaring them to the
             driver for processing and returning the result.
             """
-            context = zmq.Context()
+            context = zmq_driver_process.zmq_context
             sock = context.socket(zmq.REP)
             zmq_driver_process.cmd_port = sock.bind_to_random_port(zmq_driver_process.cmd_host_string)
+            stop_sock = context.socket(zmq.PAIR)
+            stop_sock.bind(zmq_driver_process.stop_host_string)
             log.info('Driver process cmd socket bound to %i' %
                            zmq_driver_process.cmd_port)
             file(zmq_driver_process.cmd_port_fname,'w+').write(str(zmq_driver_process.cmd_port)+'\n')
 
-            zmq_driver_process.stop_cmd_thread = False
+            poller = zmq.Poller()
+            poller.register(sock, zmq.POLLIN)
+            poller.register(stop_sock, zmq.POLLIN)
+
+            # A stop before the stop socket was bound is seen here, a
+            # later one wakes the poller.
             while not zmq_driver_process.stop_cmd_thread:
+                ready = dict(poller.poll())
+                if sock not in ready:
+                    continue
+
+                frames = sock.recv_multipart()
+                # reply in the encoding the request came in
                 try:
-                    msg = sock.recv_pyobj(flags=zmq.NOBLOCK)
+                    codec = wire_codec.message_codec(frames)
+                    msg = wire_codec.decode(frames)
+                except ValueError as e:
+                    codec = None
+                    reply = InstrumentCommandException(str(e))
+                else:
                     #log.trace('Processing message %s', msg)
                     reply = zmq_driver_process.cmd_driver(msg)
-                    # if operation raised exception, encode as triple
-                    if isinstance(reply, Exception):
-                        reply = _encode_exception(reply)
-                    # send, send, and resend
-                    while True:
-                        try:
-                            sock.send_pyobj(reply, flags=zmq.NOBLOCK)
-                            break
-                        except zmq.ZMQError:
-                            time.sleep(.1)
-                            if zmq_driver_process.stop_cmd_thread:
-                                break
-                except zmq.ZMQError:
-                    time.sleep(.1)
-                
+                # if operation raised exception, encode as triple
+                if isinstance(reply, Exception):
+                    reply = _encode_exception(reply)
+                sock.send_multipart(wire_codec.encode(reply, codec))
+
             sock.close()
-            context.term()
+            stop_sock.close()
             log.info('Driver process cmd socket closed.')
 
         def send_evt_msg(zmq_driver_process):
@@ -173,54 +234,76 @@ class ZmqDriverProcess(driver_process.DriverProcess):
             Await events on the driver process event queue and publish them
             on a ZMQ PUB socket to the driver process client.
             """
-            context = zmq.Context()
+            context = zmq_driver_process.zmq_context
             sock = context.socket(zmq.PUB)
             zmq_driver_process.evt_port = sock.bind_to_random_port(zmq_driver_process.event_host_string)
             log.info('Driver process event socket bound to %i', zmq_driver_process.evt_port)
             file(zmq_driver_process.evt_port_fname,'w+').write(str(zmq_driver_process.evt_port)+'\n')
 
-            zmq_driver_process.stop_evt_thread = False
-            while not zmq_driver_process.stop_evt_thread:
-                try:
-                    evt = zmq_driver_process.events.pop(0)
+            while not zmq_driver_process.stop_evt_thread and zmq_driver_process.messaging_started:
+                # everything queued since the last wakeup goes out together
+                for evt in zmq_driver_process.get_events():
                     #log.trace('Event thread sending event %s',evt)
-                    while evt:
-                        try:
-                            if isinstance(evt, Exception):
-                                evt = _encode_exception(evt)
-                            sock.send_pyobj(evt, flags=zmq.NOBLOCK)
-                            evt = None
-                            log.trace('Event sent!')
-                        except zmq.ZMQError:
-                            time.sleep(.1)
-                            if zmq_driver_process.stop_evt_thread:
-                                break
-                except IndexError:
-                    time.sleep(.1)
+                    if isinstance(evt, Exception):
+                        evt = _encode_exception(evt)
+                    sock.send_multipart(wire_codec.encode(evt, zmq_driver_process.event_codec))
+                    log.trace('Event sent!')
 
             sock.close()
-            context.term()
             log.info('Driver process event socket closed')
 
+        # Cleared before the threads start, so a stop_messaging arriving
+        # while they bind their sockets isn't lost.
+        self.stop_cmd_thread = False
+        self.stop_evt_thread = False
+        self.messaging_started = True
         self.cmd_thread = Thread(target=recv_cmd_msg, args=(self, ))
         self.evt_thread = Thread(target=send_evt_msg, args=(self, ))
         self.cmd_thread.start()        
         self.evt_thread.start()
-        self.messaging_started = True
     
     def stop_messaging(self):
         """
         Close messaging resource for the driver. Set flags to cause
-        command and event threads to close sockets and conclude.
+        command and event threads to close sockets and conclude, and wake
+        them.
         """
         self.stop_cmd_thread = True
         self.stop_evt_thread = True
-        self.messaging_started = False
+        with self.events_condition:
+            self.messaging_started = False
+            self.events_condition.notify_all()
+
+        if self.zmq_context:
+            # The command thread may be the caller, in which case it sees
+            # the flag once its reply is sent.
+            sock = self.zmq_context.socket(zmq.PAIR)
+            sock.setsockopt(zmq.LINGER, 0)
+            try:
+                sock.connect(self.stop_host_string)
+                sock.send('', flags=zmq.NOBLOCK)
+            except zmq.ZMQError:
+                pass
+            sock.close()
     
     def shutdown(self):
         """
         Shutdown function prior to process exit.
         """
+        for thread in (self.cmd_thread, self.evt_thread):
+            if thread:
+                thread.join(SHUTDOWN_TIMEOUT)
+        running = [thread for thread in (self.cmd_thread, self.evt_thread) if thread and thread.is_alive()]
+        if self.zmq_context:
+            # term blocks until every socket is closed, and the sockets
+            # belong to the threads. A thread that did not stop keeps the
+            # context, which is terminated when it lets go.
+            if running:
+                log.error('Driver process messaging threads did not stop in %ds, '
+                          'not terminating the ZMQ context', SHUTDOWN_TIMEOUT)
+            else:
+                self.zmq_context.term()
+            self.zmq_context = None
         driver_process.DriverProcess.shutdown(self)
 
     
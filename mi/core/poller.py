@@ -31,9 +31,12 @@ class ConditionPoller(Thread):
         try:
             while not self._shutdown_now.is_set():
                 self._check_condition()
-                self._shutdown_now.wait(self.polling_interval)
+                self._wait()
         except:
             log.error('thread failed', exc_info=True)
+    def _wait(self):
+        """ sleep until the condition should next be checked """
+        self._shutdown_now.wait(self.polling_interval)
     def _check_condition(self):
         try:
             value = self._condition()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""
+@package mi.core.test.test_common
+@file mi/core/test/test_common.py
+@brief Test cases for the common MI classes
+"""
+
+__license__ = 'Apache 2.0'
+
+import glob
+import os
+import time
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.common import BaseEnum, InstErrorCode
+
+
+class Parent(BaseEnum):
+    A = 'a'
+    B = 'b'
+
+    @classmethod
+    def parent_list(cls):
+        return [cls.A]
+
+class Child(Parent):
+    C = 'c'
+
+    @classmethod
+    def child_list(cls):
+        return cls.parent_list() + [cls.C]
+
+
+def dir_list(cls):
+    """
+    The dir() walk BaseEnum.list used to do on every call
+    """
+    return [getattr(cls, attr) for attr in dir(cls) if
+            not callable(getattr(cls, attr)) and not attr.startswith('__')]
+
+
+@attr('UNIT', group='mi')
+class TestBaseEnum(MiUnitTest):
+    """
+    Test the cached BaseEnum value sets
+    """
+    def test_values(self):
+        self.assertEqual(Parent.list(), ['a', 'b'])
+        self.assertEqual(Parent.dict(), {'A': 'a', 'B': 'b'})
+        self.assertTrue(Parent.has('a'))
+        self.assertFalse(Parent.has('c'))
+        self.assertFalse(Parent.has(None))
+        self.assertFalse(Parent.has({}))
+
+    def test_inheritance(self):
+        self.assertEqual(Child.list(), ['a', 'b', 'c'])
+        self.assertEqual(Child.dict(), {'A': 'a', 'B': 'b', 'C': 'c'})
+        self.assertTrue(Child.has('c'))
+        self.assertFalse(Parent.has('c'))
+        self.assertEqual(Child.child_list(), ['a', 'c'])
+
+    def test_unhashable_values(self):
+        self.assertEqual(InstErrorCode.list(), dir_list(InstErrorCode))
+        self.assertTrue(InstErrorCode.has(InstErrorCode.TIMEOUT))
+        self.assertFalse(InstErrorCode.has(['ERROR_BOGUS']))
+        self.assertFalse(InstErrorCode.has('OK'))
+
+    def test_copies(self):
+        """
+        Callers may sort or change what they get back
+        """
+        values = Parent.list()
+        values.append('x')
+        values.reverse()
+        Parent.dict()['X'] = 'x'
+        self.assertEqual(Parent.list(), ['a', 'b'])
+        self.assertEqual(Parent.dict(), {'A': 'a', 'B': 'b'})
+
+    def test_changed_class(self):
+        """
+        Adding a value to an enum shows up in it and its subclasses
+        """
+        class Base(BaseEnum):
+            A = 'a'
+        class Derived(Base):
+            B = 'b'
+
+        self.assertEqual(Derived.list(), ['a', 'b'])
+        Base.Z = 'z'
+        self.assertEqual(Base.list(), ['a', 'z'])
+        self.assertEqual(Derived.list(), ['a', 'b', 'z'])
+        self.assertTrue(Derived.has('z'))
+        del Base.Z
+        self.assertFalse(Derived.has('z'))
+
+
+def driver_enums():
+    """
+    Import every driver module under mi/instrument that imports here
+    @retval (list of driver modules, list of every BaseEnum subclass loaded)
+    """
+    root = os.path.join(os.path.dirname(__file__), '..', '..', '..')
+    modules = []
+    for path in sorted(glob.glob(os.path.join(root, 'mi', 'instrument', '*', '*', '*', 'driver.py'))):
+        name = os.path.relpath(path, root)[:-3].replace(os.sep, '.')
+        try:
+            modules.append(__import__(name, fromlist=['driver']))
+        except Exception as e:
+            log.debug("skipping %s: %s", name, e)
+
+    enums = []
+    pending = [BaseEnum]
+    while pending:
+        cls = pending.pop()
+        enums.append(cls)
+        pending.extend(cls.__subclasses__())
+    return (modules, enums)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkBaseEnum(MiUnitTest):
+    """
+    Time enum membership, FSM event dispatch and particle construction with
+    the cached value sets against the dir() walk they replaced
+    """
+    def setUp(self):
+        (self.modules, self.enums) = driver_enums()
+        self.uncached = [patch.object(BaseEnum, 'list', classmethod(dir_list)),
+                         patch.object(BaseEnum, 'has', classmethod(lambda cls, item: item in dir_list(cls)))]
+
+    def _time(self, name, function):
+        start_time = time.time()
+        count = function()
+        cached_time = time.time() - start_time
+
+        for patcher in self.uncached:
+            patcher.start()
+        try:
+            start_time = time.time()
+            function()
+            uncached_time = time.time() - start_time
+        finally:
+            for patcher in self.uncached:
+                patcher.stop()
+
+        log.info("%s, %d calls: dir() %.3fs, cached %.3fs",
+                 name, count, uncached_time, cached_time)
+
+    def test_has(self):
+        def has():
+            count = 0
+            for cls in self.enums:
+                for value in cls.list():
+                    cls.has(value)
+                    count += 1
+            return count
+        self._time("has() over %d enums from %d driver modules" %
+                   (len(self.enums), len(self.modules)), has)
+
+    def test_fsm_dispatch(self):
+        from mi.core.instrument.instrument_fsm import InstrumentFSM
+
+        machines = []
+        for module in self.modules:
+            enums = [getattr(module, name) for name in dir(module)]
+            enums = [cls for cls in enums if isinstance(cls, type) and issubclass(cls, BaseEnum)]
+            states = [cls for cls in enums if cls.__name__.endswith('ProtocolState')]
+            events = [cls for cls in enums if cls.__name__.endswith('ProtocolEvent')]
+            if not (states and events and events[0].list()):
+                continue
+
+            event_list = events[0].list()
+            fsm = InstrumentFSM(states[0], events[0], event_list[0], event_list[-1])
+            for state in states[0].list():
+                for event in event_list:
+                    fsm.add_handler(state, event, lambda *args, **kwargs: (None, None))
+            fsm.start(states[0].list()[0])
+            machines.append((fsm, event_list))
+
+        def dispatch():
+            count = 0
+            for i in range(20):
+                for (fsm, event_list) in machines:
+                    for event in event_list:
+                        fsm.on_event(event)
+                        count += 1
+            return count
+        self._time("FSM dispatch over %d drivers" % len(machines), dispatch)
+
+    def test_particles(self):
+        from mi.instrument.seabird.sbe37smb.ooicore.driver import SBE37DataParticle
+        from mi.instrument.seabird.sbe37smb.ooicore.test.sample_data import SAMPLE
+
+        def particles():
+            for i in range(2000):
+                SBE37DataParticle(SAMPLE).generate()
+            return 2000
+        self._time("SBE37 particle generation", particles)
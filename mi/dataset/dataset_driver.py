@@ -11,11 +11,15 @@ __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
 import os
+import time
 import gevent
 import shutil
-import hashlib
 import copy
 import traceback
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+
+from collections import OrderedDict, deque
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.exceptions import InstrumentParameterException
@@ -35,6 +39,7 @@ from mi.core.instrument.driver_dict import DriverDict
 from mi.core.instrument.protocol_param_dict import ParameterDictType
 from mi.core.instrument.protocol_param_dict import Parameter
 from mi.core.common import BaseEnum
+from mi.dataset.file_checksum import checksum_cache
 
 class DataSourceConfigKey(BaseEnum):
     HARVESTER = 'harvester'
@@ -104,6 +109,11 @@ class DataSetDriverConfigKeys(BaseEnum):
     PATTERN = "pattern"
     FREQUENCY = "frequency"
     FILE_MOD_WAIT_TIME = "file_mod_wait_time"
+    INOTIFY = "inotify"
+    DEBOUNCE_TIME = "debounce_time"
+    MAX_PARALLEL_FILES = "max_parallel_files"
+    PARALLEL_MODE = "parallel_mode"
+    PARSE_TIMEOUT = "parse_timeout"
     HARVESTER = "harvester"
     PARSER = "parser"
     MODULE = "module"
@@ -111,6 +121,92 @@ class DataSetDriverConfigKeys(BaseEnum):
     URI = "uri"
     CLASS_ARGS = "class_args"
 
+class ParallelMode(BaseEnum):
+    """
+    How SimpleDataSetDriver parses files in parallel.  Threads suit parsers that wait on I/O,
+    processes forked from the driver suit parsers that are CPU bound.
+
+    Forking copies the driver process as it is, but only the forking thread runs in the child.
+    A lock another thread, greenlet or the gevent hub held at the time stays held in the
+    child, so a worker that needs it, e.g. to log, hangs.  The pool is forked when the
+    driver is constructed, before the harvester starts, to keep this to the process'
+    messaging threads.  Workers only build a parser and parse; they must not use gevent or
+    the driver's threads.  A worker that hangs or dies anyway is caught by the parse
+    timeout.
+    """
+    THREAD = "thread"
+    PROCESS = "process"
+
+# Drivers parsing files in forked processes by id, for the processes to find the driver they
+# were forked from
+_forked_drivers = {}
+
+# Default seconds a worker has to parse a file before the driver parses it itself
+DEFAULT_PARSE_TIMEOUT = 600
+
+class ParsedFile(object):
+    """
+    What a parser produced for a file parsed by a worker: the particles published, parser states
+    saved and sample exceptions raised in the order the parser produced them, so the publisher
+    can replay them as if it had parsed the file itself.
+    """
+    PARTICLES = 'particles'
+    STATE = 'state'
+    SAMPLE_EXCEPTION = 'sample_exception'
+    BATCH = 'batch'
+
+    def __init__(self):
+        self.calls = []
+        # SampleException that stopped the parser
+        self.sample_error = None
+        # any other exception that stopped the parser
+        self.error = None
+
+    def publish(self, particles):
+        self.calls.append((self.PARTICLES, particles))
+
+    def save_state(self, state, file_ingested):
+        self.calls.append((self.STATE, (state, file_ingested)))
+
+    def sample_exception(self, exception):
+        self.calls.append((self.SAMPLE_EXCEPTION, exception))
+
+    def end_batch(self):
+        self.calls.append((self.BATCH, None))
+
+def _parse_file(driver, path, parser_state, count):
+    """
+    Parse a file with a parser built by a copy of the driver whose callbacks record what the
+    parser produces.
+    @param driver: the driver to build the parser
+    @param path: the file to parse
+    @param parser_state: the parser state to start from
+    @param count: the number of records to get at a time
+    @retval a ParsedFile
+    """
+    parsed = ParsedFile()
+    worker = copy.copy(driver)
+    worker._data_callback = parsed.publish
+    worker._save_parser_state = parsed.save_state
+    worker._sample_exception_callback = parsed.sample_exception
+    try:
+        with open(path) as handle:
+            parser = worker._build_parser(parser_state, handle)
+            while parser.get_records(count):
+                parsed.end_batch()
+    except SampleException as e:
+        parsed.sample_error = e
+    except Exception as e:
+        log.debug("Exception parsing %s", path, exc_info=True)
+        parsed.error = e
+    return parsed
+
+def _parse_forked_file(driver_id, path, parser_state, count):
+    """
+    Parse a file in a process forked from the driver
+    """
+    return _parse_file(_forked_drivers[driver_id], path, parser_state, count)
+
 class DataSetDriver(object):
     """
     Base class for data set drivers.  Provides:
@@ -448,9 +544,8 @@ class DataSetDriver(object):
         to the payload of the event.
         """
         s = os.stat(name)
-        checksum = ""
-        with open(name, 'rb') as filehandle:
-            checksum = hashlib.md5(filehandle.read()).hexdigest()
+        # the harvester has usually just hashed this file
+        checksum = checksum_cache.checksum(name, s)
 
         stats = {
             'name': name,
@@ -469,14 +564,29 @@ class SimpleDataSetDriver(DataSetDriver):
     we implement.
     """
     def __init__(self, config, memento, data_callback, state_callback, event_callback, exception_callback):
-        self._new_file_queue = []
+        # files waiting to be parsed, in the order found.  Keys of an ordered dict so checking
+        # for duplicates and taking the first are both constant time
+        self._new_file_queue = OrderedDict()
+
+        # files being parsed by the worker pool, in the order found, with their async results
+        # and the time to give up waiting for them
+        self._parsing_files = deque()
+        self._ingest_pool = None
 
         super(SimpleDataSetDriver, self).__init__(config, memento, data_callback, state_callback, event_callback, exception_callback)
         self._harvester = None
         self._driver_state = None
 
+        self._max_parallel_files = self._harvester_config.get(DataSetDriverConfigKeys.MAX_PARALLEL_FILES, 1)
+        self._parallel_mode = self._harvester_config.get(DataSetDriverConfigKeys.PARALLEL_MODE, ParallelMode.THREAD)
+        self._parse_timeout = self._harvester_config.get(DataSetDriverConfigKeys.PARSE_TIMEOUT, DEFAULT_PARSE_TIMEOUT)
+
         self._init_state(memento)
 
+        if self._max_parallel_files > 1 and self._parallel_mode == ParallelMode.PROCESS:
+            # fork before the harvester thread starts, see ParallelMode
+            self._get_ingest_pool()
+
         self._ingest_directory = self._harvester_config.get(DataSetDriverConfigKeys.DIRECTORY)
 
         self._resource_id = self._config.get(DataSourceConfigKey.RESOURCE_ID)
@@ -509,6 +619,16 @@ class SimpleDataSetDriver(DataSetDriver):
             self._harvester = None
         else:
             log.debug("poller not running. no need to shutdown")
+        # files being parsed are dropped unpublished, the restarted harvester will find them again
+        self._parsing_files.clear()
+
+    def shutdown(self):
+        super(SimpleDataSetDriver, self).shutdown()
+        if self._ingest_pool:
+            self._ingest_pool.terminate()
+            self._ingest_pool.join()
+            self._ingest_pool = None
+        _forked_drivers.pop(id(self), None)
 
     ####
     ##    Helpers
@@ -535,6 +655,15 @@ class SimpleDataSetDriver(DataSetDriver):
             #    errors.append("harvester config missing 'storage_directory")
             if not self._harvester_config.get(DataSetDriverConfigKeys.PATTERN):
                 errors.append("harvester config missing 'pattern")
+            max_parallel_files = self._harvester_config.get(DataSetDriverConfigKeys.MAX_PARALLEL_FILES, 1)
+            if not isinstance(max_parallel_files, int) or max_parallel_files < 1:
+                errors.append("harvester config 'max_parallel_files' must be an integer 1 or greater")
+            if not ParallelMode.has(self._harvester_config.get(DataSetDriverConfigKeys.PARALLEL_MODE,
+                                                               ParallelMode.THREAD)):
+                errors.append("harvester config 'parallel_mode' must be one of %s" % ParallelMode.list())
+            parse_timeout = self._harvester_config.get(DataSetDriverConfigKeys.PARSE_TIMEOUT, DEFAULT_PARSE_TIMEOUT)
+            if not isinstance(parse_timeout, (int, float)) or parse_timeout <= 0:
+                errors.append("harvester config 'parse_timeout' must be a positive number of seconds")
         else:
             errors.append("missing 'harvester' config")
 
@@ -549,12 +678,116 @@ class SimpleDataSetDriver(DataSetDriver):
         """
         Main loop to listen for new files to parse.  Parse them and move on.
         """
+        if self._max_parallel_files > 1:
+            self._poll_parallel()
+            return
+
         # If we have files, grab the first and process it.
         count = len(self._new_file_queue)
         log.trace("Checking for new files in queue, count: %d", count)
         if(count > 0):
             log.debug("New file detected, resource_id: %s, array addr: %s", self._resource_id, id(self._new_file_queue))
-            self._got_file(self._new_file_queue.pop(0))
+            (file_name, _) = self._new_file_queue.popitem(last=False)
+            self._got_file(file_name)
+
+    def _poll_parallel(self):
+        """
+        Keep up to max_parallel_files files being parsed by the worker pool, and publish the files
+        that have been parsed in the order they were found.  The result of a worker that dies is
+        never ready, so a file not parsed within the parse timeout is parsed here instead, rather
+        than holding up every file found after it.
+        """
+        self._start_parsing()
+        while self._parsing_files:
+            (file_name, result, deadline) = self._parsing_files[0]
+            if result.ready():
+                self._parsing_files.popleft()
+                self._publish_parsed_file(file_name, result.get())
+            elif time.time() >= deadline:
+                self._parsing_files.popleft()
+                log.warn("Worker did not parse %s within %s seconds, parsing it in the driver",
+                         file_name, self._parse_timeout)
+                self._got_file(file_name)
+            else:
+                break
+            self._start_parsing()
+
+    def _start_parsing(self):
+        """
+        Hand queued files to the worker pool until max_parallel_files are being parsed
+        """
+        directory = self._harvester_config.get(DataSetDriverConfigKeys.DIRECTORY)
+        (count, _) = self._publish_rate()
+        while self._new_file_queue and len(self._parsing_files) < self._max_parallel_files:
+            (file_name, _) = self._new_file_queue.popitem(last=False)
+            log.debug("Parsing file in %s pool, resource_id: %s, name: %s", self._parallel_mode,
+                      self._resource_id, file_name)
+            path = os.path.join(directory, file_name)
+            # the file directory is initialized in the harvester, so it will exist by this point
+            parser_state = self._driver_state[file_name][DriverStateKey.PARSER_STATE]
+            pool = self._get_ingest_pool()
+            if self._parallel_mode == ParallelMode.PROCESS:
+                result = pool.apply_async(_parse_forked_file, (id(self), path, parser_state, count))
+            else:
+                result = pool.apply_async(_parse_file, (self, path, parser_state, count))
+            self._parsing_files.append((file_name, result, time.time() + self._parse_timeout))
+
+    def _get_ingest_pool(self):
+        """
+        @retval the worker pool, started the first time it is needed
+        """
+        if self._ingest_pool is None:
+            if self._parallel_mode == ParallelMode.PROCESS:
+                # the processes are forked now, and find this driver by its id
+                _forked_drivers[id(self)] = self
+                self._ingest_pool = multiprocessing.Pool(self._max_parallel_files)
+            else:
+                self._ingest_pool = ThreadPool(self._max_parallel_files)
+        return self._ingest_pool
+
+    def _publish_parsed_file(self, file_name, parsed):
+        """
+        Publish what a worker parsed from a file, as _got_file would have while parsing it
+        @param file_name: name of the parsed file
+        @param parsed: ParsedFile from the worker
+        """
+        (_, delay) = self._publish_rate()
+        directory = self._harvester_config.get(DataSetDriverConfigKeys.DIRECTORY)
+        self._file_in_process = file_name
+        try:
+            self._raise_new_file_event(os.path.join(directory, file_name))
+            for (kind, value) in parsed.calls:
+                if kind == ParsedFile.PARTICLES:
+                    self._data_callback(value)
+                elif kind == ParsedFile.STATE:
+                    self._save_parser_state(*value)
+                elif kind == ParsedFile.SAMPLE_EXCEPTION:
+                    self._sample_exception_callback(value)
+                elif delay:
+                    gevent.sleep(delay)
+
+            if parsed.sample_error:
+                # need to mark the bad file as ingested so we don't re-ingest it
+                self._save_parser_state_after_error()
+                self._sample_exception_callback(parsed.sample_error)
+            elif parsed.error:
+                raise parsed.error
+        finally:
+            self._file_in_process = None
+
+    def _publish_rate(self):
+        """
+        @retval the number of records to get at a time, and the delay after publishing them
+        """
+        count = 1
+        delay = None
+
+        if self._generate_particle_count:
+            # Calculate the delay between grabbing records to publish.
+            delay = float(1) / float(self._particle_count_per_second) * float(self._generate_particle_count)
+            count = self._generate_particle_count
+
+        return (count, delay)
 
     def _stage_input_file(self, path):
         """
@@ -615,13 +848,7 @@ class SimpleDataSetDriver(DataSetDriver):
             # Removed this for the time being to get new driver code out.  May bring this back in the future
             #self._stage_input_file(os.path.join(directory, file_name))
 
-            count = 1
-            delay = None
-
-            if self._generate_particle_count:
-                # Calculate the delay between grabbing records to publish.
-                delay = float(1) / float(self._particle_count_per_second) * float(self._generate_particle_count)
-                count = self._generate_particle_count
+            (count, delay) = self._publish_rate()
 
             self._file_in_process = file_name
 
@@ -665,6 +892,7 @@ class SimpleDataSetDriver(DataSetDriver):
         if file_ingested:
             log.debug("File %s fully parsed", self._file_in_process)
             self._driver_state[self._file_in_process][DriverStateKey.INGESTED] = True
+            self._discard_checksum()
         self._state_callback(self._driver_state)
 
     def _save_parser_state_after_error(self):
@@ -674,8 +902,17 @@ class SimpleDataSetDriver(DataSetDriver):
         """
         log.debug("File %s fully parsed", self._file_in_process)
         self._driver_state[self._file_in_process][DriverStateKey.INGESTED] = True
+        self._discard_checksum()
         self._state_callback(self._driver_state)
 
+    def _discard_checksum(self):
+        """
+        Forget the cached checksum of the ingested file in process, it is
+        only hashed again if the harvester finds it modified
+        """
+        directory = self._harvester_config.get(DataSetDriverConfigKeys.DIRECTORY)
+        checksum_cache.discard(os.path.join(directory, self._file_in_process))
+
     def _init_state(self, memento):
         """
         Initialize driver state
@@ -703,7 +940,7 @@ class SimpleDataSetDriver(DataSetDriver):
         # check for duplicates, don't add it if it is already there
         if file_name not in self._new_file_queue:
             log.debug("Add new file to the new file queue: resource_id: %s, queue addr: %s, name: %s", self._resource_id, id(self._new_file_queue), file_name)
-            self._new_file_queue.append(file_name)
+            self._new_file_queue[file_name] = None
 
             count = len(self._new_file_queue)
             log.trace("Current new file queue length: %d", count)
@@ -11,14 +11,123 @@ out of files and feed them into the system.
 __author__ = 'Steve Foley'
 __license__ = 'Apache 2.0'
 
+import os
+import mmap
+
 from mi.core.log import get_logger ; log = get_logger()
-from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import StringChunker, MappedChunker
 from mi.core.instrument.data_particle import DataParticleKey
 from mi.core.exceptions import SampleException, NotImplementedException
 
+# Files at least this large are memory mapped by parsers that support it
+MMAP_THRESHOLD = 16 * 1024 * 1024
+
+# Bytes of a memory mapped file mapped at a time
+MMAP_REGION_SIZE = 16 * 1024 * 1024
+
+# Bytes of a memory mapped file added to the chunker at a time
+MMAP_BLOCK_SIZE = 1024 * 1024
+
+
+class FileMap(object):
+    """
+    A read only memory map of a whole file, mapped one region at a time so
+    that only the part being parsed is resident, not every page read so
+    far. Slicing it returns strings, as slicing an mmap does; the region
+    is moved whenever a slice falls outside it, so access should mostly
+    move forward through the file.
+    """
+    def __init__(self, fileno, size, region_size=MMAP_REGION_SIZE):
+        """
+        @param fileno The file descriptor of the file, it is duplicated so
+            the file can be closed independently
+        @param size The size of the file, data appended later isn't seen
+        @param region_size The bytes to map at a time
+        """
+        self._fileno = os.dup(fileno)
+        self._size = size
+        self._region_size = region_size
+        self._region = None
+        self._region_start = 0
+        self._region_end = 0
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, index):
+        """
+        @param index A slice of file offsets
+        @retval The file contents in the slice
+        """
+        (start, stop, step) = index.indices(self._size)
+        if start >= stop:
+            return ''
+        if start < self._region_start or stop > self._region_end:
+            self._map(start, stop)
+        return self._region[start - self._region_start:stop - self._region_start]
+
+    def _map(self, start, stop):
+        """
+        Map the region starting at or just before start, at least as far as stop
+        """
+        if self._region is not None:
+            self._region.close()
+            self._region = None
+        offset = start - start % mmap.ALLOCATIONGRANULARITY
+        length = min(max(self._region_size, stop - offset), self._size - offset)
+        self._region = mmap.mmap(self._fileno, length, access=mmap.ACCESS_READ, offset=offset)
+        self._region_start = offset
+        self._region_end = offset + length
+
+    def close(self):
+        if self._region is not None:
+            self._region.close()
+            self._region = None
+        if self._fileno is not None:
+            os.close(self._fileno)
+            self._fileno = None
+
+    def __del__(self):
+        self.close()
+
+
+def map_file(stream_handle, threshold=MMAP_THRESHOLD):
+    """
+    Memory map an open file read only, if it is large enough to be worth it.
+    @param stream_handle An already open file-like filehandle
+    @param threshold The smallest file size to map, None to never map
+    @retval A FileMap of the file as it is now, None if the file is too
+        small or the handle is not a real file
+    """
+    if threshold is None:
+        return None
+    try:
+        fileno = stream_handle.fileno()
+        size = os.fstat(fileno).st_size
+    except (AttributeError, EnvironmentError, ValueError):
+        return None
+    if size == 0 or size < threshold:
+        return None
+
+    file_map = FileMap(fileno, size)
+    try:
+        # map the first region now, so a file that can't be mapped is read
+        file_map[0:1]
+    except (EnvironmentError, ValueError) as e:
+        log.warn("Unable to memory map file, reading it instead: %s", e)
+        file_map.close()
+        return None
+    return file_map
+
+
 class Parser(object):
     """ abstract class to show API needed for plugin poller objects """
 
+    # Map files at least this large and sieve them in place, None to always
+    # read them into a StringChunker. Parsers that add to or replace the
+    # chunker buffer themselves can't be mapped.
+    mmap_threshold = None
+
     def __init__(self, config, stream_handle, state, sieve_fn,
                  state_callback, publish_callback, exception_callback = None):
         """
@@ -38,7 +147,11 @@ class Parser(object):
            ultimately from the agent) where we send our error events to
            be published into ION
         """
-        self._chunker = StringChunker(sieve_fn)
+        self._mmap = map_file(stream_handle, self.mmap_threshold)
+        if self._mmap is not None:
+            self._chunker = MappedChunker(sieve_fn, self._mmap)
+        else:
+            self._chunker = StringChunker(sieve_fn)
         self._stream_handle = stream_handle
         self._state = state
         self._state_callback = state_callback
@@ -133,8 +246,14 @@ class BufferLoadingParser(Parser):
     records from this buffer as they are requested. Parsers dont have
     to operate this way, but it can keep memory in check and smooth out
     stream inputs if they dont all come at once.
+
+    Files of at least mmap_threshold bytes are memory mapped. The chunker
+    then sieves windows of the map indexed by file offset instead of 1 KB
+    reads, and the record buffer is only loaded as far as requested rather
+    than with the whole file.
     """
     file_complete = False
+    mmap_threshold = MMAP_THRESHOLD
         
     def get_records(self, num_records):
         """
@@ -146,8 +265,13 @@ class BufferLoadingParser(Parser):
         """
         if num_records <= 0:
             return []
+        wanted = num_records
+        if self._mmap is not None:
+            # one more than requested, so the last records of the file are
+            # only handed out once it is known to be complete
+            wanted += 1
         try:
-            while len(self._record_buffer) < num_records:
+            while len(self._record_buffer) < wanted:
                 self._load_particle_buffer()        
         except EOFError:
             pass            
@@ -197,22 +321,47 @@ class BufferLoadingParser(Parser):
         while self.get_block():
             result = self.parse_chunks()
             self._record_buffer.extend(result)
+            if result and self._mmap is not None:
+                # let get_records decide whether it needs more
+                break
 
     def get_block(self, size=1024):
         """
         Get a block of characters for processing
-        @param size The size of the block to try to read
+        @param size The size of the block to try to read, mapped files are
+            added MMAP_BLOCK_SIZE at a time
         @retval The length of data retreived
         @throws EOFError when the end of the file is reached
         """
-        # read in some more data
-        data = self._stream_handle.read(size)
-        if data:
-            self._chunker.add_chunk(data, self._timestamp)
-            return len(data)
-        else: # EOF
-            self.file_complete = True
-            raise EOFError
+        if self._mmap is not None:
+            length = self._get_mapped_block()
+        else:
+            # read in some more data
+            data = self._stream_handle.read(size)
+            length = len(data)
+            if data:
+                self._chunker.add_chunk(data, self._timestamp)
+        if length:
+            return length
+        # EOF
+        self.file_complete = True
+        raise EOFError
+
+    def _get_mapped_block(self, size=MMAP_BLOCK_SIZE):
+        """
+        Add the next window of a mapped file to the chunker, starting from the
+        stream handle's position and moving it past the window, so seeking
+        and reading the stream handle still work as they do unmapped.
+        @param size The size of the window
+        @retval The length of the window, 0 at the end of the file
+        """
+        start = self._stream_handle.tell()
+        end = min(start + size, len(self._mmap))
+        if end <= start:
+            return 0
+        self._stream_handle.seek(end)
+        self._chunker.add_range(start, end, self._timestamp)
+        return end - start
 
     def parse_chunks(self):
         """
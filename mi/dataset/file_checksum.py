@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.file_checksum
+@file mi/dataset/file_checksum.py
+@brief File checksums for the harvesters and data set drivers. Files are
+    hashed a block at a time, and digests are cached until the file's size,
+    modification time or inode changes, so a file found by a harvester and
+    then announced by its driver is read once. Drivers discard the digests
+    of files they have ingested, and the cache holds a bounded number,
+    forgetting the least recently used.
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+# Bytes read from a file at a time while hashing it
+BLOCK_SIZE = 1024 * 1024
+
+# Most digests a ChecksumCache holds
+MAX_CACHED_DIGESTS = 10000
+
+
+def md5_checksum(path, block_size=BLOCK_SIZE):
+    """
+    Hash a file without reading all of it into memory.
+    @param path The file to hash.
+    @param block_size Bytes to read at a time.
+    @retval The hex md5 digest of the file.
+    """
+    md5 = hashlib.md5()
+    with open(path, 'rb') as filehandle:
+        while True:
+            block = filehandle.read(block_size)
+            if not block:
+                break
+            md5.update(block)
+    return md5.hexdigest()
+
+
+def stat_key(stat):
+    """
+    @param stat An os.stat result.
+    @retval The file attributes a cached digest is valid for.
+    """
+    return (stat.st_size, stat.st_mtime, stat.st_ino)
+
+
+class ChecksumCache(object):
+    """
+    md5 digests of files by path, each valid while the file's size,
+    modification time and inode are unchanged, least recently used first.
+    """
+    def __init__(self, max_entries=MAX_CACHED_DIGESTS):
+        """
+        @param max_entries Most digests to hold, the least recently used
+        are forgotten to make room.
+        """
+        self.max_entries = max_entries
+        self._digests = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def checksum(self, path, stat=None):
+        """
+        @param path The file to hash.
+        @param stat An os.stat result for the file, if the caller already
+        has one.
+        @retval The hex md5 digest of the file.
+        @throws OSError, IOError if the file can't be read.
+        """
+        if stat is None:
+            stat = os.stat(path)
+        key = stat_key(stat)
+        path = os.path.abspath(path)
+
+        with self._lock:
+            entry = self._digests.pop(path, None)
+            if entry is not None and entry[0] == key:
+                self._digests[path] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        digest = md5_checksum(path)
+
+        # Only keep the digest if the file didn't change while being read
+        if stat_key(os.stat(path)) == key:
+            with self._lock:
+                self._digests.pop(path, None)
+                self._digests[path] = (key, digest)
+                while len(self._digests) > self.max_entries:
+                    self._digests.popitem(last=False)
+        return digest
+
+    def discard(self, path):
+        """
+        Forget the digest of a file, e.g. once it has been ingested or moved
+        away.
+        """
+        with self._lock:
+            self._digests.pop(os.path.abspath(path), None)
+
+    def clear(self):
+        with self._lock:
+            self._digests.clear()
+            self.hits = 0
+            self.misses = 0
+
+# Cache shared by the harvesters and data set drivers in this process
+checksum_cache = ChecksumCache()
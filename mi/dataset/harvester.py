@@ -14,17 +14,21 @@ __license__ = 'Apache 2.0'
 
 import os
 import glob
-import hashlib
 import time
 import re
+import errno
+import select
+import fnmatch
 
-from threading import Thread
+from threading import Thread, Lock
 from gevent.event import Event
 
 from mi.core.log import get_logger ; log = get_logger()
 from mi.core.poller import DirectoryPoller, ConditionPoller
 from mi.core.common import BaseEnum
-from mi.dataset.dataset_driver import DriverStateKey
+from mi.core import inotify
+from mi.dataset.dataset_driver import DriverStateKey, DataSetDriverConfigKeys
+from mi.dataset.file_checksum import checksum_cache
 
 
 class Harvester(object):
@@ -51,7 +55,185 @@ class Harvester(object):
 # used to determine if we should do integer sorting of the files
 NUMBER_UNDERSCORE_MATCHER = re.compile(r'_\d')
 
-class SingleDirectoryPoller(ConditionPoller):
+# seconds a file must go unwritten after it is closed before it is harvested, when watching with inotify
+DEFAULT_DEBOUNCE_TIME = 1
+
+# directory events the watcher follows
+WATCH_MASK = inotify.IN_CREATE | inotify.IN_MODIFY | inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO | \
+             inotify.IN_DELETE | inotify.IN_MOVED_FROM | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF | \
+             inotify.IN_ONLYDIR
+
+class DirectoryWatcher(object):
+    """
+    Watch a directory with inotify, keeping the time each file matching a pattern will be ready
+    to harvest.  A file being written is ready file_mod_wait seconds after it was last modified,
+    as when polling, but once it is closed or moved into the directory it is ready after the
+    shorter debounce time.
+    @param directory - directory to watch
+    @param pattern - wildcard of the files to follow
+    @param debounce_time - seconds to wait after a file is closed
+    @param file_mod_wait - seconds to wait after a file was modified
+    @throws OSError if inotify is not available or the directory can't be watched
+    """
+    def __init__(self, directory, pattern, debounce_time, file_mod_wait):
+        self._directory = directory
+        self._pattern = pattern
+        self.debounce_time = debounce_time
+        self.file_mod_wait = file_mod_wait
+        self._inotify = inotify.Inotify()
+        try:
+            self._inotify.add_watch(directory, WATCH_MASK)
+        except OSError:
+            self._inotify.close()
+            raise
+        # written by wake to end a wait early, guarded so a wake racing close can't write to a reused fd
+        (self._wake_read, self._wake_write) = os.pipe()
+        self._wake_lock = Lock()
+        # the time each file not yet ready will be ready
+        self._ready_times = {}
+        # set when events have been lost and the whole directory needs to be checked
+        self.rescan = True
+        # set when the directory has gone and the watch removed
+        self.lost = False
+
+    def wait(self, timeout):
+        """
+        Wait for directory events or the next file to be ready
+        @param timeout - most seconds to wait
+        """
+        self.due()
+        if self._ready_times:
+            timeout = max(0, min(timeout, min(self._ready_times.itervalues()) - time.time()))
+        try:
+            (ready, _, _) = select.select([self._inotify.fileno(), self._wake_read], [], [], timeout)
+        except select.error as e:
+            if e.args[0] != errno.EINTR:
+                raise
+            return
+        if self._inotify.fileno() in ready:
+            for event in self._inotify.read_events(0):
+                self._on_event(event)
+
+    def wake(self):
+        """
+        End the current wait and every one after it without waiting for events, to shut down
+        """
+        with self._wake_lock:
+            if self._wake_write is not None:
+                os.write(self._wake_write, 'x')
+
+    def _on_event(self, event):
+        if event.mask & inotify.IN_Q_OVERFLOW:
+            log.warn('inotify queue overflowed, rescanning directory')
+            self.rescan = True
+        elif event.mask & (inotify.IN_IGNORED | inotify.IN_DELETE_SELF | inotify.IN_MOVE_SELF):
+            self.lost = True
+        elif not event.name or not fnmatch.fnmatch(event.name, self._pattern):
+            pass
+        elif event.mask & (inotify.IN_DELETE | inotify.IN_MOVED_FROM):
+            self._ready_times.pop(event.name, None)
+        elif event.mask & (inotify.IN_CLOSE_WRITE | inotify.IN_MOVED_TO):
+            self._ready_times[event.name] = time.time() + self.debounce_time
+        else:
+            # created or modified, still being written
+            self._ready_times[event.name] = time.time() + self.file_mod_wait
+
+    def due(self):
+        """
+        @retval names of the files that have become ready
+        """
+        now = time.time()
+        names = [name for (name, ready_time) in self._ready_times.iteritems() if ready_time <= now]
+        for name in names:
+            if not os.path.isfile(os.path.join(self._directory, name)):
+                # gone without an event for it, forget it rather than wake for it again
+                del self._ready_times[name]
+        return [name for name in names if name in self._ready_times]
+
+    def ready(self, file_name, mod_time):
+        """
+        Check if a file is ready to harvest.  Files the watcher has seen no events for are ready
+        once file_mod_wait has passed since they were modified.
+        @param file_name - name of the file in the directory
+        @param mod_time - modification time of the file
+        @retval True if the file is ready
+        """
+        ready_time = self._ready_times.get(file_name)
+        if ready_time is None:
+            ready_time = mod_time + self.file_mod_wait
+        if ready_time > time.time():
+            # remember it so the watcher wakes up when it is ready
+            self._ready_times[file_name] = ready_time
+            return False
+        self._ready_times.pop(file_name, None)
+        return True
+
+    def close(self):
+        self._inotify.close()
+        with self._wake_lock:
+            if self._wake_write is not None:
+                os.close(self._wake_read)
+                os.close(self._wake_write)
+                self._wake_read = self._wake_write = None
+
+class WatchedPoller(ConditionPoller):
+    """
+    Base class of pollers checking files in a single directory.  If the 'inotify' config is
+    set the poller sleeps until inotify reports changes to the directory rather than checking
+    it every interval, and harvests files debounce_time after they are closed rather than
+    file_mod_wait after they are modified.  Falls back to polling if inotify is not available.
+    @param config - harvester configuration dictionary
+    @param directory - directory to check
+    @param pattern - wildcard of the files to check
+    """
+    def __init__(self, config, directory, pattern, condition, callback, exception_callback, interval):
+        self._watcher = None
+        if config.get(DataSetDriverConfigKeys.INOTIFY, False):
+            debounce_time = config.get(DataSetDriverConfigKeys.DEBOUNCE_TIME, DEFAULT_DEBOUNCE_TIME)
+            if not isinstance(debounce_time, (int, float)) or debounce_time < 0:
+                raise TypeError("Debounce time must be a number 0 or greater")
+            try:
+                self._watcher = DirectoryWatcher(directory, pattern, debounce_time, self.file_mod_wait)
+                log.debug("Watching directory %s with inotify", directory)
+            except OSError as e:
+                log.warn("Unable to watch %s with inotify, polling instead: %s", directory, e)
+        super(WatchedPoller, self).__init__(condition, callback, exception_callback, interval)
+
+    def shutdown(self):
+        super(WatchedPoller, self).shutdown()
+        watcher = self._watcher
+        if watcher:
+            watcher.wake()
+
+    def run(self):
+        try:
+            super(WatchedPoller, self).run()
+        finally:
+            if self._watcher:
+                self._watcher.close()
+
+    def _wait(self):
+        if self._watcher:
+            if self._watcher.lost:
+                log.warn("Directory watch removed, polling instead")
+                self._watcher.close()
+                self._watcher = None
+            else:
+                self._watcher.wait(self.polling_interval)
+                return
+        super(WatchedPoller, self)._wait()
+
+    def _file_ready(self, file_name, mod_time):
+        """
+        Check if a file has gone long enough without being modified to harvest
+        @param file_name - name of the file in the directory
+        @param mod_time - modification time of the file
+        """
+        if self._watcher:
+            return self._watcher.ready(file_name, mod_time)
+        return (mod_time + self.file_mod_wait) < time.time()
+
+class SingleDirectoryPoller(WatchedPoller):
     """
     Monitor a single directory to see if new files have appeared or if files have changed.
     When a change is found this information will be returned through the callback.
@@ -74,14 +256,16 @@ class SingleDirectoryPoller(ConditionPoller):
         log.debug("Start directory poller path: %s, pattern: %s", directory, wildcard)
         # driver state is not a new instance of memento, it is the same here as in the driver
         self._driver_state = memento
+        self._directory = directory
         self._path = directory + '/' + wildcard
         log.debug("Starting harvester with directory pattern: %s", self._path)
 
         # this queue holds the names of the files that have been sent to the driver.  Each time the harvester
         # restarts, the queue is emptied so all files that have not been ingested can be added and sent again,
-        # but this keeps the harvester from sending the same files over and over to not be put in the driver queue
-        self.sent_to_driver_queue = []
-        super(SingleDirectoryPoller,self).__init__(self._check_for_files, callback,
+        # but this keeps the harvester from sending the same files over and over to not be put in the driver queue.
+        # Only membership is checked, so it is a set.
+        self.sent_to_driver_queue = set()
+        super(SingleDirectoryPoller,self).__init__(config, directory, wildcard, self._check_for_files, callback,
                                                    exception_callback, interval)
 
     def _check_for_files(self):
@@ -90,7 +274,12 @@ class SingleDirectoryPoller(ConditionPoller):
         """
         filenames = []
 
-        if os.path.exists(os.path.dirname(self._path)):
+        if self._watcher and not self._watcher.rescan:
+            # only the files the watcher has seen change need checking
+            filenames = [self._directory + '/' + name for name in self._watcher.due()]
+        elif os.path.exists(os.path.dirname(self._path)):
+            if self._watcher:
+                self._watcher.rescan = False
             filenames = glob.glob(self._path)
 
         # if there are underscores in the filename, sort by ascii rather than 
@@ -104,20 +293,20 @@ class SingleDirectoryPoller(ConditionPoller):
         modified_files = False
         # loop over all files in the directory and compare their state to that in the harvester state dictionary
         for i_file in filenames:
-            mod_time = os.path.getmtime(i_file)
+            stat = os.stat(i_file)
+            mod_time = stat.st_mtime
+            file_name = os.path.basename(i_file)
             # check if the file has not been modified in the last X seconds
-            if (mod_time + self.file_mod_wait) < time.time():
-                file_name = os.path.basename(i_file)
+            if self._file_ready(file_name, mod_time):
                 # find if this file already exists in the found files
                 if file_name in self._driver_state and self._driver_state[file_name][DriverStateKey.INGESTED]:
                     # this file has been ingested (file size and date will only be available for ingested files)
-                    file_size = os.path.getsize(i_file)
+                    file_size = stat.st_size
                     if self._driver_state[file_name][DriverStateKey.FILE_SIZE] != file_size or \
                     self._driver_state[file_name][DriverStateKey.FILE_MOD_DATE] != mod_time:
                        # this file has been ingested, but the file size and times don't match, confirm that
                        # the checksum is different
-                        with open(i_file, 'rb') as filehandle:
-                            md5_checksum = hashlib.md5(filehandle.read()).hexdigest()
+                        md5_checksum = checksum_cache.checksum(i_file, stat)
                         if self._driver_state[file_name][DriverStateKey.FILE_CHECKSUM] != md5_checksum:
                             # ingested file has been modified!
                             if DriverStateKey.MODIFIED_STATE in self._driver_state[file_name]:
@@ -149,15 +338,14 @@ class SingleDirectoryPoller(ConditionPoller):
                     # duplicates are not sent
                     if file_name not in self.sent_to_driver_queue:
                         # only send this file once
-                        self.sent_to_driver_queue.append(file_name)
+                        self.sent_to_driver_queue.add(file_name)
                         new_files.append(file_name)
                     if file_name not in self._driver_state:
                         # initialize the driver state
                         # Note: because the memento came from the driver state from the dataset driver,
                         # updating the driver state here also updates it in the dataset driver
-                        file_size = os.path.getsize(i_file)
-                        with open(i_file, 'rb') as filehandle:
-                            md5_checksum = hashlib.md5(filehandle.read()).hexdigest()
+                        file_size = stat.st_size
+                        md5_checksum = checksum_cache.checksum(i_file, stat)
                         self._driver_state[file_name] = {
                             DriverStateKey.FILE_SIZE: file_size,
                             DriverStateKey.FILE_MOD_DATE: mod_time,
@@ -179,26 +367,13 @@ class SingleDirectoryPoller(ConditionPoller):
         if not filenames or len(filenames) < 2:
             return filenames
 
-        # this assumes all files have the same extension
-        file_extension = filenames[0].split('.')
-        split_names = ()
-        for fn in filenames:
-            split_name = self.ascii_to_int_list(fn)
-            # append this split up name as a tuple
-            split_names = split_names + (split_name, ) 
-        # now sort all the int formatted names
-        sorted_tuple = sorted(split_names)
-        # put the filenames back to string format
-        sorted_filenames = []
-        
-        for fn in sorted_tuple:
-            # Retrieve original name from end of sorted component list
-            sorted_filenames.append(fn[len(fn) - 1])
-
-        return sorted_filenames
+        return sorted(filenames, key=self.ascii_to_int_list)
 
     @staticmethod
     def ascii_to_int_list(filename):
+        """
+        Natural sort key of a file name, its underscore separated parts with the numeric ones as integers
+        """
         # remove file extension and split by underscores
         file_extension = filename.split('.')
         split_name = filename.replace('.' + file_extension[1], '').split('_')
@@ -255,7 +430,7 @@ class SingleDirectoryHarvester(SingleDirectoryPoller, Harvester):
         for this_file in new_files:
             self.callback(this_file)
 
-class SingleFilePoller(ConditionPoller):
+class SingleFilePoller(WatchedPoller):
     """
     Monitor a single file to see if it changes
     @param config - harvester configuration dictionary
@@ -282,7 +457,7 @@ class SingleFilePoller(ConditionPoller):
             self._driver_state[DriverStateKey.FILE_MOD_DATE] = memento.get(DriverStateKey.FILE_MOD_DATE)
             self._driver_state[DriverStateKey.FILE_CHECKSUM] = memento.get(DriverStateKey.FILE_CHECKSUM)
         log.debug("Start file poller path: %s, initial state: %s", self._path, self._driver_state)
-        super(SingleFilePoller,self).__init__(self._check_for_changes, callback,
+        super(SingleFilePoller,self).__init__(config, directory, self._filename, self._check_for_changes, callback,
                                                    exception_callback, interval)
 
     def _check_for_changes(self):
@@ -291,18 +466,18 @@ class SingleFilePoller(ConditionPoller):
         """
         new_driver_state = None
         if os.path.exists(self._path):
-            mod_time = os.path.getmtime(self._path)
-            file_size = os.path.getsize(self._path)
+            stat = os.stat(self._path)
+            mod_time = stat.st_mtime
+            file_size = stat.st_size
             # check if the file has not been modified in the last X seconds
-            if (mod_time + self.file_mod_wait) < time.time():
+            if self._file_ready(self._filename, mod_time):
                 if DriverStateKey.FILE_SIZE in self._driver_state:
                     # this file has been found previously, compare the state
                     log.trace('Comparing driver state to %s', self._driver_state)
                     if self._driver_state[DriverStateKey.FILE_SIZE] != file_size or \
                         self._driver_state[DriverStateKey.FILE_MOD_DATE] != mod_time:
                         # size or time is different, confirm with checksum
-                        with open(self._path, 'rb') as filehandle:
-                            md5_checksum = hashlib.md5(filehandle.read()).hexdigest()
+                        md5_checksum = checksum_cache.checksum(self._path, stat)
                         if self._driver_state[DriverStateKey.FILE_CHECKSUM] != md5_checksum:
                             # file is different, update the state
                             self._driver_state[DriverStateKey.FILE_SIZE] = file_size
@@ -314,8 +489,7 @@ class SingleFilePoller(ConditionPoller):
                                                 DriverStateKey.FILE_CHECKSUM: md5_checksum}
                 else:
                     # no driver state yet, first time opening this file
-                    with open(self._path, 'rb') as filehandle:
-                        md5_checksum = hashlib.md5(filehandle.read()).hexdigest()
+                    md5_checksum = checksum_cache.checksum(self._path, stat)
                     self._driver_state[DriverStateKey.FILE_SIZE] = file_size
                     self._driver_state[DriverStateKey.FILE_MOD_DATE] = mod_time
                     self._driver_state[DriverStateKey.FILE_CHECKSUM] = md5_checksum
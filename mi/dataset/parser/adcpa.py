@@ -24,14 +24,14 @@ import copy
 import datetime as dt
 import re
 from calendar import timegm
-from functools import partial
 from struct import unpack
 
 from mi.core.log import get_logger
 from mi.core.common import BaseEnum
 from mi.core.exceptions import SampleException, DatasetParserException
-from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import PD0Framer
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey
+from mi.core.instrument import pd0_decoder
 from mi.dataset.dataset_parser import BufferLoadingParser
 
 # start the logger
@@ -47,7 +47,9 @@ log = get_logger()
 # since the ensemble sizes will vary during the course of a deployment as
 # bottom-tracking is automatically turned on and off. This also allows the
 # glider pilots the flexibility to change the sampling characteristics of the
-# ADCPA without impacting the parser code.
+# ADCPA without impacting the parser code. Ensembles are framed with the
+# PD0Framer, which walks the length field; the regex now only validates the
+# header of each framed ensemble.
 ADCPA_PD0_PARSED_REGEX = (
     b'(\x7f\x7f[\x00-\xFF]{2}\x00[\x06|\x07]{1}[\x00-\xFF]+?)' +  # header bytes plus rest of ensemble
     '(?=(\x7f\x7f[\x00-\xFF]{2}\x00[\x06|\x07]{1})|\Z)'  # start of the next ensemble, or EOF
@@ -285,11 +287,7 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         data = str(self.raw_data)
 
         # Calculate the checksum
-        total = int(0)
-        for i in range(0, length):
-            total += int(ord(data[i]))
-
-        checksum = total & 65535    # bitwise and with 65535 or mod vs 65536
+        checksum = pd0_decoder.checksum(data, 0, length)
 
         if checksum != unpack("<H", self.raw_data[length: length+2])[0]:
             log.debug("Checksum mismatch " + str(checksum) + " != "
@@ -667,7 +665,6 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         @throws SampleException If there is a problem with sample creation
         """
         N = (len(chunk) - 2) / 2 / 4
-        offset = 0
 
         velocity_data_id = unpack("<H", chunk[0:2])[0]
         if 256 != velocity_data_id:
@@ -676,17 +673,8 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.VELOCITY_DATA_ID,
                                   DataParticleKey.VALUE: velocity_data_id})
 
-        water_velocity_east = []
-        water_velocity_north = []
-        water_velocity_up = []
-        error_velocity = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<hhhh', chunk[offset + 2: offset + 10])
-            water_velocity_east.append(a)
-            water_velocity_north.append(b)
-            water_velocity_up.append(c)
-            error_velocity.append(d)
-            offset += 4 * 2
+        (water_velocity_east, water_velocity_north,
+         water_velocity_up, error_velocity) = pd0_decoder.beam_values(chunk, '<i2', N)
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.WATER_VELOCITY_EAST,
                                   DataParticleKey.VALUE: water_velocity_east})
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.WATER_VELOCITY_NORTH,
@@ -703,7 +691,6 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         @throws SampleException If there is a problem with sample creation
         """
         N = (len(chunk) - 2) / 4
-        offset = 0
 
         correlation_magnitude_id = unpack("<H", chunk[0:2])[0]
         if 512 != correlation_magnitude_id:
@@ -712,17 +699,8 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.CORRELATION_MAGNITUDE_ID,
                                   DataParticleKey.VALUE: correlation_magnitude_id})
 
-        correlation_magnitude_beam1 = []
-        correlation_magnitude_beam2 = []
-        correlation_magnitude_beam3 = []
-        correlation_magnitude_beam4 = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<BBBB', chunk[offset + 2: offset + 6])
-            correlation_magnitude_beam1.append(a)
-            correlation_magnitude_beam2.append(b)
-            correlation_magnitude_beam3.append(c)
-            correlation_magnitude_beam4.append(d)
-            offset += 4
+        (correlation_magnitude_beam1, correlation_magnitude_beam2,
+         correlation_magnitude_beam3, correlation_magnitude_beam4) = pd0_decoder.beam_values(chunk, 'u1', N)
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.CORRELATION_MAGNITUDE_BEAM1,
                                   DataParticleKey.VALUE: correlation_magnitude_beam1})
@@ -740,7 +718,6 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         @throws SampleException If there is a problem with sample creation
         """
         N = (len(chunk) - 2) / 4
-        offset = 0
 
         echo_intensity_id = unpack("<H", chunk[0:2])[0]
         if 768 != echo_intensity_id:
@@ -748,17 +725,8 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.ECHO_INTENSITY_ID,
                                   DataParticleKey.VALUE: echo_intensity_id})
 
-        echo_intesity_beam1 = []
-        echo_intesity_beam2 = []
-        echo_intesity_beam3 = []
-        echo_intesity_beam4 = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<BBBB', chunk[offset + 2: offset + 6])
-            echo_intesity_beam1.append(a)
-            echo_intesity_beam2.append(b)
-            echo_intesity_beam3.append(c)
-            echo_intesity_beam4.append(d)
-            offset += 4
+        (echo_intesity_beam1, echo_intesity_beam2,
+         echo_intesity_beam3, echo_intesity_beam4) = pd0_decoder.beam_values(chunk, 'u1', N)
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.ECHO_INTENSITY_BEAM1,
                                   DataParticleKey.VALUE: echo_intesity_beam1})
@@ -776,7 +744,6 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         @throws SampleException If there is a problem with sample creation
         """
         N = (len(chunk) - 2) / 4
-        offset = 0
 
         percent_good_id = unpack("<H", chunk[0:2])[0]
         if 1024 != percent_good_id:
@@ -785,17 +752,8 @@ class ADCPA_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.PERCENT_GOOD_ID,
                                   DataParticleKey.VALUE: percent_good_id})
 
-        percent_good_3beam = []
-        percent_transforms_reject = []
-        percent_bad_beams = []
-        percent_good_4beam = []
-        for row in range(0, N):
-            (a, b, c, d) = unpack('<BBBB', chunk[offset + 2: offset + 6])
-            percent_good_3beam.append(a)
-            percent_transforms_reject.append(b)
-            percent_bad_beams.append(c)
-            percent_good_4beam.append(d)
-            offset += 4
+        (percent_good_3beam, percent_transforms_reject,
+         percent_bad_beams, percent_good_4beam) = pd0_decoder.beam_values(chunk, 'u1', N)
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.PERCENT_GOOD_3BEAM,
                                   DataParticleKey.VALUE: percent_good_3beam})
         self.final_result.append({DataParticleKey.VALUE_ID: ADCPA_PD0_PARSED_KEY.PERCENT_TRANSFORMS_REJECT,
@@ -966,8 +924,7 @@ class AdcpaParser(BufferLoadingParser):
         super(AdcpaParser, self).__init__(config,
                                           stream_handle,
                                           state,
-                                          partial(StringChunker.regex_sieve_function,
-                                                  regex_list=[ADCPA_PD0_PARSED_MATCHER]),
+                                          PD0Framer(),
                                           state_callback,
                                           publish_callback,
                                           *args,
@@ -1016,10 +973,17 @@ class AdcpaParser(BufferLoadingParser):
     def get_block(self):
         """
         Overwrites get_block method in dataset_parser.py to simply read the
-        entire file rather than break it into chunks.
+        entire file rather than break it into chunks. Memory mapped files are
+        sieved a window at a time instead.
         @retval The length of data retreived
         @throws EOFError when the end of the file is reached
         """
+        if self._mmap is not None:
+            length = self._get_mapped_block()
+            if length:
+                return length
+            raise EOFError
+
         # read in some more data
         data = self._stream_handle.read()
         if data:
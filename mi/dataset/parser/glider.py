@@ -109,13 +109,19 @@ class GliderParticle(DataParticle):
     common_parameters = GliderParticleKey.list()
 
     def _parsed_values(self, key_list):
+        (value_ids, values) = self._parsed_tuple(key_list)
+        return [{DataParticleKey.VALUE_ID: key, DataParticleKey.VALUE: value}
+                for (key, value) in zip(value_ids, values)]
+
+    def _parsed_tuple(self, key_list):
         log.debug("Build a particle with keys: %s", key_list)
         if not isinstance(self.raw_data, dict):
             raise SampleException(
                 "%s: Object Instance is not a Glider Parsed Data \
                 dictionary" % self._data_particle_type)
 
-        result = []
+        value_ids = []
+        values = []
 
         # find if any of the variables from the particle key list are in
         # the data_dict and keep it
@@ -124,14 +130,15 @@ class GliderParticle(DataParticle):
                 # read the value from the gpd dictionary
                 value = self.raw_data[key]['Data']
 
-                # check to see that the value is not a 'NaN'
-                if np.isnan(value):
+                # check to see that the value is not a 'NaN', NaN being
+                # the only value not equal to itself
+                if value != value:
                     log.trace("NaN Value: %s", key)
                     value = None
 
                 # add the value to the record
-                result.append({DataParticleKey.VALUE_ID: key,
-                               DataParticleKey.VALUE: value})
+                value_ids.append(key)
+                values.append(value)
                 log.trace("Key: %s, value: %s", key, value)
 
             else:
@@ -142,7 +149,7 @@ class GliderParticle(DataParticle):
                 #         "standard lists and/or Particle Keys")
                 SampleException("%s column missing from datafile, row ignored", key)
 
-        return result
+        return (value_ids, values)
 
 class CtdgvParticleKey(GliderParticleKey):
     SCI_WATER_COND = 'sci_water_cond'
@@ -305,31 +312,31 @@ class GgldrEngDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.GGLDR_ENG_DELAYED
     science_parameters = EngineeringParticleKey.science_parameter_list()
 
-    def _build_parsed_values(self):
+    def _build_parsed_tuple(self):
         """
         Takes a GliderParser object and extracts engineering data from the
         data dictionary and puts the data into a engineering Data Particle.
 
-        @param result A returned list with sub dictionaries of the data
+        @retval (value ids, values) for the keys present in the data
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(EngineeringParticleKey.list())
+        return self._parsed_tuple(EngineeringParticleKey.list())
 
 
 class CgldrEngDelayedDataParticle(GliderParticle):
     _data_particle_type = DataParticleType.CGLDR_ENG_DELAYED
 
-    def _build_parsed_values(self):
+    def _build_parsed_tuple(self):
         """
         Takes a GliderParser object and extracts engineering data from the
         data dictionary and puts the data into a engineering Data Particle.
 
-        @param result A returned list with sub dictionaries of the data
+        @retval (value ids, values) for the keys present in the data
         @throws SampleException if the data is not a glider data dictionary
             produced by GliderParser._read_data
         """
-        return self._parsed_values(EngineeringParticleKey.KEY_LIST)
+        return self._parsed_tuple(EngineeringParticleKey.KEY_LIST)
 
 
 class ParadParticleKey(DataParticleKey):
@@ -369,6 +376,9 @@ class GliderParser(BufferLoadingParser):
     dictionary and the data in a data dictionary using the column labels as the
     dictionary keys. These dictionaries are used to build the particles.
     """
+    # get_block adds newlines to the chunker
+    mmap_threshold = None
+
     def __init__(self,
                  config,
                  state,
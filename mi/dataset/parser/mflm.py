@@ -11,6 +11,7 @@ from the common MFLM control file.
 __author__ = 'Emily Hahn'
 __license__ = 'Apache 2.0'
 
+import os
 import re
 import struct
 import binascii
@@ -74,10 +75,9 @@ class MflmParser(Parser):
         self._timestamp = 0.0
         self._position = [0,0] # store both the start and end point for this read of data within the file
         self._record_buffer = [] # holds list of records
-        # determine the EOF index
-        self._stream_handle.seek(0)
-        all_data = self._stream_handle.read()
-        EOF = len(all_data)
+        # determine the EOF index without reading the file in
+        self._stream_handle.seek(0, os.SEEK_END)
+        EOF = self._stream_handle.tell()
         self._stream_handle.seek(0)
         self._new_seq_flag = True # always start a new sequence on init
         self._chunk_sample_count = []
@@ -12,18 +12,33 @@ import collections
 import gevent
 import numpy as np
 import os
+import time
+import random
+import shutil
+import resource
+import tempfile
+import multiprocessing
 from nose.plugins.attrib import attr
 
 from mi.core.log import get_logger
 
 from mi.core.exceptions import SampleException
+from mi.core.unit_test import MiUnitTest
 from mi.dataset.test.test_parser import ParserUnitTestCase
+from mi.dataset.dataset_parser import FileMap
 from mi.dataset.dataset_driver import DataSetDriverConfigKeys
 from mi.dataset.parser.adcpa import AdcpaParser, ADCPA_PD0_PARSED_DataParticle, StateKey
 
 log = get_logger()
 
 
+class MappedAdcpaParser(AdcpaParser):
+    """
+    An AdcpaParser that memory maps files of any size
+    """
+    mmap_threshold = 0
+
+
 @attr('UNIT', group='mi')
 class AdcpaParserUnitTestCase(ParserUnitTestCase):
     """
@@ -394,3 +409,130 @@ class AdcpaParserUnitTestCase(ParserUnitTestCase):
         particles = self.parser.get_records(5)
         self.parse_particles(particles)
         self.assert_result(self.test04, self.parsed_data, particles)
+
+    def _parse_all(self, parser_class, position=0):
+        """
+        @retval The raw data and state of every particle in the file, and the
+            parser
+        """
+        self.stream_handle.seek(0)
+        parser = parser_class(self.config, {StateKey.POSITION: position}, self.stream_handle,
+                              self.pos_callback, self.pub_callback)
+        results = []
+        particles = parser.get_records(7)
+        while particles:
+            results.extend((particle.raw_data, self.position_callback_value) for particle in particles)
+            particles = parser.get_records(7)
+        return (results, parser)
+
+    def test_mapped_file(self):
+        """
+        A memory mapped file gives the same particles and positions as one
+        read in
+        """
+        (expected, parser) = self._parse_all(AdcpaParser)
+        self.assertEqual(parser._mmap, None)
+        (results, parser) = self._parse_all(MappedAdcpaParser)
+        self.assertNotEqual(parser._mmap, None)
+        self.assertEqual(len(results), 264)
+        self.assertEqual(results, expected)
+        self.assertEqual(results[-1][1], {StateKey.POSITION: os.path.getsize(self.TEST_DATA)})
+
+        (results, parser) = self._parse_all(MappedAdcpaParser, 90538)
+        self.assertEqual(results, self._parse_all(AdcpaParser, 90538)[0])
+
+    def test_mapped_set_state(self):
+        self.stream_handle.seek(0)
+        self.parser = MappedAdcpaParser(self.config, {StateKey.POSITION: 10704}, self.stream_handle,
+                                        self.pos_callback, self.pub_callback)
+        particles = self.parser.get_records(3)
+        self.parse_particles(particles)
+        self.assert_result(self.test03, self.parsed_data, particles)
+
+    def test_file_map(self):
+        """
+        Slices of a file mapped in small regions match the file
+        """
+        data = self.stream_handle.read()
+        file_map = FileMap(self.stream_handle.fileno(), len(data), 4096)
+        self.addCleanup(file_map.close)
+        self.assertEqual(len(file_map), len(data))
+        self.assertEqual(file_map[0:len(data)], data)
+        rand = random.Random(0)
+        for i in range(200):
+            start = rand.randint(0, len(data))
+            end = start + rand.randint(0, 10000)
+            self.assertEqual(file_map[start:end], data[start:end])
+        self.assertEqual(file_map[5:5], '')
+
+
+def _parse_file(path, mmap_threshold, results):
+    """
+    Parse a file in a child process, putting the particle count, elapsed
+    time, starting and peak RSS in kB on the results queue
+    """
+    def vm_rss():
+        for line in open('/proc/self/status'):
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+
+    class BenchmarkParser(AdcpaParser):
+        pass
+    BenchmarkParser.mmap_threshold = mmap_threshold
+
+    config = {
+        DataSetDriverConfigKeys.PARTICLE_MODULE: 'mi.dataset.parser.adcpa',
+        DataSetDriverConfigKeys.PARTICLE_CLASS: 'ADCPA_PD0_PARSED_DataParticle'
+    }
+    start_rss = vm_rss()
+    start_time = time.time()
+    with open(path, 'rb') as stream_handle:
+        parser = BenchmarkParser(config, {StateKey.POSITION: 0}, stream_handle,
+                                 lambda state, ingested: None, lambda particles: None)
+        count = 0
+        particles = parser.get_records(100)
+        while particles:
+            count += len(particles)
+            particles = parser.get_records(100)
+    elapsed = time.time() - start_time
+    results.put((count, elapsed, start_rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkAdcpaParser(MiUnitTest):
+    """
+    Parse the test data replicated into a 2 MB and a 500 MB file, read in
+    and memory mapped, reporting throughput and peak RSS. Reading the 500 MB
+    file in isn't timed, it is quadratic in the file size.
+    """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        with open(AdcpaParserUnitTestCase.TEST_DATA, 'rb') as stream_handle:
+            self.data = stream_handle.read()
+
+    def _write(self, size):
+        path = os.path.join(self.directory, '%d.PD0' % size)
+        with open(path, 'wb') as stream_handle:
+            for i in range(size / len(self.data)):
+                stream_handle.write(self.data)
+        return path
+
+    def _benchmark(self, name, path, mmap_threshold):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_parse_file, args=(path, mmap_threshold, results))
+        process.start()
+        (count, elapsed, start_rss, peak_rss) = results.get()
+        process.join()
+        size = os.path.getsize(path)
+        log.info("%s: %.1f MB, %d particles in %.2fs, %.1f MB/s, peak RSS %d MB (%d MB over the starting %d MB)",
+                 name, size / 1e6, count, elapsed, size / elapsed / 1e6, peak_rss / 1024,
+                 (peak_rss - start_rss) / 1024, start_rss / 1024)
+
+    def test_small_file(self):
+        path = self._write(2000000)
+        self._benchmark('read', path, None)
+        self._benchmark('mapped', path, 0)
+
+    def test_large_file(self):
+        self._benchmark('mapped', self._write(500000000), 0)
@@ -228,6 +228,8 @@ class WfpFlortkDataParticle(WfpParticle):
 
 
 class WfpParser(BufferLoadingParser):
+    # set_state replaces the chunker buffer
+    mmap_threshold = None
 
     def __init__(self,
                  config,
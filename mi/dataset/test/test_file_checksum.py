@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_file_checksum
+@file mi/dataset/test/test_file_checksum.py
+@brief Test code for the block wise file checksums and their cache
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.dataset.file_checksum import md5_checksum, ChecksumCache
+
+
+@attr('UNIT', group='mi')
+class TestFileChecksum(MiUnitTest):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'data.txt')
+        self.data = ''.join(chr(i % 251) for i in range(100000))
+        self._write(self.data)
+        self.cache = ChecksumCache()
+
+    def _write(self, data, mtime=None):
+        with open(self.path, 'wb') as filehandle:
+            filehandle.write(data)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_md5_checksum(self):
+        expected = hashlib.md5(self.data).hexdigest()
+        self.assertEqual(md5_checksum(self.path), expected)
+        # blocks that don't divide the file evenly
+        self.assertEqual(md5_checksum(self.path, 4096), expected)
+        self.assertEqual(md5_checksum(self.path, 7), expected)
+
+        self._write('')
+        self.assertEqual(md5_checksum(self.path), hashlib.md5('').hexdigest())
+
+    def test_cache(self):
+        expected = hashlib.md5(self.data).hexdigest()
+        self.assertEqual(self.cache.checksum(self.path), expected)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+        # the same file by another path, and with a stat passed in
+        other_path = self.directory + '//' + 'data.txt'
+        self.assertEqual(self.cache.checksum(other_path, os.stat(other_path)), expected)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_changed_file(self):
+        mtime = time.time() - 100
+        self._write(self.data, mtime)
+        self.cache.checksum(self.path)
+
+        # same size and modification time, new inode
+        os.rename(self.path, self.path + '.old')
+        self._write(self.data[::-1], mtime)
+        self.assertEqual(self.cache.checksum(self.path), hashlib.md5(self.data[::-1]).hexdigest())
+
+        # same size and inode, new modification time
+        self._write(self.data, mtime + 1)
+        self.assertEqual(self.cache.checksum(self.path), hashlib.md5(self.data).hexdigest())
+
+        # new size
+        self._write(self.data[1:], mtime + 1)
+        self.assertEqual(self.cache.checksum(self.path), hashlib.md5(self.data[1:]).hexdigest())
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 4))
+
+    def test_discard(self):
+        self.cache.checksum(self.path)
+        self.cache.discard(self.path)
+        self.cache.checksum(self.path)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+
+    def test_max_entries(self):
+        cache = ChecksumCache(max_entries=2)
+        paths = []
+        for i in range(3):
+            paths.append(os.path.join(self.directory, 'data%d.txt' % i))
+            with open(paths[-1], 'wb') as filehandle:
+                filehandle.write(str(i))
+
+        cache.checksum(paths[0])
+        cache.checksum(paths[1])
+        # a hit makes the first the most recently used
+        cache.checksum(paths[0])
+        cache.checksum(paths[2])
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+        cache.checksum(paths[0])
+        cache.checksum(paths[2])
+        self.assertEqual((cache.hits, cache.misses), (3, 3))
+        cache.checksum(paths[1])
+        self.assertEqual((cache.hits, cache.misses), (3, 4))
+
+    def test_missing_file(self):
+        self.assertRaises(OSError, self.cache.checksum, os.path.join(self.directory, 'missing.txt'))
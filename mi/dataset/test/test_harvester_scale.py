@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_harvester_scale
+@file mi/dataset/test/test_harvester_scale.py
+@brief Test code for the harvester's file ordering and bookkeeping, and a
+    benchmark of polling a directory of 50000 files
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import random
+import shutil
+import tempfile
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.dataset.harvester import SingleDirectoryPoller
+from mi.dataset.dataset_driver import DriverStateKey, DataSetDriverConfigKeys
+
+
+class HarvesterTestCase(MiUnitTest):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _poller(self, memento):
+        config = {
+            DataSetDriverConfigKeys.DIRECTORY: self.directory,
+            DataSetDriverConfigKeys.PATTERN: '*.mrg',
+        }
+        return SingleDirectoryPoller(config, memento, None, file_mod_wait=0)
+
+    def _write(self, names):
+        mtime = time.time() - 60
+        for name in names:
+            path = os.path.join(self.directory, name)
+            open(path, 'w').close()
+            os.utime(path, (mtime, mtime))
+
+
+@attr('UNIT', group='mi')
+class TestHarvesterOrdering(HarvesterTestCase):
+    def test_sort_files(self):
+        expected = ['unit_363_2013_245_6_8.mrg', 'unit_363_2013_245_6_9.mrg', 'unit_363_2013_245_6_10.mrg',
+                    'unit_363_2013_245_7_0.mrg', 'unit_363_2013_245_7_10.mrg', 'unit_363_2013_246_0_0.mrg',
+                    'unit_363_2014_12_0_1.mrg']
+        shuffled = list(expected)
+        random.shuffle(shuffled)
+        poller = self._poller({})
+        self.assertEqual(poller.sort_files(shuffled), expected)
+        self.assertEqual(poller.sort_files(['a_1.mrg']), ['a_1.mrg'])
+
+    def test_files_sent_once(self):
+        names = ['unit_1_%d.mrg' % i for i in range(20)]
+        self._write(names)
+        memento = {}
+        poller = self._poller(memento)
+        (new_files, modified) = poller._check_for_files()
+        self.assertEqual(new_files, names)
+        self.assertFalse(modified)
+        self.assertEqual(memento[names[0]][DriverStateKey.INGESTED], False)
+
+        # not yet ingested, but already sent
+        self.assertEqual(poller._check_for_files(), ([], False))
+        self._write(['unit_1_20.mrg'])
+        self.assertEqual(poller._check_for_files(), (['unit_1_20.mrg'], False))
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkHarvesterScale(HarvesterTestCase):
+    """
+    Poll a directory of 50000 files, reporting the time taken by the first
+    poll, which sends every file, and the following ones
+    """
+    count = 50000
+
+    def test_poll(self):
+        self._write('unit_363_%d_%d.mrg' % (i / 100, i % 100) for i in range(self.count))
+        memento = {}
+        poller = self._poller(memento)
+
+        start_time = time.time()
+        (new_files, _) = poller._check_for_files()
+        first_poll = time.time() - start_time
+        self.assertEqual(len(new_files), self.count)
+
+        poll_times = []
+        for i in range(3):
+            start_time = time.time()
+            poller._check_for_files()
+            poll_times.append(time.time() - start_time)
+
+        start_time = time.time()
+        poller.sort_files(new_files[::-1])
+        sort_time = time.time() - start_time
+
+        log.info("%d files: first poll %.2fs, later polls %.2fs, sorting %.2fs",
+                 self.count, first_poll, sum(poll_times) / len(poll_times), sort_time)
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_inotify_harvester
+@file mi/dataset/test/test_inotify_harvester.py
+@brief Test code for the harvesters watching their directory with inotify,
+    and a benchmark comparing them to polling
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import shutil
+import tempfile
+from nose.plugins.attrib import attr
+from nose.plugins.skip import SkipTest
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.inotify import inotify_available
+from mi.dataset.harvester import SingleDirectoryHarvester, SingleFileHarvester, DirectoryWatcher
+from mi.dataset.dataset_driver import DriverStateKey, DataSetDriverConfigKeys
+
+
+class InotifyTestCase(MiUnitTest):
+    def setUp(self):
+        if not inotify_available():
+            raise SkipTest('inotify is not available')
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.found = []
+        self.exceptions = []
+
+    def _config(self, pattern, inotify=True):
+        return {
+            DataSetDriverConfigKeys.DIRECTORY: self.directory,
+            DataSetDriverConfigKeys.PATTERN: pattern,
+            DataSetDriverConfigKeys.FREQUENCY: 1,
+            DataSetDriverConfigKeys.FILE_MOD_WAIT_TIME: 30,
+            DataSetDriverConfigKeys.INOTIFY: inotify,
+            DataSetDriverConfigKeys.DEBOUNCE_TIME: .1,
+        }
+
+    def _write(self, name, data='data', mtime=None):
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as filehandle:
+            filehandle.write(data)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def _wait_for(self, count, timeout=5):
+        end_time = time.time() + timeout
+        while len(self.found) < count and time.time() < end_time:
+            time.sleep(.01)
+        self.assertEqual(len(self.found), count)
+
+    def _start(self, harvester):
+        harvester.start()
+        self.addCleanup(harvester.join)
+        self.addCleanup(harvester.shutdown)
+        return harvester
+
+
+@attr('UNIT', group='mi')
+class TestDirectoryWatcher(InotifyTestCase):
+    def test_ready(self):
+        watcher = DirectoryWatcher(self.directory, '*.txt', .1, 30)
+        self.addCleanup(watcher.close)
+
+        # files with no events wait for file_mod_wait after their modification
+        self.assertTrue(watcher.ready('old.txt', time.time() - 31))
+        self.assertFalse(watcher.ready('new.txt', time.time()))
+        self.assertEqual(watcher.due(), [])
+
+        # an open file waits for file_mod_wait, a closed one for the debounce time
+        filehandle = open(os.path.join(self.directory, 'a.txt'), 'wb')
+        filehandle.write('data')
+        filehandle.flush()
+        watcher.wait(.1)
+        self.assertFalse(watcher.ready('a.txt', time.time()))
+        filehandle.close()
+        watcher.wait(.1)
+        self.assertEqual(watcher.due(), [])
+        time.sleep(.1)
+        self.assertEqual(watcher.due(), ['a.txt'])
+        self.assertTrue(watcher.ready('a.txt', time.time()))
+        self.assertEqual(watcher.due(), [])
+
+        # files not matching the pattern are ignored, removed files forgotten
+        self._write('b.dat')
+        self._write('c.txt')
+        watcher.wait(.1)
+        os.remove(os.path.join(self.directory, 'c.txt'))
+        watcher.wait(.1)
+        time.sleep(.1)
+        self.assertEqual(watcher.due(), [])
+
+    def test_lost(self):
+        watcher = DirectoryWatcher(self.directory, '*.txt', .1, 30)
+        self.addCleanup(watcher.close)
+        self.assertFalse(watcher.lost)
+        os.rmdir(self.directory)
+        watcher.wait(1)
+        self.assertTrue(watcher.lost)
+        os.mkdir(self.directory)
+
+    def test_wake(self):
+        watcher = DirectoryWatcher(self.directory, '*.txt', .1, 30)
+        self.addCleanup(watcher.close)
+        watcher.wake()
+        start_time = time.time()
+        watcher.wait(5)
+        self.assertLess(time.time() - start_time, 1)
+        watcher.close()
+        # waking a closed watcher does nothing
+        watcher.wake()
+
+    def test_not_a_directory(self):
+        path = self._write('file.txt')
+        self.assertRaises(OSError, DirectoryWatcher, path, '*.txt', .1, 30)
+
+
+@attr('UNIT', group='mi')
+class TestInotifyHarvester(InotifyTestCase):
+    def test_directory_harvester(self):
+        self._write('a_1.txt', mtime=time.time() - 60)
+        self._write('a_10.txt', mtime=time.time() - 60)
+        memento = {}
+        harvester = self._start(SingleDirectoryHarvester(self._config('*.txt'), memento, self.found.append,
+                                                         lambda: None, self.exceptions.append))
+        self._wait_for(2)
+        self.assertEqual(self.found, ['a_1.txt', 'a_10.txt'])
+
+        # a new file is found once closed rather than after file_mod_wait
+        self._write('a_2.txt')
+        self._write('b.dat')
+        self._wait_for(3, 2)
+        self.assertEqual(self.found[2], 'a_2.txt')
+        self.assertEqual(memento['a_2.txt'][DriverStateKey.INGESTED], False)
+        self.assertEqual(memento['a_2.txt'][DriverStateKey.FILE_SIZE], 4)
+        self.assertTrue(harvester._watcher)
+        self.assertEqual(self.exceptions, [])
+
+    def test_file_harvester(self):
+        harvester = self._start(SingleFileHarvester(self._config('file.txt'), {}, self.found.append,
+                                                    self.exceptions.append))
+        self._write('file.txt', 'first')
+        self._wait_for(1, 2)
+        self.assertEqual(self.found[0][DriverStateKey.FILE_SIZE], 5)
+
+        self._write('file.txt', 'second')
+        self._wait_for(2, 2)
+        self.assertEqual(self.found[1][DriverStateKey.FILE_SIZE], 6)
+        self.assertTrue(harvester._watcher)
+
+    def test_fallback(self):
+        """
+        Harvesters poll when the directory can't be watched, or stops being watched
+        """
+        harvester = SingleDirectoryHarvester(self._config('*.txt', inotify=False), {}, self.found.append,
+                                             lambda: None, self.exceptions.append)
+        self.assertEqual(harvester._watcher, None)
+
+        self._write('a.txt', mtime=time.time() - 60)
+        harvester = self._start(SingleDirectoryHarvester(self._config('*.txt'), {}, self.found.append,
+                                                         lambda: None, self.exceptions.append))
+        self._wait_for(1)
+        harvester._watcher.lost = True
+        self._write('b.txt', mtime=time.time() - 60)
+        self._wait_for(2)
+        self.assertEqual(harvester._watcher, None)
+
+    def test_shutdown(self):
+        """
+        Shutdown ends a harvester waiting on its directory without waiting out the interval
+        """
+        config = self._config('*.txt')
+        config[DataSetDriverConfigKeys.FREQUENCY] = 30
+        harvester = SingleDirectoryHarvester(config, {}, self.found.append, lambda: None, self.exceptions.append)
+        harvester.start()
+        self.addCleanup(harvester.join)
+        self.addCleanup(harvester.shutdown)
+        time.sleep(.1)
+
+        start_time = time.time()
+        harvester.shutdown()
+        harvester.join(5)
+        self.assertFalse(harvester.is_alive())
+        self.assertLess(time.time() - start_time, 1)
+
+    def test_bad_debounce_time(self):
+        config = self._config('*.txt')
+        config[DataSetDriverConfigKeys.DEBOUNCE_TIME] = -1
+        self.assertRaises(TypeError, SingleDirectoryHarvester, config, {}, None, None, None)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkInotifyHarvester(InotifyTestCase):
+    """
+    Harvest a directory of 10000 files polling and with inotify, measuring the
+    CPU used while nothing changes and the time taken to find a new file
+    """
+    count = 10000
+    idle_time = 10
+
+    def _benchmark(self, name, config):
+        for i in range(self.count):
+            self._write('file_%d.txt' % i, mtime=time.time() - 60)
+        memento = {}
+        harvester = self._start(SingleDirectoryHarvester(config, memento, self.found.append,
+                                                         lambda: None, self.exceptions.append))
+        self._wait_for(self.count, 120)
+        # mark them ingested, as the driver would
+        for state in memento.itervalues():
+            state[DriverStateKey.INGESTED] = True
+
+        start_cpu = sum(os.times()[:2])
+        time.sleep(self.idle_time)
+        idle_cpu = (sum(os.times()[:2]) - start_cpu) / self.idle_time
+
+        latencies = []
+        for i in range(5):
+            start_time = time.time()
+            self._write('new_%d.txt' % i)
+            self._wait_for(self.count + i + 1, 10)
+            latencies.append(time.time() - start_time)
+            time.sleep(.5)
+        log.info("%s: idle CPU %.1f%% with %d files, new file found in %.2fs on average (%.2fs-%.2fs)",
+                 name, idle_cpu * 100, self.count, sum(latencies) / len(latencies), min(latencies),
+                 max(latencies))
+
+    def test_polling(self):
+        config = self._config('*.txt', inotify=False)
+        # the shortest polling can wait for writes to finish
+        config[DataSetDriverConfigKeys.FILE_MOD_WAIT_TIME] = 0
+        self._benchmark('polling', config)
+
+    def test_inotify(self):
+        self._benchmark('inotify', self._config('*.txt'))
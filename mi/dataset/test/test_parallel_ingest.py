@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+@package mi.dataset.test.test_parallel_ingest
+@file mi/dataset/test/test_parallel_ingest.py
+@brief Test code for SimpleDataSetDriver parsing files in parallel, using the
+    glider engineering driver, and a benchmark of ingesting its test data
+    replicated 100 times
+"""
+
+__license__ = 'Apache 2.0'
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+from mock import patch
+from nose.plugins.attrib import attr
+
+from mi.core.log import get_logger ; log = get_logger()
+from mi.core.unit_test import MiUnitTest
+from mi.core.exceptions import ConfigurationException
+from mi.dataset.dataset_driver import DataSourceConfigKey, DataSetDriverConfigKeys, DriverParameter
+from mi.dataset.dataset_driver import DriverStateKey, ParallelMode
+from mi.dataset.file_checksum import checksum_cache
+from mi.dataset.driver.moas.gl.engineering.driver import EngDataSetDriver
+
+RESOURCE_DIR = 'mi/dataset/driver/moas/gl/engineering/resource'
+TEST_FILES = ['single_eng_record.mrg', 'unit_363_2013_245_6_6.mrg', 'multiple_eng_record.mrg']
+
+
+class ParallelIngestTestCase(MiUnitTest):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def _copy_files(self, copies=1):
+        """
+        @retval the names of the test files copied in
+        """
+        names = []
+        for i in range(copies):
+            for name in TEST_FILES:
+                copy_name = 'unit_%d_%s' % (i, name)
+                shutil.copy(os.path.join(RESOURCE_DIR, name), os.path.join(self.directory, copy_name))
+                names.append(copy_name)
+        return names
+
+    def _driver(self, max_parallel_files=1, parallel_mode=ParallelMode.THREAD, parse_timeout=60):
+        config = {
+            DataSourceConfigKey.HARVESTER: {
+                DataSetDriverConfigKeys.DIRECTORY: self.directory,
+                DataSetDriverConfigKeys.PATTERN: '*.mrg',
+                DataSetDriverConfigKeys.MAX_PARALLEL_FILES: max_parallel_files,
+                DataSetDriverConfigKeys.PARALLEL_MODE: parallel_mode,
+                DataSetDriverConfigKeys.PARSE_TIMEOUT: parse_timeout,
+            },
+            DataSourceConfigKey.PARSER: {},
+            DataSourceConfigKey.DRIVER: {
+                DriverParameter.RECORDS_PER_SECOND: 1000000,
+                DriverParameter.BATCHED_PARTICLE_COUNT: 10,
+            },
+        }
+        self.particles = []
+        self.states = []
+        self.events = []
+        self.exceptions = []
+        driver = EngDataSetDriver(config, {}, self.particles.extend, self.states.append,
+                                  lambda **kwargs: self.events.append(kwargs), self.exceptions.append)
+        self.addCleanup(driver.shutdown)
+        return driver
+
+    def _ingest(self, driver, names, timeout=60):
+        """
+        Queue files as the harvester would, and poll until they are ingested
+        """
+        for name in names:
+            driver._driver_state[name] = {
+                DriverStateKey.FILE_SIZE: os.path.getsize(os.path.join(self.directory, name)),
+                DriverStateKey.INGESTED: False,
+                DriverStateKey.PARSER_STATE: None,
+            }
+            driver._new_file_callback(name)
+
+        end_time = time.time() + timeout
+        while not all(driver._driver_state[name][DriverStateKey.INGESTED] for name in names):
+            self.assertLess(time.time(), end_time)
+            driver._poll()
+            time.sleep(.001)
+
+
+@attr('UNIT', group='mi')
+class TestParallelIngest(ParallelIngestTestCase):
+    def _results(self, driver):
+        names = self._copy_files()
+        self._ingest(driver, names)
+        self.assertEqual(self.exceptions, [])
+        # compare reprs, the raw data has NaNs
+        particles = [(type(particle), repr(sorted(particle.raw_data.items()))) for particle in self.particles]
+        events = [event['stats']['name'] for event in self.events]
+        parser_states = [driver._driver_state[name][DriverStateKey.PARSER_STATE] for name in names]
+        return (particles, events, parser_states)
+
+    def test_same_as_sequential(self):
+        """
+        Files parsed in parallel publish the same particles, events and states, in the
+        same order, as files parsed one at a time
+        """
+        expected = self._results(self._driver())
+        self.assertTrue(expected[0])
+        self.assertEqual(self._results(self._driver(3, ParallelMode.THREAD)), expected)
+        self.assertEqual(self._results(self._driver(2, ParallelMode.PROCESS)), expected)
+
+    def test_parse_timeout(self):
+        """
+        Files a worker does not parse in time are parsed by the driver, and published in the
+        same order
+        """
+        expected = self._results(self._driver())
+
+        driver = self._driver(2, parse_timeout=.1)
+        hung = threading.Event()
+        # release the workers before the driver shuts the pool down
+        self.addCleanup(hung.set)
+        with patch('mi.dataset.dataset_driver._parse_file', lambda *args: hung.wait(30)):
+            self.assertEqual(self._results(driver), expected)
+
+    def test_stop_sampling(self):
+        driver = self._driver(2)
+        names = self._copy_files()
+        for name in names:
+            driver._driver_state[name] = {DriverStateKey.INGESTED: False, DriverStateKey.PARSER_STATE: None}
+            driver._new_file_callback(name)
+        driver._start_parsing()
+        self.assertEqual(len(driver._parsing_files), 2)
+        self.assertEqual(len(driver._new_file_queue), 1)
+
+        driver.stop_sampling()
+        self.assertEqual(len(driver._parsing_files), 0)
+
+    def test_checksums_discarded(self):
+        """
+        The checksums of ingested files are not kept cached
+        """
+        names = self._copy_files()
+        self._ingest(self._driver(2), names)
+        misses = checksum_cache.misses
+        for name in names:
+            checksum_cache.checksum(os.path.join(self.directory, name))
+        self.assertEqual(checksum_cache.misses, misses + len(names))
+
+    def test_config(self):
+        self.assertRaises(ConfigurationException, self._driver, 0)
+        self.assertRaises(ConfigurationException, self._driver, '2')
+        self.assertRaises(ConfigurationException, self._driver, 2, 'fork')
+        self.assertRaises(ConfigurationException, self._driver, 2, ParallelMode.THREAD, 0)
+
+
+@attr('BENCHMARK', group='mi')
+class BenchmarkParallelIngest(ParallelIngestTestCase):
+    """
+    Ingest the glider engineering test data replicated 100 times, one file at
+    a time and four at a time in threads and processes
+    """
+    copies = 100
+
+    def _benchmark(self, name, driver):
+        names = self._copy_files(self.copies)
+        start_time = time.time()
+        self._ingest(driver, names, 600)
+        elapsed = time.time() - start_time
+        log.info("%s: %d files, %d particles in %.2fs, %.0f particles/s", name, len(names),
+                 len(self.particles), elapsed, len(self.particles) / elapsed)
+
+    def test_sequential(self):
+        self._benchmark('sequential', self._driver())
+
+    def test_threads(self):
+        self._benchmark('4 threads', self._driver(4, ParallelMode.THREAD))
+
+    def test_processes(self):
+        self._benchmark('4 processes', self._driver(4, ParallelMode.PROCESS))
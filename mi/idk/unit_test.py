@@ -86,6 +86,7 @@ from mi.core.instrument.instrument_driver import DriverEvent
 from mi.core.instrument.instrument_driver import DriverConnectionState
 from mi.core.instrument.instrument_driver import DriverProtocolState
 from mi.core.instrument.instrument_driver import DriverAsyncEvent
+from mi.core.instrument.instrument_driver import unpack_sample_batch
 from mi.core.tcp_client import TcpClient
 from mi.core.common import BaseEnum
 from mi.core.driver_scheduler import DriverSchedulerConfigKey
@@ -1211,11 +1212,12 @@ class InstrumentDriverUnitTestCase(InstrumentDriverTestCase):
         Event call back method sent to the driver.  It simply grabs a sample event and pushes it
         into the data particle queue
         """
-        event_type = event['type']
-        if event_type == DriverAsyncEvent.SAMPLE:
-            sample_value = event['value']
-            particle_dict = json.loads(sample_value)
-            self._data_particle_received.append(sample_value)
+        for sample_event in unpack_sample_batch(event):
+            event_type = sample_event['type']
+            if event_type == DriverAsyncEvent.SAMPLE:
+                sample_value = sample_event['value']
+                particle_dict = json.loads(sample_value)
+                self._data_particle_received.append(sample_value)
 
     def compare_parsed_data_particle(self, particle_type, raw_input, happy_structure):
         """
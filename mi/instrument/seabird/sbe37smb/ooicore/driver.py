@@ -36,6 +36,7 @@ from mi.core.instrument.instrument_driver import ResourceAgentEvent
 from mi.core.instrument.data_particle import DataParticle, DataParticleKey, CommonDataParticleType
 from mi.core.instrument.driver_dict import DriverDictKey
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import CombinedRegexSieve
 from mi.core.exceptions import InstrumentTimeoutException
 from mi.core.exceptions import InstrumentParameterException
 from mi.core.exceptions import SampleException
@@ -192,6 +193,12 @@ STATUS_DATA_REGEX_MATCHER = re.compile(STATUS_DATA_REGEX, re.DOTALL)
 CALIBRATION_DATA_REGEX = r"(SBE37-SM.*?RTCA2 = -?[\d\.e\-\+]+)"
 CALIBRATION_DATA_REGEX_MATCHER = re.compile(CALIBRATION_DATA_REGEX, re.DOTALL)
 
+# Single pass sieve over all chunk patterns, tagged with the particle type
+SIEVE_MATCHER = CombinedRegexSieve([
+    (DataParticleType.PARSED, SAMPLE_PATTERN_MATCHER),
+    (DataParticleType.DEVICE_STATUS, STATUS_DATA_REGEX_MATCHER),
+    (DataParticleType.DEVICE_CALIBRATION, CALIBRATION_DATA_REGEX_MATCHER)])
+
   
 ###############################################################################
 # Seabird Electronics 37-SMP MicroCAT Driver.
@@ -254,7 +261,11 @@ class SBE37DataParticle(DataParticle):
     """
     _data_particle_type = DataParticleType.PARSED
 
-    def _build_parsed_values(self):
+    _value_ids = (SBE37DataParticleKey.TEMP,
+                  SBE37DataParticleKey.CONDUCTIVITY,
+                  SBE37DataParticleKey.DEPTH)
+
+    def _build_parsed_tuple(self):
         """
         Take something in the autosample/TS format and split it into
         C, T, and D values (with appropriate tags)
@@ -276,14 +287,7 @@ class SBE37DataParticle(DataParticle):
                                   self.raw_data)
         
         #TODO:  Get 'temp', 'cond', and 'depth' from a paramdict
-        result = [{DataParticleKey.VALUE_ID: SBE37DataParticleKey.TEMP,
-                   DataParticleKey.VALUE: temperature},
-                  {DataParticleKey.VALUE_ID: SBE37DataParticleKey.CONDUCTIVITY,
-                   DataParticleKey.VALUE: conductivity},
-                  {DataParticleKey.VALUE_ID: SBE37DataParticleKey.DEPTH,
-                    DataParticleKey.VALUE: depth}]
-        
-        return result
+        return (self._value_ids, (temperature, conductivity, depth))
 
 ##
 ## BEFORE ADDITION
@@ -762,17 +766,7 @@ class SBE37Protocol(CommandResponseInstrumentProtocol):
         Chunker sieve method to help the chunker identify chunks.
         @returns a list of chunks identified, if any.  The chunks are all the same type.
         """
-        sieve_matchers = [SAMPLE_PATTERN_MATCHER,
-                          STATUS_DATA_REGEX_MATCHER,
-                          CALIBRATION_DATA_REGEX_MATCHER]
-
-        return_list = []
-
-        for matcher in sieve_matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-
-        return return_list
+        return SIEVE_MATCHER(raw_data)
     def _filter_capabilities(self, events):
         """
         """ 
@@ -1507,9 +1501,14 @@ class SBE37Protocol(CommandResponseInstrumentProtocol):
         #if self.get_current_state() == SBE37ProtocolState.AUTOSAMPLE:
         #    self._extract_sample(SBE37DataParticle, SAMPLE_PATTERN_MATCHER, chunk)
         
-        result = self._extract_sample(SBE37DataParticle, SAMPLE_PATTERN_MATCHER, chunk, timestamp)
-        result = self._extract_sample(SBE37DeviceStatusParticle, STATUS_DATA_REGEX_MATCHER, chunk, timestamp)
-        result = self._extract_sample(SBE37DeviceCalibrationParticle, CALIBRATION_DATA_REGEX_MATCHER, chunk, timestamp)
+        particle_type = SIEVE_MATCHER.classify(chunk)
+
+        if particle_type == DataParticleType.PARSED:
+            self._extract_sample(SBE37DataParticle, SAMPLE_PATTERN_MATCHER, chunk, timestamp)
+        elif particle_type == DataParticleType.DEVICE_STATUS:
+            self._extract_sample(SBE37DeviceStatusParticle, STATUS_DATA_REGEX_MATCHER, chunk, timestamp)
+        elif particle_type == DataParticleType.DEVICE_CALIBRATION:
+            self._extract_sample(SBE37DeviceCalibrationParticle, CALIBRATION_DATA_REGEX_MATCHER, chunk, timestamp)
 
     def _build_driver_dict(self):
         """
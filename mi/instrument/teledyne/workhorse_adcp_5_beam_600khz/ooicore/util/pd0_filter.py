@@ -14,15 +14,10 @@ __license__ = 'Apache 2.0'
 from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.pd0 import PD0DataStructure
 from mi.instrument.teledyne.workhorse_adcp_5_beam_600khz.ooicore.util.coroutine import coroutine
 
+from mi.core.instrument.chunker import PD0Framer
 from mi.core.mi_logger import mi_logger as log
 
 
-# Some min data size to try to construct a structure and extract
-# the actual length of the ensemble. The number 30 seems enough
-# according to various runs.
-MIN_LENGTH_TRY_ENSEMBLE = 30
-
-
 @coroutine
 def pd0_filter(receiver):
     """
@@ -46,72 +41,35 @@ def pd0_filter(receiver):
 
     data = ''  # never None
 
-    # the length of the current ensemble. Initialized with a
-    # small number (but enough to extract the actual len):
-    ensemble_len = MIN_LENGTH_TRY_ENSEMBLE
+    # ensembles are walked by their length field and checked against
+    # their checksum, so the stream is only scanned for the 0x7f7f marker
+    # instead of being examined a byte at a time:
+    framer = PD0Framer()
 
     while True:
         xelems, buffer = (yield)
 
-#        for rcv in buffer:
-        while buffer:
-            idx = buffer.find('\x7f')
-            if idx < 0:
-                if len(data) == 0:
-                    xelems['pd0'] = None
-                    receiver.send((xelems, buffer))
-                    break  # ie., go receive more.
-
-            elif idx > 0:
-                if len(data) == 0:
-                    xelems['pd0'] = None
-                    receiver.send((xelems, buffer[0:idx]))
-                    buffer = buffer[idx:]
-
-            rcv = buffer[0]
-            buffer = buffer[1:]
-            if rcv == '\x7f':
-                if len(data) == 0:
-                    log.debug("RECEIVING DATA **")
-
-            elif len(data) == 0:
+        if not buffer:
+            continue
+
+        data += buffer
+        framer.reset()
+        position = 0
+        for start, end in framer.feed(data, 0):
+            if start > position:
                 xelems['pd0'] = None
-                receiver.send((xelems, rcv))
-                continue
-
-            data += rcv
-
-            if len(data) < ensemble_len:
-                continue
-
-            # if ensemble_len is our small number, it will still allow us
-            # to "try" a structure and retrieve the actual ensemble length:
-            #
-            try:
-                pd0 = PD0DataStructure(data)
-                ensemble_len = pd0.getNumberOfBytesInEnsemble()
-            except Exception:
-                #
-                # ok, we are not yet seeing the beginning of a structure, just
-                # shift the data array a position and continue
-                # receiving:
-                #
-                data = data[1:]
-                continue
-
-            if len(data) < ensemble_len:
-                #
-                # we don't yet have enough of the ensemble, just continue
-                # receiving:
-                #
-                continue
-
-            # we have our complete ensemble:
-            ensemble = data[:ensemble_len]
-            pd0 = PD0DataStructure(ensemble)
-            xelems['pd0'] = pd0
+                receiver.send((xelems, data[position:start]))
+
+            log.debug("RECEIVED ENSEMBLE of %d bytes", end - start)
+            xelems['pd0'] = PD0DataStructure(data[start:end])
             receiver.send((xelems, None))
+            position = end
 
-            data = data[ensemble_len:]
+        # everything before the resume index that was not framed cannot
+        # be part of an ensemble; keep the rest until more data arrives:
+        resume = max(position, framer.resume_index)
+        if resume > position:
+            xelems['pd0'] = None
+            receiver.send((xelems, data[position:resume]))
 
-            ensemble_len = MIN_LENGTH_TRY_ENSEMBLE
+        data = data[resume:]
@@ -19,6 +19,7 @@ from mi.instrument.teledyne.driver import TIMEOUT
 from mi.core.instrument.data_particle import DataParticle
 from mi.core.instrument.data_particle import DataParticleKey
 from mi.core.instrument.data_particle import CommonDataParticleType
+from mi.core.instrument import pd0_decoder
 
 
 from mi.core.exceptions import SampleException
@@ -213,11 +214,7 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
         #
         # Calculate Checksum
         #
-        total = int(0)
-        for i in range(0, length):
-            total += int(ord(data[i]))
-
-        checksum = total & 65535    # bitwise and with 65535 or mod vs 65536
+        checksum = pd0_decoder.checksum(data, 0, length)
 
         if checksum != unpack("H", self.raw_data[length: length+2])[0]:
             log.debug("Checksum mismatch "+ str(checksum) + "!= " + str(unpack("H", self.raw_data[length: length+2])[0]))
@@ -554,7 +551,6 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
         @throws SampleException If there is a problem with sample creation
         """
         N = (len(chunk) - 2) / 2 /4
-        offset = 0
 
         velocity_data_id = unpack("!H", chunk[0:2])[0]
         if 1 != velocity_data_id:
@@ -564,17 +560,8 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
 
         if 0 == self.coord_transform_type: # BEAM Coordinates
             self._data_particle_type = DataParticleType.ADCP_PD0_PARSED_BEAM
-            beam_1_velocity = []
-            beam_2_velocity = []
-            beam_3_velocity = []
-            beam_4_velocity = []
-            for row in range (1, N):
-                (a,b,c,d) = unpack('!HHHH', chunk[offset + 2: offset + 10])
-                beam_1_velocity.append(a)
-                beam_2_velocity.append(b)
-                beam_3_velocity.append(c)
-                beam_4_velocity.append(d)
-                offset += 4 * 2
+            (beam_1_velocity, beam_2_velocity,
+             beam_3_velocity, beam_4_velocity) = pd0_decoder.beam_values(chunk, '>u2', N - 1)
             self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.BEAM_1_VELOCITY,
                                       DataParticleKey.VALUE: beam_1_velocity})
             self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.BEAM_2_VELOCITY,
@@ -585,17 +572,8 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
                                       DataParticleKey.VALUE: beam_4_velocity})
         elif 3 == self.coord_transform_type: # Earth Coordinates
             self._data_particle_type = DataParticleType.ADCP_PD0_PARSED_EARTH
-            water_velocity_east = []
-            water_velocity_north = []
-            water_velocity_up = []
-            error_velocity = []
-            for row in range (1, N):
-                (a,b,c,d) = unpack('!HHHH', chunk[offset + 2: offset + 10])
-                water_velocity_east.append(a)
-                water_velocity_north.append(b)
-                water_velocity_up.append(c)
-                error_velocity.append(d)
-                offset += 4 * 2
+            (water_velocity_east, water_velocity_north,
+             water_velocity_up, error_velocity) = pd0_decoder.beam_values(chunk, '>u2', N - 1)
             self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.WATER_VELOCITY_EAST,
                                       DataParticleKey.VALUE: water_velocity_east})
             self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.WATER_VELOCITY_NORTH,
@@ -615,7 +593,6 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
         @throws SampleException If there is a problem with sample creation
         """
         N = (len(chunk) - 2) / 2 /4
-        offset = 0
 
         correlation_magnitude_id = unpack("!H", chunk[0:2])[0]
         if 2 != correlation_magnitude_id:
@@ -623,17 +600,8 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.CORRELATION_MAGNITUDE_ID,
                                       DataParticleKey.VALUE: correlation_magnitude_id})
 
-        correlation_magnitude_beam1 = []
-        correlation_magnitude_beam2 = []
-        correlation_magnitude_beam3 = []
-        correlation_magnitude_beam4 = []
-        for row in range (1, N):
-            (a, b, c, d) = unpack('!HHHH', chunk[offset + 2: offset + 10])
-            correlation_magnitude_beam1.append(a)
-            correlation_magnitude_beam2.append(b)
-            correlation_magnitude_beam3.append(c)
-            correlation_magnitude_beam4.append(d)
-            offset += 4 * 2
+        (correlation_magnitude_beam1, correlation_magnitude_beam2,
+         correlation_magnitude_beam3, correlation_magnitude_beam4) = pd0_decoder.beam_values(chunk, '>u2', N - 1)
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.CORRELATION_MAGNITUDE_BEAM1,
                                   DataParticleKey.VALUE: correlation_magnitude_beam1})
@@ -651,7 +619,6 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
         @throws SampleException If there is a problem with sample creation
         """
         N = (len(chunk) - 2) / 2 /4
-        offset = 0
 
         echo_intensity_id = unpack("!H", chunk[0:2])[0]
         if 3 != echo_intensity_id:
@@ -659,17 +626,8 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
         self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.ECHO_INTENSITY_ID,
                                       DataParticleKey.VALUE: echo_intensity_id})
 
-        echo_intesity_beam1 = []
-        echo_intesity_beam2 = []
-        echo_intesity_beam3 = []
-        echo_intesity_beam4 = []
-        for row in range (1, N):
-            (a, b, c, d) = unpack('!HHHH', chunk[offset + 2: offset + 10])
-            echo_intesity_beam1.append(a)
-            echo_intesity_beam2.append(b)
-            echo_intesity_beam3.append(c)
-            echo_intesity_beam4.append(d)
-            offset += 4 * 2
+        (echo_intesity_beam1, echo_intesity_beam2,
+         echo_intesity_beam3, echo_intesity_beam4) = pd0_decoder.beam_values(chunk, '>u2', N - 1)
 
         self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.ECHO_INTENSITY_BEAM1,
                                   DataParticleKey.VALUE: echo_intesity_beam1})
@@ -688,7 +646,6 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
         """
 
         N = (len(chunk) - 2) / 2 /4
-        offset = 0
 
         # coord_transform_type
         # Coordinate Transformation type:
@@ -703,17 +660,8 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
         if 0 == self.coord_transform_type: # BEAM Coordinates
 
             self._data_particle_type = DataParticleType.ADCP_PD0_PARSED_BEAM
-            percent_good_beam1 = []
-            percent_good_beam2 = []
-            percent_good_beam3 = []
-            percent_good_beam4 = []
-            for row in range (1, N):
-                (a,b,c,d) = unpack('!HHHH', chunk[offset + 2: offset + 10])
-                percent_good_beam1.append(a)
-                percent_good_beam2.append(b)
-                percent_good_beam3.append(c)
-                percent_good_beam4.append(d)
-                offset += 4 * 2
+            (percent_good_beam1, percent_good_beam2,
+             percent_good_beam3, percent_good_beam4) = pd0_decoder.beam_values(chunk, '>u2', N - 1)
             self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.PERCENT_GOOD_BEAM1,
                                       DataParticleKey.VALUE: percent_good_beam1})
             self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.PERCENT_GOOD_BEAM2,
@@ -724,17 +672,8 @@ class ADCP_PD0_PARSED_DataParticle(DataParticle):
                                       DataParticleKey.VALUE: percent_good_beam4})
         elif 3 == self.coord_transform_type: # Earth Coordinates
             self._data_particle_type = DataParticleType.ADCP_PD0_PARSED_EARTH
-            percent_good_3beam = []
-            percent_transforms_reject = []
-            percent_bad_beams = []
-            percent_good_4beam = []
-            for row in range (1, N):
-                (a,b,c,d) = unpack('!HHHH', chunk[offset + 2: offset + 10])
-                percent_good_3beam.append(a)
-                percent_transforms_reject.append(b)
-                percent_bad_beams.append(c)
-                percent_good_4beam.append(d)
-                offset += 4 * 2
+            (percent_good_3beam, percent_transforms_reject,
+             percent_bad_beams, percent_good_4beam) = pd0_decoder.beam_values(chunk, '>u2', N - 1)
             self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.PERCENT_GOOD_3BEAM,
                                       DataParticleKey.VALUE: percent_good_3beam})
             self.final_result.append({DataParticleKey.VALUE_ID: ADCP_PD0_PARSED_KEY.PERCENT_TRANSFORMS_REJECT,
@@ -28,6 +28,7 @@ from mi.core.instrument.instrument_driver import DriverAsyncEvent
 from mi.instrument.teledyne.workhorse_monitor_300_khz.particles import *
 
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import PD0Framer
 
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.instrument.protocol_param_dict import ParameterDictType
@@ -113,6 +114,10 @@ class WorkhorseInstrumentDriver(TeledyneInstrumentDriver):
 # Protocol
 ###########################################################################
 
+# Stateless framer shared by every protocol instance
+PD0_FRAMER = PD0Framer()
+
+
 class WorkhorseProtocol(TeledyneProtocol):
     """
     Instrument protocol class
@@ -136,24 +141,14 @@ class WorkhorseProtocol(TeledyneProtocol):
         for matcher in sieve_matchers:
             if matcher == ADCP_PD0_PARSED_REGEX_MATCHER:
                 #
-                # Have to cope with variable length binary records...
-                # lets grab the length, then write a proper query to
-                # snag it.
+                # Variable length binary records are walked by their
+                # length field rather than matched with a regex.
                 #
-                matcher2 = re.compile(r'\x7f\x7f(..)', re.DOTALL)
-                for match in matcher2.finditer(raw_data):
-                    l = unpack("H", match.group(1))
-                    outer_pos = match.start()
-                    ADCP_PD0_PARSED_TRUE_MATCHER = re.compile(r'\x7f\x7f(.{' + str(l[0]) + '})', re.DOTALL)
-                    for match in ADCP_PD0_PARSED_TRUE_MATCHER.finditer(raw_data, outer_pos):
-                        inner_pos = match.start()
-
-                        if (outer_pos == inner_pos):
-                            return_list.append((match.start(), match.end()))
+                return_list.extend(PD0_FRAMER(raw_data))
             else:
                 for match in matcher.finditer(raw_data):
                     return_list.append((match.start(), match.end()))
-                    
+
         return return_list
 
     def __init__(self, prompts, newline, driver_event):
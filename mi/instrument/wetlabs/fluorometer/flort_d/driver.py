@@ -33,6 +33,7 @@ from mi.core.instrument.data_particle import DataParticleKey
 from mi.core.instrument.data_particle import CommonDataParticleType
 
 from mi.core.instrument.chunker import StringChunker
+from mi.core.instrument.chunker import CombinedRegexSieve
 
 from mi.core.instrument.protocol_param_dict import ParameterDictVisibility
 from mi.core.instrument.protocol_param_dict import ParameterDictType
@@ -201,6 +202,14 @@ DUMP_MEMORY_REGEX_MATCHER = re.compile(DUMP_MEMORY_REGEX, re.DOTALL)
 SAMPLE_REGEX = r"([0-1][0-9]/[0-3][0-9]/[0-1][0-9]\t[0-1][0-9]:[0-5][0-9]:[0-5][0-9](\t[0-9]{1,10}){7}\n)"
 SAMPLE_REGEX_MATCHER = re.compile(SAMPLE_REGEX, re.DOTALL)
 
+# Single pass sieve over all chunk patterns, tagged with the particle type
+SIEVE_MATCHER = CombinedRegexSieve([
+    (DataParticleType.FlortD_MNU, MNU_REGEX_MATCHER),
+    (DataParticleType.FlortD_RUN, RUN_REGEX_MATCHER),
+    (DataParticleType.FlortD_MET, MET_REGEX_MATCHER),
+    (DataParticleType.FlortD_DUMP_MEMORY, DUMP_MEMORY_REGEX_MATCHER),
+    (DataParticleType.FlortD_SAMPLE, SAMPLE_REGEX_MATCHER)])
+
 
 class FlortDMNU_ParticleKey(BaseEnum):
     Serial_number = "serial_number"
@@ -925,19 +934,7 @@ class Protocol(CommandResponseInstrumentProtocol):
         The method that splits samples
         """
 
-        return_list = []
-
-        sieve_matchers = [ MNU_REGEX_MATCHER,
-                           RUN_REGEX_MATCHER,
-                           MET_REGEX_MATCHER,
-                           DUMP_MEMORY_REGEX_MATCHER,
-                           SAMPLE_REGEX_MATCHER ]
-
-        for matcher in sieve_matchers:
-            for match in matcher.finditer(raw_data):
-                return_list.append((match.start(), match.end()))
-
-        return return_list
+        return SIEVE_MATCHER(raw_data)
 
     def _filter_capabilities(self, events):
         """
@@ -1815,11 +1812,18 @@ class Protocol(CommandResponseInstrumentProtocol):
         The base class got_data has gotten a chunk from the chunker.  Pass it to extract_sample
         with the appropriate particle objects and REGEXes.
         """
-        if(self._extract_sample(FlortDMNU_Particle, MNU_REGEX_MATCHER, chunk, timestamp)) : return
-        if(self._extract_sample(FlortDMET_Particle, MET_REGEX_MATCHER, chunk, timestamp)) : return
-        if(self._extract_sample(FlortDRUN_Particle, RUN_REGEX_MATCHER, chunk, timestamp)) : return
-        if(self._extract_sample(FlortDDUMP_MEMORY_Particle, DUMP_MEMORY_REGEX_MATCHER, chunk, timestamp)) : return
-        if(self._extract_sample(FlortDSample_Particle, SAMPLE_REGEX_MATCHER, chunk, timestamp)) : return
+        particle_type = SIEVE_MATCHER.classify(chunk)
+
+        if particle_type == DataParticleType.FlortD_MNU:
+            self._extract_sample(FlortDMNU_Particle, MNU_REGEX_MATCHER, chunk, timestamp)
+        elif particle_type == DataParticleType.FlortD_MET:
+            self._extract_sample(FlortDMET_Particle, MET_REGEX_MATCHER, chunk, timestamp)
+        elif particle_type == DataParticleType.FlortD_RUN:
+            self._extract_sample(FlortDRUN_Particle, RUN_REGEX_MATCHER, chunk, timestamp)
+        elif particle_type == DataParticleType.FlortD_DUMP_MEMORY:
+            self._extract_sample(FlortDDUMP_MEMORY_Particle, DUMP_MEMORY_REGEX_MATCHER, chunk, timestamp)
+        elif particle_type == DataParticleType.FlortD_SAMPLE:
+            self._extract_sample(FlortDSample_Particle, SAMPLE_REGEX_MATCHER, chunk, timestamp)
 
     def _send_wakeup(self):
         """